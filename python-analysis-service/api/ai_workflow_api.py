@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Header
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, List, Optional, Any
@@ -23,7 +23,12 @@ from models.workflow_models import (
     MessageType, WorkflowResourceType
 )
 from utils.helpers import clean_text
-from services.workflow_persistence_service import WorkflowPersistenceService
+from services.workflow_write_behind import workflow_writer, QueuedWorkflowPersistence
+from services.workflow_dag import DagScheduler, WorkflowPlan, workflow_plan_compiler
+from services.workflow_memo import node_result_memo, current_data_version
+from services.execution_store import ExecutionStore
+from services.execution_events import execution_event_bus
+from config import config
 
 router = APIRouter(prefix="/api/v1", tags=["AI Workflow"])
 
@@ -266,17 +271,26 @@ class WorkflowResponse(BaseModel):
     agents: Optional[List[AgentStatus]] = None
     results: Optional[Dict[str, Any]] = None
 
-# 全局变量存储工作流状态
-workflow_storage: Dict[str, Dict[str, Any]] = {}
-conversation_storage: Dict[str, List[Dict[str, Any]]] = {}
-# 新增：工作流定义执行存储
-workflow_execution_storage: Dict[str, Dict[str, Any]] = {}
+# 工作流、对话和工作流定义执行状态（内存LRU + 数据库快照，多个worker共享）
+workflow_storage = ExecutionStore(
+    "workflow", max_entries=config.WORKFLOW_STATE_MAX_ENTRIES,
+    checkpoint_interval=config.WORKFLOW_STATE_CHECKPOINT_INTERVAL
+)
+conversation_storage = ExecutionStore(
+    "conversation", max_entries=config.WORKFLOW_STATE_MAX_ENTRIES,
+    is_finished=lambda messages: True  # 对话每次追加后带上完整历史写库，随时可以淘汰
+)
+workflow_execution_storage = ExecutionStore(
+    "execution", max_entries=config.WORKFLOW_STATE_MAX_ENTRIES,
+    checkpoint_interval=config.WORKFLOW_STATE_CHECKPOINT_INTERVAL
+)
 
 # 初始化服务
 qwen_analyzer = QwenAnalyzer()
 stock_recommender = StockRecommender()
 smart_stock_service = SmartStockService()
 db_service = DatabaseService()
+workflow_dag_scheduler = DagScheduler()
 
 @router.post("/workflow/start")
 async def start_workflow(request: WorkflowStartRequest, background_tasks: BackgroundTasks):
@@ -296,7 +310,10 @@ async def start_workflow(request: WorkflowStartRequest, background_tasks: Backgr
             "results": {}
         }
         
-        # 在后台执行工作流
+        # 在后台执行工作流，状态变化通过 /workflow/events/{workflow_id} 推送
+        # 执行结束前固定状态，停止后仍在运行的步骤写入的是内存中的同一对象
+        workflow_storage.pin(workflow_id)
+        execution_event_bus.open(f"workflow:{workflow_id}")
         background_tasks.add_task(execute_workflow, workflow_id, request.query, request.context)
         
         return {
@@ -315,37 +332,57 @@ async def start_workflow(request: WorkflowStartRequest, background_tasks: Backgr
 async def get_workflow_status(workflow_id: str):
     """获取工作流状态"""
     try:
-        if workflow_id not in workflow_storage:
+        workflow = await workflow_storage.aget(workflow_id)
+        if workflow is None:
             raise HTTPException(status_code=404, detail="工作流不存在")
         
-        workflow = workflow_storage[workflow_id]
-        
         return {
             "success": True,
-            "data": {
-                "workflowId": workflow_id,
-                "status": workflow["status"],
-                "progress": calculate_progress(workflow["agents"]),
-                "agents": workflow["agents"],
-                "results": workflow.get("results", {}),
-                "message": workflow.get("message", "")
-            }
+            "data": workflow_status_payload(workflow_id, workflow)
         }
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取工作流状态失败: {str(e)}")
 
+@router.get("/workflow/events/{workflow_id}")
+async def stream_workflow_events(
+    workflow_id: str,
+    last_event_id: Optional[int] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """推送工作流智能体状态变化（SSE），断线重连时从 Last-Event-ID 之后继续"""
+    if await workflow_storage.aget(workflow_id) is None:
+        raise HTTPException(status_code=404, detail="工作流不存在")
+    
+    return StreamingResponse(
+        stream_state_events(
+            f"workflow:{workflow_id}", workflow_storage, workflow_id, workflow_status_payload,
+            parse_last_event_id(last_event_id, last_event_id_header)
+        ),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache, no-transform",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
 @router.post("/workflow/stop/{workflow_id}")
 async def stop_workflow(workflow_id: str):
     """停止工作流"""
     try:
-        if workflow_id not in workflow_storage:
+        workflow = await workflow_storage.aget(workflow_id)
+        if workflow is None:
             raise HTTPException(status_code=404, detail="工作流不存在")
         
-        workflow = workflow_storage[workflow_id]
+        if workflow["status"] == "running" and not workflow_storage.is_local(workflow_id):
+            raise HTTPException(status_code=409, detail="工作流运行在其他服务实例上，无法在当前实例停止")
+        
         workflow["status"] = "stopped"
         workflow["end_time"] = datetime.now().isoformat()
+        workflow_storage.save(workflow_id)
+        publish_final_status(f"workflow:{workflow_id}", workflow, calculate_progress(workflow["agents"]))
         
         return {
             "success": True,
@@ -360,11 +397,10 @@ async def stop_workflow(workflow_id: str):
 async def get_workflow_results(workflow_id: str):
     """获取工作流结果"""
     try:
-        if workflow_id not in workflow_storage:
+        workflow = await workflow_storage.aget(workflow_id)
+        if workflow is None:
             raise HTTPException(status_code=404, detail="工作流不存在")
         
-        workflow = workflow_storage[workflow_id]
-        
         return {
             "success": True,
             "data": workflow.get("results", {})
@@ -398,9 +434,8 @@ async def stream_chat_message(
     conversation_id: str = None,
     context: str = "{}",
     workflow_id: str = None,  # 新增：直接接收工作流ID
-    db: Session = Depends(get_db)
 ):
-    """流式对话接口 - 分段式输出AI回复"""
+    """流式对话接口 - 分段式输出AI回复，持久化交给后台写入队列"""
     try:
         # 解析参数
         conversation_id = conversation_id or f"conv_{uuid.uuid4()}"
@@ -409,11 +444,11 @@ async def stream_chat_message(
         except:
             context_dict = {}
 
-        # 初始化工作流持久化服务
-        persistence_service = WorkflowPersistenceService(db)
+        # 工作流持久化：写操作进入后台队列按工作流批量提交，不阻塞流式输出
+        persistence_service = workflow_writer.persistence()
 
         # 初始化对话历史
-        if conversation_id not in conversation_storage:
+        if not await conversation_storage.acontains(conversation_id):
             conversation_storage[conversation_id] = []
 
         # 添加用户消息
@@ -442,9 +477,6 @@ async def stream_chat_message(
                 # 1. 发送开始信号 - 立即发送，确保前端能收到
                 yield f"data: {json.dumps({'type': 'start', 'messageId': ai_message_id})}\n\n"
                 
-                # 短暂延迟确保start事件被处理
-                await asyncio.sleep(0.1)
-                
                 # 保存AI消息开始到数据库
                 if workflow_id:
                     persistence_service.save_message(workflow_id, {
@@ -505,11 +537,15 @@ async def stream_chat_message(
                         from services.dynamic_resource_service import DynamicResourceService
                         # 确保 context_dict 在这里可用
                         context_data = context_dict if 'context_dict' in locals() and isinstance(context_dict, dict) else {}
-                        DynamicResourceService().generate_and_save(
-                            workflow_id=workflow_id,
-                            message=message,
-                            context=context_data,
-                            persistence_service=persistence_service,
+                        # 资源生成包含AI调用，放到线程池执行，不阻塞事件循环和本次响应
+                        asyncio.get_event_loop().run_in_executor(
+                            None,
+                            lambda: DynamicResourceService().generate_and_save(
+                                workflow_id=workflow_id,
+                                message=message,
+                                context=context_data,
+                                persistence_service=persistence_service,
+                            )
                         )
                     except Exception as e:
                         logger.error(f"自动生成资源失败: {e}")
@@ -550,9 +586,10 @@ async def send_chat_message(request: ChatMessageRequest):
     try:
         conversation_id = request.conversation_id or f"conv_{uuid.uuid4()}"
         
-        # 初始化对话历史
-        if conversation_id not in conversation_storage:
-            conversation_storage[conversation_id] = []
+        # 对话历史（生成回复期间条目可能被淘汰，保存时写入这里持有的列表）
+        history = await conversation_storage.aget(conversation_id)
+        if history is None:
+            history = []
         
         # 添加用户消息
         user_message = {
@@ -561,7 +598,7 @@ async def send_chat_message(request: ChatMessageRequest):
             "content": request.message,
             "timestamp": datetime.now().isoformat()
         }
-        conversation_storage[conversation_id].append(user_message)
+        history.append(user_message)
         
         # 生成AI回复
         ai_response = await generate_ai_response(request.message, request.context)
@@ -572,7 +609,8 @@ async def send_chat_message(request: ChatMessageRequest):
             "content": ai_response,
             "timestamp": datetime.now().isoformat()
         }
-        conversation_storage[conversation_id].append(ai_message)
+        history.append(ai_message)
+        conversation_storage.save(conversation_id, history)
         
         return {
             "success": True,
@@ -588,7 +626,7 @@ async def send_chat_message(request: ChatMessageRequest):
 async def get_chat_history(conversation_id: str):
     """获取聊天历史"""
     try:
-        history = conversation_storage.get(conversation_id, [])
+        history = await conversation_storage.aget(conversation_id, [])
         
         return {
             "success": True,
@@ -615,10 +653,7 @@ async def get_workflow_history(user_id: str):
     """获取用户工作流历史"""
     try:
         # 从存储中筛选用户的工作流
-        user_workflows = [
-            workflow for workflow in workflow_storage.values()
-            if workflow.get("user_id") == user_id
-        ]
+        user_workflows = await workflow_storage.alist_by_user(user_id)
         
         return {
             "success": True,
@@ -688,10 +723,10 @@ async def run_workflow_definition(request: WorkflowDefinitionRunRequest, backgro
         execution_id = request.execution_id
         workflow_definition = request.workflow_definition
         
-        # 验证工作流定义
-        validation_result = validate_workflow_definition_internal(workflow_definition)
-        if not validation_result["valid"]:
-            raise HTTPException(status_code=400, detail=f"工作流定义无效: {validation_result['errors']}")
+        # 编译并验证工作流定义（执行时直接复用编译结果）
+        plan = workflow_plan_compiler.compile(workflow_definition)
+        if not plan.valid:
+            raise HTTPException(status_code=400, detail=f"工作流定义无效: {list(plan.errors)}")
         
         # 初始化工作流执行状态
         workflow_execution_storage[execution_id] = {
@@ -706,8 +741,11 @@ async def run_workflow_definition(request: WorkflowDefinitionRunRequest, backgro
             "results": {}
         }
         
-        # 在后台执行工作流定义
-        background_tasks.add_task(execute_workflow_definition, execution_id, workflow_definition, request.context)
+        # 在后台执行工作流定义，状态变化通过 /workflow/execution/events/{execution_id} 推送
+        # 执行结束前固定状态，停止后仍在运行的节点写入的是内存中的同一对象
+        workflow_execution_storage.pin(execution_id)
+        execution_event_bus.open(f"execution:{execution_id}")
+        background_tasks.add_task(execute_workflow_definition, execution_id, workflow_definition, request.context, plan)
         
         return {
             "success": True,
@@ -727,38 +765,57 @@ async def run_workflow_definition(request: WorkflowDefinitionRunRequest, backgro
 async def get_workflow_execution_status(execution_id: str):
     """获取工作流执行状态"""
     try:
-        if execution_id not in workflow_execution_storage:
+        execution = await workflow_execution_storage.aget(execution_id)
+        if execution is None:
             raise HTTPException(status_code=404, detail="工作流执行不存在")
         
-        execution = workflow_execution_storage[execution_id]
-        
         return {
             "success": True,
-            "data": {
-                "execution_id": execution_id,
-                "status": execution["status"],
-                "progress": execution["progress"],
-                "node_statuses": execution["node_statuses"],
-                "results": execution.get("results", {}),
-                "current_node": execution.get("current_node"),
-                "message": execution.get("message", "")
-            }
+            "data": execution_status_payload(execution_id, execution)
         }
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取工作流执行状态失败: {str(e)}")
 
+@router.get("/workflow/execution/events/{execution_id}")
+async def stream_workflow_execution_events(
+    execution_id: str,
+    last_event_id: Optional[int] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """推送工作流执行的节点状态和进度变化（SSE），断线重连时从 Last-Event-ID 之后继续"""
+    if await workflow_execution_storage.aget(execution_id) is None:
+        raise HTTPException(status_code=404, detail="工作流执行不存在")
+    
+    return StreamingResponse(
+        stream_state_events(
+            f"execution:{execution_id}", workflow_execution_storage, execution_id, execution_status_payload,
+            parse_last_event_id(last_event_id, last_event_id_header)
+        ),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache, no-transform",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
 @router.post("/workflow/execution/stop/{execution_id}")
 async def stop_workflow_execution(execution_id: str):
     """停止工作流执行"""
     try:
-        if execution_id not in workflow_execution_storage:
+        execution = await workflow_execution_storage.aget(execution_id)
+        if execution is None:
             raise HTTPException(status_code=404, detail="工作流执行不存在")
         
-        execution = workflow_execution_storage[execution_id]
+        if execution["status"] == "running" and not workflow_execution_storage.is_local(execution_id):
+            raise HTTPException(status_code=409, detail="工作流运行在其他服务实例上，无法在当前实例停止")
+        
         execution["status"] = "stopped"
         execution["end_time"] = datetime.now().isoformat()
+        workflow_execution_storage.save(execution_id)
+        publish_final_status(f"execution:{execution_id}", execution, execution["progress"])
         
         return {
             "success": True,
@@ -773,11 +830,10 @@ async def stop_workflow_execution(execution_id: str):
 async def get_workflow_execution_results(execution_id: str):
     """获取工作流执行结果"""
     try:
-        if execution_id not in workflow_execution_storage:
+        execution = await workflow_execution_storage.aget(execution_id)
+        if execution is None:
             raise HTTPException(status_code=404, detail="工作流执行不存在")
         
-        execution = workflow_execution_storage[execution_id]
-        
         return {
             "success": True,
             "data": execution.get("results", {})
@@ -855,6 +911,85 @@ def calculate_progress(agents):
     total_progress = sum(agent.get("progress", 0) for agent in agents)
     return total_progress // len(agents)
 
+def workflow_status_payload(workflow_id: str, workflow: Dict[str, Any]) -> Dict[str, Any]:
+    """工作流状态（状态接口和事件快照共用）"""
+    return {
+        "workflowId": workflow_id,
+        "status": workflow["status"],
+        "progress": calculate_progress(workflow["agents"]),
+        "agents": workflow["agents"],
+        "results": workflow.get("results", {}),
+        "message": workflow.get("message", "")
+    }
+
+def execution_status_payload(execution_id: str, execution: Dict[str, Any]) -> Dict[str, Any]:
+    """工作流执行状态（状态接口和事件快照共用）"""
+    return {
+        "execution_id": execution_id,
+        "status": execution["status"],
+        "progress": execution["progress"],
+        "node_statuses": execution["node_statuses"],
+        "results": execution.get("results", {}),
+        "current_node": execution.get("current_node"),
+        "message": execution.get("message", "")
+    }
+
+def publish_final_status(topic: str, state: Dict[str, Any], progress: int):
+    """执行结束（完成/失败/停止）时推送最终状态并关闭事件频道"""
+    if state.get("status") == "running":
+        return
+    execution_event_bus.publish(topic, "status", {
+        "status": state["status"],
+        "progress": progress,
+        "message": state.get("message", ""),
+        "results": state.get("results", {})
+    })
+    execution_event_bus.close(topic)
+
+def parse_last_event_id(query_value: Optional[int], header_value: Optional[str]) -> Optional[int]:
+    """客户端最后收到的事件ID（EventSource重连时通过 Last-Event-ID 请求头携带）"""
+    if query_value is not None:
+        return query_value
+    try:
+        return int(header_value) if header_value else None
+    except ValueError:
+        return None
+
+async def stream_state_events(topic: str, storage: ExecutionStore, state_id: str, snapshot, last_event_id: Optional[int]):
+    """
+    生成状态事件流：
+    - 需要时先发送完整状态快照（首次订阅或遗漏的事件已不在缓冲区）
+    - 然后补发遗漏事件并实时推送新事件，空闲时发送心跳，执行结束后结束
+    - 执行不在当前实例时，按检查点间隔读取共享状态，变化时推送快照
+    """
+    subscription = execution_event_bus.subscribe(topic, last_event_id)
+    if subscription is None:
+        previous = None
+        while True:
+            state = await storage.aget(state_id)
+            if state is None:
+                return
+            payload = snapshot(state_id, state)
+            if payload != previous:
+                yield f"data: {json.dumps({'type': 'snapshot', **payload}, ensure_ascii=False, default=str)}\n\n"
+                previous = payload
+            if state.get("status") != "running":
+                return
+            await asyncio.sleep(config.WORKFLOW_STATE_CHECKPOINT_INTERVAL)
+    
+    if subscription.needs_snapshot:
+        state = await storage.aget(state_id)
+        if state is not None:
+            payload = {"type": "snapshot", "eventId": subscription.last_id, **snapshot(state_id, state)}
+            yield f"id: {subscription.last_id}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+    
+    try:
+        async for event in subscription.events(heartbeat=config.WORKFLOW_EVENT_HEARTBEAT):
+            yield ": keep-alive\n\n" if event is None else event.to_sse()
+    finally:
+        # 客户端断开时退出订阅
+        subscription.close()
+
 async def execute_workflow(workflow_id: str, query: str, context: Dict[str, Any]):
     """执行工作流"""
     try:
@@ -893,14 +1028,20 @@ async def execute_workflow(workflow_id: str, query: str, context: Dict[str, Any]
         
     except Exception as e:
         print(f"工作流执行失败: {e}")
-        workflow = workflow_storage.get(workflow_id)
+        workflow = await workflow_storage.aget(workflow_id)
         if workflow:
             workflow["status"] = "error"
             workflow["message"] = str(e)
+    finally:
+        workflow_storage.save(workflow_id)
+        workflow = await workflow_storage.aget(workflow_id)
+        if workflow:
+            publish_final_status(f"workflow:{workflow_id}", workflow, calculate_progress(workflow["agents"]))
+        workflow_storage.unpin(workflow_id)
 
 async def update_agent_status(workflow_id: str, agent_id: str, status: str, progress: int, message: str):
     """更新智能体状态"""
-    workflow = workflow_storage.get(workflow_id)
+    workflow = await workflow_storage.aget(workflow_id)
     if workflow:
         agents = workflow["agents"]
         for agent in agents:
@@ -912,7 +1053,15 @@ async def update_agent_status(workflow_id: str, agent_id: str, status: str, prog
                     agent["startTime"] = datetime.now().isoformat()
                 elif status in ["completed", "error"]:
                     agent["endTime"] = datetime.now().isoformat()
+                execution_event_bus.publish(f"workflow:{workflow_id}", "agent", {
+                    "agentId": agent_id,
+                    "status": status,
+                    "progress": progress,
+                    "message": message,
+                    "workflowProgress": calculate_progress(agents)
+                })
                 break
+        workflow_storage.checkpoint(workflow_id)
 
 async def perform_analysis(query: str):
     """执行分析"""
@@ -1077,7 +1226,7 @@ def generate_fallback_response(message: str):
 请告诉我您的具体需求，我会为您提供专业的投资分析！"""
     return clean_text(response)
 
-async def generate_analysis_stream(message: str, context: Dict[str, Any], workflow_id: str, persistence_service: WorkflowPersistenceService, ai_message_id: str):
+async def generate_analysis_stream(message: str, context: Dict[str, Any], workflow_id: str, persistence_service: QueuedWorkflowPersistence, ai_message_id: str):
     """生成股票分析的流式响应"""
     
     print(f"📊 进入generate_analysis_stream函数, workflow_id: {workflow_id}, message: {message[:50]}...")
@@ -1163,9 +1312,6 @@ async def generate_analysis_stream(message: str, context: Dict[str, Any], workfl
             print(f"🔄 发送资源更新推送: 步骤 {i+1}, 工作流ID: {workflow_id}")
             yield f"data: {json.dumps({'type': 'resource_updated', 'workflowId': workflow_id, 'trigger': 'step_thinking', 'stepNumber': i+1})}\n\n"
         
-        # 使用更短的间隔，减少阻塞感
-        await asyncio.sleep(0.5)
-        
         # 标记步骤完成
         if workflow_id:
             try:
@@ -1204,10 +1350,7 @@ async def generate_analysis_stream(message: str, context: Dict[str, Any], workfl
         # 调用通义千问API - 添加超时保护
         try:
             ai_response = await asyncio.wait_for(
-                asyncio.get_event_loop().run_in_executor(
-                    None, 
-                    lambda: qwen_analyzer.analyze_text(analysis_prompt, max_tokens=2000)
-                ),
+                qwen_analyzer.analyze_text_async(analysis_prompt, max_tokens=2000),
                 timeout=30.0  # 30秒超时
             )
         except asyncio.TimeoutError:
@@ -1244,10 +1387,8 @@ async def generate_analysis_stream(message: str, context: Dict[str, Any], workfl
                             print(f"保存AI内容到数据库失败: {e}")
                     
                     yield f"data: {json.dumps(content_data)}\n\n"
-                    await asyncio.sleep(0.3)  # 减少间隔时间
                 else:
                     yield f"data: {json.dumps({'type': 'content', 'content': '', 'stepId': 'ai_analysis'})}\n\n"
-                    await asyncio.sleep(0.05)  # 空行间隔很短
         else:
             # 取消降级长文案，发送精简错误提示事件
             warn_msg = "AI服务暂不可用，请稍后重试。"
@@ -1272,7 +1413,7 @@ async def generate_analysis_stream(message: str, context: Dict[str, Any], workfl
 
         yield f"data: {json.dumps({'type': 'content', 'content': error_msg, 'stepId': 'error', 'category': 'error'})}\n\n"
 
-async def generate_strategy_stream(message: str, context: Dict[str, Any], workflow_id: str, persistence_service: WorkflowPersistenceService, ai_message_id: str):
+async def generate_strategy_stream(message: str, context: Dict[str, Any], workflow_id: str, persistence_service: QueuedWorkflowPersistence, ai_message_id: str):
     """生成投资策略的流式响应"""
     
     # 使用AI智能生成策略步骤
@@ -1326,7 +1467,6 @@ async def generate_strategy_stream(message: str, context: Dict[str, Any], workfl
                 print(f"保存策略步骤到数据库失败: {e}")
         
         yield f"data: {json.dumps(step_data)}\n\n"
-        await asyncio.sleep(0.4)  # 减少延迟
         
         # 标记步骤完成
         if workflow_id:
@@ -1349,10 +1489,7 @@ async def generate_strategy_stream(message: str, context: Dict[str, Any], workfl
         # 调用通义千问API - 添加超时保护
         try:
             ai_response = await asyncio.wait_for(
-                asyncio.get_event_loop().run_in_executor(
-                    None, 
-                    lambda: qwen_analyzer.analyze_text(strategy_prompt, max_tokens=2000)
-                ),
+                qwen_analyzer.analyze_text_async(strategy_prompt, max_tokens=2000),
                 timeout=30.0  # 30秒超时
             )
         except asyncio.TimeoutError:
@@ -1369,10 +1506,8 @@ async def generate_strategy_stream(message: str, context: Dict[str, Any], workfl
             for part in strategy_parts:
                 if part.strip():
                     yield f"data: {json.dumps({'type': 'content', 'content': part.strip(), 'stepId': 'ai_strategy', 'category': 'result'})}\n\n"
-                    await asyncio.sleep(0.3)
                 else:
                     yield f"data: {json.dumps({'type': 'content', 'content': '', 'stepId': 'ai_strategy'})}\n\n"
-                    await asyncio.sleep(0.05)
         else:
             # 取消降级长文案，发送精简错误提示事件
             warn_msg = "AI服务暂不可用，请稍后重试。"
@@ -1384,7 +1519,7 @@ async def generate_strategy_stream(message: str, context: Dict[str, Any], workfl
 
         yield f"data: {json.dumps({'type': 'content', 'content': error_msg, 'stepId': 'error', 'category': 'error'})}\n\n"
 
-async def generate_general_stream(message: str, context: Dict[str, Any], workflow_id: str, persistence_service: WorkflowPersistenceService, ai_message_id: str):
+async def generate_general_stream(message: str, context: Dict[str, Any], workflow_id: str, persistence_service: QueuedWorkflowPersistence, ai_message_id: str):
     """生成通用对话的流式响应"""
     
     # 使用AI智能生成通用步骤
@@ -1438,7 +1573,6 @@ async def generate_general_stream(message: str, context: Dict[str, Any], workflo
                 print(f"保存通用步骤到数据库失败: {e}")
         
         yield f"data: {json.dumps(step_data)}\n\n"
-        await asyncio.sleep(0.3)  # 减少延迟
         
         # 标记步骤完成
         if workflow_id:
@@ -1467,10 +1601,7 @@ async def generate_general_stream(message: str, context: Dict[str, Any], workflo
         # 调用通义千问API - 添加超时保护
         try:
             ai_response = await asyncio.wait_for(
-                asyncio.get_event_loop().run_in_executor(
-                    None, 
-                    lambda: qwen_analyzer.analyze_text(general_prompt, max_tokens=1500)
-                ),
+                qwen_analyzer.analyze_text_async(general_prompt, max_tokens=1500),
                 timeout=300.0  # 300秒超时
             )
         except asyncio.TimeoutError:
@@ -1487,10 +1618,8 @@ async def generate_general_stream(message: str, context: Dict[str, Any], workflo
             for part in general_parts:
                 if part.strip():
                     yield f"data: {json.dumps({'type': 'content', 'content': part.strip(), 'stepId': 'ai_general', 'category': 'result'})}\n\n"
-                    await asyncio.sleep(0.3)
                 else:
                     yield f"data: {json.dumps({'type': 'content', 'content': '', 'stepId': 'ai_general'})}\n\n"
-                    await asyncio.sleep(0.05)
         else:
             # 取消降级长文案，发送精简错误提示事件
             warn_msg = "AI服务暂不可用，请稍后重试。"
@@ -1578,10 +1707,7 @@ async def generate_smart_analysis_steps(message: str, context: Dict[str, Any]) -
 """
         
         # 调用AI生成步骤
-        ai_response = await asyncio.get_event_loop().run_in_executor(
-            None, 
-            lambda: qwen_analyzer.analyze_text(step_prompt, max_tokens=1000)
-        )
+        ai_response = await qwen_analyzer.analyze_text_async(step_prompt, max_tokens=1000)
         
         if ai_response:
             try:
@@ -1976,10 +2102,7 @@ async def generate_smart_strategy_steps(message: str, context: Dict[str, Any]) -
 ]
 """
         
-        ai_response = await asyncio.get_event_loop().run_in_executor(
-            None, 
-            lambda: qwen_analyzer.analyze_text(step_prompt, max_tokens=1000)
-        )
+        ai_response = await qwen_analyzer.analyze_text_async(step_prompt, max_tokens=1000)
         
         if ai_response:
             try:
@@ -2142,10 +2265,7 @@ async def generate_smart_general_steps(message: str, context: Dict[str, Any]) ->
 请以JSON数组格式返回，根据问题实际复杂度确定步骤数量。
 """
         
-        ai_response = await asyncio.get_event_loop().run_in_executor(
-            None, 
-            lambda: qwen_analyzer.analyze_text(step_prompt, max_tokens=800)
-        )
+        ai_response = await qwen_analyzer.analyze_text_async(step_prompt, max_tokens=800)
         
         if ai_response:
             try:
@@ -2529,68 +2649,9 @@ def initialize_node_statuses(nodes: List[Dict[str, Any]]) -> Dict[str, Any]:
     return node_statuses
 
 def validate_workflow_definition_internal(workflow_definition: Dict[str, Any]) -> Dict[str, Any]:
-    """内部工作流定义验证函数"""
-    errors = []
-    warnings = []
-    
+    """内部工作流定义验证函数（编译结果按定义内容缓存，同一定义只校验一次）"""
     try:
-        # 基本验证
-        if not workflow_definition.get("name"):
-            errors.append("工作流名称不能为空")
-        
-        nodes = workflow_definition.get("nodes", [])
-        connections = workflow_definition.get("connections", [])
-        
-        if not nodes:
-            errors.append("工作流必须包含至少一个节点")
-        
-        # 节点验证
-        node_ids = set()
-        for node in nodes:
-            if not node.get("id"):
-                errors.append("节点必须有唯一ID")
-                continue
-            
-            if node["id"] in node_ids:
-                errors.append(f"节点ID重复: {node['id']}")
-            node_ids.add(node["id"])
-            
-            if not node.get("type"):
-                errors.append(f"节点{node['id']}缺少类型定义")
-            
-            if not node.get("name"):
-                errors.append(f"节点{node['id']}缺少名称")
-        
-        # 连接验证
-        for connection in connections:
-            if not connection.get("sourceId") or not connection.get("targetId"):
-                errors.append("连接必须指定源节点和目标节点")
-                continue
-            
-            if connection["sourceId"] not in node_ids:
-                errors.append(f"连接引用了不存在的源节点: {connection['sourceId']}")
-            
-            if connection["targetId"] not in node_ids:
-                errors.append(f"连接引用了不存在的目标节点: {connection['targetId']}")
-        
-        # 循环依赖检查
-        if has_cyclic_dependency(nodes, connections):
-            errors.append("工作流存在循环依赖")
-        
-        # 警告检查
-        if len(nodes) > 10:
-            warnings.append("工作流节点数量较多，可能影响执行性能")
-        
-        isolated_nodes = find_isolated_nodes(nodes, connections)
-        if isolated_nodes:
-            warnings.append(f"发现孤立节点: {', '.join(isolated_nodes)}")
-        
-        return {
-            "valid": len(errors) == 0,
-            "errors": errors,
-            "warnings": warnings
-        }
-        
+        return workflow_plan_compiler.compile(workflow_definition).validation_report()
     except Exception as e:
         return {
             "valid": False,
@@ -2598,115 +2659,66 @@ def validate_workflow_definition_internal(workflow_definition: Dict[str, Any]) -
             "warnings": []
         }
 
-def has_cyclic_dependency(nodes: List[Dict[str, Any]], connections: List[Dict[str, Any]]) -> bool:
-    """检查是否存在循环依赖"""
-    try:
-        # 构建邻接表
-        graph = {}
-        for node in nodes:
-            graph[node["id"]] = []
-        
-        for connection in connections:
-            source_id = connection.get("sourceId")
-            target_id = connection.get("targetId")
-            if source_id and target_id and source_id in graph:
-                graph[source_id].append(target_id)
-        
-        # DFS检查循环
-        visited = set()
-        recursion_stack = set()
-        
-        def has_cycle(node_id: str) -> bool:
-            visited.add(node_id)
-            recursion_stack.add(node_id)
-            
-            for neighbor in graph.get(node_id, []):
-                if neighbor not in visited:
-                    if has_cycle(neighbor):
-                        return True
-                elif neighbor in recursion_stack:
-                    return True
-            
-            recursion_stack.remove(node_id)
-            return False
-        
-        for node_id in graph:
-            if node_id not in visited:
-                if has_cycle(node_id):
-                    return True
-        
-        return False
-        
-    except Exception as e:
-        print(f"循环依赖检查失败: {e}")
-        return False
-
-def find_isolated_nodes(nodes: List[Dict[str, Any]], connections: List[Dict[str, Any]]) -> List[str]:
-    """查找孤立节点（没有连接的节点）"""
-    try:
-        connected_nodes = set()
-        
-        for connection in connections:
-            source_id = connection.get("sourceId")
-            target_id = connection.get("targetId")
-            if source_id:
-                connected_nodes.add(source_id)
-            if target_id:
-                connected_nodes.add(target_id)
-        
-        isolated_nodes = []
-        for node in nodes:
-            if node["id"] not in connected_nodes:
-                isolated_nodes.append(node["id"])
-        
-        return isolated_nodes
-        
-    except Exception as e:
-        print(f"查找孤立节点失败: {e}")
-        return []
-
-async def execute_workflow_definition(execution_id: str, workflow_definition: Dict[str, Any], context: Dict[str, Any]):
-    """执行工作流定义"""
+async def execute_workflow_definition(execution_id: str, workflow_definition: Dict[str, Any], context: Dict[str, Any],
+                                      plan: Optional[WorkflowPlan] = None):
+    """执行工作流定义（按依赖关系调度，互不依赖的节点并发执行）"""
     try:
         execution = workflow_execution_storage[execution_id]
-        nodes = workflow_definition.get("nodes", [])
-        connections = workflow_definition.get("connections", [])
-        
-        # 计算节点执行顺序（拓扑排序）
-        execution_order = calculate_execution_order(nodes, connections)
+        plan = plan or workflow_plan_compiler.compile(workflow_definition)
+        nodes = plan.nodes
+        finished = []
+        data_version = current_data_version(context)
         
-        print(f"开始执行工作流定义: {execution_id}, 节点执行顺序: {execution_order}")
+        logger.info(f"开始执行工作流定义: {execution_id}, 节点数: {len(nodes)}, 数据版本: {data_version}")
         
-        # 按顺序执行节点
-        for i, node_id in enumerate(execution_order):
-            node = next((n for n in nodes if n["id"] == node_id), None)
-            if not node:
-                continue
-            
-            # 更新当前执行节点
+        async def run_node(node: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
+            node_id = node["id"]
             execution["current_node"] = node_id
-            execution["progress"] = int((i / len(execution_order)) * 90)  # 留10%给最终处理
             
             # 更新节点状态为运行中
             await update_node_status(execution_id, node_id, "running", 0, f"正在执行{node['name']}...")
             
-            # 执行节点
-            node_result = await execute_single_node(node, execution, context)
+            # 上游节点的输出作为本节点输入；配置、输入和数据版本都未变化时复用缓存结果
+            node_context = {**(context or {}), "upstream_results": inputs}
+            node_result, cached = await node_result_memo.run(
+                node, inputs, data_version,
+                lambda: execute_single_node(node, execution, node_context)
+            )
+            
+            finished.append(node_id)
+            execution["progress"] = int((len(finished) / len(nodes)) * 90)  # 留10%给最终处理
             
-            # 更新节点状态为完成
             if node_result.get("success", True):
-                await update_node_status(execution_id, node_id, "completed", 100, f"{node['name']}执行完成")
+                message = f"{node['name']}执行完成（使用缓存结果）" if cached else f"{node['name']}执行完成"
+                execution["node_statuses"][node_id]["cached"] = cached
                 execution["node_statuses"][node_id]["result"] = node_result
+                await update_node_status(execution_id, node_id, "completed", 100, message)
             else:
-                await update_node_status(execution_id, node_id, "error", 0, f"{node['name']}执行失败: {node_result.get('error', '未知错误')}")
                 execution["node_statuses"][node_id]["error"] = node_result.get("error")
-                # 如果节点执行失败，停止整个工作流
-                execution["status"] = "error"
-                execution["message"] = f"节点{node['name']}执行失败"
-                return
-            
-            # 模拟执行时间
-            await asyncio.sleep(1)
+                await update_node_status(execution_id, node_id, "error", 0, f"{node['name']}执行失败: {node_result.get('error', '未知错误')}")
+            return node_result
+        
+        dag_result = await workflow_dag_scheduler.run(
+            plan, run_node,
+            should_continue=lambda: execution["status"] != "stopped"
+        )
+        execution["critical_path"] = dag_result.summary()
+        
+        if execution["status"] == "stopped":
+            logger.info(f"工作流定义执行已停止: {execution_id}")
+            return
+        
+        if dag_result.failed:
+            # 如果节点执行失败，停止整个工作流
+            failed_node = plan.node(dag_result.failed[0])
+            execution["status"] = "error"
+            execution["message"] = f"节点{failed_node['name']}执行失败"
+            return
+        
+        if dag_result.skipped:
+            execution["status"] = "error"
+            execution["message"] = f"存在无法执行的节点: {', '.join(dag_result.skipped)}"
+            return
         
         # 生成最终结果
         final_results = await generate_workflow_final_results(execution_id, workflow_definition, execution)
@@ -2718,65 +2730,25 @@ async def execute_workflow_definition(execution_id: str, workflow_definition: Di
         execution["results"] = final_results
         execution["message"] = "工作流执行完成"
         
-        print(f"工作流定义执行完成: {execution_id}")
+        logger.info(f"工作流定义执行完成: {execution_id}, 关键路径: {dag_result.critical_path}")
         
     except Exception as e:
-        print(f"工作流定义执行失败: {execution_id}, 错误: {e}")
-        execution = workflow_execution_storage.get(execution_id)
+        logger.error(f"工作流定义执行失败: {execution_id}, 错误: {e}")
+        execution = await workflow_execution_storage.aget(execution_id)
         if execution:
             execution["status"] = "error"
             execution["message"] = str(e)
             execution["end_time"] = datetime.now().isoformat()
-
-def calculate_execution_order(nodes: List[Dict[str, Any]], connections: List[Dict[str, Any]]) -> List[str]:
-    """计算节点执行顺序（拓扑排序）"""
-    try:
-        # 构建依赖图
-        in_degree = {}
-        graph = {}
-        
-        # 初始化
-        for node in nodes:
-            node_id = node["id"]
-            in_degree[node_id] = 0
-            graph[node_id] = []
-        
-        # 构建图和计算入度
-        for connection in connections:
-            source_id = connection.get("sourceId")
-            target_id = connection.get("targetId")
-            if source_id and target_id:
-                graph[source_id].append(target_id)
-                in_degree[target_id] += 1
-        
-        # 拓扑排序
-        queue = [node_id for node_id, degree in in_degree.items() if degree == 0]
-        result = []
-        
-        while queue:
-            current = queue.pop(0)
-            result.append(current)
-            
-            for neighbor in graph[current]:
-                in_degree[neighbor] -= 1
-                if in_degree[neighbor] == 0:
-                    queue.append(neighbor)
-        
-        # 如果结果长度不等于节点数量，说明存在循环依赖
-        if len(result) != len(nodes):
-            print("警告: 检测到循环依赖，使用节点定义顺序")
-            return [node["id"] for node in nodes]
-        
-        return result
-        
-    except Exception as e:
-        print(f"计算执行顺序失败: {e}")
-        # 降级方案：按节点定义顺序执行
-        return [node["id"] for node in nodes]
+    finally:
+        workflow_execution_storage.save(execution_id)
+        execution = await workflow_execution_storage.aget(execution_id)
+        if execution:
+            publish_final_status(f"execution:{execution_id}", execution, execution["progress"])
+        workflow_execution_storage.unpin(execution_id)
 
 async def update_node_status(execution_id: str, node_id: str, status: str, progress: int, message: str):
     """更新节点状态"""
-    execution = workflow_execution_storage.get(execution_id)
+    execution = await workflow_execution_storage.aget(execution_id)
     if execution and node_id in execution["node_statuses"]:
         node_status = execution["node_statuses"][node_id]
         node_status["status"] = status
@@ -2787,6 +2759,16 @@ async def update_node_status(execution_id: str, node_id: str, status: str, progr
             node_status["start_time"] = datetime.now().isoformat()
         elif status in ["completed", "error"]:
             node_status["end_time"] = datetime.now().isoformat()
+        
+        execution_event_bus.publish(f"execution:{execution_id}", "node", {
+            "nodeId": node_id,
+            "status": status,
+            "progress": progress,
+            "message": message,
+            "cached": node_status.get("cached", False),
+            "executionProgress": execution["progress"]
+        })
+        workflow_execution_storage.checkpoint(execution_id)
 
 async def execute_single_node(node: Dict[str, Any], execution: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
     """执行单个节点"""
@@ -3018,7 +3000,8 @@ async def generate_workflow_final_results(execution_id: str, workflow_definition
                 "totalNodes": len(nodes),
                 "completedNodes": len([s for s in node_statuses.values() if s["status"] == "completed"]),
                 "failedNodes": len([s for s in node_statuses.values() if s["status"] == "error"]),
-                "executionTime": calculate_execution_time(execution)
+                "executionTime": calculate_execution_time(execution),
+                "criticalPath": execution.get("critical_path", {})
             },
             "nodeResults": node_results,
             "recommendations": extract_recommendations_from_results(node_results),
@@ -87,7 +87,7 @@ async def get_market_insights():
         logger.info("开始获取市场洞察分析")
         
         # 使用AI分析器获取市场概览
-        market_overview = smart_stock_service.get_market_overview()
+        market_overview = await smart_stock_service.aget_market_overview()
         
         if 'error' in market_overview:
             raise Exception(market_overview['error'])
@@ -415,7 +415,7 @@ async def get_market_data():
         logger.info("开始获取市场数据")
         
         # 使用智能股票服务获取市场数据
-        market_overview = smart_stock_service.get_market_overview()
+        market_overview = await smart_stock_service.aget_market_overview()
         
         market_data = []
         
@@ -174,7 +174,7 @@ async def get_market_overview(
     try:
         logger.info(f"获取市场概览: {sector or '全市场'}")
         
-        result = smart_stock_service.get_market_overview(sector)
+        result = await smart_stock_service.aget_market_overview(sector)
         
         if 'error' in result:
             raise HTTPException(status_code=500, detail=result['error'])
@@ -6,6 +6,7 @@ from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 from services.stock_array_analyzer import StockArrayAnalyzer
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -88,7 +89,7 @@ async def analyze_stock_array(request: StockArrayAnalysisRequest):
             )
         
         # 执行分析
-        result = analyzer.analyze_stock_array(
+        result = await analyzer.analyze_stock_array(
             stock_symbols=request.stock_symbols,
             analysis_type=request.analysis_type
         )
@@ -142,7 +143,7 @@ async def analyze_by_symbols(
         )
         
         # 调用分析器服务
-        result = analyzer.analyze_stock_array(request.stock_symbols, request.analysis_type)
+        result = await analyzer.analyze_stock_array(request.stock_symbols, request.analysis_type)
         
         return AnalysisResponse(
             success=True,
@@ -172,30 +173,29 @@ async def batch_analyze_stocks(request: BatchAnalysisRequest):
         if len(request.stock_batches) > 10:
             raise HTTPException(status_code=400, detail="批次数量不能超过10个")
         
-        batch_results = []
+        batches = [(i, stock_batch) for i, stock_batch in enumerate(request.stock_batches) if stock_batch]
+        
+        # 各批次并发执行，AI调用互不阻塞（并发上限由大模型客户端控制）
+        results = await asyncio.gather(
+            *(analyzer.analyze_stock_array(stock_symbols=stock_batch, analysis_type=request.analysis_type)
+              for _, stock_batch in batches),
+            return_exceptions=True
+        )
         
-        for i, stock_batch in enumerate(request.stock_batches):
-            if not stock_batch:
-                continue
-                
-            try:
-                result = analyzer.analyze_stock_array(
-                    stock_symbols=stock_batch,
-                    analysis_type=request.analysis_type
-                )
-                
+        batch_results = []
+        for (i, stock_batch), result in zip(batches, results):
+            if isinstance(result, Exception):
+                logger.error(f"批次 {i} 分析失败: {str(result)}")
                 batch_results.append({
                     'batch_index': i,
                     'batch_symbols': stock_batch,
-                    'result': result
+                    'error': str(result)
                 })
-                
-            except Exception as e:
-                logger.error(f"批次 {i} 分析失败: {str(e)}")
+            else:
                 batch_results.append({
                     'batch_index': i,
                     'batch_symbols': stock_batch,
-                    'error': str(e)
+                    'result': result
                 })
         
         return {
@@ -13,6 +13,7 @@ from services.stock_recommender import StockRecommender
 from services.keyword_analyzer import KeywordAnalyzer
 from utils.error_handler import UnifiedResponse, ErrorCode, handle_exception
 from utils.cache import cache_manager
+from services.llm_cache import llm_response_cache
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -47,11 +48,11 @@ class KeywordAnalysisResponse(BaseModel):
 
 @router.post("/analyze-keywords")
 async def analyze_keywords(request: KeywordAnalysisRequest):
-    """关键词分析 - 不使用缓存，每次都用AI重新分析"""
+    """关键词分析 - AI分析结果按规范化问题缓存，重复问题直接命中"""
     try:
         logger.info(f"开始关键词分析: {request.query}")
         
-        # 直接执行AI分析，不检查缓存
+        # 执行关键词分析（AI响应缓存在大模型客户端中处理）
         result = await keyword_analyzer.analyze_keywords(request.query)
         
         # KeywordAnalysis对象不为None即表示成功，不需要检查"error"字段
@@ -64,8 +65,6 @@ async def analyze_keywords(request: KeywordAnalysisRequest):
         # 将KeywordAnalysis对象转换为字典格式
         result_dict = result.to_dict()
         
-        # 不缓存结果，确保每次都是最新的AI分析
-        
         logger.info(f"关键词分析完成，提取到 {len(result.extracted_keywords)} 个关键词")
         return UnifiedResponse.success(result_dict, "关键词分析完成")
         
@@ -84,17 +83,15 @@ async def analyze_keywords(request: KeywordAnalysisRequest):
 
 @router.post("/recommend")
 async def recommend_stocks(request: StockRecommendationRequest):
-    """股票推荐 - 结合AI关键词分析和本地数据库，不使用缓存"""
+    """股票推荐 - 结合AI关键词分析和本地数据库，推荐结果实时计算"""
     try:
         logger.info(f"开始股票推荐: {request.query}")
         
-        # 不检查缓存，直接进行实时分析和推荐
-        
         # 第一步：处理结构化条件或执行AI关键词分析
         if request.structured_conditions:
             logger.info(f"步骤1: 使用传递的结构化条件 ({len(request.structured_conditions)}个)")
             # 如果有结构化条件，创建一个包含结构化条件的分析结果
-            from services.keyword_analyzer import KeywordAnalysis, StructuredCondition
+            from services.keyword_analyzer import KeywordAnalysis, parse_structured_condition
             
             # 从结构化条件中提取关键词
             extracted_keywords = []
@@ -104,13 +101,11 @@ async def recommend_stocks(request: StockRecommendationRequest):
                 field = condition.get('field', '')
                 if field:
                     extracted_keywords.append(field)
+                for child in condition.get('conditions', []) or []:
+                    if isinstance(child, dict) and child.get('field'):
+                        extracted_keywords.append(child['field'])
                 
-                structured_conditions.append(StructuredCondition(
-                    field=condition.get('field', ''),
-                    operator=condition.get('operator', '='),
-                    value=condition.get('value', ''),
-                    period=condition.get('period')
-                ))
+                structured_conditions.append(parse_structured_condition(condition))
             
             # 创建关键词分析结果对象
             keyword_analysis = KeywordAnalysis(
@@ -155,7 +150,7 @@ async def recommend_stocks(request: StockRecommendationRequest):
                 details=result.get("error", "股票推荐失败")
             )
         
-        # 不缓存结果，确保每次都是最新的分析
+        # 推荐结果不缓存，确保使用最新行情数据
         
         logger.info(f"股票推荐完成，推荐了 {len(result.get('recommendations', []))} 只股票")
         return UnifiedResponse.success(result, "股票推荐完成")
@@ -185,16 +180,17 @@ async def health_check():
             "service": "股票推荐AI分析服务",
             "version": "2.0",
             "features": {
-                "ai_keyword_analysis": "实时AI关键词分析（无缓存）",
+                "ai_keyword_analysis": "AI关键词分析（响应缓存）",
                 "intelligent_recommendation": "基于AI分析的智能股票推荐",
                 "database_integration": "结合本地数据库数据",
-                "real_time_analysis": "每次请求都进行最新AI分析"
+                "real_time_analysis": "推荐结果基于最新行情实时计算"
             },
-            "analysis_method": "ai_enhanced_no_cache",
+            "analysis_method": "ai_enhanced_cached",
             "cache_policy": {
-                "keyword_analysis": "不使用缓存，每次AI重新分析",
+                "keyword_analysis": "AI响应按规范化问题持久化缓存",
                 "stock_recommendation": "不使用缓存，实时结合AI分析结果"
             },
+            "llm_cache": llm_response_cache.stats(),
             "ai_model": "通义千问（Qwen）",
             "timestamp": datetime.now().isoformat()
         }
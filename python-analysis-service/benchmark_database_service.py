@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+DatabaseService.search_stocks_by_conditions 批量加载基准测试
+
+对比逐只股票查询（旧实现：每只股票 4 次详情查询 + 匹配度计算中 3 次重复查询）
+与批量加载（每类数据一次集合查询）的 SQL 条数和耗时。
+使用内存 SQLite 构造测试数据，无需连接 MySQL。
+
+运行方式：
+python benchmark_database_service.py --stocks 1000
+"""
+
+import argparse
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from models.database import Base
+from models.stock_models import Stock, StockPrice, StockFinancial, StockTechnical, StockConcept
+from services.database_service import DatabaseService
+
+STOCK_TABLES = [Stock.__table__, StockPrice.__table__, StockFinancial.__table__,
+                StockTechnical.__table__, StockConcept.__table__]
+
+
+def build_session(stock_count: int):
+    """创建内存数据库并写入测试数据"""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=STOCK_TABLES)
+    session = sessionmaker(bind=engine)()
+
+    today = datetime(2025, 1, 1)
+    for i in range(stock_count):
+        symbol = f"{i:06d}"
+        session.add(Stock(symbol=symbol, name=f"股票{i}", sector="科技", industry="软件",
+                          market="SZ", marketCap=random.uniform(1e9, 1e12), isActive=True))
+        for days in range(3):
+            date = today - timedelta(days=days)
+            session.add(StockPrice(symbol=symbol, date=date, close_price=random.uniform(5, 100),
+                                   change_percent=random.uniform(-5, 5), volume=1000000, turnover=1e7))
+            session.add(StockTechnical(symbol=symbol, date=date, rsi=random.uniform(20, 80),
+                                       macd=0.1, macd_signal_type=random.choice(["金叉", "死叉"]),
+                                       trend_signal=random.choice(["上涨", "下跌", "震荡"]), ma20=10, ma50=10))
+        for quarter in range(2):
+            session.add(StockFinancial(symbol=symbol, report_date=today - timedelta(days=90 * quarter),
+                                       pe_ratio=random.uniform(5, 60), pb_ratio=random.uniform(0.5, 8),
+                                       roe=random.uniform(0, 30), debt_ratio=random.uniform(10, 80)))
+        session.add(StockConcept(symbol=symbol, concept="人工智能", concept_type="主题", is_active=True))
+    session.commit()
+    return engine, session
+
+
+def legacy_hydrate(service: DatabaseService, stocks, conditions):
+    """旧实现：逐只股票查询详情，匹配度计算时再重复查询财务/技术/概念"""
+    results = []
+    for stock in stocks:
+        symbol = stock['symbol']
+        service._get_latest_financial_data(symbol)
+        service._get_latest_technical_data(symbol)
+        service._get_latest_price_data(symbol)
+        service._get_stock_concepts(symbol)
+        financial_data = service._get_latest_financial_data(symbol)
+        technical_data = service._get_latest_technical_data(symbol)
+        concepts = service._get_stock_concepts(symbol)
+        results.append(service._calculate_match_score(symbol, conditions, financial_data, technical_data, concepts))
+    return results
+
+
+def measure(engine, func):
+    """统计函数执行期间的SQL条数和耗时"""
+    counter = {"queries": 0}
+
+    def on_execute(*args, **kwargs):
+        counter["queries"] += 1
+
+    event.listen(engine, "before_cursor_execute", on_execute)
+    started = time.perf_counter()
+    try:
+        func()
+    finally:
+        elapsed = time.perf_counter() - started
+        event.remove(engine, "before_cursor_execute", on_execute)
+    return counter["queries"], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DatabaseService 批量加载基准测试")
+    parser.add_argument("--stocks", type=int, default=1000, help="候选股票数量")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    engine, session = build_session(args.stocks)
+
+    service = DatabaseService()
+    service.db.close()
+    service.db = session
+
+    conditions = {
+        'sectors': ['科技'],
+        'market_cap': 'any',
+        'financial_metrics': {'roe': {'min': 5}},
+        'technical_indicators': {'momentum': 'strong'},
+        'keywords': ['人工智能'],
+    }
+    stocks = [{'symbol': row.symbol} for row in session.query(Stock.symbol).all()]
+
+    legacy_queries, legacy_elapsed = measure(engine, lambda: legacy_hydrate(service, stocks, conditions))
+    bulk_queries, bulk_elapsed = measure(engine, lambda: service.search_stocks_by_conditions(
+        {**conditions, 'financial_metrics': {}, 'technical_indicators': {}, 'keywords': []}
+    ))
+
+    print(f"候选股票数: {len(stocks)}")
+    print(f"逐只查询: {legacy_queries:>6} 条SQL, {legacy_elapsed * 1000:>9.1f} ms")
+    print(f"批量加载: {bulk_queries:>6} 条SQL, {bulk_elapsed * 1000:>9.1f} ms（含候选股票查询）")
+
+
+if __name__ == "__main__":
+    main()
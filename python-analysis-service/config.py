@@ -36,6 +36,24 @@ class Config:
     QWEN_MODEL: str = os.getenv("QWEN_MODEL", "qwen-plus")
     QWEN_MAX_TOKENS: int = int(os.getenv("QWEN_MAX_TOKENS", "8000"))
     QWEN_TEMPERATURE: float = float(os.getenv("QWEN_TEMPERATURE", "0.3"))
+    DASHSCOPE_BASE_URL: str = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/api/v1")
+    
+    # 大模型客户端配置
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))  # 每个模型的并发上限
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+    LLM_REQUEST_TIMEOUT: float = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))  # 单次调用截止时间（含排队和重试）
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    
+    # 大模型响应缓存配置（SQLite持久化）
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "True").lower() == "true"
+    LLM_CACHE_PATH: str = os.getenv("LLM_CACHE_PATH", "cache/llm_response_cache.db")
+    LLM_CACHE_TTL: int = int(os.getenv("LLM_CACHE_TTL", "86400"))  # 1天
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+    LLM_CACHE_SEMANTIC_ENABLED: bool = os.getenv("LLM_CACHE_SEMANTIC_ENABLED", "False").lower() == "true"  # 相似问题查找
+    LLM_CACHE_SIMILARITY_THRESHOLD: float = float(os.getenv("LLM_CACHE_SIMILARITY_THRESHOLD", "0.92"))
+    
+    # 增量技术指标状态（SQLite持久化）
+    INDICATOR_STATE_PATH: str = os.getenv("INDICATOR_STATE_PATH", "cache/indicator_state.db")
     
     # 日志配置
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
@@ -49,12 +67,44 @@ class Config:
     DB_PASSWORD: str = os.getenv("DB_PASSWORD", "restosuite")
     DB_DATABASE: str = os.getenv("DB_DATABASE", "chaogu")
     
+    # 工作流后台批量写入配置
+    WORKFLOW_WRITE_BATCH_SIZE: int = int(os.getenv("WORKFLOW_WRITE_BATCH_SIZE", "500"))
+    WORKFLOW_WRITE_LINGER: float = float(os.getenv("WORKFLOW_WRITE_LINGER", "0.05"))  # 批次最长等待时间（秒）
+    
+    # 工作流定义执行配置
+    WORKFLOW_MAX_CONCURRENCY: int = int(os.getenv("WORKFLOW_MAX_CONCURRENCY", "4"))  # 同时执行的节点数上限
+    WORKFLOW_PLAN_CACHE_SIZE: int = int(os.getenv("WORKFLOW_PLAN_CACHE_SIZE", "256"))  # 缓存的编译后工作流计划数
+    WORKFLOW_NODE_CACHE_ENABLED: bool = os.getenv("WORKFLOW_NODE_CACHE_ENABLED", "True").lower() == "true"
+    WORKFLOW_NODE_CACHE_TTL: int = int(os.getenv("WORKFLOW_NODE_CACHE_TTL", "3600"))
+    WORKFLOW_NODE_CACHE_MAX_ENTRIES: int = int(os.getenv("WORKFLOW_NODE_CACHE_MAX_ENTRIES", "1000"))
+    WORKFLOW_NODE_CACHE_MAX_BYTES: int = int(os.getenv("WORKFLOW_NODE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    
+    # 工作流执行状态存储（内存LRU + 数据库快照）
+    WORKFLOW_STATE_MAX_ENTRIES: int = int(os.getenv("WORKFLOW_STATE_MAX_ENTRIES", "1000"))  # 每类状态内存中最多保留的条目数
+    WORKFLOW_STATE_CHECKPOINT_INTERVAL: float = float(os.getenv("WORKFLOW_STATE_CHECKPOINT_INTERVAL", "2"))  # 运行中状态写库最小间隔（秒）
+    WORKFLOW_STATE_WRITE_LINGER: float = float(os.getenv("WORKFLOW_STATE_WRITE_LINGER", "0.2"))
+    
+    # 工作流执行事件推送（SSE）
+    WORKFLOW_EVENT_HISTORY: int = int(os.getenv("WORKFLOW_EVENT_HISTORY", "500"))  # 每个执行保留的事件数（断线补发范围）
+    WORKFLOW_EVENT_RETENTION: int = int(os.getenv("WORKFLOW_EVENT_RETENTION", "600"))  # 执行结束后事件保留时间（秒）
+    WORKFLOW_EVENT_HEARTBEAT: float = float(os.getenv("WORKFLOW_EVENT_HEARTBEAT", "15"))  # 心跳间隔（秒）
+    
     # Redis配置
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
     
+    # 两级缓存配置（L1进程内 + L2 Redis）
+    CACHE_L2_ENABLED: bool = os.getenv("CACHE_L2_ENABLED", "False").lower() == "true"
+    CACHE_L1_TTL: int = int(os.getenv("CACHE_L1_TTL", "60"))  # L1最长保留时间，控制跨worker的数据新鲜度
+    STOCK_DETAIL_CACHE_TTL: int = int(os.getenv("STOCK_DETAIL_CACHE_TTL", "300"))
+    MARKET_OVERVIEW_CACHE_TTL: int = int(os.getenv("MARKET_OVERVIEW_CACHE_TTL", "300"))
+    
     # 股票数据配置
     STOCK_DATA_CACHE_TTL: int = int(os.getenv("STOCK_DATA_CACHE_TTL", "3600"))  # 1小时
     
+    # 市场快照配置（进程内列式快照，用于筛选类查询）
+    MARKET_SNAPSHOT_ENABLED: bool = os.getenv("MARKET_SNAPSHOT_ENABLED", "True").lower() == "true"
+    MARKET_SNAPSHOT_REFRESH_INTERVAL: int = int(os.getenv("MARKET_SNAPSHOT_REFRESH_INTERVAL", "300"))  # 5分钟
+    
     # 分析配置
     MAX_KEYWORDS: int = int(os.getenv("MAX_KEYWORDS", "20"))
     MAX_RECOMMENDATIONS: int = int(os.getenv("MAX_RECOMMENDATIONS", "50"))
@@ -41,6 +41,11 @@ from models.review_models import Review  # 导入复盘模型以确保表创建
 from models.database_models import ReviewDatabase, ReviewDatabaseRecord, ReviewDatabaseTemplate  # 导入多维表格数据库模型
 from models.live_models import LiveChannel  # 导入直播频道模型
 from api.live_ws import router as live_ws_router
+from services.market_snapshot import market_snapshot
+from services.llm_client import llm_client
+from services.llm_cache import llm_response_cache
+from services.workflow_write_behind import workflow_writer
+from services.execution_store import execution_state_writer
 
 # 配置日志 - 禁用watchfiles的频繁输出
 log_config = config.get_log_config()
@@ -103,6 +108,34 @@ if not os.path.exists(uploads_dir):
     os.makedirs(uploads_dir)
 app.mount("/uploads", StaticFiles(directory=uploads_dir), name="uploads")
 
+@app.on_event("startup")
+async def start_market_snapshot():
+    """启动市场快照后台加载与增量刷新"""
+    if config.MARKET_SNAPSHOT_ENABLED:
+        market_snapshot.start_auto_refresh()
+
+@app.on_event("shutdown")
+async def stop_market_snapshot():
+    """停止市场快照后台刷新"""
+    market_snapshot.stop_auto_refresh()
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    """关闭大模型客户端连接池，写回响应缓存的访问记录"""
+    await llm_client.aclose()
+    llm_client.close()
+    llm_response_cache.flush()
+
+@app.on_event("shutdown")
+async def flush_workflow_writer():
+    """写完排队中的工作流持久化操作"""
+    workflow_writer.stop()
+
+@app.on_event("shutdown")
+async def flush_execution_states():
+    """写完排队中的工作流执行状态快照"""
+    execution_state_writer.stop()
+
 @app.get("/health")
 async def health_check():
     """健康检查"""
@@ -0,0 +1,28 @@
+-- 030-workflow-message-unique-key.sql
+-- 为 workflow_messages 添加 (workflow_id, message_id) 唯一键
+-- 工作流批量写入器使用 INSERT ... ON DUPLICATE KEY UPDATE 按消息ID幂等写入
+
+-- 清理重复消息（保留 sequence 最小的一条）
+DELETE m1 FROM workflow_messages m1
+JOIN workflow_messages m2
+  ON m1.workflow_id = m2.workflow_id
+ AND m1.message_id = m2.message_id
+ AND (m1.sequence > m2.sequence OR (m1.sequence = m2.sequence AND m1.id > m2.id));
+
+-- 检查并添加唯一键
+SET @index_exists = (
+    SELECT COUNT(*)
+    FROM INFORMATION_SCHEMA.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'workflow_messages'
+    AND INDEX_NAME = 'unique_workflow_message'
+);
+
+SET @sql = IF(@index_exists = 0,
+    'ALTER TABLE workflow_messages ADD UNIQUE KEY unique_workflow_message (workflow_id, message_id)',
+    'SELECT "unique_workflow_message 已存在" as message'
+);
+
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
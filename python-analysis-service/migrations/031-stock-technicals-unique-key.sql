@@ -0,0 +1,28 @@
+-- 031-stock-technicals-unique-key.sql
+-- 为 stock_technicals 添加 (symbol, date) 唯一键
+-- stock-crawler 的技术指标预计算任务使用 INSERT ... ON DUPLICATE KEY UPDATE 按股票和日期幂等写入
+
+-- 清理重复指标（保留 id 最大的一条）
+DELETE t1 FROM stock_technicals t1
+JOIN stock_technicals t2
+  ON t1.symbol = t2.symbol
+ AND t1.date = t2.date
+ AND t1.id < t2.id;
+
+-- 检查并添加唯一键
+SET @index_exists = (
+    SELECT COUNT(*)
+    FROM INFORMATION_SCHEMA.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'stock_technicals'
+    AND INDEX_NAME = 'uk_symbol_date'
+);
+
+SET @sql = IF(@index_exists = 0,
+    'ALTER TABLE stock_technicals ADD UNIQUE KEY uk_symbol_date (symbol, date)',
+    'SELECT "uk_symbol_date 已存在" as message'
+);
+
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
@@ -0,0 +1,20 @@
+-- 032-workflow-execution-states.sql
+-- 目的：保存工作流、工作流定义执行和对话的运行状态快照
+-- 分析服务内存中只保留有限条目，淘汰后及其他实例从这里读取
+
+SET NAMES utf8mb4;
+SET character_set_client = utf8mb4;
+SET character_set_connection = utf8mb4;
+SET character_set_results = utf8mb4;
+SET collation_connection = utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS workflow_execution_states (
+  kind VARCHAR(32) NOT NULL COMMENT 'workflow / execution / conversation',
+  state_id VARCHAR(255) NOT NULL,
+  user_id VARCHAR(36) NULL,
+  status VARCHAR(20) NULL,
+  payload LONGTEXT NOT NULL COMMENT 'JSON序列化的状态',
+  updated_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (kind, state_id),
+  KEY idx_execution_state_user (kind, user_id, updated_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
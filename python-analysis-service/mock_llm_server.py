@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+通义千问接口本地模拟服务
+模拟DashScope文本生成接口，可配置延迟和失败率，用于在不调用真实模型的情况下
+验证大模型客户端的并发上限、超时和重试行为
+
+运行方式：
+python mock_llm_server.py --port 8765 --delay 2 --failure-rate 0.2
+DASHSCOPE_BASE_URL=http://127.0.0.1:8765/api/v1 python main.py
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Mock DashScope")
+settings = {"delay": 1.0, "failure_rate": 0.0}
+stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0}
+
+
+@app.post("/api/v1/services/aigc/text-generation/generation")
+async def generation(request: Request):
+    """模拟文本生成：延迟后返回固定JSON，按失败率返回429/503"""
+    body = await request.json()
+    stats["requests"] += 1
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        await asyncio.sleep(settings["delay"])
+        if random.random() < settings["failure_rate"]:
+            status_code = random.choice([429, 503])
+            return JSONResponse(status_code=status_code, content={"code": "Throttling", "message": "mock failure"})
+
+        model_input = body.get("input", {})
+        prompt = model_input.get("prompt") or json.dumps(model_input.get("messages", []), ensure_ascii=False)
+        text = json.dumps({"keywords": ["模拟"], "echo_length": len(prompt)}, ensure_ascii=False)
+        return {
+            "output": {"text": text, "finish_reason": "stop"},
+            "usage": {"input_tokens": len(prompt), "output_tokens": len(text)},
+            "request_id": str(uuid.uuid4()),
+        }
+    finally:
+        stats["in_flight"] -= 1
+
+
+@app.get("/stats")
+async def get_stats():
+    """请求统计（含最大并发数）"""
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="通义千问接口本地模拟服务")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=1.0, help="每次响应延迟（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="返回429/503的概率")
+    args = parser.parse_args()
+
+    settings["delay"] = args.delay
+    settings["failure_rate"] = args.failure_rate
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 股票相关数据模型
 """
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, Index
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from .database import Base
 import datetime
@@ -138,9 +138,9 @@ class StockTechnical(Base):
     
     created_at = Column(DateTime, default=func.now())
     
-    # 创建复合索引
+    # 创建复合索引（stock-crawler 按 (symbol, date) 幂等批量写入）
     __table_args__ = (
-        Index('idx_symbol_date_tech', 'symbol', 'date'),
+        UniqueConstraint('symbol', 'date', name='uk_symbol_date'),
         Index('idx_rsi_macd', 'rsi', 'macd_signal_type'),
         Index('idx_trend_signal', 'trend_signal'),
     )
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, Integer, Text, DECIMAL, TIMESTAMP, JSON, Enum as SQLEnum, ForeignKey
+from sqlalchemy import Column, String, Integer, Text, DECIMAL, TIMESTAMP, JSON, Enum as SQLEnum, ForeignKey, UniqueConstraint, Index
+from sqlalchemy.dialects.mysql import LONGTEXT
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -73,6 +74,9 @@ class WorkflowInstance(Base):
 
 class WorkflowStep(Base):
     __tablename__ = 'workflow_steps'
+    __table_args__ = (
+        UniqueConstraint('workflow_id', 'step_number', name='unique_workflow_step'),
+    )
     
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     workflow_id = Column(String(36), ForeignKey('workflow_instances.id', ondelete='CASCADE'), nullable=False)
@@ -115,6 +119,10 @@ class WorkflowResource(Base):
 
 class WorkflowMessage(Base):
     __tablename__ = 'workflow_messages'
+    __table_args__ = (
+        # 批量写入使用 INSERT ... ON DUPLICATE KEY UPDATE 按消息ID幂等
+        UniqueConstraint('workflow_id', 'message_id', name='unique_workflow_message'),
+    )
     
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     workflow_id = Column(String(36), ForeignKey('workflow_instances.id', ondelete='CASCADE'), nullable=False)
@@ -138,4 +146,18 @@ class WorkflowFavorite(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(String(36), nullable=False)
     workflow_id = Column(String(36), ForeignKey('workflow_instances.id', ondelete='CASCADE'), nullable=False)
-    created_at = Column(TIMESTAMP, default=datetime.utcnow) 
\ No newline at end of file
+    created_at = Column(TIMESTAMP, default=datetime.utcnow) 
+
+class WorkflowExecutionState(Base):
+    """工作流/工作流定义执行/对话的运行状态快照（内存淘汰后从这里读取，多个worker共享）"""
+    __tablename__ = 'workflow_execution_states'
+    __table_args__ = (
+        Index('idx_execution_state_user', 'kind', 'user_id', 'updated_at'),
+    )
+    
+    kind = Column(String(32), primary_key=True)  # workflow / execution / conversation
+    state_id = Column(String(255), primary_key=True)
+    user_id = Column(String(36), nullable=True)
+    status = Column(String(20), nullable=True)
+    payload = Column(Text().with_variant(LONGTEXT(), 'mysql'), nullable=False)  # JSON序列化的状态
+    updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
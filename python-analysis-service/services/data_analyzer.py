@@ -8,17 +8,21 @@ from typing import Dict, List, Optional, Any
 from datetime import datetime, timedelta
 import logging
 
+from services.indicator_state import IndicatorStateStore, apply_bars, indicator_state_store, is_append
+from services.portfolio_analytics import TRADING_DAYS, ReturnsPanel
+
 logger = logging.getLogger(__name__)
 
 class DataAnalyzer:
     """股票数据分析器"""
     
-    def __init__(self):
+    def __init__(self, state_store: Optional[IndicatorStateStore] = None):
         self.cache = {}
+        self.state_store = state_store or indicator_state_store
     
     def analyze_stock_performance(self, stock_data: List[Dict]) -> Dict[str, Any]:
         """
-        分析股票表现
+        分析股票表现（按传入的K线全量计算，需要跨请求复用状态时使用 update_indicators）
         
         Args:
             stock_data: 股票数据列表，包含 date, open, high, low, close, volume
@@ -78,6 +82,43 @@ class DataAnalyzer:
             logger.error(f"股票分析失败: {str(e)}")
             raise
     
+    def update_indicators(self, bars_by_symbol: Dict[str, List[Dict]]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量增量更新多只股票的指标状态
+        
+        已保存的状态对应首次计算时的K线窗口，只有传入的K线全部晚于状态的最新日期时才增量追加；
+        传入的K线与已处理的日期有重叠时视为新的完整窗口，丢弃旧状态从头计算，
+        这样窗口起点变化（如先算3年再算1年）或历史K线被修正后结果不会沿用旧状态
+        
+        Args:
+            bars_by_symbol: key为股票代码，value为K线列表（只包含新K线时增量追加，否则按完整窗口重算）
+            
+        Returns:
+            每只股票的分析结果，字段与 analyze_stock_performance 一致
+        """
+        try:
+            states = self.state_store.get_many(list(bars_by_symbol))
+            updated = {}
+            results = {}
+            for symbol, bars in bars_by_symbol.items():
+                state = states.get(symbol)
+                if state is not None and bars and not is_append(state, bars):
+                    state = None
+                last_date = state.last_date if state else None
+                state = apply_bars(state, bars)
+                if state.count == 0:
+                    raise ValueError(f"股票{symbol}没有K线数据")
+                if state.last_date != last_date:
+                    updated[symbol] = state
+                results[symbol] = state.snapshot()
+            
+            self.state_store.put_many(updated)
+            return results
+            
+        except Exception as e:
+            logger.error(f"增量指标更新失败: {str(e)}")
+            raise
+    
     def analyze_portfolio(self, portfolio_data: Dict[str, List[Dict]]) -> Dict[str, Any]:
         """
         分析投资组合
@@ -89,37 +130,30 @@ class DataAnalyzer:
             组合分析结果
         """
         try:
-            # 构建价格矩阵
-            price_dfs = {}
-            for symbol, data in portfolio_data.items():
-                df = pd.DataFrame(data)
-                df['date'] = pd.to_datetime(df['date'])
-                df = df.set_index('date')['close']
-                price_dfs[symbol] = df
-            
-            # 合并所有股票数据
-            prices = pd.DataFrame(price_dfs)
-            returns = prices.pct_change().dropna()
+            panel = ReturnsPanel.from_price_data(portfolio_data)
+            metrics = panel.analyze(panel.weight_matrix([None]), 0.05)
             
-            # 计算相关性矩阵
-            correlation_matrix = returns.corr()
+            cov = panel.covariance()
+            asset_vol = np.sqrt(np.diag(cov))
             
-            # 计算组合统计
-            portfolio_return = returns.mean().mean() * 252  # 年化收益
-            portfolio_vol = returns.std().mean() * np.sqrt(252)  # 年化波动率
+            # 组合统计（等权重：收益为平均日收益年化，波动率为各股票年化波动率的平均值）
+            portfolio_return = float(metrics['annual_return'][0])
+            portfolio_vol = float(asset_vol.mean() * np.sqrt(TRADING_DAYS))
             
-            # 计算最优权重（简化版本）
-            optimal_weights = self._calculate_optimal_weights(returns)
+            correlation_matrix = pd.DataFrame(panel.correlation(cov), index=panel.symbols, columns=panel.symbols)
             
             analysis = {
                 'portfolio_return': portfolio_return * 100,
                 'portfolio_volatility': portfolio_vol * 100,
                 'sharpe_ratio': portfolio_return / portfolio_vol if portfolio_vol > 0 else 0,
                 'correlation_matrix': correlation_matrix.to_dict(),
-                'optimal_weights': optimal_weights,
-                'diversification_ratio': self._calculate_diversification_ratio(returns),
-                'var_95': self._calculate_var(returns, 0.05) * 100,
-                'expected_shortfall': self._calculate_expected_shortfall(returns, 0.05) * 100
+                'optimal_weights': self._calculate_optimal_weights(panel.symbols),
+                'diversification_ratio': float(metrics['diversification_ratio'][0]),
+                'var_95': float(metrics['var_historical'][0]) * 100,
+                'expected_shortfall': float(metrics['es_historical'][0]) * 100,
+                'parametric_var_95': float(metrics['var_parametric'][0]) * 100,
+                'parametric_expected_shortfall': float(metrics['es_parametric'][0]) * 100,
+                'max_drawdown': float(metrics['max_drawdown'][0]) * 100
             }
             
             return analysis
@@ -128,6 +162,38 @@ class DataAnalyzer:
             logger.error(f"组合分析失败: {str(e)}")
             raise
     
+    def analyze_portfolios(self, portfolio_data: Dict[str, List[Dict]],
+                           weight_sets: Dict[str, Optional[Dict[str, float]]],
+                           confidence_level: float = 0.05) -> Dict[str, Dict[str, float]]:
+        """
+        在同一收益率矩阵上批量分析多个组合
+        
+        Args:
+            portfolio_data: 所有组合涉及股票的价格数据，key为股票代码
+            weight_sets: 组合名 -> {股票代码: 权重}，权重自动归一化，None 表示等权重
+            confidence_level: VaR/ES 的尾部概率
+            
+        Returns:
+            组合名 -> 指标（收益、波动率、VaR、ES、回撤为百分比）
+        """
+        try:
+            panel = ReturnsPanel.from_price_data(portfolio_data)
+            names = list(weight_sets)
+            metrics = panel.analyze(panel.weight_matrix([weight_sets[name] for name in names]), confidence_level)
+            
+            ratio_keys = {'sharpe_ratio', 'diversification_ratio'}
+            return {
+                name: {
+                    key: float(values[i]) * (1 if key in ratio_keys else 100)
+                    for key, values in metrics.items()
+                }
+                for i, name in enumerate(names)
+            }
+            
+        except Exception as e:
+            logger.error(f"批量组合分析失败: {str(e)}")
+            raise
+    
     def _calculate_rsi(self, prices: pd.Series, window: int = 14) -> pd.Series:
         """计算 RSI 指标"""
         delta = prices.diff()
@@ -239,28 +305,8 @@ class DataAnalyzer:
         else:
             return "中下轨区域"
     
-    def _calculate_optimal_weights(self, returns: pd.DataFrame) -> Dict:
+    def _calculate_optimal_weights(self, symbols: List[str]) -> Dict:
         """计算最优权重（等权重简化版本）"""
-        n_assets = len(returns.columns)
-        equal_weight = 1.0 / n_assets
+        equal_weight = 1.0 / len(symbols)
         
-        return {symbol: equal_weight for symbol in returns.columns}
-    
-    def _calculate_diversification_ratio(self, returns: pd.DataFrame) -> float:
-        """计算分散化比率"""
-        weights = np.array([1/len(returns.columns)] * len(returns.columns))
-        portfolio_vol = np.sqrt(np.dot(weights.T, np.dot(returns.cov() * 252, weights)))
-        weighted_avg_vol = np.sum(weights * returns.std() * np.sqrt(252))
-        
-        return weighted_avg_vol / portfolio_vol if portfolio_vol > 0 else 1.0
-    
-    def _calculate_var(self, returns: pd.DataFrame, confidence_level: float) -> float:
-        """计算风险价值 VaR"""
-        portfolio_returns = returns.mean(axis=1)
-        return np.percentile(portfolio_returns, confidence_level * 100)
-    
-    def _calculate_expected_shortfall(self, returns: pd.DataFrame, confidence_level: float) -> float:
-        """计算期望损失 ES"""
-        portfolio_returns = returns.mean(axis=1)
-        var = self._calculate_var(returns, confidence_level)
-        return portfolio_returns[portfolio_returns <= var].mean()
\ No newline at end of file
+        return {symbol: equal_weight for symbol in symbols}
\ No newline at end of file
@@ -2,16 +2,28 @@
 数据库服务 - 股票数据查询和筛选
 """
 
+import asyncio
+
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_, func, desc, asc
 from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
 from models.database import get_db, SessionLocal
 from models.stock_models import Stock, StockPrice, StockFinancial, StockTechnical, StockConcept
+from services.market_snapshot import market_snapshot
+from utils.tiered_cache import tiered_cache
+from config import config
 from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 两级缓存命名空间
+STOCK_DETAIL_CACHE_NAMESPACE = "stock_detail"
+
+# 行情数据有变化时失效股票详情缓存
+market_snapshot.on_change(lambda: tiered_cache.invalidate(STOCK_DETAIL_CACHE_NAMESPACE))
+
 class DatabaseService:
     """数据库服务类"""
     
@@ -22,6 +34,10 @@ class DatabaseService:
         if hasattr(self, 'db'):
             self.db.close()
     
+    def close(self):
+        """关闭数据库会话"""
+        self.db.close()
+    
     def search_stocks_by_conditions(self, conditions: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
         根据结构化条件搜索股票
@@ -33,40 +49,14 @@ class DatabaseService:
             符合条件的股票列表
         """
         try:
-            # 构建基础查询
-            query = self.db.query(Stock).filter(Stock.isActive == True)
-            
-            # 行业筛选
-            sectors = conditions.get('sectors', [])
-            if sectors:
-                sector_filters = []
-                for sector in sectors:
-                    sector_filters.append(Stock.sector.like(f'%{sector}%'))
-                    sector_filters.append(Stock.industry.like(f'%{sector}%'))
-                query = query.filter(or_(*sector_filters))
-            
-            # 市值筛选
-            market_cap = conditions.get('market_cap', 'any')
-            if market_cap != 'any':
-                # 根据市值范围筛选（单位：亿元）
-                if market_cap == 'large':
-                    # 大盘股：市值 > 1000亿
-                    query = query.filter(Stock.marketCap > 100000000000)
-                elif market_cap == 'mid':
-                    # 中盘股：100亿 < 市值 <= 1000亿
-                    query = query.filter(and_(Stock.marketCap > 10000000000, Stock.marketCap <= 100000000000))
-                elif market_cap == 'small':
-                    # 小盘股：市值 <= 100亿
-                    query = query.filter(Stock.marketCap <= 10000000000)
-            
-            # 获取基础股票列表
-            stocks = query.limit(1000).all()  # 限制查询数量
+            # 获取基础股票列表（行业、市值筛选）
+            stocks = self._get_candidate_stocks(conditions)
             
             if not stocks:
                 return []
             
             # 获取股票代码列表
-            symbols = [stock.symbol for stock in stocks]
+            symbols = [stock['symbol'] for stock in stocks]
             
             # 应用财务指标筛选
             filtered_symbols = self._filter_by_financial_metrics(
@@ -83,34 +73,32 @@ class DatabaseService:
             if keywords:
                 filtered_symbols = self._filter_by_keywords(filtered_symbols, keywords)
             
+            # 批量获取候选股票的最新财务、技术、价格数据和概念标签（每类一次查询）
+            filtered_symbols = set(filtered_symbols)
+            matched_symbols = [stock['symbol'] for stock in stocks if stock['symbol'] in filtered_symbols]
+            financial_map = self._get_latest_financial_data_bulk(matched_symbols)
+            technical_map = self._get_latest_technical_data_bulk(matched_symbols)
+            price_map = self._get_latest_price_data_bulk(matched_symbols)
+            concepts_map = self._get_stock_concepts_bulk(matched_symbols)
+            
             # 构建最终结果
             result_stocks = []
             for stock in stocks:
-                if stock.symbol in filtered_symbols:
-                    # 获取最新财务数据
-                    financial_data = self._get_latest_financial_data(stock.symbol)
-                    
-                    # 获取最新技术数据
-                    technical_data = self._get_latest_technical_data(stock.symbol)
-                    
-                    # 获取最新价格数据
-                    price_data = self._get_latest_price_data(stock.symbol)
-                    
-                    # 获取概念标签
-                    concepts = self._get_stock_concepts(stock.symbol)
+                symbol = stock['symbol']
+                if symbol in filtered_symbols:
+                    financial_data = financial_map.get(symbol)
+                    technical_data = technical_map.get(symbol)
+                    concepts = concepts_map.get(symbol, [])
                     
                     stock_info = {
-                        'symbol': stock.symbol,
-                        'name': stock.name,
-                        'sector': stock.sector,
-                        'industry': stock.industry,
-                        'market': stock.market,
-                        'market_cap': stock.marketCap,
+                        **stock,
                         'financial_data': financial_data,
                         'technical_data': technical_data,
-                        'price_data': price_data,
+                        'price_data': price_map.get(symbol),
                         'concepts': concepts,
-                        'match_score': self._calculate_match_score(stock.symbol, conditions)
+                        'match_score': self._calculate_match_score(
+                            symbol, conditions, financial_data, technical_data, concepts
+                        )
                     }
                     result_stocks.append(stock_info)
             
@@ -124,6 +112,78 @@ class DatabaseService:
             logger.error(f"数据库股票搜索失败: {str(e)}")
             return []
     
+    def _get_candidate_stocks(self, conditions: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """按行业和市值筛选基础股票列表，市场快照可用时在内存中完成"""
+        sectors = conditions.get('sectors', [])
+        market_cap = conditions.get('market_cap', 'any')
+        
+        # 市值范围（单位：元）：大盘股 > 1000亿，中盘股 100亿~1000亿，小盘股 <= 100亿
+        market_cap_ranges = {
+            'large': (100000000000, None),
+            'mid': (10000000000, 100000000000),
+            'small': (None, 10000000000)
+        }
+        cap_range = market_cap_ranges.get(market_cap)
+        
+        if market_snapshot.is_ready:
+            frame = market_snapshot.frame
+            mask = np.ones(len(frame), dtype=bool)
+            
+            if sectors:
+                sector_mask = np.zeros(len(frame), dtype=bool)
+                for sector in sectors:
+                    sector_mask |= frame.contains(['sector', 'industry'], sector)
+                mask &= sector_mask
+            
+            if cap_range:
+                caps = frame.column('marketCap')
+                lower, upper = cap_range
+                if lower is not None:
+                    mask &= caps > lower
+                if upper is not None:
+                    mask &= caps <= upper
+            
+            indices = np.flatnonzero(mask)[:1000]  # 限制查询数量
+            return [
+                {
+                    'symbol': record['symbol'],
+                    'name': record['name'],
+                    'sector': record['sector'],
+                    'industry': record['industry'],
+                    'market': record['market'],
+                    'market_cap': record['marketCap']
+                }
+                for record in frame.records(indices)
+            ]
+        
+        query = self.db.query(Stock).filter(Stock.isActive == True)
+        
+        if sectors:
+            sector_filters = []
+            for sector in sectors:
+                sector_filters.append(Stock.sector.like(f'%{sector}%'))
+                sector_filters.append(Stock.industry.like(f'%{sector}%'))
+            query = query.filter(or_(*sector_filters))
+        
+        if cap_range:
+            lower, upper = cap_range
+            if lower is not None:
+                query = query.filter(Stock.marketCap > lower)
+            if upper is not None:
+                query = query.filter(Stock.marketCap <= upper)
+        
+        return [
+            {
+                'symbol': stock.symbol,
+                'name': stock.name,
+                'sector': stock.sector,
+                'industry': stock.industry,
+                'market': stock.market,
+                'market_cap': stock.marketCap
+            }
+            for stock in query.limit(1000).all()  # 限制查询数量
+        ]
+    
     def _filter_by_financial_metrics(self, symbols: List[str], financial_metrics: Dict[str, Any]) -> List[str]:
         """根据财务指标筛选股票"""
         if not financial_metrics or not symbols:
@@ -326,6 +386,143 @@ class DatabaseService:
             logger.error(f"关键词筛选失败: {str(e)}")
             return symbols
     
+    def _get_latest_financial_data_bulk(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取最新财务数据：一次分组子查询取每只股票的最新报告期"""
+        if not symbols:
+            return {}
+        try:
+            latest = (
+                self.db.query(
+                    StockFinancial.symbol,
+                    func.max(StockFinancial.report_date).label('latest_date')
+                )
+                .filter(StockFinancial.symbol.in_(symbols))
+                .group_by(StockFinancial.symbol)
+                .subquery()
+            )
+            rows = (
+                self.db.query(StockFinancial)
+                .join(latest, and_(
+                    StockFinancial.symbol == latest.c.symbol,
+                    StockFinancial.report_date == latest.c.latest_date
+                ))
+                .all()
+            )
+            return {row.symbol: self._serialize_financial(row) for row in rows}
+        except Exception as e:
+            logger.error(f"批量获取财务数据失败: {str(e)}")
+            return {}
+    
+    def _get_latest_technical_data_bulk(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取最新技术数据"""
+        if not symbols:
+            return {}
+        try:
+            latest = (
+                self.db.query(
+                    StockTechnical.symbol,
+                    func.max(StockTechnical.date).label('latest_date')
+                )
+                .filter(StockTechnical.symbol.in_(symbols))
+                .group_by(StockTechnical.symbol)
+                .subquery()
+            )
+            rows = (
+                self.db.query(StockTechnical)
+                .join(latest, and_(
+                    StockTechnical.symbol == latest.c.symbol,
+                    StockTechnical.date == latest.c.latest_date
+                ))
+                .all()
+            )
+            return {row.symbol: self._serialize_technical(row) for row in rows}
+        except Exception as e:
+            logger.error(f"批量获取技术数据失败: {str(e)}")
+            return {}
+    
+    def _get_latest_price_data_bulk(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取最新价格数据"""
+        if not symbols:
+            return {}
+        try:
+            latest = (
+                self.db.query(
+                    StockPrice.symbol,
+                    func.max(StockPrice.date).label('latest_date')
+                )
+                .filter(StockPrice.symbol.in_(symbols))
+                .group_by(StockPrice.symbol)
+                .subquery()
+            )
+            rows = (
+                self.db.query(StockPrice)
+                .join(latest, and_(
+                    StockPrice.symbol == latest.c.symbol,
+                    StockPrice.date == latest.c.latest_date
+                ))
+                .all()
+            )
+            return {row.symbol: self._serialize_price(row) for row in rows}
+        except Exception as e:
+            logger.error(f"批量获取价格数据失败: {str(e)}")
+            return {}
+    
+    def _get_stock_concepts_bulk(self, symbols: List[str]) -> Dict[str, List[str]]:
+        """批量获取股票概念标签"""
+        if not symbols:
+            return {}
+        try:
+            rows = (
+                self.db.query(StockConcept.symbol, StockConcept.concept)
+                .filter(StockConcept.symbol.in_(symbols))
+                .filter(StockConcept.is_active == True)
+                .all()
+            )
+            concepts: Dict[str, List[str]] = {}
+            for row in rows:
+                concepts.setdefault(row.symbol, []).append(row.concept)
+            return concepts
+        except Exception as e:
+            logger.error(f"批量获取概念标签失败: {str(e)}")
+            return {}
+    
+    @staticmethod
+    def _serialize_financial(financial: StockFinancial) -> Dict[str, Any]:
+        """序列化财务数据"""
+        return {
+            'pe_ratio': financial.pe_ratio,
+            'pb_ratio': financial.pb_ratio,
+            'roe': financial.roe,
+            'debt_ratio': financial.debt_ratio,
+            'revenue_growth': financial.revenue_growth,
+            'profit_growth': financial.profit_growth,
+            'report_date': financial.report_date.isoformat() if financial.report_date else None
+        }
+    
+    @staticmethod
+    def _serialize_technical(technical: StockTechnical) -> Dict[str, Any]:
+        """序列化技术数据"""
+        return {
+            'rsi': technical.rsi,
+            'macd': technical.macd,
+            'macd_signal_type': technical.macd_signal_type,
+            'trend_signal': technical.trend_signal,
+            'ma20': technical.ma20,
+            'ma50': technical.ma50,
+            'date': technical.date.isoformat() if technical.date else None
+        }
+    
+    @staticmethod
+    def _serialize_price(price: StockPrice) -> Dict[str, Any]:
+        """序列化价格数据"""
+        return {
+            'close_price': price.close_price,
+            'change_percent': price.change_percent,
+            'volume': price.volume,
+            'turnover': price.turnover,
+            'date': price.date.isoformat() if price.date else None
+        }
+    
     def _get_latest_financial_data(self, symbol: str) -> Optional[Dict[str, Any]]:
         """获取最新财务数据"""
         try:
@@ -337,15 +534,7 @@ class DatabaseService:
             )
             
             if financial:
-                return {
-                    'pe_ratio': financial.pe_ratio,
-                    'pb_ratio': financial.pb_ratio,
-                    'roe': financial.roe,
-                    'debt_ratio': financial.debt_ratio,
-                    'revenue_growth': financial.revenue_growth,
-                    'profit_growth': financial.profit_growth,
-                    'report_date': financial.report_date.isoformat() if financial.report_date else None
-                }
+                return self._serialize_financial(financial)
             return None
         except Exception as e:
             logger.error(f"获取财务数据失败 {symbol}: {str(e)}")
@@ -362,15 +551,7 @@ class DatabaseService:
             )
             
             if technical:
-                return {
-                    'rsi': technical.rsi,
-                    'macd': technical.macd,
-                    'macd_signal_type': technical.macd_signal_type,
-                    'trend_signal': technical.trend_signal,
-                    'ma20': technical.ma20,
-                    'ma50': technical.ma50,
-                    'date': technical.date.isoformat() if technical.date else None
-                }
+                return self._serialize_technical(technical)
             return None
         except Exception as e:
             logger.error(f"获取技术数据失败 {symbol}: {str(e)}")
@@ -387,13 +568,7 @@ class DatabaseService:
             )
             
             if price:
-                return {
-                    'close_price': price.close_price,
-                    'change_percent': price.change_percent,
-                    'volume': price.volume,
-                    'turnover': price.turnover,
-                    'date': price.date.isoformat() if price.date else None
-                }
+                return self._serialize_price(price)
             return None
         except Exception as e:
             logger.error(f"获取价格数据失败 {symbol}: {str(e)}")
@@ -414,8 +589,15 @@ class DatabaseService:
             logger.error(f"获取概念标签失败 {symbol}: {str(e)}")
             return []
     
-    def _calculate_match_score(self, symbol: str, conditions: Dict[str, Any]) -> float:
-        """计算匹配度评分"""
+    def _calculate_match_score(
+        self,
+        symbol: str,
+        conditions: Dict[str, Any],
+        financial_data: Optional[Dict[str, Any]],
+        technical_data: Optional[Dict[str, Any]],
+        concepts: List[str]
+    ) -> float:
+        """计算匹配度评分（使用已批量获取的数据，不再单独查询）"""
         try:
             score = 0.0
             
@@ -425,14 +607,12 @@ class DatabaseService:
             # 关键词匹配加分
             keywords = conditions.get('keywords', [])
             if keywords:
-                concepts = self._get_stock_concepts(symbol)
                 for keyword in keywords:
                     for concept in concepts:
                         if keyword in concept:
                             score += 0.2
             
             # 财务指标匹配加分
-            financial_data = self._get_latest_financial_data(symbol)
             if financial_data:
                 financial_metrics = conditions.get('financial_metrics', {})
                 
@@ -449,7 +629,6 @@ class DatabaseService:
                         score += 0.15
             
             # 技术指标匹配加分
-            technical_data = self._get_latest_technical_data(symbol)
             if technical_data:
                 technical_indicators = conditions.get('technical_indicators', {})
                 
@@ -470,14 +649,37 @@ class DatabaseService:
             return 0.1
     
     def get_stock_detail(self, symbol: str) -> Optional[Dict[str, Any]]:
-        """获取股票详细信息"""
+        """获取股票详细信息（两级缓存，行情快照刷新时整体失效）"""
+        return tiered_cache.get_or_set(
+            STOCK_DETAIL_CACHE_NAMESPACE, symbol,
+            lambda: self._load_stock_detail(symbol),
+            ttl=config.STOCK_DETAIL_CACHE_TTL
+        )
+    
+    async def aget_stock_detail(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """异步获取股票详细信息（未命中时在线程池中用独立会话回源，不阻塞事件循环）"""
+        return await tiered_cache.aget_or_set(
+            STOCK_DETAIL_CACHE_NAMESPACE, symbol,
+            lambda: asyncio.to_thread(self._load_stock_detail_isolated, symbol),
+            ttl=config.STOCK_DETAIL_CACHE_TTL
+        )
+    
+    @staticmethod
+    def _load_stock_detail_isolated(symbol: str) -> Optional[Dict[str, Any]]:
+        """在独立会话中加载股票详细信息（供线程池调用，不与其他线程共享会话）"""
+        service = DatabaseService()
+        try:
+            return service._load_stock_detail(symbol)
+        finally:
+            service.close()
+    
+    def _load_stock_detail(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """从数据库加载股票详细信息"""
         try:
             stock = self.db.query(Stock).filter(Stock.symbol == symbol).first()
             if not stock:
                 return None
             
-
-            
             return {
                 'basic_info': {
                     'symbol': stock.symbol,
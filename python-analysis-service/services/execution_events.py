@@ -0,0 +1,181 @@
+"""
+工作流执行事件总线
+节点/智能体状态变化时发布事件，订阅者通过SSE实时接收，替代轮询状态接口：
+- 每个执行一个频道，事件ID在频道内单调递增
+- 频道保留最近的事件，客户端断线后带上最后收到的事件ID即可补发遗漏的事件
+- 执行结束后频道关闭，保留一段时间供晚到的订阅者补发，然后清理
+- 订阅者消费过慢（队列满）时断开，由客户端带事件ID重连补发
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Set
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ExecutionEvent:
+    """一条执行事件"""
+    id: int
+    type: str
+    data: Dict[str, Any]
+
+    def to_sse(self) -> str:
+        """SSE格式（与其他流式接口一致，事件类型放在 data.type 中）"""
+        payload = json.dumps({"type": self.type, "eventId": self.id, **self.data}, ensure_ascii=False, default=str)
+        return f"id: {self.id}\ndata: {payload}\n\n"
+
+
+class _Channel:
+    """单个执行的事件频道"""
+
+    def __init__(self, history_size: int):
+        self.events: Deque[ExecutionEvent] = deque(maxlen=history_size)
+        self.last_id = 0
+        self.subscribers: Set["Subscription"] = set()
+        self.closed_at: Optional[float] = None
+
+
+class Subscription:
+    """一个订阅：先补发断线期间遗漏的事件，再接收实时事件"""
+
+    _CLOSED = object()
+
+    def __init__(self, bus: "ExecutionEventBus", topic: str, channel: _Channel, last_event_id: Optional[int]):
+        self.bus = bus
+        self.topic = topic
+        self.channel = channel
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=bus.queue_size)
+        self.overflowed = False
+
+        oldest = channel.events[0].id if channel.events else channel.last_id + 1
+        # 没有事件ID、事件已被挤出缓冲区、或事件ID来自其他进程时需要客户端先拿一次完整快照
+        self.needs_snapshot = (
+            last_event_id is None
+            or last_event_id < oldest - 1
+            or last_event_id > channel.last_id
+        )
+        after = channel.last_id if self.needs_snapshot else last_event_id
+        self.backlog = [event for event in channel.events if event.id > after]
+        self.last_id = channel.last_id
+        if channel.closed_at is None:
+            channel.subscribers.add(self)
+
+    def push(self, event: Any) -> None:
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            logger.warning(f"事件订阅者消费过慢，断开订阅: {self.topic}")
+
+    async def events(self, heartbeat: Optional[float] = None) -> AsyncIterator[Optional[ExecutionEvent]]:
+        """
+        依次产出事件；超过 heartbeat 秒没有事件时产出 None（用于发送心跳）
+        频道关闭或订阅溢出时结束
+        """
+        try:
+            for event in self.backlog:
+                yield event
+            if self.channel.closed_at is not None:
+                return
+
+            while not self.overflowed:
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if item is self._CLOSED:
+                    return
+                yield item
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        self.channel.subscribers.discard(self)
+
+
+class ExecutionEventBus:
+    """进程内事件总线（频道只存在于执行所在的worker）"""
+
+    def __init__(self, history_size: int = 500, retention: float = 600, queue_size: int = 1000):
+        """
+        Args:
+            history_size: 每个频道保留的事件数（可补发的范围）
+            retention: 频道关闭后保留的时间（秒）
+            queue_size: 每个订阅者的待发送事件上限
+        """
+        self.history_size = history_size
+        self.retention = retention
+        self.queue_size = queue_size
+        self._channels: Dict[str, _Channel] = {}
+
+    def open(self, topic: str) -> None:
+        """创建（或重新打开）频道"""
+        self._purge()
+        channel = self._channels.get(topic)
+        if channel is None or channel.closed_at is not None:
+            self._channels[topic] = _Channel(self.history_size)
+
+    def has_topic(self, topic: str) -> bool:
+        return topic in self._channels
+
+    def publish(self, topic: str, event_type: str, data: Dict[str, Any]) -> Optional[ExecutionEvent]:
+        """发布事件（频道已关闭时忽略）"""
+        channel = self._channels.get(topic)
+        if channel is None:
+            self.open(topic)
+            channel = self._channels[topic]
+        if channel.closed_at is not None:
+            return None
+
+        channel.last_id += 1
+        event = ExecutionEvent(channel.last_id, event_type, data)
+        channel.events.append(event)
+        for subscription in list(channel.subscribers):
+            subscription.push(event)
+        return event
+
+    def close(self, topic: str) -> None:
+        """关闭频道：通知订阅者结束，保留事件供补发"""
+        channel = self._channels.get(topic)
+        if channel is None or channel.closed_at is not None:
+            return
+        channel.closed_at = time.monotonic()
+        for subscription in list(channel.subscribers):
+            subscription.push(Subscription._CLOSED)
+        channel.subscribers.clear()
+
+    def subscribe(self, topic: str, last_event_id: Optional[int] = None) -> Optional[Subscription]:
+        """订阅频道，频道不存在时返回None"""
+        self._purge()
+        channel = self._channels.get(topic)
+        if channel is None:
+            return None
+        return Subscription(self, topic, channel, last_event_id)
+
+    def _purge(self) -> None:
+        """清理关闭超过保留时间的频道"""
+        now = time.monotonic()
+        expired = [
+            topic for topic, channel in self._channels.items()
+            if channel.closed_at is not None and now - channel.closed_at > self.retention
+        ]
+        for topic in expired:
+            del self._channels[topic]
+
+
+# 全局执行事件总线
+execution_event_bus = ExecutionEventBus(
+    history_size=config.WORKFLOW_EVENT_HISTORY,
+    retention=config.WORKFLOW_EVENT_RETENTION,
+)
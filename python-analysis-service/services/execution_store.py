@@ -0,0 +1,372 @@
+"""
+工作流执行状态存储
+替代模块级字典保存工作流、工作流定义执行和对话状态：
+- 内存中按LRU保留有限条目，超过上限时只淘汰已结束且未被固定的条目，运行中的条目始终保留
+- 状态快照由后台线程写入 workflow_execution_states 表（同一条目的多次保存合并为最后一次）
+- 内存未命中时从数据库读取，任意worker都能查询其他worker上的执行状态（异步接口在线程池中读取）
+- 运行中的条目按间隔检查点写库，结束时立即写库
+"""
+
+import asyncio
+import atexit
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, MutableMapping, Optional, Tuple
+
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from config import config
+from models.database import SessionLocal
+from models.workflow_models import WorkflowExecutionState
+
+logger = logging.getLogger(__name__)
+
+# 已结束的状态（可以从内存淘汰）
+TERMINAL_STATUSES = {"completed", "error", "stopped"}
+
+
+def is_terminal(value: Any) -> bool:
+    """状态字典是否已结束"""
+    return isinstance(value, dict) and value.get("status") in TERMINAL_STATUSES
+
+
+class ExecutionStateWriter:
+    """状态快照后台写入线程：按 (类型, ID) 合并待写快照，批量 upsert"""
+
+    def __init__(self, linger: float = 0.2, session_factory: Callable = SessionLocal):
+        """
+        Args:
+            linger: 收到第一个快照后等待更多快照合并成批的时间（秒）
+            session_factory: 数据库会话工厂
+        """
+        self.linger = linger
+        self.session_factory = session_factory
+        self._pending: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._writing = 0
+        self._stopping = False
+        self._stats = {"submitted": 0, "written": 0, "failed": 0, "batches": 0}
+
+    def submit(self, row: Dict[str, Any]) -> None:
+        """提交一条状态快照（立即返回，同一条目未写入的旧快照被替换）"""
+        key = (row["kind"], row["state_id"])
+        with self._condition:
+            self._pending.pop(key, None)
+            self._pending[key] = row
+            self._stats["submitted"] += 1
+            self._ensure_started()
+            self._condition.notify()
+
+    def pending(self, kind: str, state_id: str) -> Optional[Dict[str, Any]]:
+        """尚未写入数据库的快照"""
+        with self._condition:
+            return self._pending.get((kind, state_id))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待已提交的快照全部写入"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._pending or self._writing:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """写完剩余快照后停止后台线程"""
+        with self._condition:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return
+            self._stopping = True
+            self._condition.notify_all()
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning(f"执行状态未在 {timeout}s 内写完，剩余 {len(self._pending)} 条")
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._stats, "pending": len(self._pending)}
+
+    def _ensure_started(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="execution-state-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopping:
+                    self._condition.wait()
+                if not self._pending and self._stopping:
+                    return
+                stopping = self._stopping
+
+            if not stopping:
+                time.sleep(self.linger)
+
+            with self._condition:
+                rows = list(self._pending.values())
+                self._pending.clear()
+                self._writing += 1
+            try:
+                self._write(rows)
+            finally:
+                with self._condition:
+                    self._writing -= 1
+                    self._condition.notify_all()
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        db = self.session_factory()
+        try:
+            if db.get_bind().dialect.name == 'mysql':
+                stmt = mysql_insert(WorkflowExecutionState.__table__).values(rows)
+                db.execute(stmt.on_duplicate_key_update(
+                    user_id=stmt.inserted.user_id,
+                    status=stmt.inserted.status,
+                    payload=stmt.inserted.payload,
+                    updated_at=stmt.inserted.updated_at,
+                ))
+            else:
+                # 其他数据库没有 ON DUPLICATE KEY UPDATE，按主键逐条合并
+                for row in rows:
+                    db.merge(WorkflowExecutionState(**row))
+            db.commit()
+            self._stats["written"] += len(rows)
+            self._stats["batches"] += 1
+        except Exception as e:
+            db.rollback()
+            self._stats["failed"] += len(rows)
+            logger.error(f"写入执行状态失败({len(rows)}条): {e}")
+        finally:
+            db.close()
+
+
+class ExecutionStore(MutableMapping):
+    """
+    执行状态存储，字典接口：
+    - store[id] / store.get(id)：先查内存，再查未写入的快照，最后查数据库
+    - store[id] = value：放入内存并立即写库
+    - 原地修改状态后调用 checkpoint(id)（按间隔写库）或 save(id)（立即写库）
+    - 后台任务仍在修改的条目用 pin(id)/unpin(id) 固定，固定期间不会被淘汰
+    - 异步代码使用 aget/acontains/alist_by_user，内存未命中时不在事件循环中读库
+    - 遍历和 len() 只覆盖当前worker内存中的条目
+    """
+
+    def __init__(self, kind: str, max_entries: int = 1000, checkpoint_interval: float = 2.0,
+                 writer: Optional[ExecutionStateWriter] = None, session_factory: Callable = SessionLocal,
+                 is_finished: Callable[[Any], bool] = is_terminal):
+        """
+        Args:
+            kind: 状态类型（同一张表中区分工作流、执行和对话）
+            max_entries: 内存中最多保留的条目数（运行中的条目不计入淘汰）
+            checkpoint_interval: 运行中条目两次写库的最小间隔（秒）
+            writer: 后台写入线程
+            session_factory: 数据库会话工厂（读取用）
+            is_finished: 判断条目是否已结束、可以淘汰
+        """
+        self.kind = kind
+        self.max_entries = max_entries
+        self.checkpoint_interval = checkpoint_interval
+        self.writer = writer or execution_state_writer
+        self.session_factory = session_factory
+        self.is_finished = is_finished
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._saved_at: Dict[str, float] = {}
+        self._pinned: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    def __getitem__(self, state_id: str) -> Any:
+        value = self.get(state_id)
+        if value is None:
+            raise KeyError(state_id)
+        return value
+
+    def __setitem__(self, state_id: str, value: Any) -> None:
+        with self._lock:
+            self._entries[state_id] = value
+            self._entries.move_to_end(state_id)
+        self.save(state_id)
+        self._evict()
+
+    def __delitem__(self, state_id: str) -> None:
+        with self._lock:
+            del self._entries[state_id]
+            self._saved_at.pop(state_id, None)
+
+    def __contains__(self, state_id: object) -> bool:
+        return isinstance(state_id, str) and self.get(state_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, state_id: str, default: Any = None) -> Any:
+        with self._lock:
+            if state_id in self._entries:
+                self._entries.move_to_end(state_id)
+                return self._entries[state_id]
+
+        value = self._load(state_id)
+        if value is None:
+            return default
+
+        # 其他worker上运行中的状态随时在变化，只缓存已结束的状态
+        if self.is_finished(value):
+            with self._lock:
+                self._entries.setdefault(state_id, value)
+            self._evict()
+        return value
+
+    async def aget(self, state_id: str, default: Any = None) -> Any:
+        """get 的异步版本：内存命中直接返回，未命中时在线程池中读取"""
+        with self._lock:
+            if state_id in self._entries:
+                self._entries.move_to_end(state_id)
+                return self._entries[state_id]
+        return await asyncio.to_thread(self.get, state_id, default)
+
+    async def acontains(self, state_id: str) -> bool:
+        return await self.aget(state_id) is not None
+
+    def pin(self, state_id: str) -> None:
+        """固定条目（后台任务仍在修改），固定期间即使已结束也不淘汰"""
+        with self._lock:
+            self._pinned[state_id] = self._pinned.get(state_id, 0) + 1
+
+    def unpin(self, state_id: str) -> None:
+        with self._lock:
+            count = self._pinned.pop(state_id, 0) - 1
+            if count > 0:
+                self._pinned[state_id] = count
+        self._evict()
+
+    def is_local(self, state_id: str) -> bool:
+        """条目是否在当前worker内存中（运行中的执行只存在于执行它的worker）"""
+        return state_id in self._entries
+
+    def save(self, state_id: str, value: Any = None) -> None:
+        """
+        立即把状态提交给后台写入
+        传入 value 时写入该值（条目已被淘汰时重新放回内存），否则写入内存中的当前值
+        """
+        with self._lock:
+            if value is not None:
+                self._entries[state_id] = value
+                self._entries.move_to_end(state_id)
+            else:
+                value = self._entries.get(state_id)
+                if value is None:
+                    logger.warning(f"保存的执行状态不在内存中: {self.kind}/{state_id}")
+                    return
+            self._saved_at[state_id] = time.monotonic()
+            row = self._row(state_id, value)
+        if row is not None:
+            self.writer.submit(row)
+
+    def checkpoint(self, state_id: str) -> None:
+        """状态原地修改后调用：已结束立即写库，运行中距上次写库超过间隔才写库"""
+        with self._lock:
+            value = self._entries.get(state_id)
+            if value is None:
+                return
+            due = time.monotonic() - self._saved_at.get(state_id, 0.0) >= self.checkpoint_interval
+        if due or self.is_finished(value):
+            self.save(state_id)
+            self._evict()
+
+    def list_by_user(self, user_id: str, limit: int = 100) -> List[Any]:
+        """某个用户的条目（内存与数据库合并，最近更新的在前）"""
+        with self._lock:
+            local = {
+                state_id: value for state_id, value in reversed(self._entries.items())
+                if isinstance(value, dict) and value.get("user_id") == user_id
+            }
+
+        db = self.session_factory()
+        try:
+            rows = (
+                db.query(WorkflowExecutionState)
+                .filter(WorkflowExecutionState.kind == self.kind, WorkflowExecutionState.user_id == user_id)
+                .order_by(WorkflowExecutionState.updated_at.desc())
+                .limit(limit)
+                .all()
+            )
+            for row in rows:
+                if row.state_id not in local:
+                    local[row.state_id] = json.loads(row.payload)
+        except Exception as e:
+            logger.error(f"查询用户执行状态失败: {self.kind}/{user_id}, 错误: {e}")
+        finally:
+            db.close()
+
+        return list(local.values())[:limit]
+
+    async def alist_by_user(self, user_id: str, limit: int = 100) -> List[Any]:
+        """list_by_user 的异步版本（在线程池中查询数据库）"""
+        return await asyncio.to_thread(self.list_by_user, user_id, limit)
+
+    def _row(self, state_id: str, value: Any) -> Optional[Dict[str, Any]]:
+        try:
+            payload = json.dumps(value, ensure_ascii=False, default=str)
+        except Exception as e:
+            logger.error(f"序列化执行状态失败: {self.kind}/{state_id}, 错误: {e}")
+            return None
+        fields = value if isinstance(value, dict) else {}
+        return {
+            "kind": self.kind,
+            "state_id": state_id,
+            "user_id": fields.get("user_id"),
+            "status": fields.get("status"),
+            "payload": payload,
+            "updated_at": datetime.utcnow(),
+        }
+
+    def _load(self, state_id: str) -> Any:
+        pending = self.writer.pending(self.kind, state_id)
+        if pending is not None:
+            return json.loads(pending["payload"])
+
+        db = self.session_factory()
+        try:
+            row = db.get(WorkflowExecutionState, (self.kind, state_id))
+            return json.loads(row.payload) if row is not None else None
+        except Exception as e:
+            logger.error(f"读取执行状态失败: {self.kind}/{state_id}, 错误: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _evict(self) -> None:
+        """超过上限时按LRU顺序淘汰已结束且未固定的条目（淘汰前写库）"""
+        evicted = []
+        with self._lock:
+            overflow = len(self._entries) - self.max_entries
+            if overflow <= 0:
+                return
+            for state_id, value in self._entries.items():
+                if len(evicted) >= overflow:
+                    break
+                if self.is_finished(value) and state_id not in self._pinned:
+                    evicted.append((state_id, self._row(state_id, value)))
+            for state_id, _ in evicted:
+                del self._entries[state_id]
+                self._saved_at.pop(state_id, None)
+
+        for _, row in evicted:
+            if row is not None:
+                self.writer.submit(row)
+
+
+# 全局执行状态写入线程
+execution_state_writer = ExecutionStateWriter(linger=config.WORKFLOW_STATE_WRITE_LINGER)
+atexit.register(execution_state_writer.stop)
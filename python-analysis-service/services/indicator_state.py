@@ -0,0 +1,366 @@
+"""
+增量技术指标引擎
+为每只股票保存滚动状态（窗口累加和、EMA分子分母、收益率的Welford统计等），
+新K线到来时 O(1) 更新，结果与 DataAnalyzer.analyze_stock_performance 的全量计算一致；
+状态序列化为JSON持久化到SQLite，服务重启或多次请求之间无需重算全部历史
+"""
+
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+NAN = float("nan")
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS indicator_state (
+    symbol TEXT PRIMARY KEY,
+    last_date TEXT NOT NULL,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class RollingWindow:
+    """定长滑动窗口，O(1)维护累加和与平方和；每满一个窗口按窗口内数据重算一次，避免浮点误差累积"""
+
+    def __init__(self, size: int, values: Optional[Iterable[float]] = None):
+        self.size = size
+        self.values: deque = deque(values or [], maxlen=size)
+        self._resync()
+
+    def push(self, value: float) -> None:
+        if len(self.values) == self.size:
+            old = self.values[0]
+            self.sum -= old
+            self.sumsq -= old * old
+        self.values.append(value)
+        self.sum += value
+        self.sumsq += value * value
+        self._pushes += 1
+        if self._pushes >= self.size:
+            self._resync()
+
+    @property
+    def full(self) -> bool:
+        return len(self.values) == self.size
+
+    def mean(self) -> float:
+        return self.sum / self.size if self.full else NAN
+
+    def std(self) -> float:
+        """样本标准差（ddof=1，与 pandas rolling().std() 一致）"""
+        if not self.full or self.size < 2:
+            return NAN
+        variance = (self.sumsq - self.sum * self.sum / self.size) / (self.size - 1)
+        return math.sqrt(max(variance, 0.0))
+
+    def _resync(self) -> None:
+        self.sum = math.fsum(self.values)
+        self.sumsq = math.fsum(v * v for v in self.values)
+        self._pushes = 0
+
+
+class EMA:
+    """指数移动平均（等价于 pandas ewm(span=span).mean()，即 adjust=True）"""
+
+    def __init__(self, span: int, numerator: float = 0.0, denominator: float = 0.0):
+        self.span = span
+        self.decay = 1 - 2 / (span + 1)
+        self.numerator = numerator
+        self.denominator = denominator
+
+    def push(self, value: float) -> float:
+        self.numerator = value + self.decay * self.numerator
+        self.denominator = 1 + self.decay * self.denominator
+        return self.value
+
+    @property
+    def value(self) -> float:
+        return self.numerator / self.denominator if self.denominator else NAN
+
+
+class StreamingIndicators:
+    """单只股票的增量指标状态"""
+
+    def __init__(self):
+        self.count = 0
+        self.last_date: Optional[str] = None
+        self.first_close = NAN
+        self.last_close = NAN
+
+        self.sma_20 = RollingWindow(20)
+        self.sma_50 = RollingWindow(50)
+        self.gains = RollingWindow(14)
+        self.losses = RollingWindow(14)
+        self.return_window = RollingWindow(20)
+        self.ema_fast = EMA(12)
+        self.ema_slow = EMA(26)
+        self.ema_signal = EMA(9)
+
+        # 全部收益率的 Welford 统计（均值、方差）
+        self.return_count = 0
+        self.return_mean = 0.0
+        self.return_m2 = 0.0
+
+        # 最大回撤（峰值从第2根K线起算，与 pct_change().cumprod() 的口径一致）
+        self.peak = NAN
+        self.max_drawdown = NAN
+
+        # 支撑阻力位只需要最近29根K线的最高/最低价
+        self.highs: deque = deque(maxlen=29)
+        self.lows: deque = deque(maxlen=29)
+
+    def update(self, date: Any, high: float, low: float, close: float) -> None:
+        """追加一根K线"""
+        close = float(close)
+        if self.count == 0:
+            self.first_close = close
+            self.gains.push(0.0)
+            self.losses.push(0.0)
+        else:
+            delta = close - self.last_close
+            self.gains.push(max(delta, 0.0))
+            self.losses.push(max(-delta, 0.0))
+
+            ret = close / self.last_close - 1
+            self.return_window.push(ret)
+            self.return_count += 1
+            diff = ret - self.return_mean
+            self.return_mean += diff / self.return_count
+            self.return_m2 += diff * (ret - self.return_mean)
+
+            self.peak = close if math.isnan(self.peak) else max(self.peak, close)
+            drawdown = close / self.peak - 1
+            self.max_drawdown = drawdown if math.isnan(self.max_drawdown) else min(self.max_drawdown, drawdown)
+
+        self.sma_20.push(close)
+        self.sma_50.push(close)
+        macd = self.ema_fast.push(close) - self.ema_slow.push(close)
+        self.ema_signal.push(macd)
+        self.highs.append(float(high))
+        self.lows.append(float(low))
+
+        self.last_close = close
+        self.last_date = _date_key(date)
+        self.count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前指标，字段与 DataAnalyzer.analyze_stock_performance 的返回值一致"""
+        close = self.last_close
+        sma_20 = self.sma_20.mean()
+        sma_50 = self.sma_50.mean()
+        macd = self.ema_fast.value - self.ema_slow.value
+        bb_std = self.sma_20.std()
+        return_std = math.sqrt(self.return_m2 / (self.return_count - 1)) if self.return_count > 1 else NAN
+
+        return {
+            "total_return": (close / self.first_close - 1) * 100,
+            "annualized_return": _annualized_return(self.return_mean if self.return_count else NAN),
+            "volatility": self.return_window.std() * math.sqrt(252) * 100,
+            "sharpe_ratio": _sharpe_ratio(self.return_mean if self.return_count else NAN, return_std),
+            "max_drawdown": self.max_drawdown * 100,
+            "current_rsi": self._rsi(),
+            "trend_signal": _trend_signal(close, sma_20, sma_50),
+            "support_resistance": {
+                "resistance": max(self.highs) if self.count >= 10 else NAN,
+                "support": min(self.lows) if self.count >= 10 else NAN,
+            },
+            "technical_indicators": {
+                "sma_20": sma_20,
+                "sma_50": sma_50,
+                "macd": macd,
+                "macd_signal": self.ema_signal.value,
+                "bb_position": _bollinger_position(close, sma_20 + 2 * bb_std, sma_20, sma_20 - 2 * bb_std),
+            },
+        }
+
+    def _rsi(self) -> float:
+        gain, loss = self.gains.mean(), self.losses.mean()
+        if math.isnan(gain) or math.isnan(loss) or (gain == 0 and loss == 0):
+            return NAN
+        if loss == 0:
+            return 100.0
+        return 100 - 100 / (1 + gain / loss)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为可JSON编码的字典"""
+        return {
+            "count": self.count,
+            "last_date": self.last_date,
+            "first_close": self.first_close,
+            "last_close": self.last_close,
+            "windows": {name: list(getattr(self, name).values) for name in _WINDOWS},
+            "emas": {name: [getattr(self, name).numerator, getattr(self, name).denominator] for name in _EMAS},
+            "returns": [self.return_count, self.return_mean, self.return_m2],
+            "drawdown": [self.peak, self.max_drawdown],
+            "highs": list(self.highs),
+            "lows": list(self.lows),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StreamingIndicators":
+        state = cls()
+        state.count = data["count"]
+        state.last_date = data["last_date"]
+        state.first_close = data["first_close"]
+        state.last_close = data["last_close"]
+        for name, values in data["windows"].items():
+            window = getattr(state, name)
+            setattr(state, name, RollingWindow(window.size, values))
+        for name, (numerator, denominator) in data["emas"].items():
+            ema = getattr(state, name)
+            setattr(state, name, EMA(ema.span, numerator, denominator))
+        state.return_count, state.return_mean, state.return_m2 = data["returns"]
+        state.peak, state.max_drawdown = data["drawdown"]
+        state.highs.extend(data["highs"])
+        state.lows.extend(data["lows"])
+        return state
+
+
+_WINDOWS = ["sma_20", "sma_50", "gains", "losses", "return_window"]
+_EMAS = ["ema_fast", "ema_slow", "ema_signal"]
+
+
+def _date_key(value: Any) -> str:
+    """统一日期格式，便于比较新旧K线"""
+    return pd.Timestamp(value).isoformat()
+
+
+def _annualized_return(mean_return: float) -> float:
+    """与 DataAnalyzer._calculate_annualized_return 一致"""
+    base = 1 + mean_return
+    if base <= 0:
+        return -0.9999
+    try:
+        result = base ** 252 - 1
+        if result > 99.99:
+            return 99.99
+        elif result < -0.9999:
+            return -0.9999
+        return result
+    except (OverflowError, ValueError):
+        return 99.99 if base > 1 else -0.9999
+
+
+def _sharpe_ratio(mean_return: float, std: float, risk_free_rate: float = 0.02) -> float:
+    excess_returns = mean_return * 252 - risk_free_rate
+    volatility = std * math.sqrt(252)
+    return excess_returns / volatility if volatility > 0 else 0
+
+
+def _trend_signal(close: float, sma_20: float, sma_50: float) -> str:
+    if close > sma_20 > sma_50:
+        return "强势上涨"
+    elif close > sma_20 and sma_20 < sma_50:
+        return "弱势上涨"
+    elif close < sma_20 < sma_50:
+        return "强势下跌"
+    else:
+        return "弱势下跌"
+
+
+def _bollinger_position(close: float, upper: float, middle: float, lower: float) -> str:
+    if close > upper:
+        return "超买区域"
+    elif close < lower:
+        return "超卖区域"
+    elif close > middle:
+        return "中上轨区域"
+    else:
+        return "中下轨区域"
+
+
+class IndicatorStateStore:
+    """按股票代码持久化增量指标状态（SQLite，线程安全）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def get_many(self, symbols: List[str]) -> Dict[str, StreamingIndicators]:
+        """读取多只股票的状态，没有状态的股票不在结果中"""
+        if not symbols:
+            return {}
+        placeholders = ", ".join("?" * len(symbols))
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT symbol, state FROM indicator_state WHERE symbol IN ({placeholders})", list(symbols)
+            ).fetchall()
+
+        states = {}
+        for symbol, payload in rows:
+            try:
+                states[symbol] = StreamingIndicators.from_dict(json.loads(payload))
+            except Exception as e:
+                logger.warning(f"指标状态损坏，将从头计算 {symbol}: {e}")
+        return states
+
+    def put_many(self, states: Dict[str, StreamingIndicators]) -> None:
+        """批量保存状态"""
+        if not states:
+            return
+        now = time.time()
+        rows = [
+            (symbol, state.last_date, json.dumps(state.to_dict()), now)
+            for symbol, state in states.items()
+        ]
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO indicator_state (symbol, last_date, state, updated_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            conn.commit()
+
+    def delete(self, symbol: str) -> None:
+        """删除状态（历史数据被修正后需要从头重算时使用）"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM indicator_state WHERE symbol = ?", (symbol,))
+            conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """延迟打开数据库连接（调用方需持有锁）"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(CREATE_TABLE_SQL)
+            self._conn.commit()
+        return self._conn
+
+
+def is_append(state: StreamingIndicators, bars: List[Dict]) -> bool:
+    """传入的K线是否全部晚于状态的最新日期（可以增量追加）"""
+    return state.last_date is None or min(_date_key(bar["date"]) for bar in bars) > state.last_date
+
+
+def apply_bars(state: Optional[StreamingIndicators], bars: List[Dict]) -> StreamingIndicators:
+    """把晚于状态最新日期的K线按日期顺序追加到状态中（没有状态时从头计算）"""
+    state = state or StreamingIndicators()
+    for bar in sorted(bars, key=lambda item: _date_key(item["date"])):
+        if state.last_date is not None and _date_key(bar["date"]) <= state.last_date:
+            continue
+        state.update(bar["date"], bar["high"], bar["low"], bar["close"])
+    return state
+
+
+# 全局指标状态存储
+indicator_state_store = IndicatorStateStore(config.INDICATOR_STATE_PATH)
@@ -7,9 +7,8 @@ import logging
 import re
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
-import dashscope
-from dashscope import Generation
 from config import config
+from services.llm_client import llm_client
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +16,7 @@ logger = logging.getLogger(__name__)
 class StructuredCondition:
     """结构化查询条件"""
     field: str  # 字段名
-    operator: str  # 操作符: >, <, >=, <=, =, !=, between, in
+    operator: str  # 操作符: >, <, >=, <=, =, !=, between, not_between, in, not_in, top_percent, bottom_percent
     value: Any  # 值
     period: Optional[str] = None  # 时间周期，如"3y"表示3年
     
@@ -32,6 +31,37 @@ class StructuredCondition:
             result["period"] = self.period
         return result
 
+@dataclass
+class ConditionGroup:
+    """条件组 - 以AND/OR组合多个结构化条件，可嵌套"""
+    logic: str  # 逻辑关系: and, or
+    conditions: List[Any]  # StructuredCondition 或 ConditionGroup
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典格式"""
+        return {
+            "logic": self.logic,
+            "conditions": [condition.to_dict() for condition in self.conditions]
+        }
+
+def parse_structured_condition(condition_dict: Dict[str, Any]):
+    """从字典解析结构化条件，包含 conditions 字段时解析为条件组"""
+    if isinstance(condition_dict.get("conditions"), list):
+        return ConditionGroup(
+            logic=str(condition_dict.get("logic", "and")).lower(),
+            conditions=[
+                parse_structured_condition(child)
+                for child in condition_dict["conditions"]
+                if isinstance(child, dict)
+            ]
+        )
+    return StructuredCondition(
+        field=condition_dict.get("field", ""),
+        operator=condition_dict.get("operator", "="),
+        value=condition_dict.get("value", ""),
+        period=condition_dict.get("period")
+    )
+
 @dataclass
 class KeywordAnalysis:
     """关键词分析结果"""
@@ -41,7 +71,7 @@ class KeywordAnalysis:
     concept_keywords: List[str]  # 概念关键词
     financial_keywords: List[str]  # 财务指标关键词
     technical_keywords: List[str]  # 技术指标关键词
-    structured_conditions: List[StructuredCondition]  # 结构化查询条件
+    structured_conditions: List[Any]  # 结构化查询条件（StructuredCondition 或 ConditionGroup）
     sentiment: str  # 情感倾向: positive, negative, neutral
     intent: str  # 查询意图: search, analysis, recommendation
     confidence: float  # 分析置信度
@@ -66,8 +96,6 @@ class KeywordAnalyzer:
     
     def __init__(self):
         """初始化分析器"""
-        dashscope.api_key = config.DASHSCOPE_API_KEY
-        
         # 预定义关键词库
         self.industry_keywords = {
             "银行": ["银行", "金融", "存款", "贷款", "利息"],
@@ -106,14 +134,14 @@ class KeywordAnalyzer:
         ]
     
     async def analyze_keywords(self, query: str) -> KeywordAnalysis:
-        """分析关键词 - 每次都用AI重新分析，结合本地规则"""
+        """分析关键词 - AI分析（带响应缓存）结合本地规则"""
         try:
             logger.info(f"开始分析关键词: {query}")
             
             # 先进行规则分析作为基础
             rule_analysis = self._rule_based_analyze(query)
             
-            # 每次都使用AI分析，不使用缓存
+            # 使用AI分析（相同或相似问题命中响应缓存）
             try:
                 logger.info("使用AI进行关键词分析")
                 ai_analysis = await self._ai_analyze_fast(query)
@@ -162,21 +190,21 @@ class KeywordAnalyzer:
         """
         
         try:
-            response = Generation.call(
-                model=config.QWEN_MODEL,
+            content = await llm_client.generate(
                 prompt=prompt,
+                model=config.QWEN_MODEL,
                 max_tokens=config.QWEN_MAX_TOKENS,
-                temperature=config.QWEN_TEMPERATURE
+                temperature=config.QWEN_TEMPERATURE,
+                use_cache=True,
+                cache_query=query
             )
             
-            if response.status_code == 200:
-                content = response.output.text.strip()
-                # 尝试解析JSON
-                import json
-                # 提取JSON部分
-                json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                if json_match:
-                    return json.loads(json_match.group())
+            # 尝试解析JSON
+            import json
+            # 提取JSON部分
+            json_match = re.search(r'\{.*\}', content, re.DOTALL)
+            if json_match:
+                return json.loads(json_match.group())
             
             return {}
             
@@ -309,12 +337,7 @@ class KeywordAnalyzer:
         ai_conditions = ai_result.get("structured_conditions", [])
         for condition_dict in ai_conditions:
             if isinstance(condition_dict, dict):
-                structured_conditions.append(StructuredCondition(
-                    field=condition_dict.get("field", ""),
-                    operator=condition_dict.get("operator", "="),
-                    value=condition_dict.get("value", ""),
-                    period=condition_dict.get("period")
-                ))
+                structured_conditions.append(parse_structured_condition(condition_dict))
         
         # 选择置信度更高的结果
         sentiment = ai_result.get("sentiment", rule_result.get("sentiment", "neutral"))
@@ -368,7 +391,9 @@ class KeywordAnalyzer:
 - 低于/小于/少于/以下 -> "<"
 - 等于/是 -> "="
 - 不等于/不是 -> "!="
-- 介于/在...之间 -> "between"
+- 介于/在...之间 -> "between"，value为[最小值, 最大值]
+- 排名前N%/后N% -> "top_percent"/"bottom_percent"，value为N
+- 满足任一条件 -> {{"logic": "or", "conditions": [条件1, 条件2]}}
 
 时间周期格式：
 - 近1年/去年 -> "1y"
@@ -381,19 +406,19 @@ class KeywordAnalyzer:
 重要：只提取用户明确提到的条件，不要添加默认值或示例中的条件。"""
         
         try:
-            response = Generation.call(
-                model=config.QWEN_MODEL,
+            content = await llm_client.generate(
                 prompt=prompt,
+                model=config.QWEN_MODEL,
                 max_tokens=500,  # 增加token以支持结构化条件
-                temperature=0.1  # 降低随机性
+                temperature=0.1,  # 降低随机性
+                use_cache=True,
+                cache_query=query
             )
             
-            if response.status_code == 200:
-                content = response.output.text.strip()
-                import json
-                json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                if json_match:
-                    return json.loads(json_match.group())
+            import json
+            json_match = re.search(r'\{.*\}', content, re.DOTALL)
+            if json_match:
+                return json.loads(json_match.group())
             
             return {}
             
@@ -0,0 +1,323 @@
+"""
+大模型响应缓存
+以 规范化提示词 + 模型 + 温度 的哈希为键，将模型返回文本持久化到SQLite，
+支持TTL过期、按最近访问时间的LRU淘汰，以及可选的相似问题（近似重复）查找
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# 相似查找使用的哈希向量维度
+EMBEDDING_DIM = 512
+
+# 命中时的访问时间先记在内存中，累计到该条数或间隔后批量写回（只影响LRU淘汰顺序）
+ACCESS_FLUSH_BATCH = 100
+ACCESS_FLUSH_INTERVAL = 30
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS llm_response_cache (
+    cache_key TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    model TEXT NOT NULL,
+    temperature REAL NOT NULL,
+    query TEXT,
+    embedding BLOB,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+CREATE_INDEX_SQL = [
+    "CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_response_cache (last_access)",
+    "CREATE INDEX IF NOT EXISTS idx_llm_cache_namespace ON llm_response_cache (namespace)",
+]
+
+
+def normalize_prompt(text: str) -> str:
+    """规范化提示词：全角转半角、统一大小写、合并空白、去掉末尾标点"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("。.！!？?~ ")
+
+
+def embed_query(text: str) -> np.ndarray:
+    """字符 1-gram + 2-gram 哈希向量（L2归一化），无需额外模型依赖"""
+    text = normalize_prompt(text).replace(" ", "")
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    grams = list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+    for gram in grams:
+        digest = hashlib.md5(gram.encode("utf-8")).digest()
+        vector[int.from_bytes(digest[:4], "little") % EMBEDDING_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def _numbers(text: str) -> List[str]:
+    """提取文本中的数字，数字不同的问题（如PE低于10/20）不视为相似"""
+    return re.findall(r"\d+(?:\.\d+)?", normalize_prompt(text))
+
+
+class LLMResponseCache:
+    """SQLite持久化的大模型响应缓存（线程安全）"""
+
+    def __init__(
+        self,
+        path: str,
+        ttl: int = 86400,
+        max_entries: int = 10000,
+        semantic_enabled: bool = False,
+        similarity_threshold: float = 0.92,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.semantic_enabled = semantic_enabled
+        self.similarity_threshold = similarity_threshold
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # 相似查找索引：namespace -> (缓存键列表, 查询列表, 向量矩阵)
+        self._vectors: Dict[str, Tuple[List[str], List[str], np.ndarray]] = {}
+        # 待写回的访问记录：缓存键 -> (最近访问时间, 命中次数)
+        self._pending_access: Dict[str, Tuple[float, int]] = {}
+        self._last_flush = time.monotonic()
+        self._stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(prompt: str, model: str, temperature: float, query: Optional[str] = None) -> str:
+        """生成精确匹配的缓存键（提供query时，问题部分单独规范化）"""
+        if query:
+            text = f"{normalize_prompt(prompt.replace(query, chr(0)))}|{normalize_prompt(query)}"
+        else:
+            text = normalize_prompt(prompt)
+        raw = f"{model}|{temperature:.3f}|{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_namespace(prompt: str, model: str, temperature: float, query: Optional[str]) -> str:
+        """相似查找的命名空间：同一提示词模板（去掉用户问题后）+ 模型 + 温度"""
+        template = prompt.replace(query, "") if query else prompt
+        return LLMResponseCache.make_key(template, model, temperature)
+
+    def get(self, prompt: str, model: str, temperature: float, query: Optional[str] = None) -> Optional[str]:
+        """
+        查找缓存
+
+        Args:
+            prompt: 完整提示词
+            model: 模型名
+            temperature: 温度
+            query: 提示词中嵌入的用户问题，提供时可进行相似问题查找
+
+        Returns:
+            缓存的模型响应，未命中返回None
+        """
+        try:
+            key = self.make_key(prompt, model, temperature, query)
+            response = self._get_by_key(key)
+            if response is not None:
+                self._stats["hits"] += 1
+                return response
+
+            if self.semantic_enabled and query:
+                namespace = self.make_namespace(prompt, model, temperature, query)
+                similar_key = self._find_similar(namespace, query)
+                if similar_key is not None:
+                    response = self._get_by_key(similar_key)
+                    if response is not None:
+                        self._stats["semantic_hits"] += 1
+                        logger.info(f"大模型缓存相似命中: {query}")
+                        return response
+
+            self._stats["misses"] += 1
+            return None
+        except Exception as e:
+            logger.error(f"读取大模型缓存失败: {e}")
+            return None
+
+    async def aget(self, prompt: str, model: str, temperature: float, query: Optional[str] = None) -> Optional[str]:
+        """异步查找缓存（SQLite读取在线程池中执行，不阻塞事件循环）"""
+        return await asyncio.to_thread(self.get, prompt, model, temperature, query)
+
+    async def aset(self, prompt: str, model: str, temperature: float, response: str,
+                   query: Optional[str] = None) -> None:
+        """异步写入缓存（在线程池中执行）"""
+        await asyncio.to_thread(self.set, prompt, model, temperature, response, query)
+
+    def set(self, prompt: str, model: str, temperature: float, response: str, query: Optional[str] = None) -> None:
+        """写入缓存，超出容量时按最近访问时间淘汰"""
+        if not response:
+            return
+        try:
+            key = self.make_key(prompt, model, temperature, query)
+            namespace = self.make_namespace(prompt, model, temperature, query)
+            embedding = embed_query(query) if query else None
+            now = time.time()
+
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_response_cache "
+                    "(cache_key, namespace, model, temperature, query, embedding, response, created_at, last_access, hits) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                    (key, namespace, model, temperature, query,
+                     embedding.tobytes() if embedding is not None else None, response, now, now),
+                )
+                # 先写回访问时间，保证淘汰顺序准确（被覆盖的旧条目的访问记录作废）
+                self._pending_access.pop(key, None)
+                self._flush_access(conn)
+                self._evict(conn)
+                conn.commit()
+                self._stats["writes"] += 1
+
+                if embedding is not None and namespace in self._vectors:
+                    keys, queries, matrix = self._vectors[namespace]
+                    if key not in keys:
+                        self._vectors[namespace] = (keys + [key], queries + [query], np.vstack([matrix, embedding]))
+        except Exception as e:
+            logger.error(f"写入大模型缓存失败: {e}")
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM llm_response_cache")
+            conn.commit()
+            self._vectors.clear()
+            self._pending_access.clear()
+
+    def flush(self) -> None:
+        """写回内存中尚未持久化的访问记录（关闭服务前调用）"""
+        try:
+            with self._lock:
+                conn = self._connect()
+                self._flush_access(conn)
+                conn.commit()
+        except Exception as e:
+            logger.error(f"写回大模型缓存访问记录失败: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        """缓存统计"""
+        with self._lock:
+            size = self._connect().execute("SELECT COUNT(*) FROM llm_response_cache").fetchone()[0]
+        return {**self._stats, "size": size}
+
+    def _connect(self) -> sqlite3.Connection:
+        """延迟打开数据库连接（调用方需持有锁）"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(CREATE_TABLE_SQL)
+            for sql in CREATE_INDEX_SQL:
+                self._conn.execute(sql)
+            self._conn.commit()
+        return self._conn
+
+    def _get_by_key(self, key: str) -> Optional[str]:
+        """按键读取未过期的响应并记录访问（访问时间批量写回，命中时不逐次提交）"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT response, created_at FROM llm_response_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] >= self.ttl:
+                conn.execute("DELETE FROM llm_response_cache WHERE cache_key = ?", (key,))
+                conn.commit()
+                return None
+            _, hits = self._pending_access.get(key, (now, 0))
+            self._pending_access[key] = (now, hits + 1)
+            if (len(self._pending_access) >= ACCESS_FLUSH_BATCH
+                    or time.monotonic() - self._last_flush >= ACCESS_FLUSH_INTERVAL):
+                self._flush_access(conn)
+                conn.commit()
+            return row[0]
+
+    def _flush_access(self, conn: sqlite3.Connection) -> None:
+        """批量写回访问时间和命中次数（调用方需持有锁并负责提交）"""
+        self._last_flush = time.monotonic()
+        if not self._pending_access:
+            return
+        conn.executemany(
+            "UPDATE llm_response_cache SET last_access = ?, hits = hits + ? WHERE cache_key = ?",
+            [(last_access, hits, key) for key, (last_access, hits) in self._pending_access.items()],
+        )
+        self._pending_access.clear()
+
+    def _find_similar(self, namespace: str, query: str) -> Optional[str]:
+        """在同一命名空间内查找最相似且数字一致的历史问题"""
+        with self._lock:
+            if namespace not in self._vectors:
+                rows = self._connect().execute(
+                    "SELECT cache_key, query, embedding FROM llm_response_cache "
+                    "WHERE namespace = ? AND embedding IS NOT NULL",
+                    (namespace,),
+                ).fetchall()
+                keys = [row[0] for row in rows]
+                queries = [row[1] for row in rows]
+                matrix = (np.vstack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+                          if rows else np.zeros((0, EMBEDDING_DIM), dtype=np.float32))
+                self._vectors[namespace] = (keys, queries, matrix)
+            keys, queries, matrix = self._vectors[namespace]
+
+        if len(keys) == 0:
+            return None
+
+        similarities = matrix @ embed_query(query)
+        numbers = _numbers(query)
+        for i in np.argsort(-similarities):
+            if similarities[i] < self.similarity_threshold:
+                break
+            if _numbers(queries[i]) == numbers:
+                return keys[i]
+        return None
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """删除过期条目，并按LRU淘汰超出容量的条目（调用方需持有锁）"""
+        expired = conn.execute(
+            "DELETE FROM llm_response_cache WHERE created_at <= ?", (time.time() - self.ttl,)
+        ).rowcount
+        overflow = conn.execute("SELECT COUNT(*) FROM llm_response_cache").fetchone()[0] - self.max_entries
+        evicted = 0
+        if overflow > 0:
+            evicted = conn.execute(
+                "DELETE FROM llm_response_cache WHERE cache_key IN ("
+                "SELECT cache_key FROM llm_response_cache ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            ).rowcount
+        if expired or evicted:
+            self._stats["evictions"] += expired + evicted
+            # 相似索引中可能包含已删除的键，下次查找时重新加载
+            self._vectors.clear()
+
+
+# 全局大模型响应缓存
+llm_response_cache = LLMResponseCache(
+    path=config.LLM_CACHE_PATH,
+    ttl=config.LLM_CACHE_TTL,
+    max_entries=config.LLM_CACHE_MAX_ENTRIES,
+    semantic_enabled=config.LLM_CACHE_SEMANTIC_ENABLED,
+    similarity_threshold=config.LLM_CACHE_SIMILARITY_THRESHOLD,
+)
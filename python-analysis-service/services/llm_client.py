@@ -0,0 +1,377 @@
+"""
+大模型HTTP客户端
+直接调用通义千问(DashScope)文本生成HTTP接口，提供：
+- 连接池复用（httpx）
+- 按模型的并发上限（信号量）
+- 单次调用截止时间（包含排队、重试在内的总时长）
+- 带抖动的指数退避重试
+- 可选的响应缓存（按规范化提示词 + 模型 + 温度）
+异步接口供FastAPI协程使用，同步接口供线程池中的旧代码使用
+"""
+
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from config import config
+from services.llm_cache import llm_response_cache
+
+logger = logging.getLogger(__name__)
+
+GENERATION_PATH = "/services/aigc/text-generation/generation"
+
+# 可重试的HTTP状态码（限流和服务端错误）
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class LLMClientError(Exception):
+    """大模型调用失败"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retryable: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+
+
+class LLMTimeoutError(LLMClientError):
+    """超过调用截止时间"""
+
+
+class LLMClient:
+    """通义千问HTTP客户端（进程内共享，按事件循环/线程安全地复用连接池）"""
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        max_concurrency: int = 4,
+        timeout: float = 60.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        max_connections: int = 20,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+
+        # 异步客户端和信号量绑定事件循环，按循环分别维护（弱引用，循环回收后自动移除）
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = \
+            weakref.WeakKeyDictionary()
+        self._async_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = \
+            weakref.WeakKeyDictionary()
+        # 同步客户端供线程池调用
+        self._sync_client: Optional[httpx.Client] = None
+        self._sync_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def is_configured(self) -> bool:
+        """是否配置了API Key"""
+        return bool(self.api_key)
+
+    async def generate(
+        self,
+        prompt: Optional[str] = None,
+        messages: Optional[List[Dict[str, str]]] = None,
+        model: Optional[str] = None,
+        max_tokens: int = 2000,
+        temperature: float = 0.1,
+        timeout: Optional[float] = None,
+        use_cache: bool = False,
+        cache_query: Optional[str] = None,
+    ) -> str:
+        """
+        异步生成文本
+
+        Args:
+            prompt: 单轮提示词（与messages二选一）
+            messages: 多轮消息列表
+            model: 模型名，默认使用配置中的QWEN_MODEL
+            max_tokens: 最大生成token数
+            temperature: 温度
+            timeout: 本次调用截止时间（秒），包含排队和重试
+            use_cache: 是否使用响应缓存（仅适用于结果只取决于提示词的调用）
+            cache_query: 提示词中的用户问题，用于相似问题查找
+
+        Returns:
+            生成的文本
+
+        Raises:
+            LLMClientError: 调用失败或超时
+        """
+        model = model or config.QWEN_MODEL
+        payload = self._build_payload(model, prompt, messages, max_tokens, temperature)
+        cache_prompt = self._cache_prompt(payload) if use_cache and config.LLM_CACHE_ENABLED else None
+        if cache_prompt is not None:
+            cached = await llm_response_cache.aget(cache_prompt, model, temperature, cache_query)
+            if cached is not None:
+                return cached
+        deadline = time.monotonic() + (timeout or self.timeout)
+        semaphore = self._get_async_semaphore(model)
+        client = self._get_async_client()
+
+        # 截止时间覆盖排队和重试；信号量留在 async with 内，超时或取消时配额一定归还
+        acquired = False
+
+        async def call() -> str:
+            nonlocal acquired
+            async with semaphore:
+                acquired = True
+                attempt = 0
+                while True:
+                    try:
+                        response = await client.post(
+                            GENERATION_PATH,
+                            json=payload,
+                            timeout=self._remaining(deadline),
+                        )
+                        return self._parse_response(response)
+                    except (httpx.TimeoutException, httpx.TransportError, LLMClientError) as e:
+                        delay = self._next_delay(e, attempt, deadline)
+                        if delay is None:
+                            raise self._wrap_error(e, model)
+                        logger.warning(f"大模型调用失败，{delay:.2f}s后重试({attempt + 1}/{self.max_retries}): {e}")
+                        await asyncio.sleep(delay)
+                        attempt += 1
+
+        try:
+            text = await asyncio.wait_for(call(), timeout=self._remaining(deadline))
+        except asyncio.TimeoutError:
+            if not acquired:
+                raise LLMTimeoutError(f"等待模型 {model} 并发配额超时")
+            raise LLMTimeoutError("大模型调用超过截止时间")
+
+        if cache_prompt is not None:
+            await llm_response_cache.aset(cache_prompt, model, temperature, text, cache_query)
+        return text
+
+    def generate_sync(
+        self,
+        prompt: Optional[str] = None,
+        messages: Optional[List[Dict[str, str]]] = None,
+        model: Optional[str] = None,
+        max_tokens: int = 2000,
+        temperature: float = 0.1,
+        timeout: Optional[float] = None,
+        use_cache: bool = False,
+        cache_query: Optional[str] = None,
+    ) -> str:
+        """同步生成文本（供线程池中的同步代码调用，语义与generate一致）"""
+        model = model or config.QWEN_MODEL
+        payload = self._build_payload(model, prompt, messages, max_tokens, temperature)
+        cache_prompt = self._cache_prompt(payload) if use_cache and config.LLM_CACHE_ENABLED else None
+        if cache_prompt is not None:
+            cached = llm_response_cache.get(cache_prompt, model, temperature, cache_query)
+            if cached is not None:
+                return cached
+        deadline = time.monotonic() + (timeout or self.timeout)
+        semaphore = self._get_sync_semaphore(model)
+        client = self._get_sync_client()
+
+        if not semaphore.acquire(timeout=self._remaining(deadline)):
+            raise LLMTimeoutError(f"等待模型 {model} 并发配额超时")
+
+        try:
+            attempt = 0
+            while True:
+                try:
+                    response = client.post(GENERATION_PATH, json=payload, timeout=self._remaining(deadline))
+                    text = self._parse_response(response)
+                    break
+                except (httpx.TimeoutException, httpx.TransportError, LLMClientError) as e:
+                    delay = self._next_delay(e, attempt, deadline)
+                    if delay is None:
+                        raise self._wrap_error(e, model)
+                    logger.warning(f"大模型调用失败，{delay:.2f}s后重试({attempt + 1}/{self.max_retries}): {e}")
+                    time.sleep(delay)
+                    attempt += 1
+        finally:
+            semaphore.release()
+
+        if cache_prompt is not None:
+            llm_response_cache.set(cache_prompt, model, temperature, text, cache_query)
+        return text
+
+    async def aclose(self) -> None:
+        """关闭当前事件循环上的连接池"""
+        loop = asyncio.get_running_loop()
+        self._async_semaphores.pop(loop, None)
+        client = self._async_clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+    def close(self) -> None:
+        """关闭同步连接池"""
+        with self._lock:
+            if self._sync_client is not None:
+                self._sync_client.close()
+                self._sync_client = None
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        self._prune_closed_loops()
+        client = self._async_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self._headers(),
+                limits=self.limits,
+                timeout=self.timeout,
+            )
+            self._async_clients[loop] = client
+        return client
+
+    def _get_async_semaphore(self, model: str) -> asyncio.Semaphore:
+        semaphores = self._async_semaphores.setdefault(asyncio.get_running_loop(), {})
+        semaphore = semaphores.get(model)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            semaphores[model] = semaphore
+        return semaphore
+
+    def _prune_closed_loops(self) -> None:
+        """移除已关闭但尚未被回收的事件循环上的客户端和信号量（无法再在其上关闭连接，直接丢弃）"""
+        for loops in (self._async_clients, self._async_semaphores):
+            for loop in [loop for loop in list(loops.keys()) if loop.is_closed()]:
+                loops.pop(loop, None)
+
+    def _get_sync_client(self) -> httpx.Client:
+        with self._lock:
+            if self._sync_client is None:
+                self._sync_client = httpx.Client(
+                    base_url=self.base_url,
+                    headers=self._headers(),
+                    limits=self.limits,
+                    timeout=self.timeout,
+                )
+            return self._sync_client
+
+    def _get_sync_semaphore(self, model: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            semaphore = self._sync_semaphores.get(model)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.max_concurrency)
+                self._sync_semaphores[model] = semaphore
+            return semaphore
+
+    @staticmethod
+    def _build_payload(
+        model: str,
+        prompt: Optional[str],
+        messages: Optional[List[Dict[str, str]]],
+        max_tokens: int,
+        temperature: float,
+    ) -> Dict[str, Any]:
+        if messages:
+            model_input: Dict[str, Any] = {"messages": messages}
+        elif prompt is not None:
+            model_input = {"prompt": prompt}
+        else:
+            raise ValueError("prompt 和 messages 不能同时为空")
+
+        return {
+            "model": model,
+            "input": model_input,
+            "parameters": {
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                "result_format": "text",
+            },
+        }
+
+    @staticmethod
+    def _cache_prompt(payload: Dict[str, Any]) -> str:
+        """缓存键使用的提示词文本（多轮消息序列化为JSON）"""
+        model_input = payload["input"]
+        if "prompt" in model_input:
+            return model_input["prompt"]
+        return json.dumps(model_input["messages"], ensure_ascii=False, sort_keys=True)
+
+    @staticmethod
+    def _parse_response(response: httpx.Response) -> str:
+        """解析DashScope响应，非200状态转换为LLMClientError"""
+        if response.status_code != 200:
+            try:
+                body = response.json()
+                message = body.get("message") or body.get("code") or response.text
+            except ValueError:
+                message = response.text
+            raise LLMClientError(
+                f"status_code={response.status_code}, message={message}",
+                status_code=response.status_code,
+                retryable=response.status_code in RETRYABLE_STATUS_CODES,
+            )
+
+        try:
+            body = response.json()
+        except ValueError as e:
+            raise LLMClientError(f"响应不是有效的JSON: {e}")
+
+        output = body.get("output") or {}
+        text = output.get("text")
+        if text is None and output.get("choices"):
+            text = output["choices"][0].get("message", {}).get("content")
+        if text is None:
+            raise LLMClientError(f"响应缺少output.text: {body}")
+        return text.strip()
+
+    def _next_delay(self, error: Exception, attempt: int, deadline: float) -> Optional[float]:
+        """计算下次重试前的等待时间，不可重试或已超出截止时间时返回None"""
+        if isinstance(error, LLMClientError) and not error.retryable:
+            return None
+        if attempt >= self.max_retries:
+            return None
+
+        # 全抖动指数退避，避免多个请求同时重试
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    @staticmethod
+    def _remaining(deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMTimeoutError("大模型调用超过截止时间")
+        return remaining
+
+    @staticmethod
+    def _wrap_error(error: Exception, model: str) -> LLMClientError:
+        if isinstance(error, LLMClientError):
+            return error
+        if isinstance(error, httpx.TimeoutException):
+            return LLMTimeoutError(f"模型 {model} 调用超时: {error}")
+        return LLMClientError(f"模型 {model} 网络错误: {error}", retryable=True)
+
+
+# 全局大模型客户端
+llm_client = LLMClient(
+    api_key=config.DASHSCOPE_API_KEY,
+    base_url=config.DASHSCOPE_BASE_URL,
+    max_concurrency=config.LLM_MAX_CONCURRENCY,
+    timeout=config.LLM_REQUEST_TIMEOUT,
+    max_retries=config.LLM_MAX_RETRIES,
+    max_connections=config.LLM_MAX_CONNECTIONS,
+)
@@ -0,0 +1,329 @@
+"""
+市场快照服务 - 进程内列式内存快照
+将每只股票的最新行情、估值、财务和近1年绩效加载为NumPy列数组，
+筛选类查询直接在进程内做向量化过滤，不再每次回查MySQL
+"""
+
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import bindparam, text
+
+from config import config
+from models.database import engine
+
+logger = logging.getLogger(__name__)
+
+# 文本列（存储为定长unicode数组，便于np.char向量化匹配）
+TEXT_COLUMNS = ["symbol", "name", "sector", "industry", "market"]
+
+# 数值列（统一存储为float64，缺失值为NaN），列名与推荐查询返回的字段名一致
+NUMERIC_COLUMNS = [
+    "marketCap",
+    "peRatio",
+    "pbRatio",
+    "dividendYield",
+    "latest_price",
+    "changePercent",
+    "volume",
+    "roe",
+    "grossMargin",
+    "netMargin",
+    "revenue",
+    "netProfit",
+    "totalReturn",
+    "annualizedReturn",
+    "maxDrawdown",
+    "sharpeRatio",
+    "volatility",
+]
+
+# 加载最新一行数据：用分组派生表取代逐行关联的 MAX(date) 子查询
+SNAPSHOT_SQL = """
+SELECT
+    si.symbol,
+    si.name,
+    si.sector,
+    si.industry,
+    si.market,
+    si.marketCap,
+    si.peRatio,
+    si.pbRatio,
+    si.dividendYield,
+    sd.close AS latest_price,
+    sd.changePercent,
+    sd.volume,
+    sf.roe,
+    sf.grossMargin,
+    sf.netMargin,
+    sf.revenue,
+    sf.netProfit,
+    sp.totalReturn,
+    sp.annualizedReturn,
+    sp.maxDrawdown,
+    sp.sharpeRatio,
+    sp.volatility
+FROM stock_info si
+LEFT JOIN (
+    SELECT symbol, MAX(date) AS latest_date
+    FROM stock_data
+    WHERE close > 0 {symbol_filter}
+    GROUP BY symbol
+) sdl ON sdl.symbol = si.symbol
+LEFT JOIN stock_data sd ON sd.symbol = sdl.symbol AND sd.date = sdl.latest_date
+LEFT JOIN (
+    SELECT symbol, MAX(reportDate) AS latest_report
+    FROM stock_financial
+    WHERE 1 = 1 {symbol_filter}
+    GROUP BY symbol
+) sfl ON sfl.symbol = si.symbol
+LEFT JOIN stock_financial sf ON sf.symbol = sfl.symbol AND sf.reportDate = sfl.latest_report
+LEFT JOIN stock_performance sp ON sp.symbol = si.symbol AND sp.period = '1y'
+WHERE si.isActive = 1 {si_symbol_filter}
+"""
+
+# 查询自上次加载以来有变化的股票（爬虫写入时会刷新updatedAt）
+CHANGED_SYMBOLS_SQL = """
+SELECT symbol FROM stock_info WHERE updatedAt > :since
+UNION
+SELECT symbol FROM stock_data WHERE updatedAt > :since
+UNION
+SELECT symbol FROM stock_financial WHERE updatedAt > :since
+UNION
+SELECT symbol FROM stock_performance WHERE updatedAt > :since
+"""
+
+
+@dataclass(frozen=True)
+class SnapshotFrame:
+    """不可变的列式快照，刷新时整体替换，读者拿到的引用始终一致"""
+    text: Dict[str, np.ndarray]
+    numeric: Dict[str, np.ndarray]
+    index: Dict[str, int]
+    loaded_at: datetime
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def symbols(self) -> np.ndarray:
+        return self.text["symbol"]
+
+    def column(self, name: str) -> np.ndarray:
+        """按列名获取列数组"""
+        if name in self.numeric:
+            return self.numeric[name]
+        return self.text[name]
+
+    def contains(self, columns: Sequence[str], keyword: str) -> np.ndarray:
+        """任一文本列包含关键词的布尔掩码"""
+        mask = np.zeros(len(self), dtype=bool)
+        for name in columns:
+            mask |= np.char.find(self.text[name], keyword) >= 0
+        return mask
+
+    def records(self, indices: Optional[Sequence[int]] = None) -> List[Dict[str, Any]]:
+        """将指定行转换为字典列表，NaN/空字符串还原为None"""
+        if indices is None:
+            indices = range(len(self))
+        records = []
+        for i in indices:
+            row: Dict[str, Any] = {}
+            for name in TEXT_COLUMNS:
+                value = str(self.text[name][i])
+                row[name] = value or None
+            for name in NUMERIC_COLUMNS:
+                value = self.numeric[name][i]
+                row[name] = None if np.isnan(value) else float(value)
+            if row["volume"] is not None:
+                row["volume"] = int(row["volume"])
+            records.append(row)
+        return records
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]], loaded_at: datetime) -> "SnapshotFrame":
+        """从查询结果行构建列数组"""
+        text_columns = {
+            name: np.array([row.get(name) or "" for row in rows], dtype=str)
+            for name in TEXT_COLUMNS
+        }
+        numeric_columns = {
+            name: np.array(
+                [np.nan if row.get(name) is None else float(row[name]) for row in rows],
+                dtype=np.float64,
+            )
+            for name in NUMERIC_COLUMNS
+        }
+        index = {symbol: i for i, symbol in enumerate(text_columns["symbol"].tolist())}
+        return cls(text=text_columns, numeric=numeric_columns, index=index, loaded_at=loaded_at)
+
+    def patch(self, rows: List[Dict[str, Any]], changed: Sequence[str], loaded_at: datetime) -> "SnapshotFrame":
+        """
+        增量合并：把变化的行写入列数组，新股票追加到末尾，changed 中未出现在 rows 里的股票移除
+
+        快照对读者不可变，因此先整列复制（向量化内存拷贝），只对变化的行逐行赋值，
+        不把整张快照还原为行字典再重建
+        """
+        updates = {row["symbol"]: row for row in rows}
+        added = [symbol for symbol in updates if symbol not in self.index]
+        size = len(self) + len(added)
+        # 已有股票写回原位置，新股票追加在末尾
+        offsets = {symbol: len(self) + i for i, symbol in enumerate(added)}
+        positions = np.array(
+            [self.index[symbol] if symbol in self.index else offsets[symbol] for symbol in updates], dtype=np.intp
+        )
+
+        text_columns = {}
+        for name in TEXT_COLUMNS:
+            values = [row.get(name) or "" for row in updates.values()]
+            column = self.text[name]
+            width = max([column.dtype.itemsize // 4, 1] + [len(value) for value in values])
+            patched = np.empty(size, dtype=f"<U{width}")
+            patched[:len(self)] = column
+            patched[len(self):] = ""
+            if values:
+                patched[positions] = values
+            text_columns[name] = patched
+
+        numeric_columns = {}
+        for name in NUMERIC_COLUMNS:
+            patched = np.empty(size, dtype=np.float64)
+            patched[:len(self)] = self.numeric[name]
+            if updates:
+                patched[positions] = [
+                    np.nan if row.get(name) is None else float(row[name]) for row in updates.values()
+                ]
+            numeric_columns[name] = patched
+
+        # 变化但未返回的股票已下市或被停用
+        removed = [self.index[symbol] for symbol in changed if symbol in self.index and symbol not in updates]
+        if removed:
+            keep = np.ones(size, dtype=bool)
+            keep[removed] = False
+            text_columns = {name: column[keep] for name, column in text_columns.items()}
+            numeric_columns = {name: column[keep] for name, column in numeric_columns.items()}
+            index = {symbol: i for i, symbol in enumerate(text_columns["symbol"].tolist())}
+        else:
+            index = dict(self.index)
+            index.update((symbol, len(self) + i) for i, symbol in enumerate(added))
+
+        return SnapshotFrame(text=text_columns, numeric=numeric_columns, index=index, loaded_at=loaded_at)
+
+
+class MarketSnapshot:
+    """市场快照管理器 - 启动时全量加载，之后按updatedAt水位线增量刷新"""
+
+    def __init__(self, refresh_interval: int = 300):
+        self.refresh_interval = refresh_interval
+        self._frame: Optional[SnapshotFrame] = None
+        self._watermark: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[], None]] = []
+
+    @property
+    def frame(self) -> Optional[SnapshotFrame]:
+        """当前快照（未加载时为None）"""
+        return self._frame
+
+    @property
+    def is_ready(self) -> bool:
+        """快照是否可用于查询"""
+        return self._frame is not None and len(self._frame) > 0
+
+    def load(self) -> bool:
+        """全量加载快照"""
+        try:
+            with self._lock:
+                started = datetime.now()
+                with engine.connect() as conn:
+                    watermark = conn.execute(text("SELECT NOW()")).scalar()
+                    rows = self._fetch_rows(conn)
+                self._frame = SnapshotFrame.from_rows(rows, loaded_at=datetime.now())
+                self._watermark = watermark
+            elapsed = (datetime.now() - started).total_seconds()
+            logger.info(f"市场快照全量加载完成: {len(rows)} 只股票，耗时 {elapsed:.2f}s")
+            return True
+        except Exception as e:
+            logger.error(f"市场快照加载失败: {e}")
+            return False
+
+    def refresh(self) -> int:
+        """增量刷新：只重新加载水位线之后有变化的股票，返回更新的股票数"""
+        if self._frame is None or self._watermark is None:
+            return len(self._frame) if self.load() else 0
+
+        try:
+            with self._lock:
+                with engine.connect() as conn:
+                    watermark = conn.execute(text("SELECT NOW()")).scalar()
+                    changed = [
+                        row[0] for row in conn.execute(text(CHANGED_SYMBOLS_SQL), {"since": self._watermark})
+                    ]
+                    if not changed:
+                        self._watermark = watermark
+                        return 0
+                    rows = self._fetch_rows(conn, changed)
+
+                # 只把变化的行合并进列数组（变化但未返回的股票已下市或被停用，从快照中移除）
+                self._frame = self._frame.patch(rows, changed, loaded_at=datetime.now())
+                self._watermark = watermark
+
+            logger.info(f"市场快照增量刷新: {len(changed)} 只股票有变化，当前共 {len(self._frame)} 只")
+            self._notify_listeners()
+            return len(changed)
+        except Exception as e:
+            logger.error(f"市场快照增量刷新失败: {e}")
+            return 0
+
+    def on_change(self, callback: Callable[[], None]) -> None:
+        """注册数据变化回调（增量刷新发现变化时调用，用于失效相关缓存）"""
+        self._listeners.append(callback)
+
+    def _notify_listeners(self) -> None:
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"市场快照变化回调执行失败: {e}")
+
+    def start_auto_refresh(self) -> None:
+        """启动后台线程：先全量加载，再定期增量刷新"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+
+        def target():
+            self.load()
+            while not self._stop_event.wait(self.refresh_interval):
+                self.refresh()
+
+        self._thread = threading.Thread(target=target, name="market-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop_auto_refresh(self) -> None:
+        """停止后台刷新线程"""
+        self._stop_event.set()
+
+    def _fetch_rows(self, conn, symbols: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """执行快照查询，symbols为空时加载全市场"""
+        if symbols:
+            sql = text(SNAPSHOT_SQL.format(
+                symbol_filter="AND symbol IN :symbols",
+                si_symbol_filter="AND si.symbol IN :symbols",
+            )).bindparams(bindparam("symbols", expanding=True))
+            result = conn.execute(sql, {"symbols": list(symbols)})
+        else:
+            sql = text(SNAPSHOT_SQL.format(symbol_filter="", si_symbol_filter=""))
+            result = conn.execute(sql)
+        return [dict(row._mapping) for row in result]
+
+
+# 全局市场快照实例
+market_snapshot = MarketSnapshot(refresh_interval=config.MARKET_SNAPSHOT_REFRESH_INTERVAL)
@@ -0,0 +1,127 @@
+"""
+组合面板分析
+在对齐后的 (交易日 × 股票) float64 收益率矩阵上，用矩阵运算一次性计算多个组合的
+协方差、历史/参数法 VaR 与 ES、分散化比率和回撤
+"""
+
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252
+
+
+@dataclass
+class ReturnsPanel:
+    """对齐后的收益率矩阵"""
+
+    dates: pd.DatetimeIndex
+    symbols: List[str]
+    returns: np.ndarray  # 形状 (交易日数, 股票数)
+
+    @classmethod
+    def from_price_data(cls, portfolio_data: Mapping[str, List[Dict]]) -> "ReturnsPanel":
+        """
+        由各股票的价格列表构建收益率矩阵（只保留所有股票都有收益率的交易日）
+
+        Args:
+            portfolio_data: key为股票代码，value为包含 date, close 的价格列表
+        """
+        series = {}
+        for symbol, data in portfolio_data.items():
+            frame = pd.DataFrame(data, columns=["date", "close"])
+            series[symbol] = pd.Series(
+                frame["close"].to_numpy(dtype=np.float64), index=pd.to_datetime(frame["date"])
+            )
+
+        prices = pd.DataFrame(series).sort_index()
+        returns = prices.pct_change().dropna()
+        return cls(returns.index, list(returns.columns), returns.to_numpy(dtype=np.float64))
+
+    def weight_matrix(self, weight_sets: Sequence[Optional[Mapping[str, float]]]) -> np.ndarray:
+        """
+        把多组 {股票代码: 权重} 转为 (组合数, 股票数) 矩阵，每组权重归一化；None 表示等权重
+        """
+        index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        matrix = np.zeros((len(weight_sets), len(self.symbols)))
+        for row, weights in enumerate(weight_sets):
+            if weights is None:
+                matrix[row] = 1.0
+                continue
+            for symbol, weight in weights.items():
+                if symbol in index:
+                    matrix[row, index[symbol]] = weight
+        totals = matrix.sum(axis=1, keepdims=True)
+        return np.divide(matrix, totals, out=np.zeros_like(matrix), where=totals != 0)
+
+    def covariance(self) -> np.ndarray:
+        """日收益率样本协方差矩阵"""
+        centered = self.returns - self.returns.mean(axis=0)
+        return centered.T @ centered / max(len(self.returns) - 1, 1)
+
+    def correlation(self, cov: Optional[np.ndarray] = None) -> np.ndarray:
+        """相关系数矩阵"""
+        cov = self.covariance() if cov is None else cov
+        std = np.sqrt(np.diag(cov))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return cov / np.outer(std, std)
+
+    def analyze(self, weights: np.ndarray, confidence_level: float = 0.05) -> Dict[str, np.ndarray]:
+        """
+        批量计算多个组合的风险收益指标
+
+        Args:
+            weights: (组合数, 股票数) 权重矩阵
+            confidence_level: VaR/ES 的尾部概率
+
+        Returns:
+            指标名 -> 长度为组合数的数组（日频 VaR/ES 为收益率，负数表示亏损）
+        """
+        cov = self.covariance()
+        asset_vol = np.sqrt(np.diag(cov))
+        portfolio_returns = self.returns @ weights.T  # (交易日数, 组合数)
+
+        mean = portfolio_returns.mean(axis=0)
+        variance = np.einsum("pi,ij,pj->p", weights, cov, weights)
+        vol = np.sqrt(np.maximum(variance, 0.0))
+
+        # 历史法：分位数以下的平均值为ES
+        var_hist = np.percentile(portfolio_returns, confidence_level * 100, axis=0)
+        tail = portfolio_returns <= var_hist
+        tail_count = tail.sum(axis=0)
+        es_hist = np.where(
+            tail_count > 0, (portfolio_returns * tail).sum(axis=0) / np.maximum(tail_count, 1), np.nan
+        )
+
+        # 参数法（正态分布）
+        normal = NormalDist()
+        z = normal.inv_cdf(confidence_level)
+        var_param = mean + z * vol
+        es_param = mean - vol * normal.pdf(z) / confidence_level
+
+        # 回撤
+        wealth = np.cumprod(1 + portfolio_returns, axis=0)
+        peaks = np.maximum.accumulate(wealth, axis=0)
+        drawdowns = wealth / peaks - 1
+
+        annual_return = mean * TRADING_DAYS
+        annual_vol = vol * np.sqrt(TRADING_DAYS)
+        weighted_vol = weights @ asset_vol
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sharpe = np.where(annual_vol > 0, annual_return / annual_vol, 0.0)
+            diversification = np.where(vol > 0, weighted_vol / vol, 1.0)
+
+        return {
+            "annual_return": annual_return,
+            "annual_volatility": annual_vol,
+            "sharpe_ratio": sharpe,
+            "diversification_ratio": diversification,
+            "var_historical": var_hist,
+            "es_historical": es_hist,
+            "var_parametric": var_param,
+            "es_parametric": es_param,
+            "max_drawdown": drawdowns.min(axis=0) if len(drawdowns) else np.full(len(weights), np.nan),
+        }
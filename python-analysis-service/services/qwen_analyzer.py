@@ -6,6 +6,7 @@
 import logging
 from datetime import datetime
 from config import config
+from services.llm_client import llm_client, LLMClientError
 from utils.helpers import clean_text
 
 logger = logging.getLogger(__name__)
@@ -15,58 +16,65 @@ class QwenAnalyzer:
     
     def __init__(self):
         """初始化分析器"""
-        self._dashscope = None
-        self._generation = None
+        self._client = llm_client
     
-    def _init_dashscope(self):
-        """延迟初始化dashscope，避免多进程问题"""
-        if self._dashscope is None:
-            try:
-                import dashscope
-                from dashscope import Generation
-                
-                dashscope.api_key = config.DASHSCOPE_API_KEY
-                self._dashscope = dashscope
-                self._generation = Generation
-                logger.info("Dashscope初始化成功")
-            except Exception as e:
-                logger.error(f"Dashscope初始化失败: {e}")
-                raise
+    @property
+    def is_available(self) -> bool:
+        """是否可以调用通义千问"""
+        return self._client.is_configured
     
     def analyze_text(self, prompt: str, max_tokens: int = 2000) -> str:
-        """分析文本并返回结果"""
+        """分析文本并返回结果（同步，供线程池中的调用方使用）"""
         try:
-            logger.info(f"开始调用通义千问API, prompt长度: {len(prompt)}, max_tokens: {max_tokens}")
-            
-            # 延迟初始化
-            self._init_dashscope()
-            
-            logger.info(f"使用模型: {config.QWEN_MODEL}, API Key: {config.DASHSCOPE_API_KEY[:20]}...")
-            
-            response = self._generation.call(
-                model=config.QWEN_MODEL,
+            logger.info(f"开始调用通义千问API, prompt长度: {len(prompt)}, max_tokens: {max_tokens}, 模型: {config.QWEN_MODEL}")
+            raw_text = self._client.generate_sync(
                 prompt=prompt,
+                model=config.QWEN_MODEL,
                 max_tokens=max_tokens,
                 temperature=0.1  # 降低随机性，提高一致性
             )
-            
-            logger.info(f"通义千问API调用完成, status_code: {response.status_code}")
-            
-            if response.status_code == 200:
-                raw_text = response.output.text.strip()
-                cleaned_text = clean_text(raw_text)
-                logger.info(f"通义千问API调用成功, 原始返回长度: {len(raw_text)}, 清理后长度: {len(cleaned_text)}")
-                return cleaned_text
-            else:
-                logger.error(f"Qwen API调用失败: status_code={response.status_code}, message={getattr(response, 'message', 'Unknown error')}")
-                return ""
-                
+            return self._clean_response(raw_text)
+        except LLMClientError as e:
+            logger.error(f"Qwen API调用失败: {e}")
+            return ""
         except Exception as e:
             logger.error(f"Qwen分析失败: {e}, 类型: {type(e).__name__}")
-            import traceback
-            logger.error(f"Qwen分析失败堆栈: {traceback.format_exc()}")
             return ""
     
+    async def analyze_text_async(self, prompt: str, max_tokens: int = 2000) -> str:
+        """异步分析文本，不阻塞事件循环"""
+        try:
+            logger.info(f"开始调用通义千问API, prompt长度: {len(prompt)}, max_tokens: {max_tokens}, 模型: {config.QWEN_MODEL}")
+            raw_text = await self._client.generate(
+                prompt=prompt,
+                model=config.QWEN_MODEL,
+                max_tokens=max_tokens,
+                temperature=0.1
+            )
+            return self._clean_response(raw_text)
+        except LLMClientError as e:
+            logger.error(f"Qwen API调用失败: {e}")
+            return ""
+        except Exception as e:
+            logger.error(f"Qwen分析失败: {e}, 类型: {type(e).__name__}")
+            return ""
+    
+    async def _make_api_call(self, messages: list[dict], max_tokens: int = 2000) -> str:
+        """以多轮消息调用通义千问，返回原始文本（失败时抛出LLMClientError）"""
+        return await self._client.generate(
+            messages=messages,
+            model=config.QWEN_MODEL,
+            max_tokens=max_tokens,
+            temperature=0.1
+        )
+    
+    @staticmethod
+    def _clean_response(raw_text: str) -> str:
+        """清理模型返回文本"""
+        cleaned_text = clean_text(raw_text)
+        logger.info(f"通义千问API调用成功, 原始返回长度: {len(raw_text)}, 清理后长度: {len(cleaned_text)}")
+        return cleaned_text
+    
     def generate_industry_keywords(self, industry: str) -> list[str]:
         """为特定行业生成相关关键词"""
         prompt = f"""
@@ -0,0 +1,412 @@
+"""
+结构化条件筛选引擎
+将 StructuredCondition / ConditionGroup 编译为可在市场快照列数组上求值的布尔掩码，
+支持比较、区间、集合、百分位操作符以及 AND/OR 条件组；
+快照未就绪时同一组条件编译为SQL条件（百分位条件无法用SQL表达，由调用方在查询结果上求值）
+"""
+
+import logging
+import operator as op
+import re
+from dataclasses import dataclass, field as dataclass_field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.market_snapshot import SnapshotFrame
+
+logger = logging.getLogger(__name__)
+
+# 条件字段到快照列名的映射
+FIELD_COLUMN_MAPPING = {
+    '市盈率': 'peRatio',
+    '市净率': 'pbRatio',
+    'PE': 'peRatio',
+    'PB': 'pbRatio',
+    '市值': 'marketCap',
+    '股价': 'latest_price',
+    '涨跌幅': 'changePercent',
+    '成交量': 'volume',
+    '股息率': 'dividendYield',
+    'ROE': 'roe',
+    '净资产收益率': 'roe',
+    '毛利率': 'grossMargin',
+    '净利率': 'netMargin',
+    '营收': 'revenue',
+    '营业收入': 'revenue',
+    '净利润': 'netProfit',
+    '收益率': 'totalReturn',
+    '总收益率': 'totalReturn',
+    '年化收益率': 'annualizedReturn',
+    '最大回撤': 'maxDrawdown',
+    '夏普比率': 'sharpeRatio',
+    '波动率': 'volatility',
+}
+
+# 快照列 -> 推荐SQL查询中的列表达式（快照未就绪时的SQL回退路径使用）
+SQL_COLUMN_EXPRESSIONS = {
+    'peRatio': 'si.peRatio',
+    'pbRatio': 'si.pbRatio',
+    'marketCap': 'si.marketCap',
+    'dividendYield': 'si.dividendYield',
+    'latest_price': 'sd.close',
+    'changePercent': 'sd.changePercent',
+    'volume': 'sd.volume',
+    'roe': 'sf.roe',
+    'grossMargin': 'sf.grossMargin',
+    'netMargin': 'sf.netMargin',
+    'revenue': 'sf.revenue',
+    'netProfit': 'sf.netProfit',
+    'totalReturn': 'sp.totalReturn',
+    'annualizedReturn': 'sp.annualizedReturn',
+    'maxDrawdown': 'sp.maxDrawdown',
+    'sharpeRatio': 'sp.sharpeRatio',
+    'volatility': 'sp.volatility',
+}
+
+# 时间周期相关字段，不参与筛选
+EXCLUDED_FIELDS = ['时间周期', '周期', '期间']
+
+COMPARISON_OPERATORS = {
+    '>': op.gt,
+    '<': op.lt,
+    '>=': op.ge,
+    '<=': op.le,
+    '=': op.eq,
+    '==': op.eq,
+    '!=': op.ne,
+}
+
+# 百分位操作符：值为百分比（如 10 表示前10%）
+PERCENTILE_OPERATORS = ['top_percent', 'bottom_percent']
+
+# 区间字符串："min-max"、"min~max"、"min,max"、"min到max"，边界可以为负数
+_NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+_RANGE_PATTERN = re.compile(rf'^\s*({_NUMBER})\s*(?:~|,|，|-|到|至)\s*({_NUMBER})\s*$')
+
+Evaluator = Callable[[SnapshotFrame], np.ndarray]
+
+
+@dataclass(frozen=True)
+class CompiledScreen:
+    """编译后的筛选条件"""
+    evaluator: Optional[Evaluator]
+    applied: List[str]
+    skipped: List[str]
+
+    @property
+    def is_empty(self) -> bool:
+        """没有任何可用条件"""
+        return self.evaluator is None
+
+    def evaluate(self, frame: SnapshotFrame) -> np.ndarray:
+        """在快照上求值，返回布尔掩码（无条件时全部为True）"""
+        if self.evaluator is None:
+            return np.ones(len(frame), dtype=bool)
+        return self.evaluator(frame)
+
+
+def compile_conditions(conditions: Sequence[Any], logic: str = 'and') -> CompiledScreen:
+    """
+    编译结构化条件列表
+
+    Args:
+        conditions: StructuredCondition / ConditionGroup 列表（顶层默认AND）
+        logic: 顶层逻辑关系，and 或 or
+
+    Returns:
+        编译结果，包含求值函数和已应用/跳过的条件说明
+    """
+    applied: List[str] = []
+    skipped: List[str] = []
+    evaluator = _compile_group(conditions, logic, applied, skipped)
+    return CompiledScreen(evaluator=evaluator, applied=applied, skipped=skipped)
+
+
+@dataclass
+class CompiledSql:
+    """编译为SQL的筛选条件"""
+    where: Optional[str]  # 为None表示没有可用条件
+    params: Dict[str, Any] = dataclass_field(default_factory=dict)
+    applied: List[str] = dataclass_field(default_factory=list)
+    skipped: List[str] = dataclass_field(default_factory=list)
+    complete: bool = True  # 为False表示有条件无法用SQL表达（如百分位），需在查询结果上用 compile_conditions 求值
+
+
+def compile_conditions_sql(conditions: Sequence[Any], logic: str = 'and', param_prefix: str = 'condition') -> CompiledSql:
+    """
+    将结构化条件编译为SQL WHERE片段（字段映射、操作符和NULL语义与快照求值一致）
+
+    Args:
+        conditions: StructuredCondition / ConditionGroup 列表（顶层默认AND）
+        logic: 顶层逻辑关系，and 或 or
+        param_prefix: 绑定参数名前缀
+    """
+    compiled = CompiledSql(where=None)
+    compiled.where = _compile_group_sql(conditions, logic, compiled, param_prefix)
+    return compiled
+
+
+def iter_conditions(conditions: Sequence[Any]):
+    """展开条件组，逐个产出叶子条件"""
+    for condition in conditions or []:
+        if hasattr(condition, 'conditions'):
+            yield from iter_conditions(condition.conditions)
+        else:
+            yield condition
+
+
+def rank_indices(mask: np.ndarray, score: np.ndarray, limit: Optional[int] = None, descending: bool = True) -> np.ndarray:
+    """
+    对满足掩码的行按得分排序，返回行号（NaN得分排在最后）
+
+    Args:
+        mask: 布尔掩码
+        score: 排序得分列
+        limit: 返回数量上限
+        descending: 是否降序
+    """
+    candidates = np.flatnonzero(mask)
+    if len(candidates) == 0:
+        return candidates
+
+    keys = score[candidates]
+    keys = -keys if descending else keys
+    keys = np.where(np.isnan(keys), np.inf, keys)
+
+    if limit is not None and limit < len(candidates):
+        top = np.argpartition(keys, limit - 1)[:limit]
+        candidates, keys = candidates[top], keys[top]
+    return candidates[np.argsort(keys, kind='stable')]
+
+
+def _compile_group(conditions: Sequence[Any], logic: str, applied: List[str], skipped: List[str]) -> Optional[Evaluator]:
+    """编译条件组，忽略无法编译的子条件"""
+    evaluators = []
+    for condition in conditions or []:
+        if hasattr(condition, 'conditions'):
+            evaluator = _compile_group(condition.conditions, getattr(condition, 'logic', 'and'), applied, skipped)
+        else:
+            evaluator = _compile_condition(condition, applied, skipped)
+        if evaluator is not None:
+            evaluators.append(evaluator)
+
+    if not evaluators:
+        return None
+    if len(evaluators) == 1:
+        return evaluators[0]
+
+    combine = np.logical_or if str(logic).lower() == 'or' else np.logical_and
+
+    def evaluate(frame: SnapshotFrame) -> np.ndarray:
+        mask = evaluators[0](frame)
+        for evaluator in evaluators[1:]:
+            mask = combine(mask, evaluator(frame))
+        return mask
+
+    return evaluate
+
+
+def _compile_group_sql(conditions: Sequence[Any], logic: str, compiled: CompiledSql, param_prefix: str) -> Optional[str]:
+    """编译条件组为SQL，忽略无法编译的子条件（与 _compile_group 一致）"""
+    clauses = []
+    for condition in conditions or []:
+        if hasattr(condition, 'conditions'):
+            clause = _compile_group_sql(condition.conditions, getattr(condition, 'logic', 'and'), compiled, param_prefix)
+        else:
+            clause = _compile_condition_sql(condition, compiled, param_prefix)
+        if clause is not None:
+            clauses.append(clause)
+
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    joiner = ' OR ' if str(logic).lower() == 'or' else ' AND '
+    return f"({joiner.join(clauses)})"
+
+
+def _compile_condition_sql(condition: Any, compiled: CompiledSql, param_prefix: str) -> Optional[str]:
+    """编译单个条件为SQL"""
+    resolved = _resolve_condition(condition, compiled.skipped)
+    if resolved is None:
+        return None
+    column, operator, value, description = resolved
+
+    if operator in PERCENTILE_OPERATORS:
+        # 百分位依赖全市场分布，SQL中不表达，由调用方在查询结果上求值
+        compiled.complete = False
+        compiled.applied.append(description)
+        return None
+
+    def bind(param_value: Any) -> str:
+        name = f"{param_prefix}_{len(compiled.params)}"
+        compiled.params[name] = param_value
+        return f":{name}"
+
+    try:
+        clause = _build_sql(SQL_COLUMN_EXPRESSIONS[column], operator, value, bind)
+    except (TypeError, ValueError) as e:
+        compiled.skipped.append(f"{description} (参数无效: {e})")
+        return None
+
+    if clause is None:
+        compiled.skipped.append(f"{description} (操作符不支持)")
+        return None
+
+    compiled.applied.append(description)
+    return clause
+
+
+def _resolve_condition(condition: Any, skipped: List[str]) -> Optional[Tuple[str, str, Any, str]]:
+    """解析条件的字段、操作符和值，返回 (快照列名, 操作符, 值, 描述)，字段不可用时返回None"""
+    field = getattr(condition, 'field', '') or ''
+    operator = (getattr(condition, 'operator', '') or '').strip().lower()
+    value = getattr(condition, 'value', None)
+    description = f"{field} {operator} {value}"
+
+    if field in EXCLUDED_FIELDS:
+        skipped.append(f"{description} (时间周期字段)")
+        return None
+
+    column = FIELD_COLUMN_MAPPING.get(field)
+    if column is None:
+        skipped.append(f"{description} (字段暂不支持)")
+        return None
+
+    return column, operator, value, description
+
+
+def _compile_condition(condition: Any, applied: List[str], skipped: List[str]) -> Optional[Evaluator]:
+    """编译单个条件"""
+    resolved = _resolve_condition(condition, skipped)
+    if resolved is None:
+        return None
+    column, operator, value, description = resolved
+
+    try:
+        evaluator = _build_evaluator(column, operator, value)
+    except (TypeError, ValueError) as e:
+        skipped.append(f"{description} (参数无效: {e})")
+        return None
+
+    if evaluator is None:
+        skipped.append(f"{description} (操作符不支持)")
+        return None
+
+    applied.append(description)
+    return evaluator
+
+
+def _build_evaluator(column: str, operator: str, value: Any) -> Optional[Evaluator]:
+    """按操作符生成列求值函数，NaN一律视为不满足（与SQL的NULL语义一致）"""
+    if operator in COMPARISON_OPERATORS:
+        compare = COMPARISON_OPERATORS[operator]
+        threshold = float(value)
+
+        def evaluate(frame: SnapshotFrame) -> np.ndarray:
+            values = frame.column(column)
+            return compare(values, threshold) & ~np.isnan(values)
+
+        return evaluate
+
+    if operator in ('between', 'not_between'):
+        lower, upper = _parse_range(value)
+        inside = operator == 'between'
+
+        def evaluate(frame: SnapshotFrame) -> np.ndarray:
+            values = frame.column(column)
+            in_range = (values >= lower) & (values <= upper)
+            return (in_range if inside else ~in_range) & ~np.isnan(values)
+
+        return evaluate
+
+    if operator in ('in', 'not_in'):
+        members = np.array([float(v) for v in _as_list(value)], dtype=np.float64)
+        inside = operator == 'in'
+
+        def evaluate(frame: SnapshotFrame) -> np.ndarray:
+            values = frame.column(column)
+            matched = np.isin(values, members)
+            return (matched if inside else ~matched) & ~np.isnan(values)
+
+        return evaluate
+
+    if operator in PERCENTILE_OPERATORS:
+        percent = float(value)
+        if not 0 < percent <= 100:
+            raise ValueError("百分比需在 (0, 100] 之间")
+        top = operator == 'top_percent'
+
+        def evaluate(frame: SnapshotFrame) -> np.ndarray:
+            values = frame.column(column)
+            valid = ~np.isnan(values)
+            if not valid.any():
+                return valid
+            if top:
+                cutoff = np.percentile(values[valid], 100 - percent)
+                return valid & (values >= cutoff)
+            cutoff = np.percentile(values[valid], percent)
+            return valid & (values <= cutoff)
+
+        return evaluate
+
+    return None
+
+
+def _build_sql(expression: str, operator: str, value: Any, bind: Callable[[Any], str]) -> Optional[str]:
+    """按操作符生成SQL条件（NULL 在SQL中天然不满足任何比较，与快照的NaN语义一致）"""
+    if operator in COMPARISON_OPERATORS:
+        sql_operator = '=' if operator == '==' else operator
+        return f"{expression} {sql_operator} {bind(float(value))}"
+
+    if operator in ('between', 'not_between'):
+        lower, upper = _parse_range(value)
+        bounds = []
+        if np.isfinite(lower):
+            bounds.append(f"{expression} >= {bind(lower)}")
+        if np.isfinite(upper):
+            bounds.append(f"{expression} <= {bind(upper)}")
+        in_range = ' AND '.join(bounds) if bounds else f"{expression} IS NOT NULL"
+        return f"({in_range})" if operator == 'between' else f"({expression} IS NOT NULL AND NOT ({in_range}))"
+
+    if operator in ('in', 'not_in'):
+        members = [float(v) for v in _as_list(value)]
+        if not members:
+            return "1 = 0" if operator == 'in' else f"{expression} IS NOT NULL"
+        placeholders = ', '.join(bind(member) for member in members)
+        sql_operator = 'IN' if operator == 'in' else 'NOT IN'
+        return f"{expression} {sql_operator} ({placeholders})"
+
+    return None
+
+
+def _parse_range(value: Any) -> Tuple[float, float]:
+    """解析区间值：支持 [min, max]、{"min":..,"max":..} 和 "min-max" / "min~max" 字符串（边界可以为负数）"""
+    if isinstance(value, dict):
+        lower = value.get('min')
+        upper = value.get('max')
+    elif isinstance(value, (list, tuple)) and len(value) == 2:
+        lower, upper = value
+    elif isinstance(value, str):
+        match = _RANGE_PATTERN.match(value)
+        if match is None:
+            raise ValueError(f"无法解析区间: {value}")
+        lower, upper = match.groups()
+    else:
+        raise ValueError(f"无法解析区间: {value}")
+
+    lower = -np.inf if lower is None else float(lower)
+    upper = np.inf if upper is None else float(upper)
+    if lower > upper:
+        lower, upper = upper, lower
+    return lower, upper
+
+
+def _as_list(value: Any) -> List[Any]:
+    """将集合操作符的值统一为列表"""
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    if isinstance(value, str):
+        return [v for v in value.replace('，', ',').split(',') if v.strip()]
+    return [value]
@@ -2,15 +2,25 @@
 智能股票推荐服务 - 整合AI关键词拆分和数据库查询
 """
 
+import asyncio
 from typing import List, Dict, Any, Optional
 from .qwen_analyzer import QwenAnalyzer
 from .database_service import DatabaseService
+from .market_snapshot import market_snapshot
 import logging
 from datetime import datetime
 from utils.helpers import clean_text
+from utils.tiered_cache import tiered_cache
+from config import config
 
 logger = logging.getLogger(__name__)
 
+# 两级缓存命名空间
+MARKET_OVERVIEW_CACHE_NAMESPACE = "market_overview"
+
+# 行情数据有变化时失效市场概览缓存
+market_snapshot.on_change(lambda: tiered_cache.invalidate(MARKET_OVERVIEW_CACHE_NAMESPACE))
+
 class SmartStockService:
     """智能股票推荐服务"""
     
@@ -206,35 +216,38 @@ class SmartStockService:
         """
         try:
             logger.info(f"获取市场概览: {sector or '全市场'}")
+            overview = tiered_cache.get_or_set(
+                MARKET_OVERVIEW_CACHE_NAMESPACE, sector or 'all',
+                lambda: self._build_market_overview(sector),
+                ttl=config.MARKET_OVERVIEW_CACHE_TTL
+            )
+            return self._market_overview_result(sector, overview)
             
-            # 构建查询条件
-            conditions = {
-                'sectors': [sector] if sector else [],
-                'market_cap': 'any',
-                'growth_type': 'any',
-                'risk_level': 'any',
-                'time_horizon': 'any',
-                'financial_metrics': {},
-                'technical_indicators': {},
-                'keywords': [],
-                'exclusions': [],
-                'confidence': 1.0
+        except Exception as e:
+            logger.error(f"市场概览生成失败: {str(e)}")
+            return {
+                'sector': sector,
+                'error': str(e)
             }
+    
+    async def aget_market_overview(self, sector: Optional[str] = None) -> Dict[str, Any]:
+        """
+        异步获取市场概览（供异步接口调用，未命中时在线程池中用独立会话统计，不阻塞事件循环）
+        
+        Args:
+            sector: 特定行业（可选）
             
-            # 从数据库获取股票数据
-            stocks = self.database_service.search_stocks_by_conditions(conditions)
-            
-            if not stocks:
-                return {
-                    'sector': sector,
-                    'message': '暂无数据'
-                }
-            
-            # 统计分析
-            overview = self._calculate_market_statistics(stocks, sector)
-            
-            logger.info(f"市场概览生成完成: {sector or '全市场'}")
-            return overview
+        Returns:
+            市场概览数据
+        """
+        try:
+            logger.info(f"获取市场概览: {sector or '全市场'}")
+            overview = await tiered_cache.aget_or_set(
+                MARKET_OVERVIEW_CACHE_NAMESPACE, sector or 'all',
+                lambda: asyncio.to_thread(self._build_market_overview_isolated, sector),
+                ttl=config.MARKET_OVERVIEW_CACHE_TTL
+            )
+            return self._market_overview_result(sector, overview)
             
         except Exception as e:
             logger.error(f"市场概览生成失败: {str(e)}")
@@ -243,6 +256,53 @@ class SmartStockService:
                 'error': str(e)
             }
     
+    @staticmethod
+    def _market_overview_result(sector: Optional[str], overview: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if overview is None:
+            return {
+                'sector': sector,
+                'message': '暂无数据'
+            }
+        return overview
+    
+    def _build_market_overview_isolated(self, sector: Optional[str]) -> Optional[Dict[str, Any]]:
+        """在独立数据库会话中统计市场概览（供线程池调用）"""
+        database_service = DatabaseService()
+        try:
+            return self._build_market_overview(sector, database_service)
+        finally:
+            database_service.close()
+    
+    def _build_market_overview(self, sector: Optional[str],
+                               database_service: Optional[DatabaseService] = None) -> Optional[Dict[str, Any]]:
+        """统计市场概览（无数据返回None，异常向上抛出，均不写入缓存）"""
+        # 构建查询条件
+        conditions = {
+            'sectors': [sector] if sector else [],
+            'market_cap': 'any',
+            'growth_type': 'any',
+            'risk_level': 'any',
+            'time_horizon': 'any',
+            'financial_metrics': {},
+            'technical_indicators': {},
+            'keywords': [],
+            'exclusions': [],
+            'confidence': 1.0
+        }
+        
+        # 从数据库获取股票数据
+        stocks = (database_service or self.database_service).search_stocks_by_conditions(conditions)
+        
+        if not stocks:
+            # 返回None不写入缓存，数据到位后可立即生效
+            return None
+        
+        # 统计分析
+        overview = self._calculate_market_statistics(stocks, sector)
+        
+        logger.info(f"市场概览生成完成: {sector or '全市场'}")
+        return overview
+    
     def _fallback_search(self, query: str, max_results: int) -> Dict[str, Any]:
         """降级搜索方法"""
         try:
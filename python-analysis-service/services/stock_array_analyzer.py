@@ -2,6 +2,7 @@
 股票数组分析服务 - 通过通义千问结合数据库数据分析股票数组
 """
 
+import asyncio
 import logging
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
@@ -18,7 +19,7 @@ class StockArrayAnalyzer:
         self.qwen_analyzer = QwenAnalyzer()
         self.db_service = DatabaseService()
     
-    def analyze_stock_array(self, stock_symbols: List[str], analysis_type: str = "comprehensive") -> Dict[str, Any]:
+    async def analyze_stock_array(self, stock_symbols: List[str], analysis_type: str = "comprehensive") -> Dict[str, Any]:
         """
         分析股票数组
         
@@ -34,14 +35,14 @@ class StockArrayAnalyzer:
                 return self._get_empty_result("股票数组为空")
             
             # 获取股票详细数据
-            stocks_data = self._get_stocks_detailed_data(stock_symbols)
+            stocks_data = await self._get_stocks_detailed_data(stock_symbols)
             
             if not stocks_data:
                 return self._get_empty_result("未找到有效的股票数据")
             
             # 根据分析类型进行不同的分析
             if analysis_type == "comprehensive":
-                return self._comprehensive_analysis(stocks_data)
+                return await self._comprehensive_analysis(stocks_data)
             elif analysis_type == "risk":
                 return self._risk_analysis(stocks_data)
             elif analysis_type == "opportunity":
@@ -49,29 +50,31 @@ class StockArrayAnalyzer:
             elif analysis_type == "comparison":
                 return self._comparison_analysis(stocks_data)
             else:
-                return self._comprehensive_analysis(stocks_data)
+                return await self._comprehensive_analysis(stocks_data)
                 
         except Exception as e:
             logger.error(f"股票数组分析失败: {str(e)}")
             return self._get_error_result(str(e))
     
-    def _get_stocks_detailed_data(self, stock_symbols: List[str]) -> List[Dict[str, Any]]:
-        """获取股票详细数据"""
+    async def _get_stocks_detailed_data(self, stock_symbols: List[str]) -> List[Dict[str, Any]]:
+        """获取股票详细数据（并发查询，未命中缓存时在线程池中读库，不阻塞事件循环）"""
         stocks_data = []
         
-        for symbol in stock_symbols:
-            try:
-                stock_detail = self.db_service.get_stock_detail(symbol)
-                if stock_detail:
-                    stocks_data.append(stock_detail)
-                else:
-                    logger.warning(f"未找到股票数据: {symbol}")
-            except Exception as e:
-                logger.error(f"获取股票数据失败 {symbol}: {str(e)}")
+        details = await asyncio.gather(
+            *(self.db_service.aget_stock_detail(symbol) for symbol in stock_symbols),
+            return_exceptions=True
+        )
+        for symbol, stock_detail in zip(stock_symbols, details):
+            if isinstance(stock_detail, Exception):
+                logger.error(f"获取股票数据失败 {symbol}: {str(stock_detail)}")
+            elif stock_detail:
+                stocks_data.append(stock_detail)
+            else:
+                logger.warning(f"未找到股票数据: {symbol}")
         
         return stocks_data
     
-    def _comprehensive_analysis(self, stocks_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    async def _comprehensive_analysis(self, stocks_data: List[Dict[str, Any]]) -> Dict[str, Any]:
         """综合分析"""
         try:
             # 基础统计分析
@@ -90,7 +93,7 @@ class StockArrayAnalyzer:
             risk_assessment = self._assess_portfolio_risk(stocks_data)
             
             # 使用通义千问生成综合分析报告
-            ai_analysis = self._generate_ai_comprehensive_analysis(stocks_data, {
+            ai_analysis = await self._generate_ai_comprehensive_analysis(stocks_data, {
                 'basic_stats': basic_stats,
                 'sector_analysis': sector_analysis,
                 'financial_analysis': financial_analysis,
@@ -345,7 +348,7 @@ class StockArrayAnalyzer:
             logger.error(f"行业分布分析失败: {str(e)}")
             return {}
     
-    def _generate_ai_comprehensive_analysis(self, stocks_data: List[Dict[str, Any]], analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def _generate_ai_comprehensive_analysis(self, stocks_data: List[Dict[str, Any]], analysis_data: Dict[str, Any]) -> Dict[str, Any]:
         """生成AI综合分析"""
         if not self.qwen_analyzer.is_available:
             return self._get_ai_fallback_analysis("comprehensive")
@@ -386,7 +389,7 @@ class StockArrayAnalyzer:
                 {"role": "user", "content": user_content}
             ]
             
-            response_content = self.qwen_analyzer._make_api_call(messages)
+            response_content = await self.qwen_analyzer._make_api_call(messages)
             
             # 解析JSON响应
             try:
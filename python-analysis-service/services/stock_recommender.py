@@ -6,9 +6,13 @@
 import logging
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
+import numpy as np
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from config import config
+from datetime import datetime
+from services.market_snapshot import SnapshotFrame, market_snapshot
+from services.screening_engine import compile_conditions, compile_conditions_sql, iter_conditions, rank_indices
 
 logger = logging.getLogger(__name__)
 
@@ -171,7 +175,7 @@ class StockRecommender:
         # 如果有结构化条件，优先使用结构化条件，不再提取传统关键词
         if hasattr(keyword_analysis, 'structured_conditions') and keyword_analysis.structured_conditions:
             logger.info(f"检测到结构化条件，将使用结构化查询，条件数量: {len(keyword_analysis.structured_conditions)}")
-            for condition in keyword_analysis.structured_conditions:
+            for condition in iter_conditions(keyword_analysis.structured_conditions):
                 if hasattr(condition, 'field') and condition.field:
                     logger.info(f"结构化条件: {condition.field} {condition.operator} {condition.value}")
             # 返回空关键词列表，强制使用结构化条件查询
@@ -245,7 +249,14 @@ class StockRecommender:
         return keywords
     
     def _query_stocks(self, keywords: List[str], limit: int, keyword_analysis=None) -> List[Dict]:
-        """查询股票数据 - 支持结构化条件"""
+        """查询股票数据 - 支持结构化条件，市场快照可用时在进程内完成筛选"""
+        if market_snapshot.is_ready:
+            try:
+                return self._screen_frame(market_snapshot.frame, keywords, limit, keyword_analysis)
+            except Exception as e:
+                # 快照筛选出错时回退到数据库查询，而不是返回空结果
+                logger.error(f"快照筛选失败，回退到数据库查询: {e}")
+        
         session = self.SessionLocal()
         try:
             # 构建基础查询 - 支持多表联查
@@ -295,36 +306,24 @@ class StockRecommender:
             where_conditions = []
             params = {}
             
-            # 优先使用结构化条件
+            # 优先使用结构化条件（与快照筛选共用同一套字段映射和条件组编译）
+            compiled = None
             if keyword_analysis and hasattr(keyword_analysis, 'structured_conditions') and keyword_analysis.structured_conditions:
-                logger.info("使用结构化条件构建SQL查询")
-                structured_conditions_applied = False
-                
-                for condition in keyword_analysis.structured_conditions:
-                    field = condition.field if hasattr(condition, 'field') else ''
-                    operator = condition.operator if hasattr(condition, 'operator') else ''
-                    value = condition.value if hasattr(condition, 'value') else ''
-                    period = condition.period if hasattr(condition, 'period') else ''
-                    
-                    logger.info(f"结构化条件: {field} {operator} {value}" + (f" (周期: {period})" if period else ""))
-                    
-                    # 映射字段名到数据库列名
-                    db_field = self._map_field_to_db_column(field)
-                    if db_field and operator and value is not None:
-                        condition_sql = self._build_condition_sql(db_field, operator, value, len(params))
-                        if condition_sql:
-                            where_conditions.append(condition_sql['sql'])
-                            params.update(condition_sql['params'])
-                            structured_conditions_applied = True
-                            logger.info(f"添加结构化条件: {field} {operator} {value} -> {condition_sql['sql']}")
-                    else:
-                        logger.info(f"跳过条件: {field} {operator} {value} (字段映射失败或参数无效)")
-                
-                if structured_conditions_applied:
-                    logger.info("成功应用结构化条件")
-                else:
-                    logger.info("结构化条件无法应用，回退到关键词搜索")
-                    self._add_keyword_conditions(where_conditions, params, keywords)
+                compiled = compile_conditions_sql(keyword_analysis.structured_conditions)
+                for description in compiled.skipped:
+                    logger.info(f"跳过条件: {description}")
+            
+            if compiled is not None and not compiled.complete:
+                # 含百分位等无法用SQL表达的条件：读取全部活跃股票，按快照同样的方式在进程内筛选
+                logger.info(f"结构化条件需要进程内求值: {compiled.applied}")
+                result = session.execute(text(base_query))
+                frame = SnapshotFrame.from_rows([dict(row._mapping) for row in result], datetime.now())
+                return self._screen_frame(frame, keywords, limit, keyword_analysis)
+            
+            if compiled is not None and compiled.where:
+                logger.info(f"应用结构化条件: {compiled.applied} -> {compiled.where}")
+                where_conditions.append(compiled.where)
+                params.update(compiled.params)
             else:
                 # 回退到关键词搜索
                 logger.info("使用关键词搜索")
@@ -357,6 +356,46 @@ class StockRecommender:
         finally:
             session.close()
     
+    def _screen_frame(self, frame: SnapshotFrame, keywords: List[str], limit: int, keyword_analysis=None) -> List[Dict]:
+        """在列式快照上向量化筛选并排序，结构化条件由筛选引擎编译为掩码（市场快照和SQL回退的进程内求值共用）"""
+        mask = np.ones(len(frame), dtype=bool)
+        
+        screen = None
+        if keyword_analysis and hasattr(keyword_analysis, 'structured_conditions') and keyword_analysis.structured_conditions:
+            screen = compile_conditions(keyword_analysis.structured_conditions)
+            for description in screen.skipped:
+                logger.info(f"跳过条件: {description}")
+        
+        if screen is not None and not screen.is_empty:
+            logger.info(f"应用结构化条件: {screen.applied}")
+            mask &= screen.evaluate(frame)
+        else:
+            keyword_mask = self._build_keyword_mask(frame, keywords)
+            if keyword_mask is not None:
+                mask &= keyword_mask
+        
+        # 基本过滤条件（与SQL版本一致）
+        market_cap = frame.column('marketCap')
+        pe_ratio = frame.column('peRatio')
+        mask &= (market_cap > 0) & (pe_ratio > 0) & (pe_ratio < 100)
+        
+        # 排序：优先市值大且PE合理的股票
+        candidates = rank_indices(mask, market_cap / (pe_ratio + 1), limit * 3)
+        
+        stocks = frame.records(candidates)
+        logger.info(f"筛选到 {len(stocks)} 只股票（共 {len(frame)} 只）")
+        return stocks
+    
+    def _build_keyword_mask(self, frame, keywords: List[str]) -> Optional[np.ndarray]:
+        """构建关键词掩码（名称或行业包含任一有效关键词）"""
+        mask = None
+        for keyword in keywords or []:
+            if not keyword or keyword.lower() in ['优质股', '股票', '推荐', '好股', '优质', '投资']:
+                continue
+            keyword_mask = frame.contains(['name', 'sector'], keyword)
+            mask = keyword_mask if mask is None else mask | keyword_mask
+        return mask
+    
     def _format_market_cap(self, market_cap: float) -> str:
         """格式化市值显示"""
         if market_cap >= 1e12:
@@ -385,7 +424,7 @@ class StockRecommender:
             return condition_values
         
         # 从股票数据中获取对应字段的实际值
-        for condition in keyword_analysis.structured_conditions:
+        for condition in iter_conditions(keyword_analysis.structured_conditions):
             field = condition.field if hasattr(condition, 'field') else ''
             if not field:
                 continue
@@ -442,69 +481,6 @@ class StockRecommender:
         
         return str(value)
     
-    def _map_field_to_db_column(self, field: str) -> str:
-        """映射字段名到数据库列名"""
-        field_mapping = {
-            '市盈率': 'si.peRatio',
-            '市净率': 'si.pbRatio', 
-            'PE': 'si.peRatio',
-            'PB': 'si.pbRatio',
-            '市值': 'si.marketCap',
-            '股价': 'sd.close',
-            '股息率': 'si.dividendYield',
-            # 从stock_financial表查询的字段
-            'ROE': 'sf.roe',
-            '净资产收益率': 'sf.roe',
-            '毛利率': 'sf.grossMargin',
-            '净利率': 'sf.netMargin',
-            '营收': 'sf.revenue',
-            '营业收入': 'sf.revenue',
-            '净利润': 'sf.netProfit',
-            # 从stock_performance表查询的字段
-            '收益率': 'sp.totalReturn',
-            '总收益率': 'sp.totalReturn',
-            '年化收益率': 'sp.annualizedReturn',
-            '最大回撤': 'sp.maxDrawdown',
-            '夏普比率': 'sp.sharpeRatio',
-            '波动率': 'sp.volatility',
-        }
-        
-        # 排除时间周期相关字段，这些不应该映射到数据库字段
-        excluded_fields = ['时间周期', '周期', '期间']
-        if field in excluded_fields:
-            logger.info(f"字段 '{field}' 是时间周期相关字段，不进行数据库映射")
-            return None
-            
-        result = field_mapping.get(field, None)
-        if result is None:
-            logger.warning(f"字段 '{field}' 暂不支持数据库查询，将跳过此条件")
-        return result
-    
-    def _build_condition_sql(self, db_field: str, operator: str, value: any, param_index: int) -> dict:
-        """构建SQL条件"""
-        if not db_field:
-            return None
-            
-        param_name = f"condition_{param_index}"
-        
-        operator_mapping = {
-            '>': '>',
-            '<': '<', 
-            '>=': '>=',
-            '<=': '<=',
-            '=': '=',
-            '!=': '!='
-        }
-        
-        sql_operator = operator_mapping.get(operator)
-        if not sql_operator:
-            return None
-            
-        return {
-            'sql': f"{db_field} {sql_operator} :{param_name}",
-            'params': {param_name: value}
-        }
-    
     def _add_keyword_conditions(self, where_conditions: list, params: dict, keywords: List[str]):
         """添加关键词搜索条件"""
         if keywords:
@@ -534,11 +510,11 @@ class StockRecommender:
         """生成股票推荐"""
         recommendations = []
         
-        for stock in stocks_data:
+        # 一次性批量计算所有候选股票的匹配度
+        match_results = self._calculate_match_scores(stocks_data, keywords, query, keyword_analysis)
+        
+        for stock, (match_score, match_reasons) in zip(stocks_data, match_results):
             try:
-                # 计算匹配度
-                match_score, match_reasons = self._calculate_match_score(stock, keywords, query, keyword_analysis)
-                
                 # 评估风险等级
                 risk_level = self._assess_risk_level(stock)
                 
@@ -574,172 +550,127 @@ class StockRecommender:
         
         return recommendations
     
-    def _calculate_match_score(self, stock: Dict, keywords: List[str], query: str, keyword_analysis=None) -> tuple[float, List[str]]:
-        """计算匹配度评分 - 增强版，结合AI分析结果"""
-        score = 0.0
-        reasons = []
-        
-        stock_name = stock.get("name", "")
-        stock_sector = stock.get("sector", "")
-        stock_symbol = stock.get("symbol", "")
-        
-        # 调试日志
-        logger.info(f"计算匹配度 - 股票: {stock_symbol} {stock_name}, 行业: {stock_sector}")
-        logger.info(f"关键词: {keywords}")
-        if keyword_analysis:
-            logger.info(f"AI关键词 - 行业: {keyword_analysis.industry_keywords}, 概念: {keyword_analysis.concept_keywords}")
-        
-        # 基础匹配 (权重: 30%)
-        # 名称匹配 - 改进匹配逻辑
-        name_matched = False
-        for keyword in keywords:
-            if keyword and stock_name:
-                # 简单的字符串包含检查
-                if keyword in stock_name:
-                    score += 0.2
-                    reasons.append(f"名称包含: {keyword}")
-                    name_matched = True
-                    logger.info(f"名称匹配成功: {keyword} in {stock_name}")
-                    break
-        
-        if not name_matched:
-            logger.info(f"名称匹配失败 - 关键词: {keywords}, 股票名称: {stock_name}")
-        
-        # 行业匹配 - 改进匹配逻辑
-        sector_matched = False
-        for keyword in keywords:
-            if keyword and stock_sector:
-                # 简单的字符串包含检查
-                if keyword in stock_sector:
-                    score += 0.1
-                    reasons.append(f"行业匹配: {keyword}")
-                    sector_matched = True
-                    logger.info(f"行业匹配成功: {keyword} in {stock_sector}")
-                    break
-        
-        if not sector_matched:
-            logger.info(f"行业匹配失败 - 关键词: {keywords}, 股票行业: {stock_sector}")
+    def _calculate_match_scores(self, stocks: List[Dict], keywords: List[str], query: str, keyword_analysis=None) -> List[tuple[float, List[str]]]:
+        """批量计算匹配度评分 - 关键词命中矩阵 + NumPy加权求和，结合AI分析结果
+        
+        各项加分的累加顺序与逐只计算时一致，保证得分和匹配原因完全相同
+        """
+        count = len(stocks)
+        if count == 0:
+            return []
+        
+        names = np.array([stock.get("name") or "" for stock in stocks], dtype=str)
+        sectors = np.array([stock.get("sector") or "" for stock in stocks], dtype=str)
+        pe_ratios = self._numeric_column(stocks, "peRatio")
+        pb_ratios = self._numeric_column(stocks, "pbRatio")
+        market_caps = self._numeric_column(stocks, "marketCap")
+        
+        score = np.zeros(count, dtype=np.float64)
+        # 每项匹配原因: (命中掩码, 每只股票的原因文本生成函数)
+        reason_parts = []
+        
+        def first_hit(hit_matrix: np.ndarray, terms: List[str], weight: float, label: str):
+            """关键词命中矩阵(K×N)中取每只股票首个命中的关键词"""
+            nonlocal score
+            if not terms:
+                return
+            matched = hit_matrix.any(axis=0)
+            first = hit_matrix.argmax(axis=0)
+            score = score + np.where(matched, weight, 0.0)
+            reason_parts.append((matched, lambda i: f"{label}: {terms[first[i]]}"))
+        
+        def hit_matrix(terms: List[str], columns: List[np.ndarray]) -> np.ndarray:
+            matrix = np.zeros((len(terms), count), dtype=bool)
+            for k, term in enumerate(terms):
+                for column in columns:
+                    matrix[k] |= np.char.find(column, term) >= 0
+            return matrix
+        
+        # 基础匹配 (权重: 30%) - 名称匹配、行业匹配
+        valid_keywords = [keyword for keyword in keywords if keyword]
+        first_hit(hit_matrix(valid_keywords, [names]), valid_keywords, 0.2, "名称包含")
+        first_hit(hit_matrix(valid_keywords, [sectors]), valid_keywords, 0.1, "行业匹配")
         
         # AI增强匹配 (权重: 40%)
         if keyword_analysis:
-            # 行业关键词匹配 (权重: 20%)
-            if keyword_analysis.industry_keywords:
-                industry_matched = False
-                for industry_kw in keyword_analysis.industry_keywords:
-                    if industry_kw:
-                        # 简单的字符串包含检查
-                        name_match = stock_name and industry_kw in stock_name
-                        sector_match = stock_sector and industry_kw in stock_sector
-                        
-                        if name_match or sector_match:
-                            score += 0.15
-                            reasons.append(f"AI行业匹配: {industry_kw}")
-                            industry_matched = True
-                            logger.info(f"AI行业匹配成功: {industry_kw}")
-                            break
-                
-                if not industry_matched:
-                    logger.info(f"AI行业匹配失败 - AI行业关键词: {keyword_analysis.industry_keywords}")
+            industry_keywords = [kw for kw in (keyword_analysis.industry_keywords or []) if kw]
+            first_hit(hit_matrix(industry_keywords, [names, sectors]), industry_keywords, 0.15, "AI行业匹配")
             
-            # 概念关键词匹配 (权重: 15%)
-            if keyword_analysis.concept_keywords:
-                concept_matched = False
-                for concept_kw in keyword_analysis.concept_keywords:
-                    if concept_kw:
-                        # 简单的字符串包含检查
-                        name_match = stock_name and concept_kw in stock_name
-                        sector_match = stock_sector and concept_kw in stock_sector
-                        
-                        if name_match or sector_match:
-                            score += 0.1
-                            reasons.append(f"AI概念匹配: {concept_kw}")
-                            concept_matched = True
-                            logger.info(f"AI概念匹配成功: {concept_kw}")
-                            break
-                
-                if not concept_matched:
-                    logger.info(f"AI概念匹配失败 - AI概念关键词: {keyword_analysis.concept_keywords}")
+            concept_keywords = [kw for kw in (keyword_analysis.concept_keywords or []) if kw]
+            first_hit(hit_matrix(concept_keywords, [names, sectors]), concept_keywords, 0.1, "AI概念匹配")
             
             # 情感倾向影响 (权重: 5%)
             if keyword_analysis.sentiment == "positive":
-                score += 0.05
-                reasons.append("积极情感倾向")
-                logger.info("添加积极情感倾向加分")
+                score = score + 0.05
+                reason_parts.append((None, lambda i: "积极情感倾向"))
             elif keyword_analysis.sentiment == "negative":
-                score -= 0.05
-                reasons.append("消极情感影响")
-                logger.info("减去消极情感影响")
+                score = score - 0.05
+                reason_parts.append((None, lambda i: "消极情感影响"))
         
         # 财务指标匹配 (权重: 20%)
-        pe_ratio = stock.get("peRatio")
-        pb_ratio = stock.get("pbRatio")
+        low_pe = (pe_ratios > 0) & (pe_ratios < 20)
+        low_pb = (pb_ratios > 0) & (pb_ratios < 2)
         
-        logger.info(f"财务指标 - PE: {pe_ratio}, PB: {pb_ratio}")
-        
-        # 检查AI分析的财务关键词
         if keyword_analysis and keyword_analysis.financial_keywords:
             for financial_kw in keyword_analysis.financial_keywords:
                 if "低估值" in financial_kw or "PE" in financial_kw:
-                    if pe_ratio and 0 < pe_ratio < 20:
-                        score += 0.1
-                        reasons.append(f"符合低估值要求: PE {pe_ratio:.1f}")
-                        logger.info(f"财务匹配: 低PE {pe_ratio}")
+                    score = score + np.where(low_pe, 0.1, 0.0)
+                    reason_parts.append((low_pe, lambda i: f"符合低估值要求: PE {pe_ratios[i]:.1f}"))
                 
                 if "低估值" in financial_kw or "PB" in financial_kw:
-                    if pb_ratio and 0 < pb_ratio < 2:
-                        score += 0.1
-                        reasons.append(f"符合低估值要求: PB {pb_ratio:.2f}")
-                        logger.info(f"财务匹配: 低PB {pb_ratio}")
+                    score = score + np.where(low_pb, 0.1, 0.0)
+                    reason_parts.append((low_pb, lambda i: f"符合低估值要求: PB {pb_ratios[i]:.2f}"))
                 
                 if "高分红" in financial_kw:
                     # 这里可以添加分红率检查逻辑
-                    score += 0.05
-                    reasons.append("符合高分红要求")
-                    logger.info("财务匹配: 高分红")
+                    score = score + 0.05
+                    reason_parts.append((None, lambda i: "符合高分红要求"))
         else:
             # 传统财务指标检查
             if "低估值" in query or "PE" in query:
-                if pe_ratio and 0 < pe_ratio < 20:
-                    score += 0.1
-                    reasons.append(f"低PE估值: {pe_ratio:.1f}")
-                    logger.info(f"传统财务匹配: 低PE {pe_ratio}")
+                score = score + np.where(low_pe, 0.1, 0.0)
+                reason_parts.append((low_pe, lambda i: f"低PE估值: {pe_ratios[i]:.1f}"))
             
             if "低估值" in query or "PB" in query:
-                if pb_ratio and 0 < pb_ratio < 2:
-                    score += 0.1
-                    reasons.append(f"低PB估值: {pb_ratio:.2f}")
-                    logger.info(f"传统财务匹配: 低PB {pb_ratio}")
+                score = score + np.where(low_pb, 0.1, 0.0)
+                reason_parts.append((low_pb, lambda i: f"低PB估值: {pb_ratios[i]:.2f}"))
         
-        # 市值权重 (权重: 10%)
-        market_cap = stock.get("marketCap")
-        if market_cap:
-            if market_cap > 100_000_000_000:  # 1000亿以上
-                score += 0.1
-                reasons.append("大盘蓝筹")
-                logger.info(f"市值加分: 大盘蓝筹 {market_cap/100000000:.0f}亿")
-            elif market_cap > 50_000_000_000:  # 500亿以上
-                score += 0.05
-                reasons.append("中大盘股")
-                logger.info(f"市值加分: 中大盘股 {market_cap/100000000:.0f}亿")
+        # 市值权重 (权重: 10%) - 1000亿以上为大盘蓝筹，500亿以上为中大盘股
+        large_cap = market_caps > 100_000_000_000
+        mid_cap = ~large_cap & (market_caps > 50_000_000_000)
+        score = score + np.where(large_cap, 0.1, np.where(mid_cap, 0.05, 0.0))
+        reason_parts.append((large_cap, lambda i: "大盘蓝筹"))
+        reason_parts.append((mid_cap, lambda i: "中大盘股"))
         
         # AI置信度加权
         if keyword_analysis and hasattr(keyword_analysis, 'confidence'):
             confidence_bonus = keyword_analysis.confidence * 0.1
-            score += confidence_bonus
+            score = score + confidence_bonus
             if confidence_bonus > 0.05:
-                reasons.append(f"AI分析高置信度: {keyword_analysis.confidence:.2f}")
-            logger.info(f"AI置信度加分: {confidence_bonus:.3f}")
+                reason_parts.append((None, lambda i: f"AI分析高置信度: {keyword_analysis.confidence:.2f}"))
         
         # 如果匹配度仍然为0，给一个基础分数
-        if score == 0.0:
-            score = 0.1  # 给予基础匹配分数
-            reasons.append("基础匹配")
-            logger.warning(f"股票 {stock_symbol} {stock_name} 匹配度为0，给予基础分数")
+        unmatched = score == 0.0
+        score = np.where(unmatched, 0.1, score)
+        reason_parts.append((unmatched, lambda i: "基础匹配"))
         
-        final_score = min(score, 1.0)
-        logger.info(f"最终匹配度: {final_score:.3f}, 匹配原因: {reasons}")
+        final_scores = np.minimum(score, 1.0)
         
-        return final_score, reasons
+        results = []
+        for i in range(count):
+            reasons = [describe(i) for mask, describe in reason_parts if mask is None or mask[i]]
+            results.append((float(final_scores[i]), reasons))
+        
+        logger.info(f"批量计算匹配度完成: {count} 只股票，未命中 {int(unmatched.sum())} 只")
+        return results
+    
+    @staticmethod
+    def _numeric_column(stocks: List[Dict], key: str) -> np.ndarray:
+        """提取数值列，缺失值为NaN"""
+        return np.array(
+            [np.nan if stock.get(key) is None else float(stock[key]) for stock in stocks],
+            dtype=np.float64
+        )
     
     def _assess_risk_level(self, stock: Dict) -> str:
         """评估风险等级"""
@@ -0,0 +1,332 @@
+"""
+工作流DAG编译与调度
+编译：一次 O(V+E) 遍历把工作流定义转换为不可变的执行计划（节点索引、上下游邻接数组、
+拓扑顺序、层级和校验结果），按定义内容哈希缓存，同一定义再次校验/运行时直接复用
+调度：按节点依赖关系执行计划中的节点
+- 节点的上游全部完成后立即启动，互不依赖的分支并发执行（受并发上限约束）
+- 上游节点的输出作为下游节点的输入
+- 任一节点失败或外部要求停止后不再启动新节点，等待已启动的节点结束
+- 按实际耗时计算关键路径（决定整体耗时的最长依赖链）
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+
+from config import config
+from utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# 节点执行函数：(节点定义, {上游节点ID: 上游输出}) -> 节点结果（success 为 False 表示失败）
+NodeExecutor = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+# 节点数超过该值时给出性能警告
+LARGE_WORKFLOW_NODES = 10
+
+
+@dataclass(frozen=True)
+class WorkflowPlan:
+    """编译后的工作流执行计划（不可变，可在多次执行之间共享）"""
+
+    key: str
+    nodes: Tuple[Dict[str, Any], ...]  # 计划内部使用，对外只通过 node() 或调度器交出副本
+    index: Mapping[str, int]
+    upstream: Tuple[Tuple[int, ...], ...]
+    downstream: Tuple[Tuple[int, ...], ...]
+    order: Tuple[int, ...]  # 拓扑顺序（存在循环依赖时不完整）
+    levels: Tuple[int, ...]  # 节点所在层级（最长上游链长度）
+    errors: Tuple[str, ...]
+    warnings: Tuple[str, ...]
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+    @property
+    def node_ids(self) -> List[str]:
+        return [node["id"] for node in self.nodes]
+
+    def node(self, node_id: str) -> Dict[str, Any]:
+        """按ID取节点定义（返回副本，计划在多次执行之间共享，不能被调用方修改）"""
+        return copy.deepcopy(self.nodes[self.index[node_id]])
+
+    def execution_order(self) -> List[str]:
+        """拓扑排序后的节点ID"""
+        return [self.nodes[i]["id"] for i in self.order]
+
+    def validation_report(self) -> Dict[str, Any]:
+        return {
+            "valid": self.valid,
+            "errors": list(self.errors),
+            "warnings": list(self.warnings)
+        }
+
+
+def definition_hash(workflow_definition: Dict[str, Any]) -> str:
+    """工作流定义内容哈希（名称、节点和连接）"""
+    payload = json.dumps({
+        "name": workflow_definition.get("name"),
+        "nodes": workflow_definition.get("nodes", []),
+        "connections": workflow_definition.get("connections", []),
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _build_plan(key: str, workflow_definition: Dict[str, Any]) -> WorkflowPlan:
+    """一次遍历完成节点/连接校验、邻接数组构建、环检测、拓扑排序和分层"""
+    errors: List[str] = []
+    warnings: List[str] = []
+
+    if not workflow_definition.get("name"):
+        errors.append("工作流名称不能为空")
+
+    raw_nodes = workflow_definition.get("nodes", [])
+    connections = workflow_definition.get("connections", [])
+    if not raw_nodes:
+        errors.append("工作流必须包含至少一个节点")
+
+    # 节点：按定义顺序建立 ID -> 索引
+    nodes: List[Dict[str, Any]] = []
+    index: Dict[str, int] = {}
+    for node in raw_nodes:
+        node_id = node.get("id")
+        if not node_id:
+            errors.append("节点必须有唯一ID")
+            continue
+        if node_id in index:
+            errors.append(f"节点ID重复: {node_id}")
+        else:
+            index[node_id] = len(nodes)
+            nodes.append(copy.deepcopy(node))
+        if not node.get("type"):
+            errors.append(f"节点{node_id}缺少类型定义")
+        if not node.get("name"):
+            errors.append(f"节点{node_id}缺少名称")
+
+    # 连接：校验端点并构建邻接表
+    upstream: List[List[int]] = [[] for _ in nodes]
+    downstream: List[List[int]] = [[] for _ in nodes]
+    connected = set()
+    for connection in connections:
+        source_id = connection.get("sourceId")
+        target_id = connection.get("targetId")
+        if source_id:
+            connected.add(source_id)
+        if target_id:
+            connected.add(target_id)
+        if not source_id or not target_id:
+            errors.append("连接必须指定源节点和目标节点")
+            continue
+        if source_id not in index:
+            errors.append(f"连接引用了不存在的源节点: {source_id}")
+        if target_id not in index:
+            errors.append(f"连接引用了不存在的目标节点: {target_id}")
+        if source_id in index and target_id in index:
+            upstream[index[target_id]].append(index[source_id])
+            downstream[index[source_id]].append(index[target_id])
+
+    # Kahn 拓扑排序：排不完的节点在环上；层级为最长上游链长度
+    in_degree = [len(parents) for parents in upstream]
+    levels = [0] * len(nodes)
+    queue = deque(i for i, degree in enumerate(in_degree) if degree == 0)
+    order: List[int] = []
+    while queue:
+        current = queue.popleft()
+        order.append(current)
+        for child in downstream[current]:
+            levels[child] = max(levels[child], levels[current] + 1)
+            in_degree[child] -= 1
+            if in_degree[child] == 0:
+                queue.append(child)
+    if len(order) != len(nodes):
+        errors.append("工作流存在循环依赖")
+
+    if len(raw_nodes) > LARGE_WORKFLOW_NODES:
+        warnings.append("工作流节点数量较多，可能影响执行性能")
+    isolated = [node["id"] for node in nodes if node["id"] not in connected]
+    if isolated:
+        warnings.append(f"发现孤立节点: {', '.join(isolated)}")
+
+    return WorkflowPlan(
+        key=key,
+        nodes=tuple(nodes),
+        index=MappingProxyType(index),
+        upstream=tuple(tuple(parents) for parents in upstream),
+        downstream=tuple(tuple(children) for children in downstream),
+        order=tuple(order),
+        levels=tuple(levels),
+        errors=tuple(errors),
+        warnings=tuple(warnings),
+    )
+
+
+class WorkflowPlanCompiler:
+    """工作流定义编译器（按定义内容哈希缓存编译结果）"""
+
+    def __init__(self, max_plans: int = 256):
+        self._plans = LRUCache(max_size=max_plans, ttl=None)
+
+    def compile(self, workflow_definition: Dict[str, Any]) -> WorkflowPlan:
+        key = definition_hash(workflow_definition)
+        return self._plans.get_or_set(key, lambda: _build_plan(key, workflow_definition))
+
+    def stats(self) -> Dict[str, Any]:
+        return self._plans.stats()
+
+
+@dataclass
+class DagRunResult:
+    """一次DAG执行的结果"""
+
+    results: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    failed: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    timings: Dict[str, Tuple[float, float]] = field(default_factory=dict)
+    critical_path: List[str] = field(default_factory=list)
+    critical_path_seconds: float = 0.0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def success(self) -> bool:
+        return not self.failed and not self.skipped
+
+    def summary(self) -> Dict[str, Any]:
+        """关键路径与耗时摘要（写入执行结果）"""
+        return {
+            "nodes": self.critical_path,
+            "duration": round(self.critical_path_seconds, 3),
+            "elapsed": round(self.elapsed_seconds, 3),
+            "nodeDurations": {
+                node_id: round(end - start, 3) for node_id, (start, end) in self.timings.items()
+            },
+        }
+
+
+class DagScheduler:
+    """工作流DAG调度器"""
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        """
+        Args:
+            max_concurrency: 同时执行的节点数上限
+        """
+        self.max_concurrency = max(1, max_concurrency or config.WORKFLOW_MAX_CONCURRENCY)
+
+    async def run(self, plan: WorkflowPlan, execute: NodeExecutor,
+                  should_continue: Optional[Callable[[], bool]] = None) -> DagRunResult:
+        """
+        执行整个计划
+
+        Args:
+            plan: 编译后的执行计划
+            execute: 节点执行函数
+            should_continue: 每次启动新节点前调用，返回 False 时不再启动新节点（如用户停止执行）
+
+        Returns:
+            DagRunResult
+        """
+        nodes = plan.nodes
+        remaining = [len(parents) for parents in plan.upstream]
+        ready = deque(i for i, count in enumerate(remaining) if count == 0)
+        running: Dict[asyncio.Task, int] = {}
+        result = DagRunResult()
+        finished_order: List[int] = []
+        started_at = time.perf_counter()
+        halted = False
+
+        try:
+            while True:
+                while ready and len(running) < self.max_concurrency and not halted:
+                    if should_continue and not should_continue():
+                        halted = True
+                        break
+                    i = ready.popleft()
+                    inputs = {
+                        nodes[parent]["id"]: result.results[nodes[parent]["id"]].get("data")
+                        for parent in plan.upstream[i]
+                    }
+                    # 节点执行函数拿到的是副本，修改不会影响缓存的计划
+                    task = asyncio.create_task(
+                        self._run_node(copy.deepcopy(nodes[i]), inputs, execute, result.timings)
+                    )
+                    running[task] = i
+
+                if not running:
+                    break
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    i = running.pop(task)
+                    node_result = task.result()
+                    finished_order.append(i)
+                    if not node_result.get("success", True):
+                        result.failed.append(nodes[i]["id"])
+                        halted = True
+                        continue
+
+                    result.results[nodes[i]["id"]] = node_result
+                    for child in plan.downstream[i]:
+                        remaining[child] -= 1
+                        if remaining[child] == 0:
+                            ready.append(child)
+        finally:
+            for task in running:
+                task.cancel()
+
+        result.skipped = [node["id"] for node in nodes if node["id"] not in result.timings]
+        if result.skipped and not halted:
+            # 没有失败却有节点无法启动，只可能是循环依赖
+            logger.error(f"工作流存在循环依赖，未执行节点: {result.skipped}")
+
+        result.elapsed_seconds = time.perf_counter() - started_at
+        result.critical_path, result.critical_path_seconds = self._critical_path(plan, finished_order, result.timings)
+        return result
+
+    @staticmethod
+    async def _run_node(node: Dict[str, Any], inputs: Dict[str, Any], execute: NodeExecutor,
+                        timings: Dict[str, Tuple[float, float]]) -> Dict[str, Any]:
+        """执行单个节点并记录起止时间，异常视为节点失败"""
+        start = time.perf_counter()
+        try:
+            return await execute(node, inputs)
+        except Exception as e:
+            logger.error(f"节点执行异常: {node['id']}, 错误: {e}")
+            return {"success": False, "error": str(e), "node_id": node["id"]}
+        finally:
+            timings[node["id"]] = (start, time.perf_counter())
+
+    @staticmethod
+    def _critical_path(plan: WorkflowPlan, finished_order: List[int],
+                       timings: Dict[str, Tuple[float, float]]) -> Tuple[List[str], float]:
+        """按节点耗时计算最长依赖链（完成顺序即拓扑顺序）"""
+        longest: Dict[int, float] = {}
+        previous: Dict[int, Optional[int]] = {}
+        for i in finished_order:
+            start, end = timings[plan.nodes[i]["id"]]
+            parents = [parent for parent in plan.upstream[i] if parent in longest]
+            best = max(parents, key=longest.get, default=None)
+            longest[i] = (end - start) + (longest[best] if best is not None else 0.0)
+            previous[i] = best
+
+        if not longest:
+            return [], 0.0
+
+        i = max(longest, key=longest.get)
+        total = longest[i]
+        path = []
+        while i is not None:
+            path.append(plan.nodes[i]["id"])
+            i = previous[i]
+        return path[::-1], total
+
+
+# 全局工作流编译器
+workflow_plan_compiler = WorkflowPlanCompiler(max_plans=config.WORKFLOW_PLAN_CACHE_SIZE)
@@ -0,0 +1,133 @@
+"""
+工作流节点结果缓存（内容寻址）
+节点结果按 (节点类型, 节点配置, 上游结果哈希, 数据快照版本) 的哈希缓存：
+- 重新运行同一工作流定义时，配置和上游输入未变化的节点直接复用结果
+- 修改某个节点后，只有该节点及其下游（上游结果哈希随之变化）重新执行
+- 只缓存成功的结果，缓存项受TTL、条数和近似字节数限制
+- 内容相同的节点并发未命中时只执行一次
+"""
+
+import copy
+import hashlib
+import json
+import logging
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from config import config
+from services.market_snapshot import market_snapshot
+from utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# 结果只取决于配置和输入的节点类型
+CACHEABLE_NODE_TYPES = ("data", "analysis", "strategy")
+
+
+def content_hash(value: Any) -> str:
+    """任意JSON结构的稳定哈希"""
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def current_data_version(context: Optional[Dict[str, Any]] = None) -> str:
+    """
+    当前数据快照版本：调用方在上下文中指定的 dataVersion，
+    否则为行情快照的加载时间，快照未就绪时为当天日期
+    """
+    if context and context.get("dataVersion"):
+        return str(context["dataVersion"])
+    frame = market_snapshot.frame
+    if frame is not None:
+        return frame.loaded_at.isoformat()
+    return date.today().isoformat()
+
+
+class _NodeFailed(Exception):
+    """节点执行失败（失败结果不写入缓存）"""
+
+    def __init__(self, result: Dict[str, Any]):
+        super().__init__(result.get("error"))
+        self.result = result
+
+
+class NodeResultMemo:
+    """工作流节点结果缓存"""
+
+    def __init__(self, enabled: bool = True, ttl: Optional[int] = 3600, max_entries: int = 1000,
+                 max_bytes: Optional[int] = None, cacheable_types: Iterable[str] = CACHEABLE_NODE_TYPES):
+        """
+        Args:
+            enabled: 是否启用缓存
+            ttl: 缓存过期时间（秒）
+            max_entries: 最大缓存条数
+            max_bytes: 近似字节数上限
+            cacheable_types: 允许缓存的节点类型
+        """
+        self.enabled = enabled
+        self.cacheable_types = set(cacheable_types)
+        self._cache = LRUCache(max_size=max_entries, ttl=ttl, max_bytes=max_bytes)
+
+    def node_key(self, node: Dict[str, Any], inputs: Dict[str, Any], data_version: str) -> str:
+        """节点缓存键：节点类型、配置、各上游结果哈希和数据版本"""
+        return content_hash({
+            "type": node.get("type"),
+            "config": node.get("config", {}),
+            "inputs": {node_id: content_hash(data) for node_id, data in inputs.items()},
+            "dataVersion": data_version,
+        })
+
+    async def run(self, node: Dict[str, Any], inputs: Dict[str, Any], data_version: str,
+                  execute: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], bool]:
+        """
+        命中缓存时返回缓存结果，否则执行节点并缓存成功的结果
+
+        Args:
+            node: 节点定义
+            inputs: {上游节点ID: 上游输出}
+            data_version: 数据快照版本
+            execute: 节点执行函数
+
+        Returns:
+            (节点结果, 是否命中缓存)
+        """
+        if not self.enabled or node.get("type") not in self.cacheable_types:
+            return await execute(), False
+
+        key = self.node_key(node, inputs, data_version)
+        executed = False
+
+        async def loader() -> Dict[str, Any]:
+            nonlocal executed
+            executed = True
+            result = await execute()
+            if not result.get("success", True):
+                raise _NodeFailed(result)
+            return result
+
+        # 内容相同的节点（同一工作流内或并发运行的工作流之间）只执行一次
+        try:
+            result = await self._cache.aget_or_set(key, loader)
+        except _NodeFailed as e:
+            return e.result, False
+
+        if not executed:
+            logger.debug(f"节点结果命中缓存: {node['id']} ({key[:12]})")
+        return copy.deepcopy(result), not executed
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        return self._cache.stats()
+
+
+# 全局节点结果缓存
+node_result_memo = NodeResultMemo(
+    enabled=config.WORKFLOW_NODE_CACHE_ENABLED,
+    ttl=config.WORKFLOW_NODE_CACHE_TTL,
+    max_entries=config.WORKFLOW_NODE_CACHE_MAX_ENTRIES,
+    max_bytes=config.WORKFLOW_NODE_CACHE_MAX_BYTES,
+)
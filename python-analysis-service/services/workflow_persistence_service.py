@@ -10,9 +10,48 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# 步骤数据的下划线字段名 -> 驼峰字段名（流式接口使用下划线，前端同步使用驼峰）
+STEP_FIELD_ALIASES = {
+    'step_id': 'stepId',
+    'step_number': 'step',
+    'resource_type': 'resourceType',
+    'execution_details': 'executionDetails',
+}
+
+
+def normalize_step_data(step_data: dict) -> dict:
+    """统一步骤数据字段名为驼峰形式"""
+    normalized = dict(step_data)
+    for snake, camel in STEP_FIELD_ALIASES.items():
+        if snake in normalized and camel not in normalized:
+            normalized[camel] = normalized.pop(snake)
+    return normalized
+
+
 class WorkflowPersistenceService:
-    def __init__(self, db_session: Session):
+    def __init__(self, db_session: Session, autocommit: bool = True):
+        """
+        Args:
+            db_session: 数据库会话
+            autocommit: 每个操作后立即提交；为False时只flush，由调用方（批量写入器）统一提交
+        """
         self.db = db_session
+        self.autocommit = autocommit
+        self.failed = False  # 非自动提交模式下，最近一次操作是否失败
+    
+    def _commit(self):
+        """提交（批量模式下仅flush，使后续查询可见）"""
+        if self.autocommit:
+            self.db.commit()
+        else:
+            self.db.flush()
+    
+    def _rollback(self):
+        """回滚（批量模式下只标记失败，由调用方回滚该操作的保存点）"""
+        if self.autocommit:
+            self.db.rollback()
+        else:
+            self.failed = True
     
     def create_or_get_workflow(self, workflow_id: str, title: str, description: str = None, user_id: str = None):
         """创建或获取工作流实例"""
@@ -30,24 +69,25 @@ class WorkflowPersistenceService:
                     status=WorkflowStatus.RUNNING
                 )
                 self.db.add(workflow)
-                self.db.commit()
+                self._commit()
                 self.db.refresh(workflow)
                 logger.info(f"创建新工作流: {workflow_id}")
             else:
                 # 更新现有工作流
                 workflow.last_activity = datetime.utcnow()
                 workflow.status = WorkflowStatus.RUNNING
-                self.db.commit()
+                self._commit()
                 logger.info(f"更新现有工作流: {workflow_id}")
             
             return workflow
         except Exception as e:
             logger.error(f"创建/获取工作流失败: {e}")
-            self.db.rollback()
+            self._rollback()
             return None
     
     def save_step(self, workflow_id: str, step_data: dict):
         """保存工作流步骤"""
+        step_data = normalize_step_data(step_data)
         try:
             # 检查步骤是否已存在
             existing_step = self.db.query(WorkflowStep).filter(
@@ -56,15 +96,14 @@ class WorkflowPersistenceService:
             ).first()
             
             if existing_step:
-                # 更新现有步骤
+                # 更新现有步骤（只覆盖本次提供的字段）
                 existing_step.content = step_data.get('content', existing_step.content)
                 existing_step.status = StepStatus.RUNNING
-                existing_step.execution_details = step_data.get('executionDetails')
-                existing_step.results = step_data.get('results')
-                existing_step.urls = step_data.get('urls')
-                existing_step.files = step_data.get('files')
-                existing_step.start_time = datetime.utcnow()
-                self.db.commit()
+                existing_step.execution_details = step_data.get('executionDetails', existing_step.execution_details)
+                existing_step.results = step_data.get('results', existing_step.results)
+                existing_step.urls = step_data.get('urls', existing_step.urls)
+                existing_step.files = step_data.get('files', existing_step.files)
+                self._commit()
                 return existing_step
             else:
                 # 创建新步骤
@@ -85,13 +124,13 @@ class WorkflowPersistenceService:
                 )
                 
                 self.db.add(step)
-                self.db.commit()
+                self._commit()
                 self.db.refresh(step)
                 logger.info(f"保存步骤: {step.step_id}")
                 return step
         except Exception as e:
             logger.error(f"保存步骤失败: {e}")
-            self.db.rollback()
+            self._rollback()
     
     def complete_step(self, workflow_id: str, step_id: str):
         """标记步骤为完成"""
@@ -104,14 +143,14 @@ class WorkflowPersistenceService:
             if step:
                 step.status = StepStatus.COMPLETED
                 step.end_time = datetime.utcnow()
-                self.db.commit()
+                self._commit()
                 
                 # 更新工作流进度
                 self.update_workflow_progress(workflow_id)
                 logger.info(f"步骤完成: {step_id}")
         except Exception as e:
             logger.error(f"完成步骤失败: {e}")
-            self.db.rollback()
+            self._rollback()
     
     def save_message(self, workflow_id: str, message_data: dict):
         """保存工作流消息"""
@@ -131,7 +170,7 @@ class WorkflowPersistenceService:
                 existing.status = message_data.get('status', existing.status)
                 existing.data = message_data.get('data', existing.data)
                 existing.updated_at = datetime.utcnow()
-                self.db.commit()
+                self._commit()
                 logger.info(f"更新已存在消息: {existing.message_id}")
             else:
                 # 计算下一个 sequence（同一 workflow 内最大值 + 1）
@@ -157,11 +196,11 @@ class WorkflowPersistenceService:
                     sequence=next_seq
                 )
                 self.db.add(message)
-                self.db.commit()
+                self._commit()
                 logger.info(f"保存消息: {message.message_id} seq={next_seq}")
         except Exception as e:
             logger.error(f"保存消息失败: {e}")
-            self.db.rollback()
+            self._rollback()
     
     def save_resources(self, workflow_id: str, step_id: str, step_data: dict):
         """从步骤数据中提取并保存资源"""
@@ -260,13 +299,13 @@ class WorkflowPersistenceService:
                 self.db.add(resource)
                 resource_count += 1
             
-            self.db.commit()
+            self._commit()
             print(f"✅ 资源保存完成，共保存 {resource_count} 个资源")
             logger.info(f"保存资源完成，共 {resource_count} 个")
         except Exception as e:
             print(f"❌ 保存资源失败: {e}")
             logger.error(f"保存资源失败: {e}")
-            self.db.rollback()
+            self._rollback()
 
     def save_markdown_resource(self, workflow_id: str, title: str, markdown_content: str, step_id: str | None = None, category: str | None = 'result'):
         """保存Markdown资源到工作流资源列表"""
@@ -293,12 +332,12 @@ class WorkflowPersistenceService:
                 source_step_id=step_id
             )
             self.db.add(resource)
-            self.db.commit()
+            self._commit()
             logger.info(f"保存Markdown资源: {title}")
             return resource
         except Exception as e:
             logger.error(f"保存Markdown资源失败: {e}")
-            self.db.rollback()
+            self._rollback()
 
     def save_chart_resource(self, workflow_id: str, title: str, chart_data: dict, step_id: str | None = None, category: str | None = 'result'):
         """保存图表资源到工作流资源列表"""
@@ -322,12 +361,12 @@ class WorkflowPersistenceService:
                 source_step_id=step_id
             )
             self.db.add(resource)
-            self.db.commit()
+            self._commit()
             logger.info(f"保存图表资源: {title}")
             return resource
         except Exception as e:
             logger.error(f"保存图表资源失败: {e}")
-            self.db.rollback()
+            self._rollback()
 
     def update_workflow_progress(self, workflow_id: str):
         """更新工作流进度"""
@@ -347,10 +386,10 @@ class WorkflowPersistenceService:
                 workflow.progress_percentage = (completed_steps / total_steps) * 100
             workflow.last_activity = datetime.utcnow()
             
-            self.db.commit()
+            self._commit()
         except Exception as e:
             logger.error(f"更新工作流进度失败: {e}")
-            self.db.rollback()
+            self._rollback()
     
     def complete_workflow(self, workflow_id: str):
         """完成工作流"""
@@ -360,11 +399,11 @@ class WorkflowPersistenceService:
                 workflow.status = WorkflowStatus.COMPLETED
                 workflow.end_time = datetime.utcnow()
                 workflow.progress_percentage = 100.0
-                self.db.commit()
+                self._commit()
                 logger.info(f"工作流完成: {workflow_id}")
         except Exception as e:
             logger.error(f"完成工作流失败: {e}")
-            self.db.rollback()
+            self._rollback()
     
     def get_workflow_state(self, workflow_id: str):
         """获取工作流状态用于恢复"""
@@ -0,0 +1,574 @@
+"""
+工作流持久化后台写入队列（write-behind）
+流式接口只把步骤/消息/资源的写操作放入队列，由后台线程按工作流合并后批量写库：
+- 同一批内同一工作流的步骤、消息按业务ID合并，资源合并为一次多行插入
+- 步骤和消息使用 INSERT ... ON DUPLICATE KEY UPDATE 批量写入，每个工作流每批只提交一次
+- 消息序号由内存计数器分配，每个工作流只在首次写入时查询一次 MAX(sequence)
+- 批量写入失败时退回逐条写入（每个操作一个保存点），进程退出前写完队列
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from config import config
+from models.database import SessionLocal
+from models.workflow_models import (
+    WorkflowInstance, WorkflowStep, WorkflowMessage, WorkflowResource,
+    WorkflowStatus, StepStatus, StepCategory, ResourceTypeEnum,
+    MessageType, WorkflowResourceType
+)
+from services.workflow_persistence_service import WorkflowPersistenceService, normalize_step_data
+from utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# 允许排队执行的写操作
+WRITE_METHODS = {
+    'create_or_get_workflow',
+    'save_step',
+    'complete_step',
+    'save_message',
+    'save_resources',
+    'save_markdown_resource',
+    'save_chart_resource',
+    'update_workflow_progress',
+    'complete_workflow',
+}
+
+# 步骤数据字段 -> 步骤表列（已存在的步骤只更新调用方提供的字段）
+STEP_UPDATE_COLUMNS = {
+    'stepId': 'step_id',
+    'content': 'content',
+    'category': 'category',
+    'resourceType': 'resource_type',
+    'executionDetails': 'execution_details',
+    'results': 'results',
+    'urls': 'urls',
+    'files': 'files',
+}
+
+# 消息数据字段 -> 消息表列（已存在的消息只更新调用方提供的字段）
+MESSAGE_UPDATE_COLUMNS = {
+    'type': 'message_type',
+    'content': 'content',
+    'status': 'status',
+    'data': 'data',
+}
+
+# 执行详情中的资源类型 -> 工作流资源类型
+EXECUTION_RESOURCE_TYPES = {
+    'api': WorkflowResourceType.API,
+    'database': WorkflowResourceType.DATABASE,
+    'browser': WorkflowResourceType.WEB,
+}
+
+
+@dataclass
+class WriteOperation:
+    """一次排队的写操作"""
+    workflow_id: str
+    method: str
+    args: Tuple[Any, ...] = ()
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class WorkflowChanges:
+    """一批操作中同一工作流合并后的变更"""
+    workflow: Optional[Dict[str, Any]] = None
+    steps: "OrderedDict[str, Dict[str, Any]]" = field(default_factory=OrderedDict)
+    step_columns: Dict[str, set] = field(default_factory=dict)  # 步骤ID -> 调用方提供的列
+    completed_steps: Dict[str, datetime] = field(default_factory=dict)
+    messages: "OrderedDict[str, Dict[str, Any]]" = field(default_factory=OrderedDict)
+    message_columns: Dict[str, set] = field(default_factory=dict)  # 消息ID -> 调用方提供的列
+    resources: List[Dict[str, Any]] = field(default_factory=list)
+    refresh_progress: bool = False
+    completed_at: Optional[datetime] = None
+
+
+class WorkflowWriteBehind:
+    """后台批量写入器"""
+
+    def __init__(self, batch_size: int = 500, linger: float = 0.05):
+        """
+        Args:
+            batch_size: 每批最多处理的操作数
+            linger: 收到第一个操作后等待更多操作合并成批的时间（秒），即写入延迟上限
+        """
+        self.batch_size = batch_size
+        self.linger = linger
+        self._queue: "queue.Queue[Optional[WriteOperation]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # 工作流ID -> 已分配的最大消息序号（仅后台线程访问）
+        self._sequences = LRUCache(max_size=10000, ttl=3600)
+        self._stats = {"enqueued": 0, "written": 0, "failed": 0, "batches": 0, "fallbacks": 0}
+
+    def submit(self, workflow_id: str, method: str, *args, **kwargs) -> None:
+        """提交写操作（立即返回）"""
+        if method not in WRITE_METHODS:
+            raise ValueError(f"不支持排队执行的持久化方法: {method}")
+        self._ensure_started()
+        self._queue.put(WriteOperation(workflow_id, method, args, kwargs))
+        self._stats["enqueued"] += 1
+
+    def persistence(self) -> "QueuedWorkflowPersistence":
+        """返回与 WorkflowPersistenceService 写方法签名一致的排队代理"""
+        return QueuedWorkflowPersistence(self)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待队列中已提交的操作全部写入"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """写完剩余操作后停止后台线程"""
+        with self._lock:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return
+            self._queue.put(None)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning(f"工作流写入队列未在 {timeout}s 内写完，剩余 {self._queue.qsize()} 个操作")
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._stats, "pending": self._queue.qsize()}
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="workflow-write-behind", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            operation = self._queue.get()
+            if operation is None:
+                self._queue.task_done()
+                return
+
+            batch = [operation]
+            stopping = False
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    self._queue.task_done()
+                    break
+                batch.append(item)
+
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if stopping:
+                # 停止前把剩余操作写完
+                remaining_ops = []
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    self._queue.task_done()
+                    if item is not None:
+                        remaining_ops.append(item)
+                if remaining_ops:
+                    self._write_batch(remaining_ops)
+                return
+
+    def _write_batch(self, batch: List[WriteOperation]) -> None:
+        """按工作流分组，每个工作流合并后批量写入并提交一次"""
+        groups: "OrderedDict[str, List[WriteOperation]]" = OrderedDict()
+        for operation in batch:
+            groups.setdefault(operation.workflow_id, []).append(operation)
+
+        for workflow_id, operations in groups.items():
+            db = SessionLocal()
+            try:
+                if db.get_bind().dialect.name == 'mysql':
+                    self._write_bulk(db, workflow_id, operations)
+                else:
+                    self._write_operations(db, workflow_id, operations)
+            except Exception as e:
+                logger.error(f"工作流批量写入失败，改为逐条写入 {workflow_id}: {e}")
+                db.rollback()
+                # 序号计数器可能已领先于数据库，逐条写入按数据库重新计算
+                self._sequences.delete(workflow_id)
+                self._stats["fallbacks"] += 1
+                try:
+                    self._write_operations(db, workflow_id, operations)
+                except Exception as e:
+                    logger.error(f"工作流逐条写入失败 {workflow_id}: {e}")
+                    db.rollback()
+                    self._stats["failed"] += len(operations)
+            finally:
+                db.close()
+
+    def _write_bulk(self, db, workflow_id: str, operations: List[WriteOperation]) -> None:
+        """合并同一工作流的操作，用多行 upsert 写入"""
+        changes = WorkflowChanges()
+        applied = 0
+        for operation in operations:
+            try:
+                merge = getattr(self, f"_merge_{operation.method}")
+                merge(changes, workflow_id, *operation.args, **operation.kwargs)
+                applied += 1
+            except Exception as e:
+                logger.error(f"工作流写操作无效 {workflow_id}.{operation.method}: {e}")
+                self._stats["failed"] += 1
+
+        now = datetime.utcnow()
+        if changes.workflow is not None:
+            stmt = mysql_insert(WorkflowInstance.__table__).values(changes.workflow)
+            db.execute(stmt.on_duplicate_key_update(
+                status=stmt.inserted.status,
+                last_activity=stmt.inserted.last_activity,
+            ))
+
+        if changes.steps:
+            self._upsert(db, WorkflowStep.__table__, changes.steps, changes.step_columns,
+                         lambda stmt: {
+                             'status': stmt.inserted.status,
+                             'end_time': func.coalesce(stmt.inserted.end_time, WorkflowStep.__table__.c.end_time),
+                             'updated_at': now,
+                         })
+
+        if changes.completed_steps:
+            steps = WorkflowStep.__table__
+            db.execute(
+                update(steps)
+                .where(steps.c.workflow_id == workflow_id, steps.c.step_id.in_(list(changes.completed_steps)))
+                .values(status=StepStatus.COMPLETED, end_time=max(changes.completed_steps.values()), updated_at=now)
+            )
+
+        if changes.resources:
+            self._resolve_resource_steps(db, workflow_id, changes.resources)
+            db.execute(WorkflowResource.__table__.insert(), changes.resources)
+
+        if changes.messages:
+            rows = list(changes.messages.values())
+            self._assign_sequences(db, workflow_id, rows)
+            self._upsert(db, WorkflowMessage.__table__, changes.messages, changes.message_columns,
+                         lambda stmt: {'updated_at': now})
+
+        if changes.refresh_progress:
+            self._refresh_progress(db, workflow_id, now)
+
+        if changes.completed_at is not None:
+            instances = WorkflowInstance.__table__
+            db.execute(
+                update(instances)
+                .where(instances.c.id == workflow_id)
+                .values(status=WorkflowStatus.COMPLETED, end_time=changes.completed_at,
+                        progress_percentage=100.0, last_activity=now)
+            )
+
+        db.commit()
+        self._stats["written"] += applied
+        self._stats["batches"] += 1
+
+    def _write_operations(self, db, workflow_id: str, operations: List[WriteOperation]) -> None:
+        """逐条写入（每个操作一个保存点，单个操作失败只回滚该操作），最后统一提交"""
+        service = WorkflowPersistenceService(db, autocommit=False)
+        for operation in operations:
+            service.failed = False
+            savepoint = db.begin_nested()
+            try:
+                getattr(service, operation.method)(workflow_id, *operation.args, **operation.kwargs)
+            except Exception as e:
+                logger.error(f"工作流写操作失败 {workflow_id}.{operation.method}: {e}")
+                service.failed = True
+            if service.failed:
+                savepoint.rollback()
+                self._stats["failed"] += 1
+            else:
+                savepoint.commit()
+                self._stats["written"] += 1
+        db.commit()
+        self._stats["batches"] += 1
+
+    # ---- 合并各类写操作 ----
+
+    def _merge_create_or_get_workflow(self, changes: WorkflowChanges, workflow_id: str, title: str,
+                                      description: str = None, user_id: str = None) -> None:
+        now = datetime.utcnow()
+        changes.workflow = {
+            'id': workflow_id,
+            'title': title,
+            'description': description,
+            'user_id': user_id,
+            'status': WorkflowStatus.RUNNING,
+            'start_time': now,
+            'last_activity': now,
+        }
+        # 工作流重新开始运行，之前排队的完成标记作废
+        changes.completed_at = None
+
+    def _merge_save_step(self, changes: WorkflowChanges, workflow_id: str, step_data: dict) -> None:
+        step_data = normalize_step_data(step_data)
+        step_id = step_data.get('stepId') or str(uuid.uuid4())
+        values = {
+            'step_id': step_id,
+            'content': step_data.get('content'),
+            'category': StepCategory(step_data.get('category', 'general')),
+            'resource_type': ResourceTypeEnum(step_data.get('resourceType', 'general')),
+            'execution_details': step_data.get('executionDetails'),
+            'results': step_data.get('results'),
+            'urls': step_data.get('urls'),
+            'files': step_data.get('files'),
+        }
+        supplied = {column for key, column in STEP_UPDATE_COLUMNS.items() if key in step_data}
+        changes.completed_steps.pop(step_id, None)
+
+        existing = changes.steps.get(step_id)
+        if existing is not None:
+            # 同一批内重复写入同一步骤：只覆盖本次提供的字段
+            existing.update({column: values[column] for column in supplied})
+            existing['status'] = StepStatus.RUNNING
+            existing['end_time'] = None
+            changes.step_columns[step_id] |= supplied
+            return
+
+        if values['content'] is None:
+            values['content'] = ''
+        changes.steps[step_id] = {
+            'id': str(uuid.uuid4()),
+            'workflow_id': workflow_id,
+            'step_number': step_data.get('step', 0),
+            **values,
+            'status': StepStatus.RUNNING,
+            'start_time': datetime.utcnow(),
+            'end_time': None,
+        }
+        changes.step_columns[step_id] = supplied
+
+    def _merge_complete_step(self, changes: WorkflowChanges, workflow_id: str, step_id: str) -> None:
+        now = datetime.utcnow()
+        step = changes.steps.get(step_id)
+        if step is not None:
+            step['status'] = StepStatus.COMPLETED
+            step['end_time'] = now
+        else:
+            changes.completed_steps[step_id] = now
+        changes.refresh_progress = True
+
+    def _merge_save_message(self, changes: WorkflowChanges, workflow_id: str, message_data: dict) -> None:
+        message_id = message_data.get('messageId') or str(uuid.uuid4())
+        existing = changes.messages.get(message_id)
+        if existing is not None:
+            # 同一批内重复写入同一消息：只覆盖本次提供的字段
+            if 'type' in message_data:
+                existing['message_type'] = MessageType(message_data['type'])
+            for key in ('content', 'status', 'data'):
+                if key in message_data:
+                    existing[key] = message_data[key]
+            changes.message_columns[message_id] |= {
+                column for key, column in MESSAGE_UPDATE_COLUMNS.items() if key in message_data
+            }
+            return
+
+        now = datetime.utcnow()
+        changes.messages[message_id] = {
+            'id': str(uuid.uuid4()),
+            'workflow_id': workflow_id,
+            'message_id': message_id,
+            'message_type': MessageType(message_data.get('type', 'system')),
+            'content': message_data.get('content', ''),
+            'status': message_data.get('status'),
+            'data': message_data.get('data'),
+            'sequence': 0,
+            'timestamp': now,
+            'created_at': now,
+            'updated_at': now,
+        }
+        changes.message_columns[message_id] = {
+            column for key, column in MESSAGE_UPDATE_COLUMNS.items() if key in message_data
+        }
+
+    def _merge_save_resources(self, changes: WorkflowChanges, workflow_id: str, step_id: str, step_data: dict) -> None:
+        step_data = normalize_step_data(step_data)
+        source_step_id = step_data.get('stepId', step_id)
+
+        for url in step_data.get('urls') or []:
+            try:
+                title = f"{urlparse(url).netloc or '网页资源'} - 相关链接"
+            except Exception:
+                title = f"网页资源 - {url}"
+            changes.resources.append(self._resource_row(
+                workflow_id, step_id, WorkflowResourceType.WEB, title,
+                "从步骤中获取的网页链接", {'url': url}, None, source_step_id,
+            ))
+
+        for file_path in step_data.get('files') or []:
+            changes.resources.append(self._resource_row(
+                workflow_id, step_id, WorkflowResourceType.FILE, f"文件 - {file_path.split('/')[-1]}",
+                "从步骤中生成的文件", {'file_path': file_path}, None, source_step_id,
+            ))
+
+        details = step_data.get('executionDetails')
+        if details:
+            res_type = EXECUTION_RESOURCE_TYPES.get(step_data.get('resourceType'), WorkflowResourceType.GENERAL)
+            # 没有可点击链接的网页资源降级为通用资源，避免前端 about:blank
+            if res_type == WorkflowResourceType.WEB and not (isinstance(details, dict) and details.get('url')):
+                res_type = WorkflowResourceType.GENERAL
+            changes.resources.append(self._resource_row(
+                workflow_id, step_id, res_type,
+                f"{step_data.get('resourceType', '通用')}资源 - {step_data.get('content', '')[:30]}",
+                step_data.get('content'), details, None, source_step_id,
+            ))
+
+    def _merge_save_markdown_resource(self, changes: WorkflowChanges, workflow_id: str, title: str,
+                                      markdown_content: str, step_id: str = None, category: str = 'result') -> None:
+        changes.resources.append(self._resource_row(
+            workflow_id, step_id, WorkflowResourceType.GENERAL, title, 'Markdown文档',
+            {'format': 'markdown', 'content': markdown_content}, category, step_id,
+        ))
+
+    def _merge_save_chart_resource(self, changes: WorkflowChanges, workflow_id: str, title: str,
+                                   chart_data: dict, step_id: str = None, category: str = 'result') -> None:
+        changes.resources.append(self._resource_row(
+            workflow_id, step_id, WorkflowResourceType.CHART, title, '自动生成的图表',
+            chart_data, category, step_id,
+        ))
+
+    def _merge_update_workflow_progress(self, changes: WorkflowChanges, workflow_id: str) -> None:
+        changes.refresh_progress = True
+
+    def _merge_complete_workflow(self, changes: WorkflowChanges, workflow_id: str) -> None:
+        changes.completed_at = datetime.utcnow()
+
+    # ---- 写入辅助 ----
+
+    @staticmethod
+    def _upsert(db, table, rows: "OrderedDict[str, Dict[str, Any]]", supplied: Dict[str, set],
+                always: Callable[[Any], Dict[str, Any]]) -> None:
+        """
+        多行 upsert：已存在的行只更新调用方提供的列（加上 always 返回的列），
+        提供列相同的行合并为一条语句，未提供的列保留数据库中的值
+        """
+        groups: "OrderedDict[frozenset, List[Dict[str, Any]]]" = OrderedDict()
+        for key, row in rows.items():
+            groups.setdefault(frozenset(supplied.get(key, ())), []).append(row)
+
+        for columns, group in groups.items():
+            stmt = mysql_insert(table).values(group)
+            updates = {column: stmt.inserted[column] for column in sorted(columns)}
+            updates.update(always(stmt))
+            db.execute(stmt.on_duplicate_key_update(**updates))
+
+    @staticmethod
+    def _resource_row(workflow_id: str, step_ref: Optional[str], resource_type: WorkflowResourceType, title: str,
+                      description: Optional[str], data: Any, category: Optional[str],
+                      source_step_id: Optional[str]) -> Dict[str, Any]:
+        """资源行，step_id 暂存业务步骤ID，写入前替换为步骤主键"""
+        now = datetime.utcnow()
+        return {
+            'id': str(uuid.uuid4()),
+            'workflow_id': workflow_id,
+            'step_id': step_ref,
+            'resource_type': resource_type,
+            'title': title,
+            'description': description,
+            'data': data,
+            'category': category,
+            'source_step_id': source_step_id,
+            'created_at': now,
+            'updated_at': now,
+        }
+
+    @staticmethod
+    def _resolve_resource_steps(db, workflow_id: str, resources: List[Dict[str, Any]]) -> None:
+        """一次查询把资源行中的业务步骤ID替换为步骤表主键"""
+        step_refs = {row['step_id'] for row in resources if row['step_id']}
+        step_pks: Dict[str, str] = {}
+        if step_refs:
+            steps = WorkflowStep.__table__
+            step_pks = dict(db.execute(
+                select(steps.c.step_id, steps.c.id)
+                .where(steps.c.workflow_id == workflow_id, steps.c.step_id.in_(step_refs))
+            ).all())
+        for row in resources:
+            row['step_id'] = step_pks.get(row['step_id']) if row['step_id'] else None
+
+    def _assign_sequences(self, db, workflow_id: str, rows: List[Dict[str, Any]]) -> None:
+        """从内存计数器分配消息序号，计数器按工作流只从数据库初始化一次"""
+        last = self._sequences.get(workflow_id)
+        if last is None:
+            messages = WorkflowMessage.__table__
+            last = db.execute(
+                select(func.max(messages.c.sequence)).where(messages.c.workflow_id == workflow_id)
+            ).scalar() or 0
+        for row in rows:
+            last += 1
+            row['sequence'] = last
+        self._sequences.set(workflow_id, last)
+
+    @staticmethod
+    def _refresh_progress(db, workflow_id: str, now: datetime) -> None:
+        """单条 UPDATE 重新计算步骤总数和完成百分比"""
+        instances = WorkflowInstance.__table__
+        steps = WorkflowStep.__table__
+        total = (select(func.count()).select_from(steps)
+                 .where(steps.c.workflow_id == workflow_id).scalar_subquery())
+        completed = (select(func.count()).select_from(steps)
+                     .where(steps.c.workflow_id == workflow_id, steps.c.status == StepStatus.COMPLETED)
+                     .scalar_subquery())
+        db.execute(
+            update(instances)
+            .where(instances.c.id == workflow_id)
+            .values(
+                total_steps=total,
+                progress_percentage=case((total > 0, completed * 100.0 / total),
+                                         else_=instances.c.progress_percentage),
+                last_activity=now,
+            )
+        )
+
+
+class QueuedWorkflowPersistence:
+    """排队代理：调用方式与 WorkflowPersistenceService 的写方法相同，但立即返回"""
+
+    def __init__(self, writer: WorkflowWriteBehind):
+        self._writer = writer
+
+    def __getattr__(self, method: str):
+        if method not in WRITE_METHODS:
+            raise AttributeError(method)
+
+        def enqueue(workflow_id: str, *args, **kwargs) -> None:
+            self._writer.submit(workflow_id, method, *args, **kwargs)
+
+        return enqueue
+
+
+# 全局工作流写入队列
+workflow_writer = WorkflowWriteBehind(
+    batch_size=config.WORKFLOW_WRITE_BATCH_SIZE,
+    linger=config.WORKFLOW_WRITE_LINGER,
+)
+# 未经过应用关闭事件的退出（如脚本直接结束）也写完队列
+atexit.register(workflow_writer.stop)
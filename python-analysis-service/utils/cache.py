@@ -2,103 +2,284 @@
 缓存工具
 """
 
-import time
-from typing import Any, Optional, Dict
+import asyncio
+import functools
 import hashlib
 import json
 import logging
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from config import config
 
 logger = logging.getLogger(__name__)
 
-class SimpleCache:
-    """简单内存缓存"""
-    
-    def __init__(self, max_size: int = 1000, ttl: int = 3600):
+# 未命中标记（区分"未缓存"与缓存值本身）
+_MISSING = object()
+
+
+class _InflightCall:
+    """同步single-flight：同一个键只允许一个线程执行加载"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class LRUCache:
+    """内存LRU缓存：O(1)读写与淘汰，支持单键TTL、按条数/近似字节数限制容量"""
+
+    def __init__(self, max_size: int = 1000, ttl: Optional[int] = 3600, max_bytes: Optional[int] = None):
+        """
+        Args:
+            max_size: 最大条目数
+            ttl: 默认过期时间（秒），None表示不过期
+            max_bytes: 近似字节数上限（按pickle序列化长度估算），None表示不限制
+        """
         self.max_size = max_size
         self.ttl = ttl
-        self.cache: Dict[str, Dict[str, Any]] = {}
-    
+        self.max_bytes = max_bytes
+        # key -> (value, expires_at, size)
+        self._data: "OrderedDict[str, Tuple[Any, Optional[float], int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._inflight: Dict[str, _InflightCall] = {}
+        self._async_inflight: Dict[str, asyncio.Future] = {}
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
     def _generate_key(self, *args, **kwargs) -> str:
         """生成缓存键"""
         key_data = {"args": args, "kwargs": kwargs}
         key_str = json.dumps(key_data, sort_keys=True, default=str)
         return hashlib.md5(key_str.encode()).hexdigest()
-    
-    def get(self, key: str) -> Optional[Any]:
-        """获取缓存值"""
-        if key in self.cache:
-            item = self.cache[key]
-            if time.time() - item['timestamp'] < self.ttl:
-                return item['value']
-            else:
-                # 过期删除
-                del self.cache[key]
-        return None
-    
-    def set(self, key: str, value: Any) -> None:
-        """设置缓存值"""
-        # 如果缓存满了，删除最旧的项
-        if len(self.cache) >= self.max_size:
-            oldest_key = min(self.cache.keys(), key=lambda k: self.cache[k]['timestamp'])
-            del self.cache[oldest_key]
-        
-        self.cache[key] = {
-            'value': value,
-            'timestamp': time.time()
-        }
-    
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """获取缓存值，未命中或已过期返回default"""
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        """设置缓存值，ttl为None时使用默认过期时间"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        size = self._estimate_size(value) if self.max_bytes else 0
+
+        with self._lock:
+            if key in self._data:
+                self._bytes -= self._data.pop(key)[2]
+            self._data[key] = (value, expires_at, size)
+            self._bytes += size
+            self._evict()
+
+    def delete(self, key: str) -> bool:
+        """删除缓存项"""
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return False
+            self._bytes -= item[2]
+            return True
+
+    def __contains__(self, key: str) -> bool:
+        return self._lookup(key, count=False) is not _MISSING
+
+    def get_or_set(self, key: str, loader: Callable[[], Any], ttl: Optional[int] = None) -> Any:
+        """
+        获取缓存值，未命中时调用loader加载并写入缓存
+
+        并发未命中同一个键时只有一个线程执行loader，其余线程等待其结果（single-flight）。
+        loader返回None时不写入缓存。
+        """
+        value = self._lookup(key)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            value = self._lookup(key, count=False)
+            if value is not _MISSING:
+                return value
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _InflightCall()
+                self._inflight[key] = call
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            value = loader()
+            if value is not None:
+                self.set(key, value, ttl)
+            call.result = value
+            return value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+
+    async def aget_or_set(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[int] = None) -> Any:
+        """get_or_set 的异步版本，同一事件循环内并发未命中只执行一次loader"""
+        while True:
+            value = self._lookup(key)
+            if value is not _MISSING:
+                return value
+
+            future = self._async_inflight.get(key)
+            if future is None:
+                break
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 执行加载的协程被取消，由当前协程重新加载
+                if not future.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_inflight[key] = future
+        try:
+            value = await loader()
+            if value is not None:
+                self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 标记异常已被读取，避免没有等待者时输出告警
+            future.exception()
+            raise
+        finally:
+            self._async_inflight.pop(key, None)
+
     def clear(self) -> None:
         """清空缓存"""
-        self.cache.clear()
-    
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
     def size(self) -> int:
         """获取缓存大小"""
-        return len(self.cache)
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中/未命中/淘汰统计"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "size": len(self._data),
+                "bytes": self._bytes,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
+
+    def _lookup(self, key: str, count: bool = True) -> Any:
+        """查找未过期的值并标记为最近使用，未命中返回_MISSING"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] is not None and item[1] <= time.monotonic():
+                self._data.pop(key)
+                self._bytes -= item[2]
+                self._stats["expirations"] += 1
+                item = None
+
+            if item is None:
+                if count:
+                    self._stats["misses"] += 1
+                return _MISSING
+
+            self._data.move_to_end(key)
+            if count:
+                self._stats["hits"] += 1
+            return item[0]
+
+    def _evict(self) -> None:
+        """从最久未使用的一端淘汰，直到满足条数和字节数限制（调用方需持有锁）"""
+        while self._data and (
+            len(self._data) > self.max_size
+            or (self.max_bytes is not None and self._bytes > self.max_bytes and len(self._data) > 1)
+        ):
+            _, (_, _, size) = self._data.popitem(last=False)
+            self._bytes -= size
+            self._stats["evictions"] += 1
+
+    @staticmethod
+    def _estimate_size(value: Any) -> int:
+        """估算值占用的字节数"""
+        try:
+            return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            return sys.getsizeof(value)
+
+
+# 兼容旧名称
+SimpleCache = LRUCache
+
 
-def cache_result(cache_instance: SimpleCache, ttl: Optional[int] = None):
-    """缓存装饰器"""
+def cache_result(cache_instance: LRUCache, ttl: Optional[int] = None):
+    """缓存装饰器，支持同步和异步函数，并发未命中同一参数时只执行一次"""
     def decorator(func):
+        def make_key(args, kwargs) -> str:
+            return f"{func.__name__}_{cache_instance._generate_key(*args, **kwargs)}"
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await cache_instance.aget_or_set(
+                    make_key(args, kwargs), lambda: func(*args, **kwargs), ttl
+                )
+            return async_wrapper
+
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            # 生成缓存键
-            cache_key = f"{func.__name__}_{cache_instance._generate_key(*args, **kwargs)}"
-            
-            # 尝试从缓存获取
-            cached_result = cache_instance.get(cache_key)
-            if cached_result is not None:
-                logger.debug(f"缓存命中: {func.__name__}")
-                return cached_result
-            
-            # 执行函数
-            result = func(*args, **kwargs)
-            
-            # 存入缓存
-            cache_instance.set(cache_key, result)
-            logger.debug(f"缓存存储: {func.__name__}")
-            
-            return result
+            return cache_instance.get_or_set(make_key(args, kwargs), lambda: func(*args, **kwargs), ttl)
         return wrapper
     return decorator
 
+
 # 全局缓存实例
-global_cache = SimpleCache()
+global_cache = LRUCache(max_size=config.CACHE_SIZE)
+
 
 class AsyncCacheManager:
     """异步缓存管理器"""
-    
-    def __init__(self, cache_instance: SimpleCache = None):
+
+    def __init__(self, cache_instance: LRUCache = None):
         self.cache = cache_instance or global_cache
-    
+
     async def get(self, key: str) -> Optional[Any]:
         """异步获取缓存值"""
         return self.cache.get(key)
-    
+
     async def set(self, key: str, value: Any, ttl: int = None) -> None:
         """异步设置缓存值"""
-        self.cache.set(key, value)
-    
+        self.cache.set(key, value, ttl)
+
+    async def get_or_set(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: int = None) -> Any:
+        """异步获取缓存值，未命中时加载（并发未命中只加载一次）"""
+        return await self.cache.aget_or_set(key, loader, ttl)
+
+    async def delete(self, key: str) -> bool:
+        """异步删除缓存值"""
+        return self.cache.delete(key)
+
     async def clear(self) -> None:
         """异步清空缓存"""
         self.cache.clear()
 
+
 # 全局异步缓存管理器实例
-cache_manager = AsyncCacheManager()
\ No newline at end of file
+cache_manager = AsyncCacheManager()
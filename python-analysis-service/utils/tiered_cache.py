@@ -0,0 +1,408 @@
+"""
+两级缓存
+L1 为进程内 LRUCache，L2 为 Redis（多个 uvicorn worker / 多台机器共享），值使用 msgpack 序列化。
+支持：
+- 命名空间整体失效（命名空间版本号存放在 Redis，所有 worker 可见）
+- 缓存击穿保护：进程内 single-flight + Redis 分布式锁，同一个键只有一个 worker 回源
+- Redis 不可用时自动降级为仅使用 L1
+"""
+
+import asyncio
+import datetime
+import decimal
+import hashlib
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from config import config
+from utils.cache import LRUCache
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 未安装时退化为JSON
+    msgpack = None
+
+try:
+    import redis
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - 未安装时仅使用L1
+    redis = None
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+# 命名空间版本号在本地缓存的时间（秒），其他 worker 的失效最多延迟这么久可见
+NAMESPACE_VERSION_REFRESH = 2.0
+# Redis 出错后暂停访问的时间（秒）
+L2_RETRY_INTERVAL = 30.0
+# 等待其他 worker 回源时的轮询间隔（秒）
+LOCK_POLL_INTERVAL = 0.05
+
+
+def _encode_default(value: Any) -> Any:
+    """msgpack/JSON 不支持的类型转换"""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, "item"):  # numpy 标量
+        return value.item()
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    raise TypeError(f"无法序列化类型: {type(value).__name__}")
+
+
+def dumps(value: Any) -> bytes:
+    """序列化缓存值"""
+    if msgpack is not None:
+        return msgpack.packb(value, default=_encode_default, use_bin_type=True)
+    return json.dumps(value, default=_encode_default, ensure_ascii=False).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    """反序列化缓存值"""
+    if msgpack is not None:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    return json.loads(data.decode("utf-8"))
+
+
+def _on_event_loop() -> bool:
+    """当前线程是否正在运行事件循环"""
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class TieredCache:
+    """L1 进程内 + L2 Redis 两级缓存"""
+
+    def __init__(
+        self,
+        redis_url: Optional[str] = None,
+        prefix: str = "quantai",
+        l1_max_size: int = 1000,
+        l1_max_bytes: Optional[int] = None,
+        l1_ttl: int = 60,
+        lock_timeout: float = 30.0,
+        lock_wait: float = 10.0,
+    ):
+        """
+        Args:
+            redis_url: Redis 地址，为空时仅使用 L1
+            prefix: Redis 键前缀
+            l1_max_size: L1 最大条目数
+            l1_max_bytes: L1 近似字节数上限
+            l1_ttl: L1 最长保留时间（秒），L1 条目的 TTL 取该值与调用方 TTL 的较小者
+            lock_timeout: 回源锁的过期时间（秒）
+            lock_wait: 未拿到回源锁时等待其他 worker 写入结果的最长时间（秒）
+        """
+        self.redis_url = redis_url
+        self.prefix = prefix
+        self.l1 = LRUCache(max_size=l1_max_size, ttl=l1_ttl, max_bytes=l1_max_bytes)
+        self.l1_ttl = l1_ttl
+        self.lock_timeout = lock_timeout
+        self.lock_wait = lock_wait
+
+        self._redis = None
+        self._async_redis: Dict[int, Any] = {}
+        self._l2_disabled_until = 0.0
+        # namespace -> (版本号, 获取时间)
+        self._versions: Dict[str, Tuple[int, float]] = {}
+        self._stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "loads": 0, "l2_errors": 0}
+
+    @property
+    def l2_enabled(self) -> bool:
+        """L2 是否可用（已配置且未处于故障暂停期）"""
+        return bool(self.redis_url) and redis is not None and time.monotonic() >= self._l2_disabled_until
+
+    # ------------------------------------------------------------------
+    # 同步接口
+    # ------------------------------------------------------------------
+
+    def get(self, namespace: str, key: Any) -> Optional[Any]:
+        """读取缓存，未命中返回None"""
+        l1_key, l2_key = self._keys(namespace, key, self._namespace_version(namespace))
+        data = self.l1.get(l1_key)
+        if data is not None:
+            self._stats["l1_hits"] += 1
+            return loads(data)
+
+        data = self._l2_call(lambda client: client.get(l2_key))
+        if data is not None:
+            self._stats["l2_hits"] += 1
+            self.l1.set(l1_key, data, self.l1_ttl)
+            return loads(data)
+
+        self._stats["misses"] += 1
+        return None
+
+    def set(self, namespace: str, key: Any, value: Any, ttl: int) -> None:
+        """写入两级缓存"""
+        l1_key, l2_key = self._keys(namespace, key, self._namespace_version(namespace))
+        data = dumps(value)
+        self.l1.set(l1_key, data, min(ttl, self.l1_ttl))
+        self._l2_call(lambda client: client.set(l2_key, data, ex=ttl))
+
+    def get_or_set(self, namespace: str, key: Any, loader: Callable[[], Any], ttl: int) -> Any:
+        """
+        读取缓存，未命中时回源并写入（loader返回None时不缓存）
+
+        进程内并发未命中由 L1 single-flight 合并；跨 worker 通过 Redis 锁保证只有一个回源，
+        其余 worker 在 lock_wait 内等待结果，超时后自行回源。
+        同步接口会阻塞调用线程，异步代码应使用 aget_or_set；在事件循环线程中调用时不等待其他 worker。
+        """
+        version = self._namespace_version(namespace)
+        l1_key, l2_key = self._keys(namespace, key, version)
+        loaded = False
+
+        def load() -> Optional[bytes]:
+            nonlocal loaded
+            loaded = True
+            data = self._l2_call(lambda client: client.get(l2_key))
+            if data is not None:
+                self._stats["l2_hits"] += 1
+                return data
+
+            lock_key = f"{l2_key}:lock"
+            token = uuid.uuid4().hex
+            locked = self._l2_call(lambda client: client.set(lock_key, token, nx=True, px=int(self.lock_timeout * 1000)))
+            # SET NX 未成功（且不是因为 Redis 故障）说明其他 worker 正在回源
+            if not locked and self.l2_enabled:
+                data = self._wait_for_l2(l2_key)
+                if data is not None:
+                    self._stats["l2_hits"] += 1
+                    return data
+
+            try:
+                self._stats["misses"] += 1
+                self._stats["loads"] += 1
+                value = loader()
+                if value is None:
+                    return None
+                data = dumps(value)
+                self._l2_call(lambda client: client.set(l2_key, data, ex=ttl))
+                return data
+            finally:
+                if locked:
+                    self._l2_call(lambda client: self._release_lock(client, lock_key, token))
+
+        data = self.l1.get_or_set(l1_key, load, min(ttl, self.l1_ttl))
+        if not loaded:
+            # L1 命中，或等待了本进程内其他线程的回源结果
+            self._stats["l1_hits"] += 1
+        return None if data is None else loads(data)
+
+    def invalidate(self, namespace: str) -> None:
+        """使命名空间下所有缓存失效（递增版本号，旧键随TTL自然过期）"""
+        version = self._l2_call(lambda client: client.incr(self._version_key(namespace)))
+        if version is None:
+            version = self._versions.get(namespace, (0, 0.0))[0] + 1
+        self._versions[namespace] = (int(version), time.monotonic())
+        logger.info(f"缓存命名空间失效: {namespace} -> v{version}")
+
+    # ------------------------------------------------------------------
+    # 异步接口
+    # ------------------------------------------------------------------
+
+    async def aget(self, namespace: str, key: Any) -> Optional[Any]:
+        """异步读取缓存"""
+        l1_key, l2_key = self._keys(namespace, key, await self._anamespace_version(namespace))
+        data = self.l1.get(l1_key)
+        if data is not None:
+            self._stats["l1_hits"] += 1
+            return loads(data)
+
+        data = await self._al2_call(lambda client: client.get(l2_key))
+        if data is not None:
+            self._stats["l2_hits"] += 1
+            self.l1.set(l1_key, data, self.l1_ttl)
+            return loads(data)
+
+        self._stats["misses"] += 1
+        return None
+
+    async def aset(self, namespace: str, key: Any, value: Any, ttl: int) -> None:
+        """异步写入两级缓存"""
+        l1_key, l2_key = self._keys(namespace, key, await self._anamespace_version(namespace))
+        data = dumps(value)
+        self.l1.set(l1_key, data, min(ttl, self.l1_ttl))
+        await self._al2_call(lambda client: client.set(l2_key, data, ex=ttl))
+
+    async def aget_or_set(self, namespace: str, key: Any, loader: Callable[[], Awaitable[Any]], ttl: int) -> Any:
+        """get_or_set 的异步版本"""
+        version = await self._anamespace_version(namespace)
+        l1_key, l2_key = self._keys(namespace, key, version)
+
+        loaded = False
+
+        async def load() -> Optional[bytes]:
+            nonlocal loaded
+            loaded = True
+            data = await self._al2_call(lambda client: client.get(l2_key))
+            if data is not None:
+                self._stats["l2_hits"] += 1
+                return data
+
+            lock_key = f"{l2_key}:lock"
+            token = uuid.uuid4().hex
+            locked = await self._al2_call(
+                lambda client: client.set(lock_key, token, nx=True, px=int(self.lock_timeout * 1000))
+            )
+            # SET NX 未成功（且不是因为 Redis 故障）说明其他 worker 正在回源
+            if not locked and self.l2_enabled:
+                data = await self._await_for_l2(l2_key)
+                if data is not None:
+                    self._stats["l2_hits"] += 1
+                    return data
+
+            try:
+                self._stats["misses"] += 1
+                self._stats["loads"] += 1
+                value = await loader()
+                if value is None:
+                    return None
+                data = dumps(value)
+                await self._al2_call(lambda client: client.set(l2_key, data, ex=ttl))
+                return data
+            finally:
+                if locked:
+                    await self._al2_call(lambda client: self._arelease_lock(client, lock_key, token))
+
+        data = await self.l1.aget_or_set(l1_key, load, min(ttl, self.l1_ttl))
+        if not loaded:
+            # L1 命中，或等待了本进程内其他协程的回源结果
+            self._stats["l1_hits"] += 1
+        return None if data is None else loads(data)
+
+    async def ainvalidate(self, namespace: str) -> None:
+        """异步使命名空间失效"""
+        version = await self._al2_call(lambda client: client.incr(self._version_key(namespace)))
+        if version is None:
+            version = self._versions.get(namespace, (0, 0.0))[0] + 1
+        self._versions[namespace] = (int(version), time.monotonic())
+        logger.info(f"缓存命名空间失效: {namespace} -> v{version}")
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        return {**self._stats, "l1": self.l1.stats(), "l2_enabled": self.l2_enabled}
+
+    # ------------------------------------------------------------------
+    # 内部实现
+    # ------------------------------------------------------------------
+
+    def _keys(self, namespace: str, key: Any, version: int) -> Tuple[str, str]:
+        """生成 L1/L2 键（过长或非字符串的键取哈希）"""
+        if not isinstance(key, str) or len(key) > 128:
+            key = hashlib.md5(json.dumps(key, sort_keys=True, default=str, ensure_ascii=False).encode()).hexdigest()
+        l1_key = f"{namespace}:v{version}:{key}"
+        return l1_key, f"{self.prefix}:{l1_key}"
+
+    def _version_key(self, namespace: str) -> str:
+        return f"{self.prefix}:ns:{namespace}"
+
+    def _namespace_version(self, namespace: str) -> int:
+        """获取命名空间版本号（本地短暂缓存，减少 Redis 往返）"""
+        cached = self._versions.get(namespace)
+        if cached and time.monotonic() - cached[1] < NAMESPACE_VERSION_REFRESH:
+            return cached[0]
+        value = self._l2_call(lambda client: client.get(self._version_key(namespace)))
+        version = int(value) if value is not None else (cached[0] if cached and not self.l2_enabled else 0)
+        self._versions[namespace] = (version, time.monotonic())
+        return version
+
+    async def _anamespace_version(self, namespace: str) -> int:
+        cached = self._versions.get(namespace)
+        if cached and time.monotonic() - cached[1] < NAMESPACE_VERSION_REFRESH:
+            return cached[0]
+        value = await self._al2_call(lambda client: client.get(self._version_key(namespace)))
+        version = int(value) if value is not None else (cached[0] if cached and not self.l2_enabled else 0)
+        self._versions[namespace] = (version, time.monotonic())
+        return version
+
+    def _wait_for_l2(self, l2_key: str) -> Optional[bytes]:
+        """等待持有锁的 worker 写入结果（在事件循环线程中不等待，直接回源，避免阻塞整个 worker）"""
+        if _on_event_loop():
+            return None
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            data = self._l2_call(lambda client: client.get(l2_key))
+            if data is not None:
+                return data
+        return None
+
+    async def _await_for_l2(self, l2_key: str) -> Optional[bytes]:
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            data = await self._al2_call(lambda client: client.get(l2_key))
+            if data is not None:
+                return data
+        return None
+
+    @staticmethod
+    def _release_lock(client, lock_key: str, token: str) -> None:
+        """只释放自己持有的锁"""
+        if client.get(lock_key) == token.encode():
+            client.delete(lock_key)
+
+    @staticmethod
+    async def _arelease_lock(client, lock_key: str, token: str) -> None:
+        if await client.get(lock_key) == token.encode():
+            await client.delete(lock_key)
+
+    def _get_redis(self):
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(
+                self.redis_url, socket_timeout=0.5, socket_connect_timeout=0.5
+            )
+        return self._redis
+
+    def _get_async_redis(self):
+        loop_id = id(asyncio.get_running_loop())
+        client = self._async_redis.get(loop_id)
+        if client is None:
+            client = aioredis.Redis.from_url(
+                self.redis_url, socket_timeout=0.5, socket_connect_timeout=0.5
+            )
+            self._async_redis[loop_id] = client
+        return client
+
+    def _l2_call(self, operation: Callable[[Any], Any]) -> Any:
+        """执行 Redis 操作，失败时暂停 L2 并返回None"""
+        if not self.l2_enabled:
+            return None
+        try:
+            return operation(self._get_redis())
+        except Exception as e:
+            self._on_l2_error(e)
+            return None
+
+    async def _al2_call(self, operation: Callable[[Any], Awaitable[Any]]) -> Any:
+        if not self.l2_enabled or aioredis is None:
+            return None
+        try:
+            return await operation(self._get_async_redis())
+        except Exception as e:
+            self._on_l2_error(e)
+            return None
+
+    def _on_l2_error(self, error: Exception) -> None:
+        self._stats["l2_errors"] += 1
+        self._l2_disabled_until = time.monotonic() + L2_RETRY_INTERVAL
+        logger.warning(f"Redis缓存不可用，{L2_RETRY_INTERVAL:.0f}秒内仅使用本地缓存: {error}")
+
+
+# 全局两级缓存
+tiered_cache = TieredCache(
+    redis_url=config.REDIS_URL if config.CACHE_L2_ENABLED else None,
+    l1_max_size=config.CACHE_SIZE,
+    l1_ttl=config.CACHE_L1_TTL,
+)
@@ -8,6 +8,7 @@ from loguru import logger
 from config import Config
 from database import db_manager
 from complete_data_crawler import CompleteDataCrawler
+from crawl_ledger import crawl_ledger, STATUS_DONE, STATUS_FAILED, STATUS_PENDING, STATUS_RUNNING
 
 class AutoBatchCrawler:
     def __init__(self):
@@ -15,8 +16,13 @@ class AutoBatchCrawler:
         self.batch_size = 50
         self.delay_between_batches = 60  # 批次间延迟60秒
     
-    def run_auto_crawl(self):
-        """自动批量爬取所有缺失数据"""
+    def run_auto_crawl(self, retry_failed=False):
+        """
+        按爬取台账自动批量爬取所有缺失数据
+        
+        台账记录每只股票每个数据集的状态，中断后重新运行会从未完成的任务继续；
+        多个进程同时运行时各自领取不同的任务
+        """
         logger.info("开始自动批量数据爬取...")
         
         if not db_manager.test_connection():
@@ -24,15 +30,12 @@ class AutoBatchCrawler:
             return False
         
         try:
-            # 获取总股票数
-            total_stocks = db_manager.execute_query("SELECT COUNT(*) FROM stock_info WHERE isActive = 1")
-            total_count = total_stocks[0][0] if total_stocks else 0
-            
-            logger.info(f"总共需要处理 {total_count} 只股票")
+            # 为新股票补齐台账记录
+            crawl_ledger.seed()
+            if retry_failed:
+                logger.info(f"重置 {crawl_ledger.reset_failed()} 个失败任务")
             
-            # 计算需要的批次数
-            total_batches = (total_count + self.batch_size - 1) // self.batch_size
-            logger.info(f"将分 {total_batches} 个批次处理，每批 {self.batch_size} 只股票")
+            self.log_ledger_progress()
             
             total_stats = {
                 'f10_success': 0, 'f10_failed': 0,
@@ -41,46 +44,38 @@ class AutoBatchCrawler:
             }
             
             start_time = datetime.now()
+            batch_num = 0
             
-            # 逐批处理
-            for batch_num in range(total_batches):
-                start_index = batch_num * self.batch_size
-                
-                logger.info(f"=== 开始第 {batch_num + 1}/{total_batches} 批次 ===")
-                logger.info(f"处理股票索引: {start_index} - {start_index + self.batch_size - 1}")
-                
+            # 逐批领取任务，直到台账中没有可领取的任务
+            while True:
+                batch_num += 1
                 batch_start_time = datetime.now()
+                logger.info(f"=== 开始第 {batch_num} 批次 ===")
                 
                 try:
-                    # 执行批次爬取
-                    batch_stats = self.crawler.crawl_all_missing_data(
-                        start_index=start_index,
-                        batch_size=self.batch_size
-                    )
-                    
-                    if batch_stats:
-                        # 累计统计
-                        for key in total_stats:
-                            total_stats[key] += batch_stats[key]
-                        
-                        batch_duration = (datetime.now() - batch_start_time).total_seconds()
-                        logger.info(f"第 {batch_num + 1} 批次完成，耗时 {batch_duration:.1f}秒")
-                        logger.info(f"本批次: F10({batch_stats['f10_success']}), 财务({batch_stats['financial_success']}), 分红({batch_stats['dividend_success']})")
-                        
-                        # 显示总体进度
-                        progress = ((batch_num + 1) / total_batches) * 100
-                        logger.info(f"总体进度: {progress:.1f}% ({batch_num + 1}/{total_batches})")
-                        
-                    else:
-                        logger.error(f"第 {batch_num + 1} 批次执行失败")
-                
+                    batch_stats = self.crawler.crawl_ledger_batch(self.batch_size)
                 except Exception as e:
-                    logger.error(f"第 {batch_num + 1} 批次执行异常: {e}")
+                    logger.error(f"第 {batch_num} 批次执行异常: {e}")
+                    break
                 
-                # 批次间延迟（最后一批不需要延迟）
-                if batch_num < total_batches - 1:
-                    logger.info(f"批次间休息 {self.delay_between_batches} 秒...")
-                    time.sleep(self.delay_between_batches)
+                if batch_stats is None:
+                    logger.info("台账中没有待处理的任务")
+                    break
+                
+                # 累计统计
+                for key in total_stats:
+                    total_stats[key] += batch_stats[key]
+                
+                batch_duration = (datetime.now() - batch_start_time).total_seconds()
+                logger.info(f"第 {batch_num} 批次完成，耗时 {batch_duration:.1f}秒")
+                logger.info(f"本批次: F10({batch_stats['f10_success']}), 财务({batch_stats['financial_success']}), 分红({batch_stats['dividend_success']})")
+                self.log_ledger_progress()
+                
+                # 领取数不足一批说明台账已取完
+                if sum(batch_stats.values()) < self.batch_size:
+                    continue
+                logger.info(f"批次间休息 {self.delay_between_batches} 秒...")
+                time.sleep(self.delay_between_batches)
             
             # 总结
             total_duration = (datetime.now() - start_time).total_seconds()
@@ -99,14 +94,29 @@ class AutoBatchCrawler:
         except Exception as e:
             logger.error(f"自动批量爬取异常: {e}")
             return False
+        finally:
+            # 退回本进程已领取但未执行完的任务，下次运行可立即重新领取
+            try:
+                crawl_ledger.release()
+            except Exception as e:
+                logger.error(f"退回未完成任务失败: {e}")
+    
+    def log_ledger_progress(self):
+        """输出台账中各数据集的完成进度"""
+        for dataset, counts in crawl_ledger.progress().items():
+            total = sum(counts.values())
+            done = counts.get(STATUS_DONE, 0)
+            logger.info(
+                f"台账进度 {dataset}: 完成{done}/{total} ({done/total*100:.1f}%), "
+                f"待处理{counts.get(STATUS_PENDING, 0)}, 处理中{counts.get(STATUS_RUNNING, 0)}, 失败{counts.get(STATUS_FAILED, 0)}"
+            )
     
     def show_final_statistics(self):
         """显示最终数据统计"""
         logger.info("=== 最终数据统计 ===")
         
         try:
-            conn = db_manager.get_connection()
-            with conn.cursor() as cursor:
+            with db_manager.connection() as conn, conn.cursor() as cursor:
                 # 各表总数
                 tables = ['stock_info', 'stock_data', 'stock_f10', 'stock_financial', 'stock_dividend']
                 for table in tables:
@@ -132,8 +142,6 @@ class AutoBatchCrawler:
                 logger.info(f"财务数据覆盖率: {financial_coverage}/{active_stocks} ({financial_coverage/active_stocks*100:.1f}%)")
                 logger.info(f"分红数据覆盖率: {dividend_coverage}/{active_stocks} ({dividend_coverage/active_stocks*100:.1f}%)")
             
-            conn.close()
-            
         except Exception as e:
             logger.error(f"获取最终统计失败: {e}")
     
@@ -265,6 +273,7 @@ def main():
                        help='爬取模式: all=全量爬取, missing=只爬取缺失数据')
     parser.add_argument('--batch-size', type=int, default=50, help='批次大小')
     parser.add_argument('--delay', type=int, default=60, help='批次间延迟(秒)')
+    parser.add_argument('--retry-failed', action='store_true', help='重新处理台账中已用完重试次数的失败任务')
     
     args = parser.parse_args()
     
@@ -295,7 +304,7 @@ def main():
     
     try:
         if args.mode == 'all':
-            success = auto_crawler.run_auto_crawl()
+            success = auto_crawler.run_auto_crawl(retry_failed=args.retry_failed)
         else:  # missing
             success = auto_crawler.run_missing_data_only()
         
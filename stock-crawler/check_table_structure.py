@@ -8,8 +8,7 @@ from database import db_manager
 def check_table_structure():
     """检查数据库表结构"""
     try:
-        conn = db_manager.get_connection()
-        with conn.cursor() as cursor:
+        with db_manager.connection() as conn, conn.cursor() as cursor:
             # 检查所有相关表的结构
             tables = ['stock_info', 'stock_data', 'stock_f10', 'stock_financial', 'stock_dividend']
             
@@ -27,8 +26,6 @@ def check_table_structure():
                     extra = column[5]
                     print(f"  {field_name}: {field_type} {'NULL' if is_null == 'YES' else 'NOT NULL'} {key} {extra}")
         
-        conn.close()
-        
     except Exception as e:
         print(f"检查表结构失败: {e}")
 
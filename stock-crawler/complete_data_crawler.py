@@ -3,18 +3,25 @@
 
 import akshare as ak
 import pandas as pd
-import time
+from concurrent.futures import as_completed
 from datetime import datetime, timedelta
 from loguru import logger
 from config import Config
 from database import db_manager
-import random
+from fetch_scheduler import fetch, fetch_scheduler
+from crawl_ledger import crawl_ledger
 
 class CompleteDataCrawler:
     def __init__(self):
         self.delay = Config.CRAWL_DELAY
         self.batch_size = Config.BATCH_SIZE
         self.max_retries = Config.MAX_RETRIES
+        # 数据集 -> 单只股票爬取方法
+        self.dataset_crawlers = {
+            'f10': self._crawl_single_f10,
+            'financial': self._crawl_single_financial,
+            'dividend': self._crawl_single_dividend,
+        }
     
     def crawl_all_missing_data(self, start_index=0, batch_size=50):
         """爬取所有缺失数据，按股票逐个处理"""
@@ -45,42 +52,26 @@ class CompleteDataCrawler:
                 'dividend_success': 0, 'dividend_failed': 0
             }
             
-            for i, (symbol, name) in enumerate(current_batch):
-                logger.info(f"正在处理 {symbol} {name} ({start_index + i + 1}/{total_stocks})")
-                
-                # 1. 处理F10数据
-                if not self._has_f10_data(symbol):
-                    if self._crawl_single_f10(symbol, name):
-                        stats['f10_success'] += 1
-                    else:
-                        stats['f10_failed'] += 1
-                else:
-                    logger.debug(f"{symbol} F10数据已存在")
-                
-                time.sleep(random.uniform(0.5, 1.0))
-                
-                # 2. 处理财务数据
-                if not self._has_financial_data(symbol):
-                    if self._crawl_single_financial(symbol, name):
-                        stats['financial_success'] += 1
-                    else:
-                        stats['financial_failed'] += 1
-                else:
-                    logger.debug(f"{symbol} 财务数据已存在")
-                
-                time.sleep(random.uniform(1.0, 2.0))
+            # 按顺序提交到抓取调度器，由调度器控制并发和各接口请求速率
+            futures = [
+                fetch_scheduler.submit(self._process_symbol, symbol, name, priority=start_index + i)
+                for i, (symbol, name) in enumerate(current_batch)
+            ]
+            
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    logger.error(f"处理股票异常: {e}")
+                    continue
                 
-                # 3. 处理分红数据
-                if not self._has_dividend_data(symbol):
-                    if self._crawl_single_dividend(symbol, name):
-                        stats['dividend_success'] += 1
-                    else:
-                        stats['dividend_failed'] += 1
-                else:
-                    logger.debug(f"{symbol} 分红数据已存在")
+                for kind, success in outcome.items():
+                    if success is None:
+                        continue
+                    stats[f"{kind}_success" if success else f"{kind}_failed"] += 1
                 
-                # 股票间延迟
-                time.sleep(random.uniform(1.0, 2.0))
+                if done % 10 == 0:
+                    logger.info(f"批次进度: {done}/{len(futures)}")
             
             logger.info("=== 批次处理完成 ===")
             logger.info(f"F10数据: 成功{stats['f10_success']}只, 失败{stats['f10_failed']}只")
@@ -93,6 +84,92 @@ class CompleteDataCrawler:
             logger.error(f"完整数据爬取失败: {e}")
             return None
     
+    def crawl_ledger_batch(self, batch_size=50):
+        """
+        从爬取台账领取一批任务并执行，结果写回台账
+        
+        Returns:
+            本批统计，台账中已没有可领取的任务时返回 None
+        """
+        jobs = crawl_ledger.claim(batch_size)
+        if not jobs:
+            return None
+        
+        # 同一只股票的多个数据集在一个任务里顺序执行
+        symbols = {}
+        for symbol, name, dataset in jobs:
+            symbols.setdefault(symbol, (name, []))[1].append(dataset)
+        
+        logger.info(f"从台账领取 {len(jobs)} 个任务，涉及 {len(symbols)} 只股票")
+        
+        stats = {
+            'f10_success': 0, 'f10_failed': 0,
+            'financial_success': 0, 'financial_failed': 0,
+            'dividend_success': 0, 'dividend_failed': 0
+        }
+        
+        futures = [
+            fetch_scheduler.submit(self._run_ledger_jobs, symbol, name, datasets, priority=i)
+            for i, (symbol, (name, datasets)) in enumerate(symbols.items())
+        ]
+        
+        for future in as_completed(futures):
+            try:
+                outcome = future.result()
+            except Exception as e:
+                logger.error(f"处理股票异常: {e}")
+                continue
+            
+            for dataset, success in outcome.items():
+                stats[f"{dataset}_success" if success else f"{dataset}_failed"] += 1
+        
+        return stats
+    
+    def _run_ledger_jobs(self, symbol, name, datasets):
+        """执行单只股票领取到的数据集任务，并记录到台账"""
+        logger.info(f"正在处理 {symbol} {name}: {', '.join(datasets)}")
+        outcome = {}
+        
+        for dataset in datasets:
+            try:
+                success = bool(self.dataset_crawlers[dataset](symbol, name))
+                error = None if success else '未获取到数据'
+            except Exception as e:
+                success, error = False, e
+            
+            if success:
+                crawl_ledger.complete(symbol, dataset)
+            else:
+                crawl_ledger.fail(symbol, dataset, error)
+            outcome[dataset] = success
+        
+        return outcome
+    
+    def _process_symbol(self, symbol, name):
+        """处理单只股票缺失的F10、财务、分红数据，返回各项结果（None表示已存在无需处理）"""
+        logger.info(f"正在处理 {symbol} {name}")
+        outcome = {'f10': None, 'financial': None, 'dividend': None}
+        
+        # 1. 处理F10数据
+        if not self._has_f10_data(symbol):
+            outcome['f10'] = self._crawl_single_f10(symbol, name)
+        else:
+            logger.debug(f"{symbol} F10数据已存在")
+        
+        # 2. 处理财务数据
+        if not self._has_financial_data(symbol):
+            outcome['financial'] = self._crawl_single_financial(symbol, name)
+        else:
+            logger.debug(f"{symbol} 财务数据已存在")
+        
+        # 3. 处理分红数据
+        if not self._has_dividend_data(symbol):
+            outcome['dividend'] = self._crawl_single_dividend(symbol, name)
+        else:
+            logger.debug(f"{symbol} 分红数据已存在")
+        
+        return outcome
+    
     def _has_f10_data(self, symbol):
         """检查是否已有F10数据"""
         result = db_manager.execute_query("SELECT COUNT(*) FROM stock_f10 WHERE symbol = %s", (symbol,))
@@ -138,7 +215,7 @@ class CompleteDataCrawler:
     
     def _get_f10_from_individual_info(self, symbol, name):
         """从个股信息获取F10数据"""
-        df = ak.stock_individual_info_em(symbol=symbol)
+        df = fetch(ak.stock_individual_info_em, symbol=symbol)
         if df.empty:
             return None
         
@@ -166,7 +243,7 @@ class CompleteDataCrawler:
         """从基本信息获取F10数据"""
         try:
             # 尝试其他接口
-            df = ak.stock_individual_basic_info_em(symbol=symbol)
+            df = fetch(ak.stock_individual_basic_info_em, symbol=symbol)
             if df.empty:
                 return None
             
@@ -229,7 +306,7 @@ class CompleteDataCrawler:
     
     def _get_financial_from_abstract(self, symbol, name):
         """从财务摘要获取数据"""
-        df = ak.stock_financial_abstract_ths(symbol=symbol)
+        df = fetch(ak.stock_financial_abstract_ths, symbol=symbol)
         if df.empty:
             return None
         
@@ -264,7 +341,7 @@ class CompleteDataCrawler:
         """从财务报表获取数据"""
         try:
             # 尝试利润表
-            df = ak.stock_profit_sheet_by_report_em(symbol=symbol)
+            df = fetch(ak.stock_profit_sheet_by_report_em, symbol=symbol)
             if df.empty:
                 return None
             
@@ -311,7 +388,7 @@ class CompleteDataCrawler:
     
     def _get_dividend_from_cninfo(self, symbol, name):
         """从cninfo获取分红数据"""
-        df = ak.stock_dividend_cninfo(symbol=symbol)
+        df = fetch(ak.stock_dividend_cninfo, symbol=symbol)
         if df.empty:
             return None
         
@@ -384,7 +461,7 @@ class CompleteDataCrawler:
     def _get_dividend_from_history(self, symbol, name):
         """从历史分红获取数据"""
         try:
-            df = ak.stock_history_dividend_detail(symbol=symbol)
+            df = fetch(ak.stock_history_dividend_detail, symbol=symbol)
             if df.empty:
                 return None
             
@@ -12,6 +12,11 @@ class Config:
     DB_PASSWORD = os.getenv('DB_PASSWORD', 'restosuite')
     DB_NAME = os.getenv('DB_NAME', 'chaogu')
     
+    # 数据库连接池配置
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))  # 最大连接数
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))  # 连接全部借出时的最长等待时间（秒）
+    DB_POOL_PING_INTERVAL = float(os.getenv('DB_POOL_PING_INTERVAL', 30))  # 空闲超过该时间的连接借出前先ping检查（秒）
+    
     # 数据库连接字符串
     DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4"
     
@@ -20,6 +25,30 @@ class Config:
     BATCH_SIZE = int(os.getenv('BATCH_SIZE', 100))
     MAX_RETRIES = int(os.getenv('MAX_RETRIES', 3))
     
+    # 抓取调度配置
+    FETCH_MAX_WORKERS = int(os.getenv('FETCH_MAX_WORKERS', 4))  # 并发抓取线程数
+    FETCH_RATE = float(os.getenv('FETCH_RATE', 2))  # 每个上游接口默认每秒请求数
+    FETCH_RATE_LIMITS = os.getenv('FETCH_RATE_LIMITS', '')  # 单独限速，如 "stock_individual_info_em:1,stock_dividend_cninfo:0.5"
+    
+    # 爬取台账配置
+    LEDGER_MAX_ATTEMPTS = int(os.getenv('LEDGER_MAX_ATTEMPTS', 3))  # 单个任务最多领取次数，之后保持失败状态
+    LEDGER_CLAIM_TIMEOUT = int(os.getenv('LEDGER_CLAIM_TIMEOUT', 1800))  # 领取后超时未完成可被重新领取（秒）
+    
+    # 每日同步候选配置
+    SYNC_MAX_CANDIDATES = int(os.getenv('SYNC_MAX_CANDIDATES', 0))  # 每次最多更新的股票数，0表示不限制
+    SYNC_STALE_DAYS = int(os.getenv('SYNC_STALE_DAYS', 7))  # 距上次更新多少天计1分陈旧度
+    SYNC_EARNINGS_MONTHS = [int(m) for m in os.getenv('SYNC_EARNINGS_MONTHS', '1,4,8,10').split(',') if m.strip()]  # 财报季月份
+    SYNC_EARNINGS_BOOST = float(os.getenv('SYNC_EARNINGS_BOOST', 2))  # 财报季财务数据陈旧度倍数
+    MARKET_CLOSE_TIME = os.getenv('MARKET_CLOSE_TIME', '15:30')  # 收盘（含数据落定）时间，早于该时间当天K线视为未收盘
+    
+    # 技术指标预计算配置
+    TECH_SYMBOL_BATCH_SIZE = int(os.getenv('TECH_SYMBOL_BATCH_SIZE', 500))  # 每批计算技术指标的股票数
+    TECH_LOOKBACK_BARS = int(os.getenv('TECH_LOOKBACK_BARS', 260))  # 增量计算读取的K线数（覆盖MA200和EMA收敛）
+    
+    # 批量写库配置
+    BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', 1000))  # 每个多行INSERT的行数
+    BULK_LOAD_INFILE = os.getenv('BULK_LOAD_INFILE', 'false').lower() == 'true'  # 大批量日线使用LOAD DATA LOCAL INFILE
+    
     # 日志配置
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FILE = os.getenv('LOG_FILE', 'logs/crawler.log')
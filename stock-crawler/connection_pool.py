@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import deque
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+from loguru import logger
+
+
+class PooledConnection:
+    """从连接池借出的连接：close() 把连接归还连接池而不是断开，其余属性透传给 pymysql 连接"""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def close(self):
+        """归还连接（可重复调用）"""
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw)
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise pymysql.err.InterfaceError("连接已归还连接池")
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        # 调用方异常路径上没有 close() 时也归还连接，避免连接池被耗尽
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """线程安全的 pymysql 连接池"""
+
+    def __init__(self, connect_kwargs, max_size=10, timeout=30.0, ping_interval=30.0):
+        """
+        Args:
+            connect_kwargs: pymysql.connect 参数
+            max_size: 最大连接数（含借出和空闲）
+            timeout: 连接全部借出时的最长等待时间（秒）
+            ping_interval: 空闲超过该时间的连接借出前先 ping 检查（秒）
+        """
+        self.connect_kwargs = connect_kwargs
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+
+        self._idle = deque()  # (连接, 归还时间)
+        self._size = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'reused': 0,
+            'discarded': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'max_wait_time': 0.0,
+        }
+
+    def get_connection(self, timeout=None):
+        """借出连接，连接池已满时等待其他线程归还"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        raw = None
+        idle_since = None
+
+        with self._cond:
+            waited = False
+            while True:
+                if self._idle:
+                    # 后进先出，尽量复用最近使用过的连接
+                    raw, idle_since = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    raise pymysql.err.OperationalError(f"等待数据库连接超时（{timeout}s），连接池已满: {self.max_size}")
+                waited = True
+                self._cond.wait(remaining)
+
+            wait_time = time.monotonic() - start
+            self._stats['checkouts'] += 1
+            self._stats['wait_time'] += wait_time
+            self._stats['max_wait_time'] = max(self._stats['max_wait_time'], wait_time)
+            if waited:
+                self._stats['waits'] += 1
+
+        try:
+            if raw is None:
+                raw = self._connect()
+            elif time.monotonic() - idle_since > self.ping_interval and not self._is_alive(raw):
+                self._close_raw(raw)
+                raw = self._connect()
+            else:
+                with self._cond:
+                    self._stats['reused'] += 1
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        return PooledConnection(self, raw)
+
+    def release(self, raw):
+        """归还连接，断开或状态异常的连接直接丢弃"""
+        healthy = raw.open
+        if healthy and raw.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+            # 调用方开启事务后未提交，回滚后再复用
+            try:
+                raw.rollback()
+            except Exception:
+                healthy = False
+
+        with self._cond:
+            if healthy:
+                self._idle.append((raw, time.monotonic()))
+            else:
+                self._size -= 1
+                self._stats['discarded'] += 1
+            self._cond.notify()
+
+        if not healthy:
+            self._close_raw(raw)
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for raw, _ in idle:
+            self._close_raw(raw)
+
+    def stats(self):
+        """借出次数、等待次数与等待时间等统计"""
+        with self._cond:
+            checkouts = self._stats['checkouts']
+            return {
+                **self._stats,
+                'avg_wait_time': self._stats['wait_time'] / checkouts if checkouts else 0.0,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+            }
+
+    def _connect(self):
+        raw = pymysql.connect(**self.connect_kwargs)
+        with self._cond:
+            self._stats['created'] += 1
+        return raw
+
+    def _is_alive(self, raw):
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception as e:
+            logger.warning(f"数据库连接已失效，重新建立: {e}")
+            with self._cond:
+                self._stats['discarded'] += 1
+            return False
+
+    @staticmethod
+    def _close_raw(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
@@ -0,0 +1,188 @@
+import os
+import socket
+import uuid
+
+from loguru import logger
+from config import Config
+from database import db_manager
+
+# 数据集 -> 对应的数据表（初始化台账时据此判断是否已有数据）
+LEDGER_DATASETS = {
+    'f10': 'stock_f10',
+    'financial': 'stock_financial',
+    'dividend': 'stock_dividend',
+}
+
+# 任务状态
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+CREATE_LEDGER_TABLE = """
+    CREATE TABLE IF NOT EXISTS crawl_job_ledger (
+        symbol VARCHAR(20) NOT NULL COMMENT '股票代码',
+        dataset VARCHAR(32) NOT NULL COMMENT '数据集: f10/financial/dividend',
+        status VARCHAR(16) NOT NULL DEFAULT 'pending' COMMENT 'pending/running/done/failed',
+        attempts INT NOT NULL DEFAULT 0 COMMENT '已领取次数',
+        owner VARCHAR(100) NULL COMMENT '领取任务的爬虫进程',
+        claimedAt DATETIME NULL COMMENT '领取时间',
+        lastSuccessAt DATETIME NULL COMMENT '最近成功时间',
+        lastError VARCHAR(500) NULL COMMENT '最近一次失败原因',
+        createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (symbol, dataset),
+        KEY idx_ledger_status (status, dataset)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='爬取任务台账'
+"""
+
+
+class CrawlLedger:
+    """
+    爬取任务台账：按 股票 x 数据集 记录状态、领取次数和最近成功时间
+    - 重启后从台账继续，已完成的任务不再逐只查询数据表
+    - 领取任务是一条带 LIMIT 的 UPDATE，多个爬虫进程并发领取时互不重复
+    - 领取后超时未完成（进程崩溃）的任务可被重新领取
+    """
+
+    def __init__(self, max_attempts=None, claim_timeout=None):
+        """
+        Args:
+            max_attempts: 单个任务最多领取次数，超过后保持 failed 不再自动重试
+            claim_timeout: 领取后超过该时间仍未完成视为进程已退出（秒）
+        """
+        self.max_attempts = max_attempts or Config.LEDGER_MAX_ATTEMPTS
+        self.claim_timeout = claim_timeout or Config.LEDGER_CLAIM_TIMEOUT
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._table_ready = False
+
+    def ensure_table(self):
+        """创建台账表（已存在时跳过）"""
+        if self._table_ready:
+            return
+        with db_manager.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(CREATE_LEDGER_TABLE)
+        self._table_ready = True
+
+    def seed(self, datasets=None):
+        """
+        为所有活跃股票补齐台账记录，已有数据的直接记为 done（每个数据集一条集合查询）
+
+        Returns:
+            新增的任务数
+        """
+        self.ensure_table()
+        added = 0
+        with db_manager.connection() as conn, conn.cursor() as cursor:
+            for dataset in datasets or LEDGER_DATASETS:
+                table = LEDGER_DATASETS[dataset]
+                added += cursor.execute(f"""
+                    INSERT IGNORE INTO crawl_job_ledger (symbol, dataset, status, lastSuccessAt)
+                    SELECT s.symbol, %s,
+                           IF(d.symbol IS NULL, %s, %s),
+                           IF(d.symbol IS NULL, NULL, NOW())
+                    FROM stock_info s
+                    LEFT JOIN (SELECT DISTINCT symbol FROM {table}) d ON d.symbol = s.symbol
+                    WHERE s.isActive = 1
+                """, (dataset, STATUS_PENDING, STATUS_DONE))
+        logger.info(f"爬取台账新增 {added} 个任务")
+        return added
+
+    def claim(self, limit, datasets=None):
+        """
+        领取一批待处理任务：pending、未超过重试次数的 failed、以及领取超时的 running
+
+        Returns:
+            [(symbol, name, dataset), ...]
+        """
+        self.ensure_table()
+        datasets = list(datasets or LEDGER_DATASETS)
+        # 每次领取使用独立标记，随后按标记取回本次领取到的任务
+        token = f"{self.worker_id}:{uuid.uuid4().hex[:8]}"
+        placeholders = ', '.join(['%s'] * len(datasets))
+
+        with db_manager.connection() as conn, conn.cursor() as cursor:
+            claimed = cursor.execute(f"""
+                UPDATE crawl_job_ledger
+                SET status = %s, owner = %s, claimedAt = NOW(), attempts = attempts + 1
+                WHERE dataset IN ({placeholders})
+                  AND (
+                    status = %s
+                    OR (status = %s AND attempts < %s)
+                    OR (status = %s AND claimedAt < NOW() - INTERVAL %s SECOND)
+                  )
+                ORDER BY symbol, dataset
+                LIMIT %s
+            """, (STATUS_RUNNING, token, *datasets,
+                  STATUS_PENDING, STATUS_FAILED, self.max_attempts,
+                  STATUS_RUNNING, int(self.claim_timeout), int(limit)))
+            if not claimed:
+                return []
+
+            cursor.execute("""
+                SELECT l.symbol, COALESCE(s.name, ''), l.dataset
+                FROM crawl_job_ledger l
+                LEFT JOIN stock_info s ON s.symbol = l.symbol
+                WHERE l.owner = %s AND l.status = %s
+                ORDER BY l.symbol, l.dataset
+            """, (token, STATUS_RUNNING))
+            return list(cursor.fetchall())
+
+    def complete(self, symbol, dataset):
+        """记录任务成功"""
+        self._execute("""
+            UPDATE crawl_job_ledger
+            SET status = %s, owner = NULL, lastSuccessAt = NOW(), lastError = NULL
+            WHERE symbol = %s AND dataset = %s
+        """, (STATUS_DONE, symbol, dataset))
+
+    def fail(self, symbol, dataset, error=None):
+        """记录任务失败，领取次数未用完时后续会被重新领取"""
+        self._execute("""
+            UPDATE crawl_job_ledger
+            SET status = %s, owner = NULL, lastError = %s
+            WHERE symbol = %s AND dataset = %s
+        """, (STATUS_FAILED, str(error)[:500] if error else None, symbol, dataset))
+
+    def release(self):
+        """把本进程领取但未完成的任务退回 pending（进程正常退出或被中断时调用）"""
+        self.ensure_table()
+        released = self._execute("""
+            UPDATE crawl_job_ledger
+            SET status = %s, owner = NULL, attempts = GREATEST(attempts - 1, 0)
+            WHERE status = %s AND owner LIKE %s
+        """, (STATUS_PENDING, STATUS_RUNNING, f"{self.worker_id}:%"))
+        if released:
+            logger.info(f"退回 {released} 个未完成的爬取任务")
+        return released
+
+    def reset_failed(self, datasets=None):
+        """清零失败任务的领取次数，使其重新进入待处理"""
+        self.ensure_table()
+        datasets = list(datasets or LEDGER_DATASETS)
+        placeholders = ', '.join(['%s'] * len(datasets))
+        return self._execute(f"""
+            UPDATE crawl_job_ledger
+            SET status = %s, attempts = 0, lastError = NULL
+            WHERE status = %s AND dataset IN ({placeholders})
+        """, (STATUS_PENDING, STATUS_FAILED, *datasets))
+
+    def progress(self):
+        """各数据集各状态的任务数: {dataset: {status: count}}"""
+        self.ensure_table()
+        rows = db_manager.execute_query(
+            "SELECT dataset, status, COUNT(*) FROM crawl_job_ledger GROUP BY dataset, status"
+        )
+        result = {}
+        for dataset, status, count in rows or []:
+            result.setdefault(dataset, {})[status] = count
+        return result
+
+    def _execute(self, query, params):
+        """执行写语句，返回影响行数"""
+        with db_manager.connection() as conn, conn.cursor() as cursor:
+            return cursor.execute(query, params)
+
+
+# 全局爬取台账
+crawl_ledger = CrawlLedger()
@@ -1,10 +1,13 @@
 import akshare as ak
 import pandas as pd
 import time
+from concurrent.futures import as_completed
 from datetime import datetime, timedelta
 from loguru import logger
 from config import Config
 from database import db_manager
+from fetch_scheduler import fetch, fetch_scheduler
+from spot_transform import transform_spot_frame
 import numpy as np
 
 class StockCrawler:
@@ -53,26 +56,16 @@ class StockCrawler:
             
             logger.info(f"{market_name}获取到{len(df)}只股票")
             
-            # 处理股票数据
-            stock_info_list = []
-            stock_data_list = []
-            
-            for _, row in df.iterrows():
-                try:
-                    stock_info, stock_data = self._process_stock_row(row, market_info)
-                    if stock_info and stock_data:
-                        stock_info_list.append(stock_info)
-                        stock_data_list.append(stock_data)
-                        success_count += 1
-                    else:
-                        failed_count += 1
-                except Exception as e:
-                    logger.error(f"处理股票数据失败: {e}")
-                    failed_count += 1
+            # 整表转换为 stock_info / stock_data 写入数据
+            info_frame, data_frame = transform_spot_frame(
+                df, market=market_info['market'], sector=market_info.get('sector')
+            )
+            success_count = len(info_frame)
+            failed_count = len(df) - success_count
             
             # 批量保存数据
-            if stock_info_list:
-                self._save_batch_data(stock_info_list, stock_data_list)
+            if success_count:
+                self._save_batch_data(info_frame, data_frame)
             
         except Exception as e:
             logger.error(f"爬取{market_name}失败: {e}")
@@ -80,92 +73,15 @@ class StockCrawler:
         
         return success_count, failed_count
     
-    def _process_stock_row(self, row, market_info):
-        """处理单只股票数据"""
+    def _save_batch_data(self, info_frame, data_frame):
+        """批量保存数据（按 batch_size 分块提交）"""
         try:
-            # 获取基本信息
-            symbol = str(row.get('代码', ''))
-            name = str(row.get('名称', ''))
+            # 保存股票基本信息（使用upsert）
+            db_manager.upsert_stock_info_dataframe(info_frame, chunk_size=self.batch_size)
             
-            if not symbol or not name:
-                return None, None
-            
-            # 股票基本信息
-            stock_info = {
-                'symbol': symbol,
-                'name': name,
-                'industry': str(row.get('所属行业', '未知')),
-                'sector': market_info.get('sector', self._get_sector_by_symbol(symbol)),
-                'market': market_info['market'],
-                'listDate': '2000-01-01',  # 默认上市日期，后续可以通过其他接口获取
-                'marketCap': float(row.get('总市值', 0)) if pd.notna(row.get('总市值')) else 0,
-                'circulationMarketCap': float(row.get('流通市值', 0)) if pd.notna(row.get('流通市值')) else 0,
-                'totalShares': float(row.get('总股本', 0)) if pd.notna(row.get('总股本')) else 0,
-                'circulationShares': float(row.get('流通股', 0)) if pd.notna(row.get('流通股')) else 0,
-                'peRatio': float(row.get('市盈率-动态', 0)) if pd.notna(row.get('市盈率-动态')) else 0,
-                'pbRatio': float(row.get('市净率', 0)) if pd.notna(row.get('市净率')) else 0,
-                'dividendYield': 0,  # 股息率，后续通过分红数据计算
-                'isActive': True,
-            }
-            
-            # 当日交易数据
-            today = datetime.now().strftime('%Y-%m-%d')
-            stock_data = {
-                'symbol': symbol,
-                'name': name,
-                'date': today,
-                'open': float(row.get('今开', 0)) if pd.notna(row.get('今开')) else 0,
-                'high': float(row.get('最高', 0)) if pd.notna(row.get('最高')) else 0,
-                'low': float(row.get('最低', 0)) if pd.notna(row.get('最低')) else 0,
-                'close': float(row.get('最新价', 0)) if pd.notna(row.get('最新价')) else 0,
-                'volume': int(row.get('成交量', 0)) if pd.notna(row.get('成交量')) else 0,
-                'amount': float(row.get('成交额', 0)) if pd.notna(row.get('成交额')) else 0,
-                'changePercent': float(row.get('涨跌幅', 0)) if pd.notna(row.get('涨跌幅')) else 0,
-                'changeAmount': float(row.get('涨跌额', 0)) if pd.notna(row.get('涨跌额')) else 0,
-                'turnoverRate': float(row.get('换手率', 0)) if pd.notna(row.get('换手率')) else 0,
-            }
-            
-            return stock_info, stock_data
+            # 保存交易数据
+            db_manager.insert_stock_dataframe(data_frame, chunk_size=self.batch_size)
             
-        except Exception as e:
-            logger.error(f"处理股票行数据失败: {e}")
-            return None, None
-    
-    def _get_sector_by_symbol(self, symbol):
-        """根据股票代码判断板块"""
-        if symbol.startswith('688'):
-            return '科创板'
-        elif symbol.startswith('300'):
-            return '创业板'
-        elif symbol.startswith('002'):
-            return '中小板'
-        elif symbol.startswith('6'):
-            return '主板'
-        elif symbol.startswith('0'):
-            return '主板'
-        elif symbol.startswith('8') or symbol.startswith('4'):
-            return '北交所'
-        else:
-            return '其他'
-    
-    def _save_batch_data(self, stock_info_list, stock_data_list):
-        """批量保存数据"""
-        try:
-            # 分批保存，避免一次性插入过多数据
-            batch_size = self.batch_size
-            
-            for i in range(0, len(stock_info_list), batch_size):
-                info_batch = stock_info_list[i:i + batch_size]
-                data_batch = stock_data_list[i:i + batch_size]
-                
-                # 保存股票基本信息（使用upsert）
-                db_manager.upsert_stock_info(info_batch)
-                
-                # 保存交易数据
-                db_manager.insert_stock_data(data_batch)
-                
-                time.sleep(0.1)  # 批次间短暂延迟
-                
         except Exception as e:
             logger.error(f"批量保存数据失败: {e}")
     
@@ -175,44 +91,138 @@ class StockCrawler:
             if not start_date:
                 start_date = (datetime.now() - timedelta(days=365)).strftime('%Y%m%d')
             if not end_date:
-                end_date = datetime.now().strftime('%Y%m%d')
+                end_date = self._latest_closed_session(datetime.now()).strftime('%Y%m%d')
             
-            # 获取历史数据
-            df = ak.stock_zh_a_hist(symbol=symbol, period=period, start_date=start_date, end_date=end_date)
+            name = db_manager.get_stock_names([symbol]).get(symbol, '')
+            historical_data = self._fetch_history(symbol, period, start_date, end_date, name)
             
-            if df.empty:
+            if historical_data.empty:
                 logger.warning(f"股票{symbol}没有历史数据")
                 return False
             
-            # 处理历史数据
-            historical_data = []
-            for _, row in df.iterrows():
-                data = {
-                    'symbol': symbol,
-                    'name': '',  # 历史数据中没有名称，需要从股票信息中获取
-                    'date': row['日期'].strftime('%Y-%m-%d'),
-                    'open': float(row['开盘']),
-                    'high': float(row['最高']),
-                    'low': float(row['最低']),
-                    'close': float(row['收盘']),
-                    'volume': int(row['成交量']),
-                    'amount': float(row['成交额']),
-                    'changePercent': float(row.get('涨跌幅', 0)),
-                    'changeAmount': float(row.get('涨跌额', 0)),
-                    'turnoverRate': float(row.get('换手率', 0)),
-                }
-                historical_data.append(data)
-            
             # 保存历史数据
-            if historical_data:
-                db_manager.insert_stock_data(historical_data)
-                logger.info(f"成功保存股票{symbol}的{len(historical_data)}条历史数据")
-                return True
+            result = db_manager.insert_stock_dataframe(historical_data)
+            logger.info(f"成功保存股票{symbol}的{result['success']}条历史数据")
+            return result['success'] > 0
             
         except Exception as e:
             logger.error(f"爬取股票{symbol}历史数据失败: {e}")
             return False
     
+    def _fetch_history(self, symbol, period, start_date, end_date, name=''):
+        """获取历史行情并按列整体转换为 stock_data 格式（历史接口不返回名称，由调用方从股票信息中传入）"""
+        df = fetch(ak.stock_zh_a_hist, symbol=symbol, period=period, start_date=start_date, end_date=end_date)
+        
+        if df is None or df.empty:
+            return pd.DataFrame()
+        
+        return pd.DataFrame({
+            'symbol': symbol,
+            'name': name,
+            'date': pd.to_datetime(df['日期']).dt.strftime('%Y-%m-%d'),
+            'open': df['开盘'].astype(float),
+            'high': df['最高'].astype(float),
+            'low': df['最低'].astype(float),
+            'close': df['收盘'].astype(float),
+            'volume': df['成交量'].astype('int64'),
+            'amount': df['成交额'].astype(float),
+            'changePercent': df['涨跌幅'].astype(float) if '涨跌幅' in df else 0.0,
+            'changeAmount': df['涨跌额'].astype(float) if '涨跌额' in df else 0.0,
+            'turnoverRate': df['换手率'].astype(float) if '换手率' in df else 0.0,
+        })
+    
+    def sync_daily_bars(self, symbols=None, lookback_days=365):
+        """
+        增量同步日线：按每只股票已入库的最新日期只请求缺失区间，已是最新的股票直接跳过
+        
+        Args:
+            symbols: 股票代码列表，默认所有活跃股票
+            lookback_days: 没有水位的股票回补的天数
+        
+        Returns:
+            {'synced': 有新数据的股票数, 'skipped': 已是最新的股票数, 'failed': 失败数, 'rows': 写入行数}
+        """
+        if symbols is None:
+            symbols = db_manager.get_existing_symbols()
+        
+        target = self._latest_closed_session(datetime.now())
+        # 初始化水位时以目标日之前的交易日为上限，目标日的K线总会被抓取，覆盖可能写入的实时快照
+        watermarks = db_manager.load_daily_watermarks(seed_cap=self._previous_session(target))
+        # 名称一并写入日线，避免 ON DUPLICATE KEY 用空名称覆盖已有记录
+        names = db_manager.get_stock_names()
+        stats = {'synced': 0, 'skipped': 0, 'failed': 0, 'rows': 0}
+        
+        futures = {}
+        for i, symbol in enumerate(symbols):
+            last_date = watermarks.get(symbol)
+            if last_date and last_date >= target:
+                stats['skipped'] += 1
+                continue
+            
+            start = last_date + timedelta(days=1) if last_date else target - timedelta(days=lookback_days)
+            futures[fetch_scheduler.submit(self._sync_symbol_bars, symbol, start, target, names.get(symbol, ''), priority=i)] = symbol
+        
+        logger.info(f"日线增量同步: 需要更新{len(futures)}只, 已是最新{stats['skipped']}只, 目标日期{target}")
+        
+        advanced = {}
+        try:
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    last_date, rows = future.result()
+                except Exception as e:
+                    logger.error(f"同步股票{symbol}日线失败: {e}")
+                    stats['failed'] += 1
+                    continue
+                
+                if last_date:
+                    advanced[symbol] = last_date
+                    stats['synced'] += 1
+                    stats['rows'] += rows
+                else:
+                    # 停牌或节假日，区间内没有新数据
+                    stats['skipped'] += 1
+        finally:
+            # 中途中断时也保存已完成股票的水位
+            db_manager.update_daily_watermarks(advanced)
+        
+        logger.info(f"日线增量同步完成: 更新{stats['synced']}只({stats['rows']}条), 跳过{stats['skipped']}只, 失败{stats['failed']}只")
+        return stats
+    
+    def _sync_symbol_bars(self, symbol, start, end, name=''):
+        """同步单只股票 [start, end] 区间的日线，返回 (写入的最新日期, 写入行数)"""
+        bars = self._fetch_history(symbol, 'daily', start.strftime('%Y%m%d'), end.strftime('%Y%m%d'), name)
+        if bars.empty:
+            return None, 0
+        
+        result = db_manager.insert_stock_dataframe(bars)
+        if result['failed']:
+            raise RuntimeError(f"{result['failed']}条日线写入失败")
+        return datetime.strptime(bars['date'].max(), '%Y-%m-%d').date(), result['success']
+    
+    @staticmethod
+    def _latest_closed_session(now):
+        """
+        不晚于 now 的最近一个已收盘交易日（不含节假日判断，节假日只会多请求一次空区间）
+        
+        收盘前当天的K线还在变化，写入后水位会推进到当天导致收盘价不再补抓，因此收盘前以前一交易日为准
+        """
+        close_time = datetime.strptime(Config.MARKET_CLOSE_TIME, '%H:%M').time()
+        day = now.date()
+        if now.time() < close_time:
+            day -= timedelta(days=1)
+        while day.weekday() >= 5:
+            day -= timedelta(days=1)
+        return day
+    
+    @staticmethod
+    def _previous_session(day):
+        """早于 day 的最近一个工作日（不含节假日判断）"""
+        day -= timedelta(days=1)
+        while day.weekday() >= 5:
+            day -= timedelta(days=1)
+        return day
+    
     def crawl_f10_data(self, symbols=None):
         """爬取F10基本信息"""
         logger.info("开始爬取F10基本信息")
@@ -5,11 +5,15 @@ import akshare as ak
 import pandas as pd
 import time
 import schedule
+from concurrent.futures import as_completed
 from datetime import datetime, timedelta
 from loguru import logger
 from config import Config
 from database import db_manager
-import random
+from fetch_scheduler import fetch_scheduler
+from spot_transform import transform_spot_frame
+from update_priority import CandidateScorer, rank_candidates
+from technical_indicators import technical_job
 import sys
 import os
 
@@ -18,6 +22,9 @@ class DailyStockSyncer:
         self.delay = Config.CRAWL_DELAY
         self.batch_size = Config.BATCH_SIZE
         self.max_retries = Config.MAX_RETRIES
+        # 更新候选打分函数 (DataFrame, now) -> Series，及每次运行最多更新的股票数
+        self.candidate_scorer = CandidateScorer()
+        self.max_candidates = Config.SYNC_MAX_CANDIDATES
         
     def daily_sync_task(self):
         """每日同步任务"""
@@ -43,8 +50,12 @@ class DailyStockSyncer:
             logger.info("步骤3: 增量更新现有股票数据")
             self.incremental_update_existing_stocks()
             
-            # 4. 数据质量检查
-            logger.info("步骤4: 数据质量检查")
+            # 4. 增量计算技术指标
+            logger.info("步骤4: 增量计算技术指标")
+            technical_job.run()
+            
+            # 5. 数据质量检查
+            logger.info("步骤5: 数据质量检查")
             self.data_quality_check()
             
             end_time = datetime.now()
@@ -77,52 +88,37 @@ class DailyStockSyncer:
             
             logger.info(f"从akshare获取到{len(df)}只股票")
             
+            # 整表转换为 stock_info / stock_data 写入数据
+            info_frame, data_frame = transform_spot_frame(df)
+            
             # 获取数据库中现有的股票
             existing_stocks = db_manager.execute_query(
-                "SELECT symbol, name, updatedAt FROM stock_info"
+                "SELECT symbol, name FROM stock_info"
+            )
+            existing_names = pd.Series(
+                {row[0]: row[1] for row in existing_stocks} if existing_stocks else {}, dtype=object
             )
-            existing_dict = {row[0]: {'name': row[1], 'updated': row[2]} for row in existing_stocks} if existing_stocks else {}
             
-            new_stocks = []
-            updated_stocks = []
+            # 按代码对齐已有名称：不存在的为新股票，名称变化的需要更新
+            old_names = info_frame['symbol'].map(existing_names)
+            is_new = old_names.isna()
+            is_renamed = ~is_new & (old_names != info_frame['name'])
             
-            # 处理每只股票
-            for _, row in df.iterrows():
-                symbol = str(row.get('代码', ''))
-                name = str(row.get('名称', ''))
-                
-                if not symbol or not name:
-                    continue
-                
-                stock_info, stock_data = self._process_stock_row(row)
-                
-                if symbol not in existing_dict:
-                    # 新股票
-                    new_stocks.append({
-                        'symbol': symbol,
-                        'name': name,
-                        'stock_info': stock_info,
-                        'stock_data': stock_data
-                    })
-                    logger.info(f"发现新股票: {symbol} {name}")
-                else:
-                    # 现有股票，检查是否需要更新
-                    if existing_dict[symbol]['name'] != name:
-                        updated_stocks.append({
-                            'symbol': symbol,
-                            'name': name,
-                            'stock_info': stock_info,
-                            'stock_data': stock_data
-                        })
-                        logger.info(f"股票信息变更: {symbol} {existing_dict[symbol]['name']} -> {name}")
+            new_stocks = info_frame.loc[is_new, ['symbol', 'name']].to_dict('records')
+            updated_stocks = info_frame.loc[is_renamed, ['symbol', 'name']].to_dict('records')
+            
+            for stock in new_stocks:
+                logger.info(f"发现新股票: {stock['symbol']} {stock['name']}")
+            for symbol, old_name, name in zip(info_frame['symbol'][is_renamed], old_names[is_renamed], info_frame['name'][is_renamed]):
+                logger.info(f"股票信息变更: {symbol} {old_name} -> {name}")
             
             # 批量插入新股票
             if new_stocks:
-                self._insert_new_stocks(new_stocks)
+                self._insert_new_stocks(info_frame[is_new], data_frame[is_new])
             
             # 批量更新现有股票
             if updated_stocks:
-                self._update_existing_stocks(updated_stocks)
+                self._update_existing_stocks(info_frame[is_renamed], data_frame[is_renamed])
             
             return new_stocks, updated_stocks
             
@@ -130,108 +126,30 @@ class DailyStockSyncer:
             logger.error(f"同步股票列表失败: {e}")
             return [], []
     
-    def _process_stock_row(self, row):
-        """处理单只股票数据"""
-        try:
-            symbol = str(row.get('代码', ''))
-            name = str(row.get('名称', ''))
-            
-            # 股票基本信息
-            stock_info = {
-                'symbol': symbol,
-                'name': name,
-                'industry': str(row.get('所属行业', '未知')),
-                'sector': self._get_sector_by_symbol(symbol),
-                'market': 'ALL',
-                'listDate': '2000-01-01',  # 默认上市日期
-                'marketCap': float(row.get('总市值', 0)) if pd.notna(row.get('总市值')) else 0,
-                'circulationMarketCap': float(row.get('流通市值', 0)) if pd.notna(row.get('流通市值')) else 0,
-                'totalShares': float(row.get('总股本', 0)) if pd.notna(row.get('总股本')) else 0,
-                'circulationShares': float(row.get('流通股', 0)) if pd.notna(row.get('流通股')) else 0,
-                'peRatio': float(row.get('市盈率-动态', 0)) if pd.notna(row.get('市盈率-动态')) else 0,
-                'pbRatio': float(row.get('市净率', 0)) if pd.notna(row.get('市净率')) else 0,
-                'dividendYield': 0,
-                'isActive': True,
-            }
-            
-            # 当日交易数据
-            today = datetime.now().strftime('%Y-%m-%d')
-            stock_data = {
-                'symbol': symbol,
-                'name': name,
-                'date': today,
-                'open': float(row.get('今开', 0)) if pd.notna(row.get('今开')) else 0,
-                'high': float(row.get('最高', 0)) if pd.notna(row.get('最高')) else 0,
-                'low': float(row.get('最低', 0)) if pd.notna(row.get('最低')) else 0,
-                'close': float(row.get('最新价', 0)) if pd.notna(row.get('最新价')) else 0,
-                'volume': int(row.get('成交量', 0)) if pd.notna(row.get('成交量')) else 0,
-                'amount': float(row.get('成交额', 0)) if pd.notna(row.get('成交额')) else 0,
-                'changePercent': float(row.get('涨跌幅', 0)) if pd.notna(row.get('涨跌幅')) else 0,
-                'changeAmount': float(row.get('涨跌额', 0)) if pd.notna(row.get('涨跌额')) else 0,
-                'turnoverRate': float(row.get('换手率', 0)) if pd.notna(row.get('换手率')) else 0,
-            }
-            
-            return stock_info, stock_data
-            
-        except Exception as e:
-            logger.error(f"处理股票行数据失败: {e}")
-            return None, None
-    
-    def _get_sector_by_symbol(self, symbol):
-        """根据股票代码判断板块"""
-        if symbol.startswith('688'):
-            return '科创板'
-        elif symbol.startswith('300'):
-            return '创业板'
-        elif symbol.startswith('002'):
-            return '中小板'
-        elif symbol.startswith('6'):
-            return '主板'
-        elif symbol.startswith('0'):
-            return '主板'
-        elif symbol.startswith('8') or symbol.startswith('4'):
-            return '北交所'
-        else:
-            return '其他'
-    
-    def _insert_new_stocks(self, new_stocks):
+    def _insert_new_stocks(self, info_frame, data_frame):
         """插入新股票"""
         try:
-            stock_info_list = []
-            stock_data_list = []
-            
-            for stock in new_stocks:
-                stock_info_list.append(stock['stock_info'])
-                stock_data_list.append(stock['stock_data'])
-            
             # 插入股票基本信息
-            db_manager.insert_stock_info(stock_info_list)
+            db_manager.upsert_stock_info_dataframe(info_frame)
             
             # 插入交易数据
-            db_manager.insert_stock_data(stock_data_list)
+            db_manager.insert_stock_dataframe(data_frame)
             
-            logger.info(f"成功插入{len(new_stocks)}只新股票")
+            logger.info(f"成功插入{len(info_frame)}只新股票")
             
         except Exception as e:
             logger.error(f"插入新股票失败: {e}")
     
-    def _update_existing_stocks(self, updated_stocks):
+    def _update_existing_stocks(self, info_frame, data_frame):
         """更新现有股票"""
         try:
-            stock_info_list = []
-            stock_data_list = []
-            
-            for stock in updated_stocks:
-                stock_info_list.append(stock['stock_info'])
-                stock_data_list.append(stock['stock_data'])
-            
             # 更新股票基本信息
-            db_manager.upsert_stock_info(stock_info_list)
+            db_manager.upsert_stock_info_dataframe(info_frame)
             
             # 插入最新交易数据
-            db_manager.insert_stock_data(stock_data_list)
+            db_manager.insert_stock_dataframe(data_frame)
             
-            logger.info(f"成功更新{len(updated_stocks)}只股票")
+            logger.info(f"成功更新{len(info_frame)}只股票")
             
         except Exception as e:
             logger.error(f"更新现有股票失败: {e}")
@@ -242,42 +160,32 @@ class DailyStockSyncer:
         
         stats = {'f10_success': 0, 'f10_failed': 0, 'financial_success': 0, 'financial_failed': 0, 'dividend_success': 0, 'dividend_failed': 0}
         
-        for i, stock in enumerate(new_stocks):
-            symbol = stock['symbol']
-            name = stock['name']
-            
-            logger.info(f"正在处理新股票 {symbol} {name} ({i+1}/{len(new_stocks)})")
-            
+        futures = {
+            fetch_scheduler.submit(self._crawl_new_symbol, stock['symbol'], stock['name'], priority=i): stock['symbol']
+            for i, stock in enumerate(new_stocks)
+        }
+        
+        for future in as_completed(futures):
             try:
-                # 1. F10数据
-                if self._crawl_single_f10(symbol, name):
-                    stats['f10_success'] += 1
-                else:
-                    stats['f10_failed'] += 1
-                
-                time.sleep(random.uniform(1.0, 2.0))
-                
-                # 2. 财务数据
-                if self._crawl_single_financial(symbol, name):
-                    stats['financial_success'] += 1
-                else:
-                    stats['financial_failed'] += 1
-                
-                time.sleep(random.uniform(1.0, 2.0))
-                
-                # 3. 分红数据
-                if self._crawl_single_dividend(symbol, name):
-                    stats['dividend_success'] += 1
-                else:
-                    stats['dividend_failed'] += 1
-                
-                time.sleep(random.uniform(1.0, 2.0))
-                
+                outcome = future.result()
             except Exception as e:
-                logger.error(f"处理新股票{symbol}数据失败: {e}")
+                logger.error(f"处理新股票{futures[future]}数据失败: {e}")
+                continue
+            
+            for kind, success in outcome.items():
+                stats[f"{kind}_success" if success else f"{kind}_failed"] += 1
         
         logger.info(f"新股票数据爬取完成: F10({stats['f10_success']}/{len(new_stocks)}), 财务({stats['financial_success']}/{len(new_stocks)}), 分红({stats['dividend_success']}/{len(new_stocks)})")
     
+    def _crawl_new_symbol(self, symbol, name):
+        """爬取单只新股票的F10、财务、分红数据"""
+        logger.info(f"正在处理新股票 {symbol} {name}")
+        return {
+            'f10': self._crawl_single_f10(symbol, name),
+            'financial': self._crawl_single_financial(symbol, name),
+            'dividend': self._crawl_single_dividend(symbol, name),
+        }
+    
     def incremental_update_existing_stocks(self):
         """增量更新现有股票数据 - 全量处理，不限制数量"""
         logger.info("开始全量更新现有股票数据...")
@@ -294,126 +202,60 @@ class DailyStockSyncer:
             
             stats = {'f10_success': 0, 'f10_failed': 0, 'financial_success': 0, 'financial_failed': 0, 'dividend_success': 0, 'dividend_failed': 0}
             
-            # 分批处理，提高效率
-            batch_size = 50
-            for batch_start in range(0, len(update_candidates), batch_size):
-                batch_end = min(batch_start + batch_size, len(update_candidates))
-                batch = update_candidates[batch_start:batch_end]
-                
-                logger.info(f"处理第{batch_start+1}-{batch_end}只股票...")
+            # 按优先级顺序提交到抓取调度器，由调度器控制并发和各接口请求速率
+            futures = {
+                fetch_scheduler.submit(self._update_symbol, symbol, name, priority=i): symbol
+                for i, (symbol, name, score) in enumerate(update_candidates)
+            }
+            
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    logger.error(f"更新股票{futures[future]}数据失败: {e}")
+                    continue
                 
-                for i, (symbol, name, priority) in enumerate(batch):
-                    logger.info(f"正在更新 {symbol} {name} (优先级:{priority}) ({batch_start + i + 1}/{len(update_candidates)})")
-                    
-                    try:
-                        # 全量更新策略：所有需要更新的数据都更新
-                        if self._update_f10_if_needed(symbol, name):
-                            stats['f10_success'] += 1
-                        else:
-                            stats['f10_failed'] += 1
-                        
-                        time.sleep(random.uniform(0.3, 0.8))  # 减少延迟
-                        
-                        if self._update_financial_if_needed(symbol, name):
-                            stats['financial_success'] += 1
-                        else:
-                            stats['financial_failed'] += 1
-                        
-                        time.sleep(random.uniform(0.3, 0.8))
-                        
-                        if self._update_dividend_if_needed(symbol, name):
-                            stats['dividend_success'] += 1
-                        else:
-                            stats['dividend_failed'] += 1
-                        
-                        time.sleep(random.uniform(0.5, 1.0))  # 股票间延迟
-                        
-                    except Exception as e:
-                        logger.error(f"更新股票{symbol}数据失败: {e}")
+                for kind, success in outcome.items():
+                    stats[f"{kind}_success" if success else f"{kind}_failed"] += 1
                 
-                # 批次间稍长延迟
-                if batch_end < len(update_candidates):
-                    logger.info(f"批次完成，休息2秒...")
-                    time.sleep(2.0)
+                if done % 50 == 0:
+                    logger.info(f"已处理{done}/{len(futures)}只股票...")
             
             logger.info(f"全量更新完成: F10({stats['f10_success']}), 财务({stats['financial_success']}), 分红({stats['dividend_success']})")
             
         except Exception as e:
             logger.error(f"增量更新失败: {e}")
     
+    def _update_symbol(self, symbol, name):
+        """按需更新单只股票的F10、财务、分红数据（全量更新策略：所有需要更新的数据都更新）"""
+        logger.info(f"正在更新 {symbol} {name}")
+        return {
+            'f10': self._update_f10_if_needed(symbol, name),
+            'financial': self._update_financial_if_needed(symbol, name),
+            'dividend': self._update_dividend_if_needed(symbol, name),
+        }
+    
     def _get_update_candidates(self):
-        """获取需要更新的股票候选列表"""
+        """获取需要更新的股票候选列表（按 candidate_scorer 打分排序，最多 max_candidates 只）"""
         try:
-            # 优先级策略：
-            # 1. 高优先级：大盘股（市值大）、近期没有更新的
-            # 2. 中优先级：中盘股
-            # 3. 低优先级：小盘股
-            
             query = """
                 SELECT s.symbol, s.name, s.marketCap,
-                       COALESCE(f.updatedAt, '1900-01-01') as f10_updated,
-                       COALESCE(fin.updatedAt, '1900-01-01') as financial_updated,
-                       COALESCE(d.updatedAt, '1900-01-01') as dividend_updated
+                       f.updatedAt as f10_updated,
+                       fin.updatedAt as financial_updated,
+                       d.updatedAt as dividend_updated
                 FROM stock_info s
                 LEFT JOIN stock_f10 f ON s.symbol = f.symbol
                 LEFT JOIN (SELECT symbol, MAX(updatedAt) as updatedAt FROM stock_financial GROUP BY symbol) fin ON s.symbol = fin.symbol
                 LEFT JOIN (SELECT symbol, MAX(updatedAt) as updatedAt FROM stock_dividend GROUP BY symbol) d ON s.symbol = d.symbol
                 WHERE s.isActive = 1
-                ORDER BY s.marketCap DESC
             """
             
             results = db_manager.execute_query(query)
             if not results:
                 return []
             
-            candidates = []
-            now = datetime.now()
-            
-            for row in results:
-                symbol, name, market_cap, f10_updated, financial_updated, dividend_updated = row
-                
-                # 计算优先级
-                priority = 'low'
-                
-                # 市值优先级
-                if market_cap > 100000000000:  # 1000亿以上
-                    priority = 'high'
-                elif market_cap > 10000000000:  # 100亿以上
-                    priority = 'medium'
-                
-                # 时间优先级（超过7天没更新的提高优先级）
-                if isinstance(f10_updated, str):
-                    if f10_updated == '1900-01-01':
-                        f10_updated = datetime(1900, 1, 1)
-                    else:
-                        f10_updated = datetime.strptime(f10_updated, '%Y-%m-%d %H:%M:%S')
-                if isinstance(financial_updated, str):
-                    if financial_updated == '1900-01-01':
-                        financial_updated = datetime(1900, 1, 1)
-                    else:
-                        financial_updated = datetime.strptime(financial_updated, '%Y-%m-%d %H:%M:%S')
-                if isinstance(dividend_updated, str):
-                    if dividend_updated == '1900-01-01':
-                        dividend_updated = datetime(1900, 1, 1)
-                    else:
-                        dividend_updated = datetime.strptime(dividend_updated, '%Y-%m-%d %H:%M:%S')
-                
-                days_since_f10 = (now - f10_updated).days
-                days_since_financial = (now - financial_updated).days
-                days_since_dividend = (now - dividend_updated).days
-                
-                if days_since_f10 > 7 or days_since_financial > 7 or days_since_dividend > 7:
-                    if priority == 'low':
-                        priority = 'medium'
-                    elif priority == 'medium':
-                        priority = 'high'
-                
-                candidates.append((symbol, name, priority))
-            
-            # 按优先级排序
-            priority_order = {'high': 0, 'medium': 1, 'low': 2}
-            candidates.sort(key=lambda x: priority_order[x[2]])
-            
+            candidates = rank_candidates(results, self.candidate_scorer, datetime.now(), self.max_candidates)
+            logger.info(f"候选股票{len(results)}只，本次更新{len(candidates)}只")
             return candidates
             
         except Exception as e:
@@ -538,8 +380,7 @@ class DailyStockSyncer:
         logger.info("开始数据质量检查...")
         
         try:
-            conn = db_manager.get_connection()
-            with conn.cursor() as cursor:
+            with db_manager.connection() as conn, conn.cursor() as cursor:
                 # 检查各表数据量
                 tables = ['stock_info', 'stock_data', 'stock_f10', 'stock_financial', 'stock_dividend']
                 stats = {}
@@ -575,8 +416,6 @@ class DailyStockSyncer:
                 today_data = cursor.fetchone()[0]
                 logger.info(f"今日交易数据: {today_data}条")
             
-            conn.close()
-            
         except Exception as e:
             logger.error(f"数据质量检查失败: {e}")
 
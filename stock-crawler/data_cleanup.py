@@ -1,33 +1,16 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import pymysql
 from loguru import logger
-from config import Config
 from database import db_manager
 
 class DataCleanup:
-    def __init__(self):
-        self.db_config = {
-            'host': Config.DB_HOST,
-            'port': Config.DB_PORT,
-            'user': Config.DB_USER,
-            'password': Config.DB_PASSWORD,
-            'database': Config.DB_NAME,
-            'charset': 'utf8mb4',
-            'autocommit': True
-        }
-    
-    def get_connection(self):
-        return pymysql.connect(**self.db_config)
-    
     def analyze_duplicates(self):
         """分析重复数据"""
         logger.info("开始分析数据重复情况...")
         
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
+            with db_manager.connection() as conn, conn.cursor() as cursor:
                 # 检查stock_data重复数据
                 cursor.execute("""
                     SELECT symbol, date, COUNT(*) as cnt 
@@ -72,8 +55,6 @@ class DataCleanup:
                         logger.warning(f"发现{len(orphan_symbols)}只股票在stock_data中但不在stock_info中:")
                         for symbol in orphan_symbols[:10]:  # 只显示前10个
                             logger.warning(f"  {symbol[0]}")
-            
-            conn.close()
             return duplicates
             
         except Exception as e:
@@ -85,8 +66,7 @@ class DataCleanup:
         logger.info("开始清理重复数据...")
         
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
+            with db_manager.connection() as conn, conn.cursor() as cursor:
                 # 删除重复的stock_data记录，保留最新的
                 delete_query = """
                     DELETE d1 FROM stock_data d1
@@ -108,8 +88,6 @@ class DataCleanup:
                 """)
                 orphan_deleted = cursor.rowcount
                 logger.info(f"删除了{orphan_deleted}条孤立的交易数据")
-            
-            conn.close()
             return deleted_count + orphan_deleted
             
         except Exception as e:
@@ -121,8 +99,7 @@ class DataCleanup:
         logger.info("检查数据库索引...")
         
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
+            with db_manager.connection() as conn, conn.cursor() as cursor:
                 # 检查stock_data表的唯一索引
                 cursor.execute("""
                     SHOW INDEX FROM stock_data 
@@ -166,8 +143,6 @@ class DataCleanup:
                             """)
                         logger.info(f"为{table}.{column}创建了{index_type}索引")
             
-            conn.close()
-            
         except Exception as e:
             logger.error(f"检查索引失败: {e}")
     
@@ -176,8 +151,7 @@ class DataCleanup:
         logger.info("获取数据库统计信息...")
         
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
+            with db_manager.connection() as conn, conn.cursor() as cursor:
                 stats = {}
                 
                 # 各表的记录数
@@ -222,8 +196,6 @@ class DataCleanup:
                 logger.info("最近10天的数据量:")
                 for date, count in stats['daily_counts']:
                     logger.info(f"  {date}: {count}条")
-            
-            conn.close()
             return stats
             
         except Exception as e:
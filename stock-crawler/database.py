@@ -1,8 +1,37 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
 import pymysql
 from loguru import logger
 from config import Config
+from connection_pool import ConnectionPool
 import pandas as pd
 
+# stock_data 写入字段（不含 createdAt/updatedAt）
+STOCK_DATA_COLUMNS = [
+    'symbol', 'name', 'date', 'open', 'high', 'low', 'close', 'volume', 'amount',
+    'changePercent', 'changeAmount', 'turnoverRate'
+]
+
+# stock_info 写入字段（不含 createdAt/updatedAt）
+STOCK_INFO_COLUMNS = [
+    'symbol', 'name', 'industry', 'sector', 'market', 'listDate',
+    'marketCap', 'circulationMarketCap', 'totalShares', 'circulationShares',
+    'peRatio', 'pbRatio', 'dividendYield', 'isActive'
+]
+
+# 每只股票已入库的最新日线日期（增量同步的高水位）
+CREATE_WATERMARK_TABLE = """
+    CREATE TABLE IF NOT EXISTS stock_sync_watermark (
+        symbol VARCHAR(20) NOT NULL PRIMARY KEY COMMENT '股票代码',
+        lastDate DATE NOT NULL COMMENT '已入库的最新交易日',
+        createdAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updatedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='日线增量同步水位'
+"""
+
 class DatabaseManager:
     def __init__(self):
         self.connection_config = {
@@ -14,19 +43,36 @@ class DatabaseManager:
             'charset': 'utf8mb4',
             'autocommit': True
         }
+        self.pool = ConnectionPool(
+            self.connection_config,
+            max_size=Config.DB_POOL_SIZE,
+            timeout=Config.DB_POOL_TIMEOUT,
+            ping_interval=Config.DB_POOL_PING_INTERVAL,
+        )
     
     def get_connection(self):
-        """获取数据库连接"""
-        return pymysql.connect(**self.connection_config)
+        """从连接池获取数据库连接（close() 归还连接池）"""
+        return self.pool.get_connection()
+    
+    @contextmanager
+    def connection(self):
+        """借出连接池中的连接，退出时自动归还"""
+        conn = self.pool.get_connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
+    
+    def pool_stats(self):
+        """连接池借出次数与等待时间统计"""
+        return self.pool.stats()
     
     def test_connection(self):
         """测试数据库连接"""
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute("SELECT 1")
                 result = cursor.fetchone()
-            conn.close()
             logger.info("数据库连接测试成功")
             return True
         except Exception as e:
@@ -36,108 +82,167 @@ class DatabaseManager:
     def execute_query(self, query, params=None):
         """执行查询语句"""
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute(query, params)
                 result = cursor.fetchall()
-            conn.close()
             return result
         except Exception as e:
             logger.error(f"查询执行失败: {e}")
             return None
     
-    def insert_stock_info(self, stock_data):
-        """插入股票基本信息"""
+    def bulk_upsert(self, table, columns, rows, update_columns, chunk_size=None, timestamps=True):
+        """
+        分块批量写入：每块一条多行 INSERT ... ON DUPLICATE KEY UPDATE 并单独提交
+        
+        Args:
+            table: 表名
+            columns: 写入字段（createdAt/updatedAt 自动追加）
+            rows: 与 columns 顺序一致的行（元组或列表）
+            update_columns: 主键/唯一键冲突时更新的字段
+            chunk_size: 每块行数，默认 Config.BULK_CHUNK_SIZE
+            timestamps: 是否自动写入 createdAt/updatedAt（表中没有这两列时传 False）
+        
+        Returns:
+            {'success': 成功行数, 'failed': 失败行数, 'chunks': [每块的成功/失败行数]}
+        """
+        chunk_size = chunk_size or Config.BULK_CHUNK_SIZE
+        result = {'success': 0, 'failed': 0, 'chunks': []}
+        if not rows:
+            return result
+        
+        all_columns = list(columns)
+        updates = [f"{col} = VALUES({col})" for col in update_columns]
+        if timestamps:
+            all_columns += ['createdAt', 'updatedAt']
+            updates.append("updatedAt = VALUES(updatedAt)")
+        # VALUES 中只能有占位符，pymysql 的 executemany 才会改写为一条多行 INSERT
+        insert_query = (
+            f"INSERT INTO {table} ({', '.join(all_columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(all_columns))}) "
+            f"ON DUPLICATE KEY UPDATE {', '.join(updates)}"
+        )
+        now = datetime.now()
+        suffix = (now, now) if timestamps else ()
+        
+        with self.connection() as conn, conn.cursor() as cursor:
+            for index, start in enumerate(range(0, len(rows), chunk_size)):
+                chunk = [tuple(row) + suffix for row in rows[start:start + chunk_size]]
+                success, failed = self._write_chunk(conn, cursor, insert_query, chunk, table)
+                result['success'] += success
+                result['failed'] += failed
+                result['chunks'].append({'chunk': index, 'success': success, 'failed': failed})
+        
+        logger.info(f"{table} 批量写入完成: 成功{result['success']}条, 失败{result['failed']}条, 共{len(result['chunks'])}块")
+        return result
+    
+    def _write_chunk(self, conn, cursor, insert_query, chunk, table):
+        """写入一块数据，整块失败时逐条重试以定位坏数据"""
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
-                insert_query = """
-                    INSERT INTO stock_info (
-                        symbol, name, industry, sector, market, listDate,
-                        marketCap, circulationMarketCap, totalShares, circulationShares,
-                        peRatio, pbRatio, dividendYield, isActive, createdAt, updatedAt
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW()
-                    )
-                """
-                
-                for stock in stock_data:
-                    cursor.execute(insert_query, (
-                        stock['symbol'], stock['name'], stock['industry'], stock['sector'],
-                        stock['market'], stock['listDate'], stock['marketCap'], 
-                        stock['circulationMarketCap'], stock['totalShares'], 
-                        stock['circulationShares'], stock['peRatio'], stock['pbRatio'],
-                        stock['dividendYield'], stock['isActive']
-                    ))
-            
-            conn.close()
-            logger.info(f"成功插入 {len(stock_data)} 条股票基本信息")
-            return True
+            conn.begin()
+            cursor.executemany(insert_query, chunk)
+            conn.commit()
+            return len(chunk), 0
         except Exception as e:
-            logger.error(f"插入股票基本信息失败: {e}")
-            return False
+            conn.rollback()
+            logger.warning(f"{table} 批量写入失败，改为逐条写入{len(chunk)}条: {e}")
+        
+        success_count = 0
+        failed_count = 0
+        for row in chunk:
+            try:
+                cursor.execute(insert_query, row)
+                success_count += 1
+            except Exception as e:
+                logger.error(f"写入 {table} 数据 {row[0]} 失败: {e}")
+                failed_count += 1
+        return success_count, failed_count
+    
+    def insert_stock_info(self, stock_data):
+        """插入股票基本信息（股票代码已存在时更新）"""
+        return self.upsert_stock_info(stock_data)
     
     def insert_stock_data(self, stock_data):
         """插入股票交易数据（使用ON DUPLICATE KEY UPDATE避免重复）"""
         if not stock_data:
             return True
-            
+        
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
-                insert_query = """
-                    INSERT INTO stock_data (
-                        symbol, name, date, open, high, low, close, volume, amount,
-                        changePercent, changeAmount, turnoverRate, createdAt, updatedAt
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW()
-                    ) ON DUPLICATE KEY UPDATE
-                        name = VALUES(name),
-                        open = VALUES(open),
-                        high = VALUES(high),
-                        low = VALUES(low),
-                        close = VALUES(close),
-                        volume = VALUES(volume),
-                        amount = VALUES(amount),
-                        changePercent = VALUES(changePercent),
-                        changeAmount = VALUES(changeAmount),
-                        turnoverRate = VALUES(turnoverRate),
-                        updatedAt = NOW()
-                """
-                
-                # 逐条插入，避免批量插入时的重复键错误
-                success_count = 0
-                failed_count = 0
-                
-                for stock in stock_data:
-                    try:
-                        cursor.execute(insert_query, (
-                            stock['symbol'], stock['name'], stock['date'], stock['open'],
-                            stock['high'], stock['low'], stock['close'], stock['volume'],
-                            stock['amount'], stock['changePercent'], stock['changeAmount'],
-                            stock['turnoverRate']
-                        ))
-                        success_count += 1
-                    except Exception as e:
-                        # 如果是重复键错误，记录但不中断
-                        if "Duplicate entry" in str(e):
-                            logger.warning(f"股票 {stock['symbol']} 日期 {stock['date']} 数据已存在，跳过")
-                        else:
-                            logger.error(f"插入股票 {stock['symbol']} 数据失败: {e}")
-                        failed_count += 1
-            
-            conn.close()
-            logger.info(f"股票交易数据处理完成: 成功{success_count}条, 失败{failed_count}条")
+            rows = [tuple(stock[col] for col in STOCK_DATA_COLUMNS) for stock in stock_data]
+            self.bulk_upsert('stock_data', STOCK_DATA_COLUMNS, rows, STOCK_DATA_COLUMNS[3:] + ['name'])
             return True
         except Exception as e:
             logger.error(f"插入股票交易数据失败: {e}")
             return False
     
+    def insert_stock_dataframe(self, df, chunk_size=None, use_infile=None):
+        """
+        批量写入日线数据DataFrame（列名与 STOCK_DATA_COLUMNS 一致）
+        
+        Args:
+            df: 日线数据
+            chunk_size: 每块行数
+            use_infile: 是否使用 LOAD DATA LOCAL INFILE，默认 Config.BULK_LOAD_INFILE
+        
+        Returns:
+            {'success': 成功行数, 'failed': 失败行数, 'chunks': [每块的成功/失败行数]}
+        """
+        if df is None or df.empty:
+            return {'success': 0, 'failed': 0, 'chunks': []}
+        
+        frame = df[STOCK_DATA_COLUMNS].copy()
+        frame['date'] = pd.to_datetime(frame['date']).dt.strftime('%Y-%m-%d')
+        
+        use_infile = Config.BULK_LOAD_INFILE if use_infile is None else use_infile
+        if use_infile:
+            try:
+                return self._load_stock_data_infile(frame)
+            except Exception as e:
+                logger.warning(f"LOAD DATA 写入日线失败，改用批量INSERT: {e}")
+        
+        # NaN 转为 NULL，numpy 标量转为 Python 原生类型
+        rows = list(frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None))
+        return self.bulk_upsert('stock_data', STOCK_DATA_COLUMNS, rows, STOCK_DATA_COLUMNS[3:] + ['name'], chunk_size)
+    
+    def _load_stock_data_infile(self, frame):
+        """通过临时CSV + LOAD DATA LOCAL INFILE 导入临时表，再一次性合并到 stock_data"""
+        columns = ', '.join(STOCK_DATA_COLUMNS)
+        updates = ', '.join(f"{col} = VALUES({col})" for col in STOCK_DATA_COLUMNS[3:] + ['name'])
+        
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8', newline='') as f:
+            frame.to_csv(f, index=False, header=False, na_rep='\\N')
+            path = f.name
+        
+        conn = pymysql.connect(**self.connection_config, local_infile=True)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("CREATE TEMPORARY TABLE IF NOT EXISTS stock_data_staging LIKE stock_data")
+                cursor.execute("TRUNCATE TABLE stock_data_staging")
+                loaded = cursor.execute(
+                    f"LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE stock_data_staging "
+                    f"CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+                    f"LINES TERMINATED BY '\\n' ({columns})",
+                    (path,)
+                )
+                conn.begin()
+                cursor.execute(
+                    f"INSERT INTO stock_data ({columns}, createdAt, updatedAt) "
+                    f"SELECT {columns}, NOW(), NOW() FROM stock_data_staging "
+                    f"ON DUPLICATE KEY UPDATE {updates}, updatedAt = NOW()"
+                )
+                conn.commit()
+                cursor.execute("DROP TEMPORARY TABLE IF EXISTS stock_data_staging")
+        finally:
+            conn.close()
+            os.unlink(path)
+        
+        failed = len(frame) - loaded
+        logger.info(f"stock_data LOAD DATA 写入完成: 成功{loaded}条, 失败{failed}条")
+        return {'success': loaded, 'failed': failed, 'chunks': [{'chunk': 0, 'success': loaded, 'failed': failed}]}
+    
     def insert_stock_f10(self, f10_data):
         """插入F10基本信息"""
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 insert_query = """
                     INSERT INTO stock_f10 (
                         symbol, name, fullName, industry, mainBusiness, businessScope,
@@ -163,18 +268,15 @@ class DatabaseManager:
                         updatedAt = CURRENT_TIMESTAMP
                 """
                 
-                for f10 in f10_data:
-                    cursor.execute(insert_query, (
-                        f10['symbol'], f10.get('name', ''), f10.get('companyName', ''), 
-                        f10.get('industry', ''), f10.get('mainBusiness', ''),
-                        f10.get('businessScope', ''), f10.get('listDate', None), 
-                        f10.get('totalShares', None), f10.get('circulationShares', None),
-                        f10.get('chairman', ''), f10.get('generalManager', ''), 
-                        f10.get('secretary', ''), f10.get('website', ''), 
-                        f10.get('address', ''), f10.get('introduction', '')
-                    ))
-            
-            conn.close()
+                cursor.executemany(insert_query, [(
+                    f10['symbol'], f10.get('name', ''), f10.get('companyName', ''),
+                    f10.get('industry', ''), f10.get('mainBusiness', ''),
+                    f10.get('businessScope', ''), f10.get('listDate', None),
+                    f10.get('totalShares', None), f10.get('circulationShares', None),
+                    f10.get('chairman', ''), f10.get('generalManager', ''),
+                    f10.get('secretary', ''), f10.get('website', ''),
+                    f10.get('address', ''), f10.get('introduction', '')
+                ) for f10 in f10_data])
             logger.info(f"成功插入 {len(f10_data)} 条F10基本信息")
             return True
         except Exception as e:
@@ -184,8 +286,7 @@ class DatabaseManager:
     def insert_stock_financial(self, financial_data):
         """插入财务数据"""
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 insert_query = """
                     INSERT INTO stock_financial (
                         symbol, name, reportDate, reportType, revenue, netProfit, 
@@ -211,19 +312,16 @@ class DatabaseManager:
                         updatedAt = CURRENT_TIMESTAMP
                 """
                 
-                for financial in financial_data:
-                    cursor.execute(insert_query, (
-                        financial['symbol'], financial.get('name', ''), financial['reportDate'], 
-                        financial.get('reportType', '年报'), financial.get('revenue', None),
-                        financial.get('netProfit', None), financial.get('totalAssets', None), 
-                        financial.get('totalLiabilities', None), financial.get('shareholderEquity', None),
-                        financial.get('operatingCashFlow', None), financial.get('eps', None),
-                        financial.get('roe', None), financial.get('roa', None), 
-                        financial.get('grossMargin', None), financial.get('netMargin', None),
-                        financial.get('debtRatio', None)
-                    ))
-            
-            conn.close()
+                cursor.executemany(insert_query, [(
+                    financial['symbol'], financial.get('name', ''), financial['reportDate'],
+                    financial.get('reportType', '年报'), financial.get('revenue', None),
+                    financial.get('netProfit', None), financial.get('totalAssets', None),
+                    financial.get('totalLiabilities', None), financial.get('shareholderEquity', None),
+                    financial.get('operatingCashFlow', None), financial.get('eps', None),
+                    financial.get('roe', None), financial.get('roa', None),
+                    financial.get('grossMargin', None), financial.get('netMargin', None),
+                    financial.get('debtRatio', None)
+                ) for financial in financial_data])
             logger.info(f"成功插入 {len(financial_data)} 条财务数据")
             return True
         except Exception as e:
@@ -233,8 +331,7 @@ class DatabaseManager:
     def insert_stock_dividend(self, dividend_data):
         """插入分红配股数据"""
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 insert_query = """
                     INSERT INTO stock_dividend (
                         symbol, name, recordDate, exDividendDate, paymentDate,
@@ -256,17 +353,14 @@ class DatabaseManager:
                         updatedAt = CURRENT_TIMESTAMP
                 """
                 
-                for dividend in dividend_data:
-                    cursor.execute(insert_query, (
-                        dividend['symbol'], dividend.get('name', ''), dividend['recordDate'],
-                        dividend.get('exDividendDate', None), dividend.get('paymentDate', None),
-                        dividend.get('dividendPerShare', None), dividend.get('bonusShareRatio', None),
-                        dividend.get('rightIssueRatio', None), dividend.get('totalDividend', None),
-                        dividend.get('dividendYield', None), dividend.get('dividendPlan', ''),
-                        dividend.get('status', '已实施')
-                    ))
-            
-            conn.close()
+                cursor.executemany(insert_query, [(
+                    dividend['symbol'], dividend.get('name', ''), dividend['recordDate'],
+                    dividend.get('exDividendDate', None), dividend.get('paymentDate', None),
+                    dividend.get('dividendPerShare', None), dividend.get('bonusShareRatio', None),
+                    dividend.get('rightIssueRatio', None), dividend.get('totalDividend', None),
+                    dividend.get('dividendYield', None), dividend.get('dividendPlan', ''),
+                    dividend.get('status', '已实施')
+                ) for dividend in dividend_data])
             logger.info(f"成功插入 {len(dividend_data)} 条分红配股数据")
             return True
         except Exception as e:
@@ -276,56 +370,72 @@ class DatabaseManager:
     def upsert_stock_info(self, stock_data):
         """更新或插入股票基本信息"""
         try:
-            conn = self.get_connection()
-            with conn.cursor() as cursor:
-                for stock in stock_data:
-                    # 检查是否存在
-                    check_query = "SELECT COUNT(*) FROM stock_info WHERE symbol = %s"
-                    cursor.execute(check_query, (stock['symbol'],))
-                    exists = cursor.fetchone()[0] > 0
-                    
-                    if exists:
-                        # 更新
-                        update_query = """
-                            UPDATE stock_info SET 
-                                name = %s, industry = %s, sector = %s, market = %s,
-                                listDate = %s, marketCap = %s, circulationMarketCap = %s,
-                                totalShares = %s, circulationShares = %s, peRatio = %s,
-                                pbRatio = %s, dividendYield = %s, isActive = %s, updatedAt = NOW()
-                            WHERE symbol = %s
-                        """
-                        cursor.execute(update_query, (
-                            stock['name'], stock['industry'], stock['sector'], stock['market'],
-                            stock['listDate'], stock['marketCap'], stock['circulationMarketCap'],
-                            stock['totalShares'], stock['circulationShares'], stock['peRatio'],
-                            stock['pbRatio'], stock['dividendYield'], stock['isActive'],
-                            stock['symbol']
-                        ))
-                    else:
-                        # 插入
-                        insert_query = """
-                            INSERT INTO stock_info (
-                                symbol, name, industry, sector, market, listDate,
-                                marketCap, circulationMarketCap, totalShares, circulationShares,
-                                peRatio, pbRatio, dividendYield, isActive, createdAt, updatedAt
-                            ) VALUES (
-                                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW()
-                            )
-                        """
-                        cursor.execute(insert_query, (
-                            stock['symbol'], stock['name'], stock['industry'], stock['sector'],
-                            stock['market'], stock['listDate'], stock['marketCap'],
-                            stock['circulationMarketCap'], stock['totalShares'], stock['circulationShares'],
-                            stock['peRatio'], stock['pbRatio'], stock['dividendYield'], stock['isActive']
-                        ))
-            
-            conn.close()
-            logger.info(f"成功更新/插入 {len(stock_data)} 条股票基本信息")
-            return True
+            rows = [tuple(stock[col] for col in STOCK_INFO_COLUMNS) for stock in stock_data]
+            result = self.bulk_upsert('stock_info', STOCK_INFO_COLUMNS, rows, STOCK_INFO_COLUMNS[1:])
+            logger.info(f"成功更新/插入 {result['success']} 条股票基本信息")
+            return result['failed'] == 0
         except Exception as e:
             logger.error(f"更新/插入股票基本信息失败: {e}")
             return False
     
+    def upsert_stock_info_dataframe(self, df, chunk_size=None):
+        """
+        批量更新或插入股票基本信息DataFrame（列名与 STOCK_INFO_COLUMNS 一致）
+    
+        Returns:
+            {'success': 成功行数, 'failed': 失败行数, 'chunks': [每块的成功/失败行数]}
+        """
+        if df is None or df.empty:
+            return {'success': 0, 'failed': 0, 'chunks': []}
+    
+        frame = df[STOCK_INFO_COLUMNS]
+        rows = list(frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None))
+        result = self.bulk_upsert('stock_info', STOCK_INFO_COLUMNS, rows, STOCK_INFO_COLUMNS[1:], chunk_size)
+        logger.info(f"成功更新/插入 {result['success']} 条股票基本信息")
+        return result
+    
+    def load_daily_watermarks(self, seed_cap):
+        """
+        读取每只股票已入库的最新日线日期: {symbol: date}
+        
+        水位表为空时用 stock_data 的 MAX(date) 初始化一次；最新日期可能是实时行情快照
+        （按抓取当天日期写入，不一定是收盘价），因此初始化的水位不超过 seed_cap，
+        之后的交易日会重新抓取一次（写入是幂等的）
+        
+        Args:
+            seed_cap: 初始化水位的上限日期
+        """
+        with self.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(CREATE_WATERMARK_TABLE)
+            cursor.execute("SELECT symbol, lastDate FROM stock_sync_watermark")
+            rows = cursor.fetchall()
+            if not rows:
+                logger.info("日线水位表为空，从 stock_data 初始化")
+                cursor.execute("""
+                    INSERT INTO stock_sync_watermark (symbol, lastDate)
+                    SELECT symbol, LEAST(MAX(date), %s) FROM stock_data GROUP BY symbol
+                """, (seed_cap,))
+                cursor.execute("SELECT symbol, lastDate FROM stock_sync_watermark")
+                rows = cursor.fetchall()
+        return {symbol: last_date for symbol, last_date in rows}
+    
+    def update_daily_watermarks(self, watermarks):
+        """批量推进日线水位（只前进不后退），返回写入的股票数"""
+        if not watermarks:
+            return 0
+        
+        now = datetime.now()
+        rows = [(symbol, last_date, now, now) for symbol, last_date in watermarks.items()]
+        with self.connection() as conn, conn.cursor() as cursor:
+            cursor.executemany("""
+                INSERT INTO stock_sync_watermark (symbol, lastDate, createdAt, updatedAt)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    lastDate = GREATEST(lastDate, VALUES(lastDate)),
+                    updatedAt = VALUES(updatedAt)
+            """, rows)
+        return len(rows)
+    
     def get_existing_symbols(self):
         """获取数据库中已存在的股票代码"""
         try:
@@ -336,13 +446,27 @@ class DatabaseManager:
             logger.error(f"获取已存在股票代码失败: {e}")
             return []
     
+    def get_stock_names(self, symbols=None):
+        """读取股票名称: {symbol: name}，symbols 为空时读取全部"""
+        try:
+            if symbols:
+                placeholders = ', '.join(['%s'] * len(symbols))
+                result = self.execute_query(
+                    f"SELECT symbol, name FROM stock_info WHERE symbol IN ({placeholders})", list(symbols)
+                )
+            else:
+                result = self.execute_query("SELECT symbol, name FROM stock_info")
+            return {symbol: name for symbol, name in result} if result else {}
+        except Exception as e:
+            logger.error(f"获取股票名称失败: {e}")
+            return {}
+    
     def get_stock_count(self):
         """获取股票数量统计"""
         try:
-            conn = self.get_connection()
             stats = {}
             
-            with conn.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 # 总股票数
                 cursor.execute("SELECT COUNT(*) FROM stock_info WHERE isActive = 1")
                 stats['total_stocks'] = cursor.fetchone()[0]
@@ -355,7 +479,6 @@ class DatabaseManager:
                 cursor.execute("SELECT COUNT(*) FROM stock_data WHERE date = CURDATE()")
                 stats['today_records'] = cursor.fetchone()[0]
             
-            conn.close()
             return stats
         except Exception as e:
             logger.error(f"获取股票统计失败: {e}")
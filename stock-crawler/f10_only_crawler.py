@@ -3,12 +3,12 @@
 
 import akshare as ak
 import pandas as pd
-import time
+from concurrent.futures import as_completed
 from datetime import datetime
 from loguru import logger
 from config import Config
 from database import db_manager
-import random
+from fetch_scheduler import fetch, fetch_scheduler
 import sys
 
 class F10OnlyCrawler:
@@ -47,25 +47,24 @@ class F10OnlyCrawler:
             success_count = 0
             failed_count = 0
             
-            for i, (symbol, name) in enumerate(current_batch):
-                logger.info(f"正在处理 {symbol} {name} ({start_index + i + 1}/{total_missing})")
-                
+            # 按市值顺序提交到抓取调度器，由调度器控制并发和请求速率
+            futures = {
+                fetch_scheduler.submit(self._crawl_single_f10, symbol, name, priority=start_index + i): symbol
+                for i, (symbol, name) in enumerate(current_batch)
+            }
+            
+            for future in as_completed(futures):
+                symbol = futures[future]
                 try:
-                    if self._crawl_single_f10(symbol, name):
+                    if future.result():
                         success_count += 1
                         logger.info(f"✓ {symbol} F10数据获取成功")
                     else:
                         failed_count += 1
                         logger.warning(f"✗ {symbol} F10数据获取失败")
-                    
-                    # 随机延迟，避免被限制
-                    delay = self.delay + random.uniform(0.5, 2.0)
-                    time.sleep(delay)
-                    
                 except Exception as e:
                     logger.error(f"处理{symbol}异常: {e}")
                     failed_count += 1
-                    time.sleep(self.delay * 2)
             
             logger.info("=== F10数据批次处理完成 ===")
             logger.info(f"成功: {success_count}只, 失败: {failed_count}只")
@@ -105,7 +104,7 @@ class F10OnlyCrawler:
     def _get_f10_from_individual_info(self, symbol, name):
         """从个股信息获取F10数据"""
         try:
-            df = ak.stock_individual_info_em(symbol=symbol)
+            df = fetch(ak.stock_individual_info_em, symbol=symbol)
             if df.empty:
                 return None
             
@@ -255,12 +254,6 @@ class F10OnlyCrawler:
                 except Exception as e:
                     logger.error(f"第 {batch_num + 1} 批次执行异常: {e}")
                 
-                # 批次间延迟（最后一批不需要延迟）
-                if batch_num < total_batches - 1:
-                    delay_time = 30  # F10数据批次间延迟30秒
-                    logger.info(f"批次间休息 {delay_time} 秒...")
-                    time.sleep(delay_time)
-            
             # 总结
             total_duration = (datetime.now() - start_time).total_seconds()
             
@@ -295,8 +288,7 @@ class F10OnlyCrawler:
     def _show_f10_statistics(self):
         """显示F10数据统计"""
         try:
-            conn = db_manager.get_connection()
-            with conn.cursor() as cursor:
+            with db_manager.connection() as conn, conn.cursor() as cursor:
                 # 总股票数
                 cursor.execute("SELECT COUNT(*) FROM stock_info WHERE isActive = 1")
                 total_stocks = cursor.fetchone()[0]
@@ -324,8 +316,6 @@ class F10OnlyCrawler:
                 logger.info(f"F10数据覆盖率: {f10_unique}/{total_stocks} ({f10_unique/total_stocks*100:.1f}%)")
                 logger.info(f"仍缺失F10数据: {missing_f10} 只")
             
-            conn.close()
-            
         except Exception as e:
             logger.error(f"获取F10统计失败: {e}")
 
@@ -0,0 +1,201 @@
+import itertools
+import json
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from loguru import logger
+from config import Config
+
+# 视为上游限流/网络问题的异常：触发退避和重试（限流时接口常返回HTML，解析JSON失败）
+RETRYABLE_ERRORS = (
+    requests.exceptions.RequestException,
+    ConnectionError,
+    TimeoutError,
+    json.JSONDecodeError,
+)
+
+
+def parse_rate_limits(value):
+    """解析 "接口名:每秒请求数,接口名:每秒请求数" 格式的限速配置"""
+    limits = {}
+    for item in (value or '').split(','):
+        if ':' not in item:
+            continue
+        endpoint, rate = item.split(':', 1)
+        try:
+            limits[endpoint.strip()] = float(rate)
+        except ValueError:
+            logger.warning(f"忽略无效的限速配置: {item}")
+    return limits
+
+
+class TokenBucket:
+    """令牌桶限速，出错时速率减半并暂停，成功后逐步恢复（AIMD）"""
+
+    def __init__(self, rate, capacity=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """阻塞直到拿到一个令牌"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
+
+    def on_error(self, pause):
+        with self._lock:
+            self.rate = max(self.max_rate * 0.1, self.rate / 2)
+            self._tokens = 0
+            self._blocked_until = max(self._blocked_until, time.monotonic() + pause)
+
+
+class FetchScheduler:
+    """
+    抓取调度器
+    - call(): 按上游接口限速执行一次请求，限流/网络错误时退避重试
+    - submit(): 把一只股票的抓取任务放入优先级队列，由有限个工作线程执行
+    工作线程数决定并发度，令牌桶决定每个接口的请求速率，二者配合可以跑满允许的请求速率
+    """
+
+    def __init__(self, max_workers=4, default_rate=2.0, rate_limits=None,
+                 max_retries=3, backoff_base=2.0, backoff_max=60.0):
+        """
+        Args:
+            max_workers: 工作线程数
+            default_rate: 未单独配置的接口每秒请求数
+            rate_limits: 按接口名配置的每秒请求数
+            max_retries: 单次请求最大重试次数
+            backoff_base: 连续出错时暂停时间的基数（秒）
+            backoff_max: 最长暂停时间（秒）
+        """
+        self.max_workers = max_workers
+        self.default_rate = default_rate
+        self.rate_limits = rate_limits or {}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._buckets = {}
+        self._consecutive_errors = {}
+        self._lock = threading.Lock()
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._workers = []
+        self._stats = {'requests': 0, 'errors': 0, 'retries': 0, 'tasks': 0}
+
+    def call(self, endpoint, func, *args, **kwargs):
+        """限速执行一次上游请求"""
+        bucket = self._bucket(endpoint)
+        attempt = 0
+        while True:
+            bucket.acquire()
+            self._count('requests')
+            try:
+                result = func(*args, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                self._count('errors')
+                pause = self._on_error(endpoint, bucket)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self._count('retries')
+                logger.warning(f"{endpoint} 请求失败，暂停{pause:.1f}s后重试({attempt}/{self.max_retries}): {e}")
+                continue
+
+            with self._lock:
+                self._consecutive_errors[endpoint] = 0
+            bucket.on_success()
+            return result
+
+    def submit(self, func, *args, priority=0, **kwargs):
+        """提交抓取任务，priority 越小越先执行，返回 concurrent.futures.Future"""
+        self._ensure_workers()
+        future = Future()
+        self._queue.put((priority, next(self._sequence), future, func, args, kwargs))
+        self._count('tasks')
+        return future
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'pending': self._queue.qsize(),
+                'rates': {endpoint: round(bucket.rate, 2) for endpoint, bucket in self._buckets.items()},
+            }
+
+    def _bucket(self, endpoint):
+        with self._lock:
+            bucket = self._buckets.get(endpoint)
+            if bucket is None:
+                bucket = TokenBucket(self.rate_limits.get(endpoint, self.default_rate))
+                self._buckets[endpoint] = bucket
+            return bucket
+
+    def _on_error(self, endpoint, bucket):
+        """连续出错次数越多暂停越久（带抖动），并降低该接口速率"""
+        with self._lock:
+            errors = self._consecutive_errors.get(endpoint, 0) + 1
+            self._consecutive_errors[endpoint] = errors
+        pause = min(self.backoff_max, self.backoff_base * (2 ** (errors - 1)))
+        pause = random.uniform(pause / 2, pause)
+        bucket.on_error(pause)
+        return pause
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _ensure_workers(self):
+        with self._lock:
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            while len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work, name=f"fetch-worker-{len(self._workers)}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            _, _, future, func, args, kwargs = self._queue.get()
+            try:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(func(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+
+# 全局抓取调度器
+fetch_scheduler = FetchScheduler(
+    max_workers=Config.FETCH_MAX_WORKERS,
+    default_rate=Config.FETCH_RATE,
+    rate_limits=parse_rate_limits(Config.FETCH_RATE_LIMITS),
+    max_retries=Config.MAX_RETRIES,
+)
+
+
+def fetch(func, *args, **kwargs):
+    """通过全局调度器限速调用 akshare 接口（以函数名作为接口名）"""
+    return fetch_scheduler.call(func.__name__, func, *args, **kwargs)
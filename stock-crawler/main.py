@@ -9,6 +9,7 @@ from loguru import logger
 from config import Config
 from database import db_manager
 from crawler import crawler
+from technical_indicators import technical_job
 
 def setup_logging():
     """设置日志"""
@@ -134,6 +135,38 @@ def crawl_historical_data(symbol, days=30):
         logger.error(f"历史数据爬取失败: {e}")
         return False
 
+def sync_daily_bars(days=365):
+    """增量同步所有股票日线"""
+    logger.info("开始增量同步日线数据")
+    
+    try:
+        if not db_manager.test_connection():
+            logger.error("数据库连接失败")
+            return False
+        
+        stats = crawler.sync_daily_bars(lookback_days=days)
+        return stats['failed'] == 0
+        
+    except Exception as e:
+        logger.error(f"日线增量同步失败: {e}")
+        return False
+
+def compute_technicals(full=False):
+    """计算技术指标"""
+    logger.info("开始计算技术指标" + ("（全量重算）" if full else ""))
+    
+    try:
+        if not db_manager.test_connection():
+            logger.error("数据库连接失败")
+            return False
+        
+        stats = technical_job.run(full=full)
+        return stats['failed'] == 0
+        
+    except Exception as e:
+        logger.error(f"技术指标计算失败: {e}")
+        return False
+
 def test_connection():
     """测试数据库连接"""
     logger.info("测试数据库连接")
@@ -150,10 +183,11 @@ def test_connection():
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description='股票数据爬虫')
-    parser.add_argument('--mode', choices=['all', 'basic', 'historical', 'test'], 
+    parser.add_argument('--mode', choices=['all', 'basic', 'historical', 'incremental', 'technicals', 'test'], 
                        default='all', help='爬取模式')
     parser.add_argument('--symbol', help='股票代码（历史数据模式使用）')
-    parser.add_argument('--days', type=int, default=30, help='历史数据天数')
+    parser.add_argument('--full', action='store_true', help='technicals 模式下忽略已有指标重新计算全部历史')
+    parser.add_argument('--days', type=int, help='历史数据天数，historical 默认30天；incremental 为无水位股票的回补天数，默认365天')
     
     args = parser.parse_args()
     
@@ -171,7 +205,11 @@ def main():
             if not args.symbol:
                 logger.error("历史数据模式需要指定股票代码")
                 return 1
-            success = crawl_historical_data(args.symbol, args.days)
+            success = crawl_historical_data(args.symbol, args.days or 30)
+        elif args.mode == 'incremental':
+            success = sync_daily_bars(args.days or 365)
+        elif args.mode == 'technicals':
+            success = compute_technicals(args.full)
         elif args.mode == 'test':
             success = test_connection()
         else:
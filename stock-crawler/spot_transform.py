@@ -0,0 +1,96 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from database import STOCK_DATA_COLUMNS, STOCK_INFO_COLUMNS
+
+# 实时行情（stock_zh_a_spot_em）列名 -> stock_info 数值字段
+SPOT_INFO_NUMERIC = {
+    '总市值': 'marketCap',
+    '流通市值': 'circulationMarketCap',
+    '总股本': 'totalShares',
+    '流通股': 'circulationShares',
+    '市盈率-动态': 'peRatio',
+    '市净率': 'pbRatio',
+}
+
+# 实时行情列名 -> stock_data 数值字段
+SPOT_DATA_NUMERIC = {
+    '今开': 'open',
+    '最高': 'high',
+    '最低': 'low',
+    '最新价': 'close',
+    '成交量': 'volume',
+    '成交额': 'amount',
+    '涨跌幅': 'changePercent',
+    '涨跌额': 'changeAmount',
+    '换手率': 'turnoverRate',
+}
+
+# 股票代码前缀 -> 板块（按顺序匹配，先匹配到的优先）
+SECTOR_PREFIXES = [
+    (('688',), '科创板'),
+    (('300',), '创业板'),
+    (('002',), '中小板'),
+    (('6', '0'), '主板'),
+    (('8', '4'), '北交所'),
+]
+
+
+def sector_by_symbol(symbols):
+    """根据股票代码前缀判断板块（整列计算）"""
+    symbols = symbols.astype(str)
+    conditions = [symbols.str.startswith(prefixes) for prefixes, _ in SECTOR_PREFIXES]
+    choices = [sector for _, sector in SECTOR_PREFIXES]
+    return pd.Series(np.select(conditions, choices, default='其他'), index=symbols.index)
+
+
+def _numeric(df, column):
+    """取数值列，缺失列或无法解析的值按0处理"""
+    if column not in df:
+        return pd.Series(0.0, index=df.index)
+    return pd.to_numeric(df[column], errors='coerce').fillna(0.0)
+
+
+def transform_spot_frame(df, market='ALL', sector=None, date=None):
+    """
+    把实时行情DataFrame整体转换为 stock_info / stock_data 两张表的写入数据
+
+    Args:
+        df: ak.stock_zh_a_spot_em() 返回的数据
+        market: 市场标识
+        sector: 指定板块，为空时按股票代码判断
+        date: 交易日期，默认今天
+
+    Returns:
+        (info_frame, data_frame)，列顺序分别与 STOCK_INFO_COLUMNS / STOCK_DATA_COLUMNS 一致，
+        代码或名称为空的行已剔除
+    """
+    if df is None or df.empty:
+        return pd.DataFrame(columns=STOCK_INFO_COLUMNS), pd.DataFrame(columns=STOCK_DATA_COLUMNS)
+
+    symbols = df['代码'].astype('string').str.strip()
+    names = df['名称'].astype('string').str.strip()
+    valid = symbols.notna() & names.notna() & (symbols != '') & (names != '')
+    df = df[valid.to_numpy()]
+    symbols = symbols[valid].astype(str)
+    names = names[valid].astype(str)
+
+    info = pd.DataFrame({'symbol': symbols, 'name': names}, index=df.index)
+    info['industry'] = df['所属行业'].fillna('未知').astype(str) if '所属行业' in df else '未知'
+    info['sector'] = sector or sector_by_symbol(symbols)
+    info['market'] = market
+    info['listDate'] = '2000-01-01'  # 默认上市日期，后续可以通过其他接口获取
+    for source, target in SPOT_INFO_NUMERIC.items():
+        info[target] = _numeric(df, source)
+    info['dividendYield'] = 0.0  # 股息率，后续通过分红数据计算
+    info['isActive'] = True
+
+    data = pd.DataFrame({'symbol': symbols, 'name': names}, index=df.index)
+    data['date'] = date or datetime.now().strftime('%Y-%m-%d')
+    for source, target in SPOT_DATA_NUMERIC.items():
+        data[target] = _numeric(df, source)
+    data['volume'] = data['volume'].astype('int64')
+
+    return info[STOCK_INFO_COLUMNS].reset_index(drop=True), data[STOCK_DATA_COLUMNS].reset_index(drop=True)
+
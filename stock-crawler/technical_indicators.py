@@ -0,0 +1,241 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+from config import Config
+from database import db_manager
+
+# 移动平均线窗口
+MA_WINDOWS = [5, 10, 20, 50, 200]
+
+# stock_technicals 写入字段（id 自增）
+TECHNICAL_COLUMNS = [
+    'symbol', 'date',
+    'ma5', 'ma10', 'ma20', 'ma50', 'ma200',
+    'rsi', 'macd', 'macd_signal', 'macd_histogram',
+    'bb_upper', 'bb_middle', 'bb_lower',
+    'volume_ma', 'volume_ratio',
+    'trend_signal', 'macd_signal_type',
+    'created_at',
+]
+
+# 表结构与 python-analysis-service 的 StockTechnical 模型一致，另加 (symbol, date) 唯一键用于幂等写入
+CREATE_TECHNICALS_TABLE = """
+    CREATE TABLE IF NOT EXISTS stock_technicals (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        symbol VARCHAR(20) NOT NULL COMMENT '股票代码',
+        date DATETIME NOT NULL COMMENT '计算日期',
+        ma5 FLOAT COMMENT '5日均线',
+        ma10 FLOAT COMMENT '10日均线',
+        ma20 FLOAT COMMENT '20日均线',
+        ma50 FLOAT COMMENT '50日均线',
+        ma200 FLOAT COMMENT '200日均线',
+        rsi FLOAT COMMENT 'RSI指标',
+        macd FLOAT COMMENT 'MACD',
+        macd_signal FLOAT COMMENT 'MACD信号线',
+        macd_histogram FLOAT COMMENT 'MACD柱状图',
+        bb_upper FLOAT COMMENT '布林带上轨',
+        bb_middle FLOAT COMMENT '布林带中轨',
+        bb_lower FLOAT COMMENT '布林带下轨',
+        volume_ma FLOAT COMMENT '成交量均线',
+        volume_ratio FLOAT COMMENT '量比',
+        trend_signal VARCHAR(20) COMMENT '趋势信号',
+        macd_signal_type VARCHAR(20) COMMENT 'MACD信号类型',
+        created_at DATETIME,
+        UNIQUE KEY uk_symbol_date (symbol, date),
+        KEY idx_rsi_macd (rsi, macd_signal_type),
+        KEY idx_trend_signal (trend_signal)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+
+def _per_symbol(grouped, method, *args, **kwargs):
+    """在每只股票自己的K线序列上做滚动/指数平滑（停牌日不产生空值），结果按原行对齐"""
+    return getattr(grouped, method)(*args, **kwargs).mean().reset_index(level=0, drop=True)
+
+
+def compute_indicators(bars):
+    """
+    按股票分组一次性计算所有股票的技术指标
+    窗口按每只股票实际有K线的交易日计数，其他股票交易而本股票停牌的日期不会打断窗口
+
+    Args:
+        bars: 长表（symbol, date, close, volume），按 symbol, date 排序
+
+    Returns:
+        与 bars 行对齐的指标表
+    """
+    by_symbol = bars.groupby('symbol', sort=False)
+    close = by_symbol['close']
+    volume = by_symbol['volume']
+    result = pd.DataFrame(index=bars.index)
+    for window in MA_WINDOWS:
+        result[f'ma{window}'] = _per_symbol(close, 'rolling', window)
+
+    # RSI（14日简单平均，与 DataAnalyzer 一致）
+    delta = close.diff()
+    changes = bars[['symbol']].assign(gain=delta.clip(lower=0), loss=(-delta).clip(lower=0)).groupby('symbol', sort=False)
+    gain = _per_symbol(changes['gain'], 'rolling', 14)
+    loss = _per_symbol(changes['loss'], 'rolling', 14)
+    result['rsi'] = 100 - 100 / (1 + gain / loss)
+
+    # MACD(12, 26, 9)
+    macd = _per_symbol(close, 'ewm', span=12, adjust=False) - _per_symbol(close, 'ewm', span=26, adjust=False)
+    signal = _per_symbol(bars[['symbol']].assign(macd=macd).groupby('symbol', sort=False)['macd'], 'ewm', span=9, adjust=False)
+    result['macd'] = macd
+    result['macd_signal'] = signal
+    result['macd_histogram'] = macd - signal
+
+    # 布林带(20, 2)
+    std = close.rolling(20).std().reset_index(level=0, drop=True)
+    result['bb_middle'] = result['ma20']
+    result['bb_upper'] = result['ma20'] + 2 * std
+    result['bb_lower'] = result['ma20'] - 2 * std
+
+    # 成交量均线与量比（当日成交量 / 前5日平均成交量）
+    result['volume_ma'] = _per_symbol(volume, 'rolling', 5)
+    previous_volume = bars[['symbol']].assign(volume=volume.shift(1)).groupby('symbol', sort=False)['volume']
+    result['volume_ratio'] = bars['volume'] / _per_symbol(previous_volume, 'rolling', 5)
+
+    return result
+
+
+def classify_signals(bars, indicators):
+    """趋势信号与MACD信号类型（与 DataAnalyzer._get_trend_signal 的划分一致）"""
+    close, ma20, ma50, histogram = bars['close'], indicators['ma20'], indicators['ma50'], indicators['macd_histogram']
+    trend = np.select(
+        [(close > ma20) & (ma20 > ma50), (close > ma20) & (ma20 < ma50), (close < ma20) & (ma20 < ma50)],
+        ['强势上涨', '弱势上涨', '强势下跌'],
+        default='弱势下跌',
+    )
+    previous = histogram.groupby(bars['symbol'], sort=False).shift(1)
+    macd_type = np.select(
+        [(previous <= 0) & (histogram > 0), (previous >= 0) & (histogram < 0), histogram > 0, histogram < 0],
+        ['金叉', '死叉', '多头', '空头'],
+        default='',
+    )
+    return (
+        pd.Series(trend, index=bars.index).where(ma50.notna()),
+        pd.Series(macd_type, index=bars.index).where(histogram.notna()),
+    )
+
+
+class TechnicalIndicatorJob:
+    """
+    技术指标预计算：从 stock_data 读取日线，按股票分批，
+    在每只股票自己的K线序列上分组滚动计算 MA/RSI/MACD/布林带/量比 并批量写入 stock_technicals
+    - 没有指标的股票计算全部历史
+    - 已有指标的股票只读取最近 lookback_bars 根K线，只写入新的交易日
+    """
+
+    def __init__(self, symbol_batch_size=None, lookback_bars=None):
+        """
+        Args:
+            symbol_batch_size: 每批处理的股票数（控制内存）
+            lookback_bars: 增量计算时读取的K线数，需覆盖最长窗口(200)和EMA收敛
+        """
+        self.symbol_batch_size = symbol_batch_size or Config.TECH_SYMBOL_BATCH_SIZE
+        self.lookback_bars = lookback_bars or Config.TECH_LOOKBACK_BARS
+
+    def run(self, symbols=None, full=False):
+        """
+        计算并写入技术指标
+
+        Args:
+            symbols: 股票代码列表，默认所有活跃股票
+            full: 是否忽略已有指标重新计算全部历史
+
+        Returns:
+            {'symbols': 处理的股票数, 'rows': 写入行数, 'failed': 写入失败行数}
+        """
+        with db_manager.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(CREATE_TECHNICALS_TABLE)
+
+        if symbols is None:
+            symbols = db_manager.get_existing_symbols()
+
+        watermarks = {} if full else self._load_watermarks()
+        stats = {'symbols': 0, 'rows': 0, 'failed': 0}
+
+        # 已有指标的股票和新股票分开分批：前者只需读取尾部窗口
+        existing = [symbol for symbol in symbols if symbol in watermarks]
+        missing = [symbol for symbol in symbols if symbol not in watermarks]
+        logger.info(f"技术指标计算: 增量{len(existing)}只, 全量{len(missing)}只")
+
+        for group in (existing, missing):
+            for start in range(0, len(group), self.symbol_batch_size):
+                batch = group[start:start + self.symbol_batch_size]
+                try:
+                    rows, failed = self._process_batch(batch, watermarks)
+                except Exception as e:
+                    logger.error(f"技术指标批次计算失败({batch[0]}...): {e}")
+                    stats['failed'] += len(batch)
+                    continue
+                stats['symbols'] += len(batch)
+                stats['rows'] += rows
+                stats['failed'] += failed
+
+        logger.info(f"技术指标计算完成: 股票{stats['symbols']}只, 写入{stats['rows']}条, 失败{stats['failed']}条")
+        return stats
+
+    def _process_batch(self, symbols, watermarks):
+        """计算一批股票的指标，返回 (写入行数, 失败行数)"""
+        known = [watermarks[symbol] for symbol in symbols if symbol in watermarks]
+        since = None
+        if len(known) == len(symbols):
+            # 交易日约占自然日的5/7，多留一个月余量
+            since = min(known) - timedelta(days=self.lookback_bars * 7 // 5 + 30)
+
+        bars = self._load_bars(symbols, since)
+        if bars.empty:
+            return 0, 0
+
+        # 每只股票只用自己有收盘价的K线计算
+        bars = bars.dropna(subset=['close']).sort_values(['symbol', 'date'], ignore_index=True)
+        bars[['close', 'volume']] = bars[['close', 'volume']].astype('float64')
+
+        indicators = compute_indicators(bars)
+        indicators['trend_signal'], indicators['macd_signal_type'] = classify_signals(bars, indicators)
+
+        # 只保留晚于水位的交易日
+        frame = pd.concat([bars[['symbol', 'date']], indicators], axis=1)
+        if watermarks:
+            last = frame['symbol'].map(watermarks)
+            frame = frame[last.isna() | (frame['date'] > last)]
+        if frame.empty:
+            return 0, 0
+
+        frame['date'] = pd.to_datetime(frame['date']).dt.strftime('%Y-%m-%d')
+        frame['created_at'] = datetime.now()
+        frame = frame[TECHNICAL_COLUMNS].replace([np.inf, -np.inf], np.nan)
+        rows = list(frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None))
+
+        result = db_manager.bulk_upsert('stock_technicals', TECHNICAL_COLUMNS, rows, TECHNICAL_COLUMNS[2:-1], timestamps=False)
+        return result['success'], result['failed']
+
+    def _load_bars(self, symbols, since=None):
+        """读取一批股票的日线（since 为空时读取全部历史）"""
+        placeholders = ', '.join(['%s'] * len(symbols))
+        query = f"SELECT symbol, date, close, volume FROM stock_data WHERE symbol IN ({placeholders})"
+        params = list(symbols)
+        if since is not None:
+            query += " AND date >= %s"
+            params.append(since)
+
+        with db_manager.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+
+        bars = pd.DataFrame(list(rows), columns=['symbol', 'date', 'close', 'volume'])
+        bars['date'] = pd.to_datetime(bars['date'])
+        return bars.drop_duplicates(['symbol', 'date'], keep='last')
+
+    def _load_watermarks(self):
+        """每只股票已计算指标的最新日期"""
+        rows = db_manager.execute_query("SELECT symbol, MAX(date) FROM stock_technicals GROUP BY symbol")
+        return {symbol: pd.Timestamp(last_date) for symbol, last_date in rows or [] if last_date is not None}
+
+
+# 全局技术指标任务
+technical_job = TechnicalIndicatorJob()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+sys.path.append('.')
+
+import numpy as np
+import pandas as pd
+
+from technical_indicators import classify_signals, compute_indicators
+
+
+def _bars(symbol, dates, start_price=10.0):
+    closes = start_price + np.arange(len(dates), dtype='float64')
+    return pd.DataFrame({
+        'symbol': symbol,
+        'date': dates,
+        'close': closes,
+        'volume': 1000.0 + np.arange(len(dates), dtype='float64'),
+    })
+
+
+def test_indicators_skip_suspended_days():
+    """停牌缺一天K线不应让后续窗口变成空值"""
+    calendar = pd.bdate_range('2024-01-01', periods=260)
+    suspended = calendar.delete(100)  # B 在第100个交易日停牌
+    bars = pd.concat([_bars('A', calendar), _bars('B', suspended, 50.0)])
+    bars = bars.sort_values(['symbol', 'date'], ignore_index=True)
+
+    indicators = compute_indicators(bars)
+    indicators['trend_signal'], indicators['macd_signal_type'] = classify_signals(bars, indicators)
+    frame = pd.concat([bars, indicators], axis=1)
+
+    b = frame[frame['symbol'] == 'B'].reset_index(drop=True)
+    # 窗口填满后不再出现空值（包括停牌日之后的K线）
+    assert b['ma20'].iloc[19:].notna().all()
+    assert b['ma200'].iloc[199:].notna().all()
+    assert b['rsi'].iloc[14:].notna().all()
+    assert b['volume_ratio'].iloc[5:].notna().all()
+    assert b['trend_signal'].iloc[49:].notna().all()
+
+    # 停牌日之后的均线按 B 自己最近的20根K线计算
+    after = 101
+    assert np.isclose(b['ma20'].iloc[after], b['close'].iloc[after - 19:after + 1].mean())
+
+    # 另一只股票不受影响
+    a = frame[frame['symbol'] == 'A'].reset_index(drop=True)
+    assert a['ma20'].iloc[19:].notna().all()
+    assert np.isclose(a['ma5'].iloc[-1], a['close'].iloc[-5:].mean())
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+from config import Config
+
+# 数据集 -> 候选表中的更新时间列
+DATASET_COLUMNS = {
+    'f10': 'f10_updated',
+    'financial': 'financial_updated',
+    'dividend': 'dividend_updated',
+}
+
+
+class CandidateScorer:
+    """
+    更新候选打分（整表计算，分数越高越先更新）
+    - 市值档位：1000亿以上 +2，100亿以上 +1
+    - 各数据集陈旧度：距上次更新天数 / stale_days，最多计 max_staleness，没有数据按最大值计
+    - 财报季（earnings_months）财务数据陈旧度乘以 earnings_boost
+    可以替换为任意 (DataFrame, now) -> Series 的函数
+    """
+
+    def __init__(self, stale_days=None, max_staleness=4.0, weights=None,
+                 earnings_months=None, earnings_boost=None):
+        """
+        Args:
+            stale_days: 陈旧度计 1 分对应的天数
+            max_staleness: 单个数据集陈旧度上限
+            weights: 各数据集陈旧度权重
+            earnings_months: 财报季月份
+            earnings_boost: 财报季财务数据陈旧度倍数
+        """
+        self.stale_days = stale_days or Config.SYNC_STALE_DAYS
+        self.max_staleness = max_staleness
+        self.weights = weights or {'f10': 1.0, 'financial': 1.0, 'dividend': 1.0}
+        self.earnings_months = set(earnings_months or Config.SYNC_EARNINGS_MONTHS)
+        self.earnings_boost = earnings_boost or Config.SYNC_EARNINGS_BOOST
+
+    def __call__(self, frame, now):
+        market_cap = frame['marketCap'].fillna(0)
+        score = pd.Series(np.select([market_cap > 1e11, market_cap > 1e10], [2.0, 1.0], 0.0), index=frame.index)
+
+        for dataset, column in DATASET_COLUMNS.items():
+            days = (now - frame[column]).dt.days
+            staleness = (days / self.stale_days).clip(upper=self.max_staleness).fillna(self.max_staleness)
+            weight = self.weights.get(dataset, 1.0)
+            if dataset == 'financial' and now.month in self.earnings_months:
+                weight *= self.earnings_boost
+            score += weight * staleness
+
+        return score
+
+
+def rank_candidates(rows, scorer, now, limit=None):
+    """
+    按分数排序候选股票
+
+    Args:
+        rows: (symbol, name, marketCap, f10_updated, financial_updated, dividend_updated) 查询结果
+        scorer: 打分函数
+        now: 当前时间
+        limit: 本次最多返回的股票数，为空或0表示不限制
+
+    Returns:
+        [(symbol, name, score), ...]，分数相同时市值大的在前
+    """
+    frame = pd.DataFrame(list(rows), columns=['symbol', 'name', 'marketCap', *DATASET_COLUMNS.values()])
+    if frame.empty:
+        return []
+
+    frame['marketCap'] = pd.to_numeric(frame['marketCap'], errors='coerce')
+    for column in DATASET_COLUMNS.values():
+        frame[column] = pd.to_datetime(frame[column], errors='coerce')
+
+    frame['score'] = scorer(frame, now)
+    frame = frame.sort_values(['score', 'marketCap'], ascending=False, kind='stable')
+    if limit:
+        frame = frame.head(limit)
+
+    return list(zip(frame['symbol'], frame['name'], frame['score'].round(3)))